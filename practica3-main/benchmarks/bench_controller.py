@@ -0,0 +1,395 @@
+"""
+bench_controller.py
+
+Benchmark de carga del controlador domótico.
+
+Ejecuta el controlador en el propio proceso (sin broker ni Discord) y mide tres caminos:
+
+  ingest          on_mqtt_message con lecturas de N sensores (topic router, caché, reglas)
+  rules           process_sensor_message con R reglas repartidas entre N sensores
+  command         !sensor de extremo a extremo: publicación, respuesta desde otro hilo
+                  (como haría el hilo de red de paho) y respuesta agregada
+  command_cached  !sensor respondido desde la caché de últimos valores
+  switch          !switch de extremo a extremo a través del broker en memoria (common.loopback)
+                  contra una flota de switches de dummy_devices/fleet.py
+
+Para cada escenario informa del throughput, latencias p50/p95/p99, tiempo de CPU y memoria
+residente máxima, y guarda los resultados en JSON para comparar ejecuciones entre commits.
+Si se indica --rate, los mensajes se envían a ese ritmo y la latencia se mide desde el
+instante programado de cada mensaje (incluye el tiempo en cola si el controlador no da abasto).
+
+Ejemplo:
+  python benchmarks/bench_controller.py --devices 200 --messages 50000 --rules 500
+  python benchmarks/bench_controller.py --compare benchmarks/results/anterior.json
+"""
+import argparse
+import asyncio
+import contextlib
+import json
+import os
+import platform
+import queue
+import resource
+import subprocess
+import sys
+import threading
+import time
+
+# Permitir ejecutar el benchmark como script (python benchmarks/bench_controller.py)
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import controller.controller as ctrl
+from common.loopback import LOOPBACK_HOST, make_client
+from controller.rules import RuleEngine
+from dummy_devices.fleet import Fleet
+
+SCENARIOS = ("ingest", "rules", "command", "command_cached", "switch")
+RESULTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "results")
+
+
+class FakeMessage:
+    """
+    Mensaje MQTT mínimo con la interfaz que usa on_mqtt_message.
+    """
+
+    __slots__ = ("topic", "payload")
+
+    def __init__(self, topic, payload):
+        self.topic = topic
+        self.payload = payload
+
+
+class NullClient:
+    """
+    Cliente MQTT que descarta las publicaciones y solo las cuenta.
+    """
+
+    def __init__(self):
+        self.published = 0
+
+    def publish(self, topic, payload=None, qos=0, retain=False):
+        self.published += 1
+
+
+class EchoDevicesClient:
+    """
+    Cliente MQTT simulado: cada petición a un sensor se contesta desde un hilo aparte,
+    entregando la respuesta a on_mqtt_message igual que el hilo de red de paho.
+    """
+
+    def __init__(self, payload=b"Temperature: 22 \xc2\xb0C"):
+        self.payload = payload
+        self._queue = queue.Queue()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def publish(self, topic, payload=None, qos=0, retain=False):
+        self._queue.put(topic)
+
+    def _run(self):
+        while True:
+            topic = self._queue.get()
+            if topic is None:
+                return
+            ctrl.on_mqtt_message(None, None, FakeMessage(topic, self.payload))
+
+    def close(self):
+        self._queue.put(None)
+        self._thread.join()
+
+
+class FakeDiscordMessage:
+    """
+    Mensaje de Discord simulado que guarda las respuestas del bot.
+    """
+
+    def __init__(self, content):
+        self.content = content
+        self.channel = self
+        self.replies = []
+
+    async def send(self, text):
+        self.replies.append(text)
+
+
+def percentile(sorted_values, fraction):
+    """
+    Calcula un percentil sobre una lista ya ordenada.
+
+    Args:
+        sorted_values (list[float]): Valores ordenados.
+        fraction (float): Percentil entre 0 y 1.
+
+    Returns:
+        float: Valor del percentil (0 si la lista está vacía).
+    """
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, int(fraction * len(sorted_values)))
+    return sorted_values[index]
+
+
+def summarize(latencies, elapsed, cpu, extra=None):
+    """
+    Resume las medidas de un escenario.
+
+    Args:
+        latencies (list[float]): Latencias individuales en segundos.
+        elapsed (float): Duración total en segundos.
+        cpu (float): Tiempo de CPU consumido en segundos.
+        extra (dict or None): Campos adicionales del escenario.
+
+    Returns:
+        dict: Resultados (latencias en microsegundos).
+    """
+    latencies.sort()
+    result = {
+        "operations": len(latencies),
+        "elapsed_s": round(elapsed, 4),
+        "throughput_ops": round(len(latencies) / elapsed, 1) if elapsed else 0.0,
+        "p50_us": round(percentile(latencies, 0.50) * 1e6, 1),
+        "p95_us": round(percentile(latencies, 0.95) * 1e6, 1),
+        "p99_us": round(percentile(latencies, 0.99) * 1e6, 1),
+        "max_us": round(latencies[-1] * 1e6, 1) if latencies else 0.0,
+        "cpu_s": round(cpu, 4),
+        "max_rss_kb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+    }
+    if extra:
+        result.update(extra)
+    return result
+
+
+def cpu_time():
+    """
+    Devuelve el tiempo de CPU (usuario + sistema) consumido por el proceso.
+    """
+    usage = resource.getrusage(resource.RUSAGE_SELF)
+    return usage.ru_utime + usage.ru_stime
+
+
+def paced(count, rate):
+    """
+    Genera los instantes programados de envío de cada operación.
+
+    Args:
+        count (int): Número de operaciones.
+        rate (float): Operaciones por segundo (0 = sin límite).
+
+    Yields:
+        tuple: (índice, instante programado según time.perf_counter()).
+    """
+    start = time.perf_counter()
+    for i in range(count):
+        if rate > 0:
+            scheduled = start + i / rate
+            delay = scheduled - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+        else:
+            scheduled = time.perf_counter()
+        yield i, scheduled
+
+
+def setup_devices(devices):
+    """
+    Sustituye los dispositivos del controlador por N sensores y N/4 switches (sin tocar disco).
+
+    Args:
+        devices (int): Número de sensores.
+
+    Returns:
+        list[str]: Topics de los sensores.
+    """
+    table = {str(i): "sensor" for i in range(1, devices + 1)}
+    table.update({str(devices + i): "switch" for i in range(1, devices // 4 + 2)})
+    ctrl.device_data["devices"] = table
+    ctrl.device_data["device_last_id"] = len(table)
+    ctrl.last_values = ctrl.LastValueCache()
+    return [f"{ctrl.TOPIC_BASE}/sensor_{i}" for i in range(1, devices + 1)]
+
+
+def bench_ingest(args):
+    """
+    Escenario ingest: lecturas de sensores entrando por on_mqtt_message.
+    """
+    topics = setup_devices(args.devices)
+    ctrl.mqtt_client = NullClient()
+    messages = [FakeMessage(topics[i % len(topics)], str(20 + i % 10).encode()) for i in range(args.messages)]
+    latencies = []
+    cpu0, t0 = cpu_time(), time.perf_counter()
+    for i, scheduled in paced(args.messages, args.rate):
+        ctrl.on_mqtt_message(None, None, messages[i])
+        latencies.append(time.perf_counter() - scheduled)
+    elapsed, cpu = time.perf_counter() - t0, cpu_time() - cpu0
+    return summarize(latencies, elapsed, cpu, {"published": ctrl.mqtt_client.published})
+
+
+def bench_rules(args):
+    """
+    Escenario rules: evaluación de reglas por mensaje con muchas reglas cargadas.
+    """
+    topics = setup_devices(args.devices)
+    specs = [{"source": f"sensor_{1 + i % args.devices}", "condition": {"op": ">", "value": 20 + i % 10},
+              "targets": [str(args.devices + 1)], "action": "ON"} for i in range(args.rules)]
+    ctrl.rule_engine = RuleEngine(ctrl.TOPIC_BASE, specs)
+    ctrl.mqtt_client = NullClient()
+    values = [str(20 + i % 10) for i in range(args.messages)]
+    latencies = []
+    cpu0, t0 = cpu_time(), time.perf_counter()
+    for i, scheduled in paced(args.messages, args.rate):
+        ctrl.process_sensor_message(topics[i % len(topics)], values[i])
+        latencies.append(time.perf_counter() - scheduled)
+    elapsed, cpu = time.perf_counter() - t0, cpu_time() - cpu0
+    return summarize(latencies, elapsed, cpu, {"rules": args.rules, "fired": ctrl.mqtt_client.published})
+
+
+def bench_command(args, cached=False):
+    """
+    Escenario command: !sensor de extremo a extremo (con o sin caché).
+    """
+    setup_devices(args.devices)
+    client = EchoDevicesClient()
+    max_age = 3600.0 if cached else 0.0
+    latencies = []
+
+    async def run():
+        # Primera consulta para llenar la caché en el escenario cacheado
+        await ctrl.query_devices(client, "sensor", "Sensor", timeout=args.timeout, max_age=max_age)
+        for _, scheduled in paced(args.commands, args.rate):
+            message = FakeDiscordMessage("!sensor")
+            response = ctrl.query_devices(client, "sensor", "Sensor", timeout=args.timeout, max_age=max_age)
+            await ctrl.respond_discord(message, await response)
+            latencies.append(time.perf_counter() - scheduled)
+
+    ctrl.mqtt_client = NullClient()
+    cpu0, t0 = cpu_time(), time.perf_counter()
+    asyncio.run(run())
+    elapsed, cpu = time.perf_counter() - t0, cpu_time() - cpu0
+    client.close()
+    return summarize(latencies, elapsed, cpu, {"devices_per_command": args.devices})
+
+
+def bench_switch(args):
+    """
+    Escenario switch: !switch contra una flota de switches a través del broker en memoria.
+    """
+    fleet = Fleet({"connections": 2, "switches": {"count": args.devices, "first_id": 1, "probability": 0.0}})
+    switch_ids = [str(switch_id) for switch_id in fleet.switches]
+    ctrl.device_data["devices"] = {switch_id: "switch" for switch_id in switch_ids}
+    client = make_client(LOOPBACK_HOST)
+    client.on_connect = ctrl.on_connect
+    client.on_message = ctrl.on_mqtt_message
+    latencies = []
+
+    async def run():
+        fleet.loop = asyncio.get_running_loop()
+        fleet.connect(LOOPBACK_HOST, 0)
+        client.connect(LOOPBACK_HOST)
+        client.loop_start()
+        await asyncio.sleep(0.1)
+        for i, scheduled in paced(args.commands, args.rate):
+            message = FakeDiscordMessage(f"!switch {switch_ids[i % len(switch_ids)]}")
+            await ctrl.handle_command(message, client)
+            latencies.append(time.perf_counter() - scheduled)
+
+    cpu0, t0 = cpu_time(), time.perf_counter()
+    asyncio.run(run())
+    elapsed, cpu = time.perf_counter() - t0, cpu_time() - cpu0
+    client.loop_stop()
+    client.disconnect()
+    fleet.stop()
+    return summarize(latencies, elapsed, cpu, {"switches": len(switch_ids)})
+
+
+def git_commit():
+    """
+    Obtiene el commit actual del repositorio, si está disponible.
+    """
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True,
+                              text=True, timeout=5).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+
+def compare(current, previous):
+    """
+    Muestra la variación de las métricas principales respecto a una ejecución anterior.
+
+    Args:
+        current (dict): Resultados de esta ejecución.
+        previous (dict): Resultados de la ejecución de referencia.
+
+    Returns:
+        None
+    """
+    print(f"\nComparación con {previous.get('commit')} ({previous.get('timestamp')}):")
+    for name, result in current["scenarios"].items():
+        old = previous.get("scenarios", {}).get(name)
+        if not old:
+            continue
+        changes = []
+        for key in ("throughput_ops", "p50_us", "p99_us", "cpu_s"):
+            if old.get(key):
+                changes.append(f"{key} {100.0 * (result[key] - old[key]) / old[key]:+.1f}%")
+        print(f"  {name:15s} " + ", ".join(changes))
+
+
+def main():
+    """
+    Analiza los argumentos, ejecuta los escenarios y guarda los resultados.
+    """
+    parser = argparse.ArgumentParser(description="Benchmark de carga del controlador")
+    parser.add_argument("--devices", type=int, default=100, help="Número de sensores simulados")
+    parser.add_argument("--messages", type=int, default=20000, help="Mensajes para ingest y rules")
+    parser.add_argument("--rules", type=int, default=200, help="Reglas cargadas en el escenario rules")
+    parser.add_argument("--commands", type=int, default=200, help="Comandos !sensor a ejecutar")
+    parser.add_argument("--rate", type=float, default=0.0, help="Operaciones por segundo (0 = sin límite)")
+    parser.add_argument("--timeout", type=float, default=5.0, help="Timeout de cada petición a dispositivos")
+    parser.add_argument("--scenarios", default=",".join(SCENARIOS), help="Escenarios separados por comas")
+    parser.add_argument("--output", default=None, help="Fichero JSON de resultados")
+    parser.add_argument("--compare", default=None, help="Resultados anteriores con los que comparar")
+    args = parser.parse_args()
+    # Todos los comandos simulados vienen del mismo "usuario": sin límites por usuario ni canal
+    ctrl.commands.rate = 0
+    ctrl.commands.per_user = ctrl.commands.per_channel = float("inf")
+
+    runners = {
+        "ingest": bench_ingest,
+        "rules": bench_rules,
+        "command": bench_command,
+        "command_cached": lambda a: bench_command(a, cached=True),
+        "switch": bench_switch,
+    }
+    results = {
+        "commit": git_commit(),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": platform.python_version(),
+        "params": vars(args).copy(),
+        "scenarios": {},
+    }
+    for name in args.scenarios.split(","):
+        if name not in runners:
+            parser.error(f"Escenario desconocido: {name}")
+        # Los print del controlador van a /dev/null para medir el coste sin el del terminal
+        with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+            result = runners[name](args)
+        results["scenarios"][name] = result
+        print(f"{name:15s} {result['throughput_ops']:>12.1f} ops/s  p50 {result['p50_us']:>9.1f} us  "
+              f"p95 {result['p95_us']:>9.1f} us  p99 {result['p99_us']:>9.1f} us  cpu {result['cpu_s']:.3f} s  "
+              f"rss {result['max_rss_kb']} KB")
+
+    output = args.output
+    if output is None:
+        os.makedirs(RESULTS_DIR, exist_ok=True)
+        output = os.path.join(RESULTS_DIR, f"{time.strftime('%Y%m%d-%H%M%S')}-{results['commit'] or 'local'}.json")
+    with open(output, "w") as f:
+        json.dump(results, f, indent=2)
+    print(f"Resultados guardados en {output}")
+
+    if args.compare:
+        with open(args.compare, "r") as f:
+            compare(results, json.load(f))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,197 @@
+"""
+codec.py
+
+Formato de los mensajes de telemetría de los dispositivos.
+
+Los mensajes de texto de los sensores ('Temperature: 25 °C', 'Sensor value: 12.34' o
+simplemente '25') se analizan con `parse_number`, con un camino rápido (float() directo o
+el número tras los dos puntos) que solo recurre a una expresión regular si lo anterior
+falla.
+
+Además existe una codificación binaria compacta y opcional, de tamaño fijo:
+
+    magic (1 B) | tipo (1 B) | id (4 B) | seq (2 B) | timestamp (8 B) | valor (4 B)
+
+en orden de red. El primer byte (MAGIC) no puede empezar un mensaje de texto UTF-8
+válido, así que el receptor distingue ambos formatos mirando solo ese byte. Cada
+dispositivo elige su codificación (texto o binaria) y el controlador acepta las dos en
+cualquier mensaje, sin negociación previa: las lecturas binarias se entregan como
+`Reading`, cuyo valor usan directamente las reglas, y el esquema de su tipo (`Schema`) da
+el texto legible para la caché y Discord.
+
+Solo los sensores publican lecturas binarias, así que es el único tipo con esquema; para
+otro tipo basta con registrar el suyo con `register_schema`.
+"""
+import re
+import struct
+import time
+
+MAGIC = 0xC1  # Byte inicial de los mensajes binarios (nunca válido al inicio de UTF-8)
+BINARY_FORMAT = struct.Struct("!BBIHdf")
+ENCODINGS = ("text", "binary")
+
+_NUMBER = re.compile(r"[-+]?\d+(?:\.\d+)?")
+
+
+def parse_number(text):
+    """
+    Extrae el valor numérico de un mensaje de texto.
+
+    Args:
+        text (str): Mensaje, por ejemplo '25', 'Temperature: 25 °C' o 'Sensor value: 12.34'.
+
+    Returns:
+        float or None: Valor encontrado, o None si el mensaje no contiene ningún número.
+    """
+    try:
+        return float(text)
+    except (TypeError, ValueError):
+        if not isinstance(text, str):
+            return None
+    tail = text.rpartition(":")[2].split()
+    if tail:
+        try:
+            return float(tail[0])
+        except ValueError:
+            pass
+    match = _NUMBER.search(text)
+    return float(match.group()) if match else None
+
+
+def format_temperature(value):
+    return f"Temperature: {value:g} °C"
+
+
+class Schema:
+    """
+    Esquema de los mensajes binarios de un tipo de dispositivo.
+    """
+
+    def __init__(self, tipo, code, format_text):
+        """
+        Args:
+            tipo (str): Tipo de dispositivo (por ejemplo, 'sensor').
+            code (int): Código del tipo en la codificación binaria (1-255).
+            format_text (callable): Función valor -> texto legible.
+        """
+        self.tipo = tipo
+        self.code = code
+        self.format_text = format_text
+
+
+class Reading:
+    """
+    Lectura decodificada de un dispositivo.
+    """
+
+    __slots__ = ("tipo", "device_id", "value", "seq", "timestamp", "encoding", "_text")
+
+    def __init__(self, tipo, device_id, value, seq=None, timestamp=None, encoding="text"):
+        self.tipo = tipo
+        self.device_id = device_id
+        self.value = value
+        self.seq = seq
+        self.timestamp = timestamp
+        self.encoding = encoding
+        self._text = None
+
+    def text(self):
+        """
+        Devuelve el texto legible de la lectura según el esquema de su tipo.
+
+        Se construye una sola vez, la primera vez que se pide.
+
+        Returns:
+            str: Texto de la lectura (por ejemplo 'Temperature: 25 °C').
+        """
+        if self._text is None:
+            schema = SCHEMAS.get(self.tipo)
+            self._text = f"{self.value:g}" if schema is None else schema.format_text(self.value)
+        return self._text
+
+
+SCHEMAS = {}  # Esquemas por tipo de dispositivo
+_BY_CODE = {}  # Esquemas por código binario
+
+
+def register_schema(schema):
+    """
+    Registra (o sustituye) el esquema de un tipo de dispositivo.
+
+    Args:
+        schema (Schema): Esquema a registrar.
+
+    Returns:
+        None
+
+    Raises:
+        ValueError: Si el código binario ya lo usa otro tipo o no cabe en un byte.
+    """
+    if not 0 < schema.code < 256:
+        raise ValueError(f"Código binario fuera de rango: {schema.code}")
+    other = _BY_CODE.get(schema.code)
+    if other is not None and other.tipo != schema.tipo:
+        raise ValueError(f"El código {schema.code} ya lo usa el tipo '{other.tipo}'")
+    SCHEMAS[schema.tipo] = schema
+    _BY_CODE[schema.code] = schema
+
+
+register_schema(Schema("sensor", 1, format_temperature))
+
+
+def is_binary(payload):
+    """
+    Indica si un payload está en la codificación binaria.
+
+    Args:
+        payload (bytes): Payload MQTT.
+
+    Returns:
+        bool: True si empieza por MAGIC.
+    """
+    return bool(payload) and payload[0] == MAGIC
+
+
+def encode_binary(tipo, device_id, value, seq=0, timestamp=None):
+    """
+    Codifica una lectura en el formato binario compacto.
+
+    Args:
+        tipo (str): Tipo de dispositivo (debe tener esquema registrado).
+        device_id (int or str): ID numérico del dispositivo.
+        value (float): Valor de la lectura.
+        seq (int): Número de secuencia (módulo 65536).
+        timestamp (float or None): Instante de la lectura (por defecto, ahora).
+
+    Returns:
+        bytes: Mensaje de BINARY_FORMAT.size bytes.
+
+    Raises:
+        KeyError: Si el tipo no tiene esquema.
+    """
+    if timestamp is None:
+        timestamp = time.time()
+    return BINARY_FORMAT.pack(MAGIC, SCHEMAS[tipo].code, int(device_id), seq & 0xFFFF, timestamp, value)
+
+
+def decode_binary(payload):
+    """
+    Decodifica un mensaje binario.
+
+    Args:
+        payload (bytes): Mensaje generado por `encode_binary`.
+
+    Returns:
+        Reading: Lectura decodificada.
+
+    Raises:
+        ValueError: Si el mensaje no tiene el tamaño, la marca o el tipo esperados.
+    """
+    if len(payload) != BINARY_FORMAT.size:
+        raise ValueError(f"Mensaje binario de {len(payload)} bytes (se esperaban {BINARY_FORMAT.size})")
+    magic, code, device_id, seq, timestamp, value = BINARY_FORMAT.unpack(payload)
+    schema = _BY_CODE.get(code)
+    if magic != MAGIC or schema is None:
+        raise ValueError(f"Mensaje binario no reconocido (tipo {code})")
+    return Reading(schema.tipo, str(device_id), value, seq, timestamp, "binary")
+
@@ -0,0 +1,158 @@
+"""
+deadband.py
+
+Publicación por excepción (report-by-exception) para los sensores simulados.
+
+Un sensor que publica cada `interval` segundos aunque su valor no cambie genera, a escala
+de flota, sobre todo tráfico redundante. Con una `DeadbandPolicy` el sensor sigue
+muestreando al mismo ritmo, pero solo publica cuando:
+
+- el valor se aleja del último publicado más que la banda muerta (absoluta, relativa al
+  último valor, o la mayor de ambas);
+- o lleva `heartbeat` segundos sin publicar (latido para que el controlador sepa que el
+  sensor sigue vivo);
+
+y nunca más a menudo que `min_interval` segundos. Un cambio retenido por `min_interval`
+se publica en la primera muestra posterior en la que se cumpla el intervalo, porque la
+comparación es siempre contra el último valor publicado.
+"""
+import time
+
+
+class DeadbandPolicy:
+    """
+    Decide qué muestras de un sensor hay que publicar.
+    """
+
+    def __init__(self, absolute=0.0, relative=0.0, heartbeat=None, min_interval=0.0):
+        """
+        Args:
+            absolute (float): Cambio absoluto mínimo para publicar (0 = cualquier cambio).
+            relative (float): Cambio mínimo relativo al último valor publicado (0.05 = 5 %).
+            heartbeat (float or None): Segundos máximos sin publicar; None para no forzar latidos.
+            min_interval (float): Segundos mínimos entre dos publicaciones.
+
+        Raises:
+            ValueError: Si algún parámetro es negativo.
+        """
+        if absolute < 0 or relative < 0 or min_interval < 0 or (heartbeat is not None and heartbeat <= 0):
+            raise ValueError("Los parámetros de la banda muerta deben ser positivos")
+        self.absolute = absolute
+        self.relative = relative
+        self.heartbeat = heartbeat
+        self.min_interval = min_interval
+        self.last_value = None
+        self.last_time = None
+        self.published = 0
+        self.suppressed = 0
+
+    def should_publish(self, value, now=None):
+        """
+        Indica si una muestra debe publicarse, sin modificar el estado.
+
+        Args:
+            value (float): Valor muestreado.
+            now (float or None): Instante de la muestra (por defecto, time.monotonic()).
+
+        Returns:
+            bool: True si hay que publicarla.
+        """
+        if self.last_value is None:
+            return True
+        if now is None:
+            now = time.monotonic()
+        elapsed = now - self.last_time
+        if elapsed < self.min_interval:
+            return False
+        if self.heartbeat is not None and elapsed >= self.heartbeat:
+            return True
+        delta = abs(value - self.last_value)
+        threshold = max(self.absolute, self.relative * abs(self.last_value))
+        return delta > threshold if threshold else delta > 0
+
+    def record(self, value, now=None):
+        """
+        Registra que una muestra se ha publicado.
+
+        Args:
+            value (float): Valor publicado.
+            now (float or None): Instante de la publicación (por defecto, time.monotonic()).
+
+        Returns:
+            None
+        """
+        self.last_value = value
+        self.last_time = time.monotonic() if now is None else now
+        self.published += 1
+
+    def check(self, value, now=None):
+        """
+        Decide si publicar una muestra y, si es así, la registra como publicada.
+
+        Args:
+            value (float): Valor muestreado.
+            now (float or None): Instante de la muestra (por defecto, time.monotonic()).
+
+        Returns:
+            bool: True si hay que publicarla.
+        """
+        if now is None:
+            now = time.monotonic()
+        if self.should_publish(value, now):
+            self.record(value, now)
+            return True
+        self.suppressed += 1
+        return False
+
+
+def policy_from_spec(spec):
+    """
+    Construye una política a partir de un diccionario de configuración.
+
+    Reconoce las claves 'deadband', 'deadband_relative', 'heartbeat' y 'min_interval'.
+
+    Args:
+        spec (dict): Configuración (por ejemplo, la sección 'sensors' de una flota).
+
+    Returns:
+        DeadbandPolicy or None: Política, o None si no se configura ninguna de esas claves.
+    """
+    keys = ("deadband", "deadband_relative", "heartbeat", "min_interval")
+    if not any(spec.get(key) is not None for key in keys):
+        return None
+    return DeadbandPolicy(spec.get("deadband") or 0.0, spec.get("deadband_relative") or 0.0,
+                          spec.get("heartbeat"), spec.get("min_interval") or 0.0)
+
+
+def add_arguments(parser):
+    """
+    Añade a un ArgumentParser las opciones de publicación por excepción.
+
+    Args:
+        parser (argparse.ArgumentParser): Parser de la línea de comandos.
+
+    Returns:
+        None
+    """
+    parser.add_argument("--deadband", type=float, default=None,
+                        help="Publicar solo si el valor cambia más que esta cantidad")
+    parser.add_argument("--deadband-relative", type=float, default=None,
+                        help="Publicar solo si el valor cambia más que esta fracción (0.05 = 5 %%)")
+    parser.add_argument("--heartbeat", type=float, default=None,
+                        help="Segundos máximos sin publicar aunque el valor no cambie")
+    parser.add_argument("--min-interval", type=float, default=None,
+                        help="Segundos mínimos entre dos publicaciones")
+
+
+def policy_from_args(args):
+    """
+    Construye la política a partir de las opciones añadidas con `add_arguments`.
+
+    Args:
+        args (argparse.Namespace): Argumentos ya analizados.
+
+    Returns:
+        DeadbandPolicy or None: Política, o None si no se ha pedido publicación por excepción.
+    """
+    return policy_from_spec({"deadband": args.deadband, "deadband_relative": args.deadband_relative,
+                             "heartbeat": args.heartbeat, "min_interval": args.min_interval})
@@ -0,0 +1,235 @@
+"""
+log.py
+
+Logging estructurado y de bajo coste para el controlador y los dispositivos simulados.
+
+Sustituye a los `print` por mensaje del camino caliente. Se apoya en el módulo `logging`
+de la biblioteca estándar:
+
+- Niveles: las trazas por mensaje van a DEBUG y no cuestan nada (más allá de
+  `isEnabledFor`) cuando el nivel configurado es INFO o superior.
+- Formato perezoso: los argumentos se pasan aparte (`log.debug("x=%s", x)`) y los campos
+  estructurados en `extra`, de modo que el texto solo se construye si el registro se emite.
+- Salida sin bloqueo: `setup_logging` instala un `QueueHandler`; un `QueueListener` en
+  segundo plano es quien escribe en la consola, así que un stdout lento no frena el hilo
+  de red de MQTT ni el bucle de Discord.
+- Muestreo por topic: `RateLimitFilter` limita cuántos registros por segundo se emiten
+  para cada valor del campo 'topic' y cuenta los descartados, que se indican en el
+  siguiente registro emitido de ese topic.
+
+Ejemplo:
+
+    log = get_logger("controller")
+    if log.isEnabledFor(logging.DEBUG):
+        log.debug("mensaje recibido", extra={"topic": topic, "payload": payload})
+"""
+import atexit
+import json
+import logging
+import logging.handlers
+import queue
+import sys
+import threading
+import time
+
+LOG_RATE = 5.0  # Registros por segundo y topic como máximo (0 para no limitar)
+LOG_BURST = 10  # Registros seguidos permitidos por topic antes de limitar
+
+# Atributos estándar de LogRecord: el resto son campos estructurados pasados en `extra`
+_RECORD_ATTRS = set(vars(logging.LogRecord("", 0, "", 0, "", (), None))) | {"message", "asctime"}
+_listener = None  # Escritor en segundo plano configurado por setup_logging
+
+
+def get_logger(name):
+    """
+    Devuelve el logger de un componente.
+
+    Args:
+        name (str): Nombre del componente (por ejemplo 'controller' o 'dummy.switch').
+
+    Returns:
+        logging.Logger: Logger correspondiente.
+    """
+    return logging.getLogger(name)
+
+
+def record_fields(record):
+    """
+    Extrae los campos estructurados (los pasados en `extra`) de un registro.
+
+    Args:
+        record (logging.LogRecord): Registro de log.
+
+    Returns:
+        dict: Campos adicionales del registro.
+    """
+    return {key: value for key, value in record.__dict__.items()
+            if key not in _RECORD_ATTRS and not key.startswith("_")}
+
+
+class StructuredFormatter(logging.Formatter):
+    """
+    Formatea los registros como 'hora NIVEL logger mensaje clave=valor ...' o como JSON.
+    """
+
+    def __init__(self, json_format=False):
+        """
+        Args:
+            json_format (bool): True para emitir una línea JSON por registro.
+        """
+        super().__init__()
+        self.json_format = json_format
+
+    def format(self, record):
+        fields = record_fields(record)
+        timestamp = time.strftime("%Y-%m-%dT%H:%M:%S", time.localtime(record.created))
+        timestamp += f".{int(record.msecs):03d}"
+        if self.json_format:
+            entry = {"time": timestamp, "level": record.levelname, "logger": record.name,
+                     "msg": record.getMessage()}
+            entry.update(fields)
+            if record.exc_info:
+                entry["exc"] = self.formatException(record.exc_info)
+            return json.dumps(entry, ensure_ascii=False, default=str)
+        parts = [timestamp, record.levelname, record.name, record.getMessage()]
+        for key, value in fields.items():
+            text = str(value)
+            if not text or " " in text or '"' in text:
+                text = json.dumps(text, ensure_ascii=False)
+            parts.append(f"{key}={text}")
+        line = " ".join(parts)
+        if record.exc_info:
+            line += "\n" + self.formatException(record.exc_info)
+        return line
+
+
+class RateLimitFilter(logging.Filter):
+    """
+    Limita los registros por segundo de cada valor de un campo (por defecto, 'topic').
+
+    Cada clave tiene un cubo de tokens de capacidad `burst` que se rellena a `rate` tokens
+    por segundo. Los registros sin ese campo, o de nivel WARNING o superior, no se limitan.
+    """
+
+    def __init__(self, rate=LOG_RATE, burst=LOG_BURST, key="topic", max_keys=10000):
+        """
+        Args:
+            rate (float): Registros por segundo y clave.
+            burst (int): Registros seguidos permitidos por clave.
+            key (str): Campo del registro que identifica la clave.
+            max_keys (int): Claves distintas recordadas como máximo.
+        """
+        super().__init__()
+        self.rate = rate
+        self.burst = burst
+        self.key = key
+        self.max_keys = max_keys
+        self._buckets = {}
+        self._lock = threading.Lock()
+
+    def filter(self, record):
+        if record.levelno >= logging.WARNING:
+            return True
+        key = getattr(record, self.key, None)
+        if key is None:
+            return True
+        now = time.monotonic()
+        with self._lock:
+            bucket = self._buckets.get(key)
+            if bucket is None:
+                if len(self._buckets) >= self.max_keys:
+                    self._buckets.clear()
+                bucket = self._buckets[key] = [float(self.burst), now, 0]
+            tokens = min(self.burst, bucket[0] + (now - bucket[1]) * self.rate)
+            bucket[1] = now
+            if tokens < 1:
+                bucket[0] = tokens
+                bucket[2] += 1
+                return False
+            bucket[0] = tokens - 1
+            suppressed, bucket[2] = bucket[2], 0
+        if suppressed:
+            record.suppressed = suppressed
+        return True
+
+
+def setup_logging(level="INFO", json_format=False, rate=LOG_RATE, burst=LOG_BURST, stream=None):
+    """
+    Configura el logging del proceso con salida por cola y muestreo por topic.
+
+    Si ya estaba configurado, sustituye la configuración anterior.
+
+    Args:
+        level (str or int): Nivel mínimo ('DEBUG', 'INFO', 'WARNING'...).
+        json_format (bool): True para emitir JSON en lugar de texto clave=valor.
+        rate (float): Registros por segundo y topic (0 para no limitar).
+        burst (int): Registros seguidos permitidos por topic.
+        stream (file or None): Destino de los registros (por defecto, sys.stdout).
+
+    Returns:
+        logging.handlers.QueueListener: Escritor en segundo plano (se detiene al salir).
+    """
+    global _listener
+    shutdown_logging()
+    log_queue = queue.SimpleQueue()
+    queue_handler = logging.handlers.QueueHandler(log_queue)
+    if rate:
+        queue_handler.addFilter(RateLimitFilter(rate, burst))
+    output = logging.StreamHandler(stream or sys.stdout)
+    output.setFormatter(StructuredFormatter(json_format))
+
+    root = logging.getLogger()
+    root.addHandler(queue_handler)
+    root.setLevel(level.upper() if isinstance(level, str) else level)
+
+    _listener = logging.handlers.QueueListener(log_queue, output)
+    _listener.start()
+    return _listener
+
+
+@atexit.register
+def shutdown_logging():
+    """
+    Escribe los registros pendientes, detiene el escritor y retira el handler de la cola.
+
+    Returns:
+        None
+    """
+    global _listener
+    root = logging.getLogger()
+    for handler in list(root.handlers):
+        if isinstance(handler, logging.handlers.QueueHandler):
+            root.removeHandler(handler)
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
+
+
+def add_arguments(parser):
+    """
+    Añade a un ArgumentParser las opciones comunes de logging (--log-level, --log-json, --log-rate).
+
+    Args:
+        parser (argparse.ArgumentParser): Parser de la línea de comandos.
+
+    Returns:
+        None
+    """
+    parser.add_argument("--log-level", default="INFO", choices=("DEBUG", "INFO", "WARNING", "ERROR"),
+                        help="Nivel mínimo de log (DEBUG muestra cada mensaje MQTT)")
+    parser.add_argument("--log-json", action="store_true", help="Emitir los logs como JSON")
+    parser.add_argument("--log-rate", type=float, default=LOG_RATE,
+                        help="Registros por segundo y topic como máximo (0 para no limitar)")
+
+
+def setup_from_args(args):
+    """
+    Configura el logging a partir de las opciones añadidas con `add_arguments`.
+
+    Args:
+        args (argparse.Namespace): Argumentos ya analizados.
+
+    Returns:
+        logging.handlers.QueueListener: Escritor en segundo plano.
+    """
+    return setup_logging(args.log_level, args.log_json, args.log_rate)
@@ -0,0 +1,516 @@
+"""
+loopback.py
+
+Broker MQTT en memoria y cliente compatible con paho para pruebas y benchmarks sin red.
+
+`LoopbackClient` implementa la parte de la interfaz de `paho.mqtt.client.Client` que usan el
+controlador y los dummies (connect, subscribe, publish, loop_start, loop_forever, callbacks
+on_connect/on_message/on_publish...), pero en vez de abrir un socket se conecta a un
+`LoopbackBroker` del mismo proceso. El broker soporta:
+
+- Suscripciones con comodines '+' y '#'.
+- Mensajes retenidos (un payload vacío con retain borra el retenido del topic).
+- QoS 0 y 1: la QoS efectiva es la mínima entre publicación y suscripción. Con sesiones
+  persistentes (clean_session=False) los mensajes QoS 1 se guardan mientras el cliente está
+  desconectado y se entregan al reconectar; los QoS 0 se descartan.
+
+Cada cliente tiene su bandeja de entrada y, como en paho, los callbacks se ejecutan desde
+loop(), loop_forever() o el hilo de loop_start(), o bien en un bucle de asyncio asociado
+con `attach_loop` (lo usa `controller.aio_mqtt`). Así las pruebas de integración y los
+benchmarks se ejecutan de forma determinista, sin Mosquitto y a máxima velocidad.
+
+Para usarlo basta con pasar LOOPBACK_HOST como host a `make_client` (lo hace, por ejemplo,
+`Fleet.run` en los benchmarks). El broker solo existe dentro del proceso que lo crea: dos
+procesos con '--host loopback' no se verían entre sí, así que los programas que se
+ejecutan por separado (controlador, workers, dummies) siempre usan un broker real.
+"""
+import itertools
+import queue
+import threading
+
+import paho.mqtt.client as mqtt
+
+LOOPBACK_HOST = "loopback"  # Host que selecciona el broker en memoria
+
+
+class _Session:
+    """
+    Estado del broker para un client_id: suscripciones y mensajes pendientes.
+    """
+
+    def __init__(self, clean):
+        self.clean = clean
+        self.client = None
+        self.subscriptions = {}
+        self.offline = []
+
+
+class LoopbackBroker:
+    """
+    Broker MQTT en memoria compartido por los LoopbackClient de un proceso.
+    """
+
+    def __init__(self):
+        """
+        Inicializa un broker sin sesiones ni mensajes retenidos.
+        """
+        self._lock = threading.RLock()
+        self._sessions = {}
+        self._exact = {}
+        self._wildcards = {}
+        self._retained = {}
+        self._anonymous = itertools.count(1)
+        self.published = 0
+
+    def connect(self, client):
+        """
+        Asocia un cliente a su sesión (nueva o persistente) y entrega los mensajes guardados.
+
+        Args:
+            client (LoopbackClient): Cliente que se conecta.
+
+        Returns:
+            bool: True si se ha recuperado una sesión persistente existente.
+        """
+        with self._lock:
+            if not client.client_id:
+                client.client_id = f"loopback-{next(self._anonymous)}"
+            session = self._sessions.get(client.client_id)
+            present = session is not None and not client.clean_session
+            if session is not None and session.client is not None and session.client is not client:
+                session.client._broker_disconnect()
+            if not present:
+                if session is not None:
+                    self._drop_subscriptions(client.client_id, session)
+                session = _Session(client.clean_session)
+                self._sessions[client.client_id] = session
+            session.client = client
+            pending, session.offline = session.offline, []
+        for message in pending:
+            client._deliver(message)
+        return present
+
+    def disconnect(self, client):
+        """
+        Desasocia un cliente; las sesiones limpias se eliminan junto con sus suscripciones.
+
+        Args:
+            client (LoopbackClient): Cliente que se desconecta.
+
+        Returns:
+            None
+        """
+        with self._lock:
+            session = self._sessions.get(client.client_id)
+            if session is None or session.client is not client:
+                return
+            session.client = None
+            if session.clean:
+                self._drop_subscriptions(client.client_id, session)
+                del self._sessions[client.client_id]
+
+    def _drop_subscriptions(self, client_id, session):
+        for topic in list(session.subscriptions):
+            self._index_remove(client_id, topic)
+        session.subscriptions.clear()
+
+    def _index_remove(self, client_id, topic):
+        table = self._wildcards if ("+" in topic or "#" in topic) else self._exact
+        subscribers = table.get(topic)
+        if subscribers is not None:
+            subscribers.discard(client_id)
+            if not subscribers:
+                del table[topic]
+
+    def subscribe(self, client, topic, qos):
+        """
+        Registra una suscripción y entrega los mensajes retenidos que coinciden.
+
+        Args:
+            client (LoopbackClient): Cliente suscriptor.
+            topic (str): Filtro de topic (admite '+' y '#').
+            qos (int): QoS máxima de la suscripción (0 o 1).
+
+        Returns:
+            int: QoS concedida.
+        """
+        qos = min(int(qos), 1)
+        with self._lock:
+            session = self._sessions[client.client_id]
+            session.subscriptions[topic] = qos
+            table = self._wildcards if ("+" in topic or "#" in topic) else self._exact
+            table.setdefault(topic, set()).add(client.client_id)
+            retained = [message for name, message in self._retained.items()
+                        if name == topic or mqtt.topic_matches_sub(topic, name)]
+        for topic_name, payload, message_qos in retained:
+            client._deliver(_make_message(topic_name, payload, min(qos, message_qos), True))
+        return qos
+
+    def unsubscribe(self, client, topic):
+        """
+        Elimina una suscripción de un cliente.
+
+        Args:
+            client (LoopbackClient): Cliente suscriptor.
+            topic (str): Filtro de topic a eliminar.
+
+        Returns:
+            None
+        """
+        with self._lock:
+            session = self._sessions.get(client.client_id)
+            if session is not None and session.subscriptions.pop(topic, None) is not None:
+                self._index_remove(client.client_id, topic)
+
+    def publish(self, topic, payload, qos=0, retain=False):
+        """
+        Publica un mensaje y lo entrega a todas las sesiones suscritas.
+
+        Args:
+            topic (str): Topic del mensaje.
+            payload (bytes): Contenido del mensaje.
+            qos (int): QoS de la publicación (0 o 1).
+            retain (bool): Si el broker debe retener el mensaje para futuros suscriptores.
+
+        Returns:
+            int: Número de sesiones a las que se ha entregado (o guardado) el mensaje.
+        """
+        qos = min(int(qos), 1)
+        with self._lock:
+            self.published += 1
+            if retain:
+                if payload:
+                    self._retained[topic] = (topic, payload, qos)
+                else:
+                    self._retained.pop(topic, None)
+            # Un cliente con varias suscripciones que coinciden recibe el mensaje una vez,
+            # con la mayor QoS concedida
+            granted = {}
+            for client_id in self._exact.get(topic, ()):
+                granted[client_id] = self._sessions[client_id].subscriptions[topic]
+            for pattern, client_ids in self._wildcards.items():
+                if mqtt.topic_matches_sub(pattern, topic):
+                    for client_id in client_ids:
+                        sub_qos = self._sessions[client_id].subscriptions[pattern]
+                        granted[client_id] = max(granted.get(client_id, 0), sub_qos)
+            targets = []
+            for client_id, sub_qos in granted.items():
+                session = self._sessions[client_id]
+                message_qos = min(qos, sub_qos)
+                if session.client is not None:
+                    targets.append((session.client, message_qos))
+                elif message_qos >= 1:
+                    session.offline.append(_make_message(topic, payload, message_qos, False))
+        for client, message_qos in targets:
+            client._deliver(_make_message(topic, payload, message_qos, False))
+        return len(granted)
+
+    def retained(self, topic):
+        """
+        Obtiene el payload retenido en un topic.
+
+        Args:
+            topic (str): Topic a consultar.
+
+        Returns:
+            bytes or None: Payload retenido, o None si no hay.
+        """
+        with self._lock:
+            message = self._retained.get(topic)
+        return message[1] if message else None
+
+
+def _make_message(topic, payload, qos, retain):
+    """
+    Construye un MQTTMessage de paho con los campos que reciben los callbacks.
+    """
+    message = mqtt.MQTTMessage(topic=topic.encode("utf-8"))
+    message.payload = payload
+    message.qos = qos
+    message.retain = retain
+    return message
+
+
+def _encode_payload(payload):
+    """
+    Convierte el payload de una publicación a bytes, como hace paho.
+    """
+    if payload is None:
+        return b""
+    if isinstance(payload, bytes):
+        return payload
+    if isinstance(payload, (bytearray, memoryview)):
+        return bytes(payload)
+    if isinstance(payload, (int, float)):
+        return str(payload).encode("ascii")
+    return str(payload).encode("utf-8")
+
+
+class LoopbackMessageInfo:
+    """
+    Resultado de una publicación, compatible con paho.mqtt.client.MQTTMessageInfo.
+    """
+
+    def __init__(self, mid):
+        self.mid = mid
+        self.rc = mqtt.MQTT_ERR_SUCCESS
+        self._published = threading.Event()
+
+    def is_published(self):
+        return self._published.is_set()
+
+    def wait_for_publish(self, timeout=None):
+        self._published.wait(timeout)
+
+
+class LoopbackClient:
+    """
+    Cliente MQTT en memoria con la interfaz de paho.mqtt.client.Client (callbacks versión 1).
+    """
+
+    def __init__(self, client_id="", clean_session=None, userdata=None, broker=None, **kwargs):
+        """
+        Inicializa un cliente desconectado.
+
+        Args:
+            client_id (str): Identificador del cliente (vacío para generar uno).
+            clean_session (bool or None): False para mantener la sesión al desconectar.
+            userdata (any): Datos que se pasan a los callbacks.
+            broker (LoopbackBroker or None): Broker a usar (por defecto, el compartido del proceso).
+            **kwargs: Argumentos de paho que no aplican (protocol, transport...).
+        """
+        self.client_id = client_id or ""
+        self.clean_session = True if clean_session is None else clean_session
+        self._userdata = userdata
+        self.broker = broker or default_broker
+        self.on_connect = None
+        self.on_disconnect = None
+        self.on_message = None
+        self.on_publish = None
+        self.on_subscribe = None
+        self._inbox = queue.Queue()
+        self._loop = None
+        self._mids = itertools.count(1)
+        self._connected = False
+        self._thread = None
+        self._stop = threading.Event()
+
+    def user_data_set(self, userdata):
+        self._userdata = userdata
+
+    def is_connected(self):
+        return self._connected
+
+    def connect(self, host=LOOPBACK_HOST, port=1883, keepalive=60, **kwargs):
+        """
+        Se conecta al broker en memoria. El callback on_connect se ejecuta desde el bucle.
+
+        Returns:
+            int: MQTT_ERR_SUCCESS.
+        """
+        session_present = self.broker.connect(self)
+        self._connected = True
+        self._post(("connect", {"session present": int(session_present)}))
+        return mqtt.MQTT_ERR_SUCCESS
+
+    def reconnect(self):
+        return self.connect()
+
+    def disconnect(self, *args, **kwargs):
+        """
+        Se desconecta del broker. El callback on_disconnect se ejecuta desde el bucle.
+
+        Returns:
+            int: MQTT_ERR_SUCCESS.
+        """
+        if self._connected:
+            self.broker.disconnect(self)
+            self._connected = False
+            self._post(("disconnect", mqtt.MQTT_ERR_SUCCESS))
+        return mqtt.MQTT_ERR_SUCCESS
+
+    def _broker_disconnect(self):
+        """
+        Desconexión forzada por el broker (otro cliente tomó el mismo client_id).
+        """
+        self._connected = False
+        self._post(("disconnect", mqtt.MQTT_ERR_CONN_LOST))
+
+    def subscribe(self, topic, qos=0, **kwargs):
+        """
+        Se suscribe a uno o varios topics (str o lista de tuplas (topic, qos)).
+
+        Returns:
+            tuple: (MQTT_ERR_SUCCESS, mid).
+        """
+        if not self._connected:
+            return mqtt.MQTT_ERR_NO_CONN, None
+        topics = topic if isinstance(topic, list) else [(topic, qos)]
+        mid = next(self._mids)
+        granted = [self.broker.subscribe(self, name, topic_qos) for name, topic_qos in topics]
+        self._post(("subscribe", (mid, tuple(granted))))
+        return mqtt.MQTT_ERR_SUCCESS, mid
+
+    def unsubscribe(self, topic, **kwargs):
+        """
+        Cancela la suscripción a uno o varios topics.
+
+        Returns:
+            tuple: (MQTT_ERR_SUCCESS, mid).
+        """
+        for name in (topic if isinstance(topic, list) else [topic]):
+            self.broker.unsubscribe(self, name)
+        return mqtt.MQTT_ERR_SUCCESS, next(self._mids)
+
+    def publish(self, topic, payload=None, qos=0, retain=False, **kwargs):
+        """
+        Publica un mensaje en el broker en memoria.
+
+        El callback on_publish se ejecuta desde el bucle, como el PUBACK de QoS 1 en paho.
+
+        Returns:
+            LoopbackMessageInfo: Información de la publicación.
+        """
+        info = LoopbackMessageInfo(next(self._mids))
+        if not self._connected:
+            info.rc = mqtt.MQTT_ERR_NO_CONN
+            return info
+        self.broker.publish(topic, _encode_payload(payload), qos, retain)
+        info._published.set()
+        self._post(("publish", info.mid))
+        return info
+
+    def attach_loop(self, loop):
+        """
+        Entrega los eventos directamente a un bucle de asyncio en lugar de a la bandeja de entrada.
+
+        Con un bucle asociado los callbacks se ejecutan en ese bucle (vía call_soon_threadsafe)
+        y no hace falta loop(), loop_forever() ni loop_start(). Con loop=None se vuelve al modo
+        normal.
+
+        Args:
+            loop (asyncio.AbstractEventLoop or None): Bucle que ejecutará los callbacks.
+
+        Returns:
+            None
+        """
+        self._loop = loop
+
+    def _post(self, event):
+        """
+        Encola un evento en la bandeja de entrada o lo programa en el bucle asociado.
+        """
+        if self._loop is not None:
+            self._loop.call_soon_threadsafe(self._handle, event)
+        else:
+            self._inbox.put(event)
+
+    def _deliver(self, message):
+        """
+        Encola un mensaje entregado por el broker.
+        """
+        self._post(("message", message))
+
+    def loop(self, timeout=1.0):
+        """
+        Procesa los eventos pendientes, esperando hasta `timeout` segundos por el primero.
+
+        Returns:
+            int: MQTT_ERR_SUCCESS.
+        """
+        try:
+            event = self._inbox.get(timeout=timeout) if timeout else self._inbox.get_nowait()
+        except queue.Empty:
+            return mqtt.MQTT_ERR_SUCCESS
+        self._handle(event)
+        while True:
+            try:
+                event = self._inbox.get_nowait()
+            except queue.Empty:
+                return mqtt.MQTT_ERR_SUCCESS
+            self._handle(event)
+
+    def _handle(self, event):
+        """
+        Ejecuta el callback correspondiente a un evento de la bandeja de entrada.
+        """
+        kind, data = event
+        if kind == "message":
+            if self.on_message is not None:
+                self.on_message(self, self._userdata, data)
+        elif kind == "publish":
+            if self.on_publish is not None:
+                self.on_publish(self, self._userdata, data)
+        elif kind == "connect":
+            if self.on_connect is not None:
+                self.on_connect(self, self._userdata, data, 0)
+        elif kind == "subscribe":
+            if self.on_subscribe is not None:
+                self.on_subscribe(self, self._userdata, data[0], data[1])
+        elif kind == "disconnect":
+            if self.on_disconnect is not None:
+                self.on_disconnect(self, self._userdata, data)
+
+    def loop_forever(self, *args, **kwargs):
+        """
+        Procesa eventos indefinidamente (hasta loop_stop o disconnect desde otro hilo).
+
+        Returns:
+            int: MQTT_ERR_SUCCESS.
+        """
+        self._stop.clear()
+        while not self._stop.is_set():
+            self.loop(timeout=0.1)
+            if not self._connected and self._inbox.empty():
+                break
+        return mqtt.MQTT_ERR_SUCCESS
+
+    def loop_start(self):
+        """
+        Arranca un hilo que procesa los eventos, como el hilo de red de paho.
+
+        Returns:
+            int: MQTT_ERR_SUCCESS.
+        """
+        if self._thread is None:
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name="loopback-mqtt", daemon=True)
+            self._thread.start()
+        return mqtt.MQTT_ERR_SUCCESS
+
+    def _run(self):
+        while not self._stop.is_set():
+            self.loop(timeout=0.05)
+
+    def loop_stop(self, *args, **kwargs):
+        """
+        Detiene el hilo de loop_start.
+
+        Returns:
+            int: MQTT_ERR_SUCCESS.
+        """
+        self._stop.set()
+        if self._thread is not None:
+            if self._thread is not threading.current_thread():
+                self._thread.join()
+            self._thread = None
+        return mqtt.MQTT_ERR_SUCCESS
+
+
+default_broker = LoopbackBroker()
+
+
+def make_client(host, **kwargs):
+    """
+    Crea un cliente MQTT: en memoria si host es LOOPBACK_HOST, de paho en otro caso.
+
+    Args:
+        host (str): Host del broker.
+        **kwargs: Argumentos del constructor del cliente (protocol, client_id...).
+
+    Returns:
+        mqtt.Client or LoopbackClient: Cliente listo para conectar.
+    """
+    if host == LOOPBACK_HOST:
+        return LoopbackClient(**kwargs)
+    return mqtt.Client(**kwargs)
@@ -0,0 +1,375 @@
+"""
+metrics.py
+
+Métricas del controlador y de los dispositivos simulados.
+
+Un `MetricsRegistry` agrupa contadores, gauges e histogramas con etiquetas opcionales y
+los exporta en el formato de texto de Prometheus, tanto para un endpoint HTTP local
+(`start_http_server`) como para el comando `!stats` del bot. Solo usa la biblioteca
+estándar y es seguro usarlo desde varios hilos (hilo de red de paho, bucle de Discord,
+escritor del journal...).
+
+Ejemplo:
+
+    metrics = MetricsRegistry()
+    received = metrics.counter("mqtt_messages_in_total", "Mensajes MQTT recibidos", ("class",))
+    received.inc(labels=("sensor",))
+    print(metrics.render())
+"""
+import bisect
+import http.server
+import math
+import threading
+
+# Límites (en segundos) de los histogramas de latencia por defecto
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def _format_labels(names, values, extra=()):
+    """
+    Construye el bloque de etiquetas de una muestra ('{a="x",b="y"}' o '').
+    """
+    pairs = list(zip(names, values)) + list(extra)
+    if not pairs:
+        return ""
+    body = ",".join('{}="{}"'.format(name, str(value).replace("\\", "\\\\").replace('"', '\\"'))
+                    for name, value in pairs)
+    return "{" + body + "}"
+
+
+def _format_value(value):
+    """
+    Formatea un valor numérico como en la exposición de Prometheus.
+    """
+    if value == math.inf:
+        return "+Inf"
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+class Counter:
+    """
+    Contador monótono, opcionalmente con etiquetas.
+    """
+
+    kind = "counter"
+
+    def __init__(self, name, help_text, labelnames=()):
+        self.name = name
+        self.help = help_text
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1, labels=()):
+        """
+        Incrementa el contador.
+
+        Args:
+            amount (float): Cantidad a sumar.
+            labels (tuple): Valores de las etiquetas, en el orden de `labelnames`.
+
+        Returns:
+            None
+        """
+        labels = tuple(labels)
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def value(self, labels=()):
+        """
+        Devuelve el valor actual del contador para unas etiquetas.
+
+        Returns:
+            float: Valor acumulado (0 si nunca se ha incrementado).
+        """
+        with self._lock:
+            return self._values.get(tuple(labels), 0)
+
+    def labelsets(self):
+        """
+        Devuelve las combinaciones de etiquetas con valor.
+
+        Returns:
+            list[tuple]: Valores de etiquetas, ordenados.
+        """
+        with self._lock:
+            return sorted(self._values)
+
+    def total(self):
+        """
+        Devuelve la suma del contador sobre todas las etiquetas.
+
+        Returns:
+            float: Suma de todos los valores.
+        """
+        with self._lock:
+            return sum(self._values.values())
+
+    def samples(self):
+        with self._lock:
+            items = sorted(self._values.items())
+        return [(self.name, _format_labels(self.labelnames, labels), value) for labels, value in items]
+
+
+class Gauge:
+    """
+    Valor instantáneo: fijado con `set` o calculado al exportar con una función.
+    """
+
+    kind = "gauge"
+
+    def __init__(self, name, help_text, labelnames=(), fn=None):
+        """
+        Args:
+            name (str): Nombre de la métrica.
+            help_text (str): Descripción.
+            labelnames (tuple): Nombres de las etiquetas.
+            fn (callable or None): Función sin argumentos que devuelve el valor (sin etiquetas)
+                o un dict {valores de etiquetas: valor}.
+        """
+        self.name = name
+        self.help = help_text
+        self.labelnames = tuple(labelnames)
+        self.fn = fn
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def set(self, value, labels=()):
+        with self._lock:
+            self._values[tuple(labels)] = value
+
+    def value(self, labels=()):
+        """
+        Devuelve el valor actual del gauge para unas etiquetas.
+
+        Returns:
+            float: Valor actual (0 si no hay ninguno).
+        """
+        return dict(self._collect()).get(tuple(labels), 0)
+
+    def _collect(self):
+        if self.fn is not None:
+            result = self.fn()
+            if isinstance(result, dict):
+                return sorted((tuple(k) if isinstance(k, tuple) else (k,), v) for k, v in result.items())
+            return [((), result)]
+        with self._lock:
+            return sorted(self._values.items())
+
+    def samples(self):
+        return [(self.name, _format_labels(self.labelnames, labels), value)
+                for labels, value in self._collect()]
+
+
+class Histogram:
+    """
+    Histograma acumulativo de observaciones (por ejemplo, latencias en segundos).
+    """
+
+    kind = "histogram"
+
+    def __init__(self, name, help_text, labelnames=(), buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.help = help_text
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(sorted(buckets))
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, labels=()):
+        """
+        Registra una observación.
+
+        Args:
+            value (float): Valor observado.
+            labels (tuple): Valores de las etiquetas.
+
+        Returns:
+            None
+        """
+        labels = tuple(labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(labels)
+            if series is None:
+                series = self._series[labels] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            series[0][index] += 1
+            series[1] += value
+            series[2] += 1
+
+    def labelsets(self):
+        """
+        Devuelve las combinaciones de etiquetas con observaciones.
+
+        Returns:
+            list[tuple]: Valores de etiquetas, ordenados.
+        """
+        with self._lock:
+            return sorted(self._series)
+
+    def count(self, labels=()):
+        with self._lock:
+            series = self._series.get(tuple(labels))
+            return series[2] if series else 0
+
+    def quantile(self, q, labels=()):
+        """
+        Estima un percentil a partir de los buckets (límite superior del bucket que lo contiene).
+
+        Args:
+            q (float): Percentil entre 0 y 1 (por ejemplo 0.95).
+            labels (tuple): Valores de las etiquetas.
+
+        Returns:
+            float or None: Estimación del percentil, o None si no hay observaciones.
+        """
+        with self._lock:
+            series = self._series.get(tuple(labels))
+            if not series or not series[2]:
+                return None
+            counts, total = list(series[0]), series[2]
+        target = q * total
+        seen = 0
+        for bound, bucket_count in zip(self.buckets + (math.inf,), counts):
+            seen += bucket_count
+            if seen >= target:
+                return bound
+        return math.inf
+
+    def samples(self):
+        with self._lock:
+            items = sorted((labels, (list(s[0]), s[1], s[2])) for labels, s in self._series.items())
+        result = []
+        for labels, (counts, total_sum, total_count) in items:
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (math.inf,), counts):
+                cumulative += bucket_count
+                le = (("le", _format_value(bound)),)
+                result.append((self.name + "_bucket", _format_labels(self.labelnames, labels, le), cumulative))
+            result.append((self.name + "_sum", _format_labels(self.labelnames, labels), total_sum))
+            result.append((self.name + "_count", _format_labels(self.labelnames, labels), total_count))
+        return result
+
+
+class MetricsRegistry:
+    """
+    Conjunto de métricas con nombre, exportables en formato de texto de Prometheus.
+    """
+
+    def __init__(self, prefix=""):
+        """
+        Args:
+            prefix (str): Prefijo que se antepone al nombre de todas las métricas.
+        """
+        self.prefix = prefix
+        self._metrics = {}
+        self._lock = threading.Lock()
+
+    def _get_or_create(self, cls, name, *args, **kwargs):
+        name = self.prefix + name
+        with self._lock:
+            metric = self._metrics.get(name)
+            if metric is None:
+                metric = self._metrics[name] = cls(name, *args, **kwargs)
+            elif not isinstance(metric, cls):
+                raise ValueError(f"La métrica '{name}' ya existe con otro tipo")
+            return metric
+
+    def counter(self, name, help_text, labelnames=()):
+        """
+        Devuelve el contador con ese nombre, creándolo si no existe.
+
+        Returns:
+            Counter: Contador registrado.
+
+        Raises:
+            ValueError: Si ya existe una métrica con ese nombre de otro tipo.
+        """
+        return self._get_or_create(Counter, name, help_text, labelnames)
+
+    def gauge(self, name, help_text, labelnames=(), fn=None):
+        """
+        Devuelve el gauge con ese nombre, creándolo si no existe.
+
+        Returns:
+            Gauge: Gauge registrado (si ya existía y se pasa `fn`, se actualiza su función).
+
+        Raises:
+            ValueError: Si ya existe una métrica con ese nombre de otro tipo.
+        """
+        gauge = self._get_or_create(Gauge, name, help_text, labelnames)
+        if fn is not None:
+            gauge.fn = fn
+        return gauge
+
+    def histogram(self, name, help_text, labelnames=(), buckets=LATENCY_BUCKETS):
+        """
+        Devuelve el histograma con ese nombre, creándolo si no existe.
+
+        Returns:
+            Histogram: Histograma registrado.
+
+        Raises:
+            ValueError: Si ya existe una métrica con ese nombre de otro tipo.
+        """
+        return self._get_or_create(Histogram, name, help_text, labelnames, buckets)
+
+    def get(self, name):
+        """
+        Devuelve una métrica registrada por su nombre (sin prefijo), o None.
+        """
+        with self._lock:
+            return self._metrics.get(self.prefix + name)
+
+    def render(self):
+        """
+        Exporta todas las métricas en el formato de texto de Prometheus.
+
+        Returns:
+            str: Texto de exposición (terminado en salto de línea).
+        """
+        with self._lock:
+            metrics = sorted(self._metrics.values(), key=lambda metric: metric.name)
+        lines = []
+        for metric in metrics:
+            lines.append(f"# HELP {metric.name} {metric.help}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            for name, labels, value in metric.samples():
+                lines.append(f"{name}{labels} {_format_value(value)}")
+        return "\n".join(lines) + "\n"
+
+
+def start_http_server(registry, port, host="127.0.0.1"):
+    """
+    Sirve las métricas en http://host:port/metrics desde un hilo en segundo plano.
+
+    Args:
+        registry (MetricsRegistry): Métricas a exportar.
+        port (int): Puerto TCP (0 para elegir uno libre).
+        host (str): Dirección en la que escuchar (por defecto, solo local).
+
+    Returns:
+        http.server.ThreadingHTTPServer: Servidor arrancado (server_address tiene el puerto real).
+    """
+
+    class MetricsHandler(http.server.BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split("?")[0] not in ("/", "/metrics"):
+                self.send_error(404)
+                return
+            body = registry.render().encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    server = http.server.ThreadingHTTPServer((host, port), MetricsHandler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="metrics-http", daemon=True).start()
+    return server
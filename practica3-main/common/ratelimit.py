@@ -0,0 +1,70 @@
+"""
+ratelimit.py
+
+Cubo de tokens para limitar la frecuencia de una operación.
+
+El cubo tiene capacidad `burst` y se rellena a `rate` tokens por segundo: se permiten
+ráfagas de hasta `burst` operaciones seguidas y, a la larga, `rate` operaciones por
+segundo. Se usa para no superar los límites de Discord por canal y para limitar los
+comandos de cada usuario.
+"""
+import time
+
+
+class TokenBucket:
+    """
+    Cubo de tokens (no es seguro entre hilos: usarlo desde un único hilo o bucle).
+    """
+
+    __slots__ = ("rate", "burst", "tokens", "updated")
+
+    def __init__(self, rate, burst, now=None):
+        """
+        Args:
+            rate (float): Tokens por segundo.
+            burst (float): Capacidad del cubo (el cubo empieza lleno).
+            now (float or None): Instante inicial (por defecto, time.monotonic()).
+        """
+        self.rate = rate
+        self.burst = burst
+        self.tokens = float(burst)
+        self.updated = time.monotonic() if now is None else now
+
+    def _refill(self, now):
+        if now is None:
+            now = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def take(self, amount=1, now=None):
+        """
+        Consume tokens si hay suficientes.
+
+        Args:
+            amount (float): Tokens a consumir.
+            now (float or None): Instante actual (por defecto, time.monotonic()).
+
+        Returns:
+            bool: True si se han consumido, False si no había suficientes.
+        """
+        self._refill(now)
+        if self.tokens < amount:
+            return False
+        self.tokens -= amount
+        return True
+
+    def delay(self, amount=1, now=None):
+        """
+        Calcula cuánto hay que esperar para disponer de `amount` tokens.
+
+        Args:
+            amount (float): Tokens necesarios.
+            now (float or None): Instante actual (por defecto, time.monotonic()).
+
+        Returns:
+            float: Segundos de espera (0 si ya hay tokens suficientes).
+        """
+        self._refill(now)
+        if self.tokens >= amount or self.rate <= 0:
+            return 0.0
+        return (amount - self.tokens) / self.rate
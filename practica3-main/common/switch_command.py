@@ -0,0 +1,212 @@
+"""
+switch_command.py
+
+Formato de las órdenes a los switches y de sus confirmaciones.
+
+Una orden lleva una acción y, opcionalmente, un identificador de orden:
+
+    TOGGLE            conmutar (formato antiguo; cualquier payload no reconocido,
+                      como '1', se interpreta igual)
+    ON cmd=5f2a91c0   encender
+    OFF cmd=5f2a91c0  apagar
+    TOGGLE cmd=5f2a91c0
+
+El switch aplica cada identificador una sola vez: si la misma orden llega repetida (un
+reintento del controlador o un duplicado tardío) no la vuelve a aplicar y se limita a
+confirmar el estado que dejó. Así el controlador puede reintentar sin miedo a que un
+TOGGLE duplicado deshaga el anterior.
+
+Las respuestas a órdenes sin identificador son el estado a secas ('ON' u 'OFF'); las
+respuestas a órdenes con identificador lo repiten para que el controlador las
+correlacione:
+
+    ON ack=5f2a91c0
+
+Como cada switch responde en el topic del ID siguiente, que es el de otro switch, un
+'ON'/'OFF' a secas se trata siempre como una respuesta y nunca como una orden; si no, la
+respuesta de un switch conmutaría al siguiente y este al siguiente. El controlador envía
+todas sus órdenes con identificador.
+
+Además, cada switch publica su estado ('ON'/'OFF') como mensaje retenido en su topic de
+estado (`state_topic`) al conectarse y cada vez que aplica una orden, de modo que el
+controlador lo conoce sin depender de las respuestas en el topic del ID siguiente.
+"""
+import secrets
+from collections import OrderedDict
+
+ACTIONS = ("ON", "OFF", "TOGGLE")
+REMEMBERED_COMMANDS = 256  # Identificadores recordados por switch para descartar duplicados
+TOPIC_BASE = "redes2/2312/1"
+
+
+def state_topic(device_id, base=TOPIC_BASE):
+    """
+    Obtiene el topic en el que un switch publica su estado retenido.
+
+    Args:
+        device_id (int or str): ID del switch.
+        base (str): Prefijo de los topics del grupo.
+
+    Returns:
+        str: Topic de estado, por ejemplo 'redes2/2312/1/state/switch_2'.
+    """
+    return f"{base}/state/switch_{device_id}"
+
+
+def new_command_id():
+    """
+    Genera un identificador de orden aleatorio.
+
+    Returns:
+        str: Identificador de 8 caracteres hexadecimales.
+    """
+    return secrets.token_hex(4)
+
+
+def format_command(action, command_id=None):
+    """
+    Construye el payload de una orden.
+
+    Args:
+        action (str): 'ON', 'OFF' o 'TOGGLE'.
+        command_id (str or None): Identificador de la orden; None para el formato antiguo.
+
+    Returns:
+        str: Payload de la orden.
+    """
+    return action if command_id is None else f"{action} cmd={command_id}"
+
+
+def parse_command(payload):
+    """
+    Interpreta el payload recibido por un switch.
+
+    Args:
+        payload (str): Payload MQTT decodificado.
+
+    Returns:
+        tuple or None: (acción, identificador o None), o None si el payload es una
+        respuesta ('ON'/'OFF' a secas o una confirmación) y no una orden.
+    """
+    parts = payload.split()
+    if len(parts) == 2 and parts[0] in ACTIONS:
+        if parts[1].startswith("cmd="):
+            return parts[0], parts[1][4:]
+        if parts[1].startswith("ack="):
+            return None
+    if len(parts) == 1 and parts[0] in ACTIONS:
+        # 'ON'/'OFF' a secas es la respuesta de otro switch
+        return ("TOGGLE", None) if parts[0] == "TOGGLE" else None
+    # Formato antiguo: cualquier otro payload (por ejemplo '1') conmuta el switch
+    return "TOGGLE", None
+
+
+def is_command(payload):
+    """
+    Indica si un payload es una orden del controlador (y no un estado publicado por un switch).
+
+    Los estados 'ON'/'OFF' a secas se consideran respuestas, como hasta ahora.
+
+    Args:
+        payload (str): Payload MQTT decodificado.
+
+    Returns:
+        bool: True si es 'TOGGLE' o una orden con identificador.
+    """
+    parts = payload.split()
+    return (parts == ["TOGGLE"]) or (len(parts) == 2 and parts[0] in ACTIONS and parts[1].startswith("cmd="))
+
+
+def format_reply(state, command_id=None):
+    """
+    Construye la respuesta de un switch.
+
+    Args:
+        state (bool): Estado del switch tras la orden.
+        command_id (str or None): Identificador de la orden confirmada.
+
+    Returns:
+        str: 'ON'/'OFF', seguido de 'ack=<id>' si la orden tenía identificador.
+    """
+    text = "ON" if state else "OFF"
+    return text if command_id is None else f"{text} ack={command_id}"
+
+
+def parse_reply(payload):
+    """
+    Interpreta la confirmación de una orden con identificador.
+
+    Args:
+        payload (str): Payload MQTT decodificado.
+
+    Returns:
+        tuple or None: (estado 'ON'/'OFF', identificador), o None si no es una confirmación.
+    """
+    parts = payload.split()
+    if len(parts) == 2 and parts[0] in ("ON", "OFF") and parts[1].startswith("ack="):
+        return parts[0], parts[1][4:]
+    return None
+
+
+def next_state(state, action):
+    """
+    Calcula el estado de un switch tras aplicar una acción.
+
+    Args:
+        state (bool): Estado actual.
+        action (str): 'ON', 'OFF' o 'TOGGLE'.
+
+    Returns:
+        bool: Nuevo estado.
+    """
+    if action == "ON":
+        return True
+    if action == "OFF":
+        return False
+    return not state
+
+
+class CommandLog:
+    """
+    Últimas órdenes aplicadas por un switch, para no aplicar dos veces la misma.
+    """
+
+    def __init__(self, size=REMEMBERED_COMMANDS):
+        """
+        Args:
+            size (int): Identificadores recordados como máximo.
+        """
+        self.size = size
+        self._applied = OrderedDict()
+
+    def get(self, command_id):
+        """
+        Obtiene el estado que dejó una orden ya aplicada.
+
+        Args:
+            command_id (str or None): Identificador de la orden.
+
+        Returns:
+            bool or None: Estado tras la orden, o None si no se ha aplicado (o no tiene identificador).
+        """
+        if command_id is None:
+            return None
+        return self._applied.get(command_id)
+
+    def record(self, command_id, state):
+        """
+        Registra que se ha aplicado una orden.
+
+        Args:
+            command_id (str or None): Identificador de la orden (None no se registra).
+            state (bool): Estado del switch tras aplicarla.
+
+        Returns:
+            None
+        """
+        if command_id is None:
+            return
+        self._applied[command_id] = state
+        self._applied.move_to_end(command_id)
+        while len(self._applied) > self.size:
+            self._applied.popitem(last=False)
@@ -0,0 +1,317 @@
+"""
+timing_wheel.py
+
+Planificador de temporizadores compartido basado en una rueda temporal jerárquica.
+
+Con miles de dispositivos simulados (o miles de dispositivos vigilados por el
+controlador) no conviene tener una tarea o un hilo durmiendo por cada uno. La rueda
+divide el tiempo en ticks de `tick` segundos y guarda cada temporizador en la ranura
+del tick en que vence:
+
+- el nivel 0 tiene `slots` ranuras de un tick;
+- el nivel 1 tiene `slots` ranuras de `slots` ticks, el nivel 2 de `slots`² ticks, etc.
+
+Un temporizador lejano se guarda en un nivel alto y, cuando el tiempo llega a su
+ranura, baja en cascada a un nivel más fino. Insertar y cancelar son O(1), y avanzar un
+tick solo toca la ranura que vence. Con los valores por defecto (ticks de 10 ms, 256
+ranuras y 4 niveles) la rueda cubre más de un año.
+
+Los temporizadores periódicos se reprograman contra plazos absolutos, de modo que los
+retrasos de un disparo no se acumulan en los siguientes. La rueda es segura entre
+hilos: se puede programar o cancelar desde el hilo de red de paho mientras otro hilo o
+un bucle asyncio la hace avanzar (`start` o `run_async`).
+"""
+import asyncio
+import itertools
+import logging
+import math
+import threading
+import time
+
+TICK = 0.01  # Segundos por tick
+SLOTS = 256  # Ranuras por nivel (potencia de 2)
+LEVELS = 4
+
+log = logging.getLogger("common.timing_wheel")
+
+
+class Timer:
+    """
+    Temporizador programado en una `TimingWheel`.
+    """
+
+    __slots__ = ("wheel", "callback", "args", "deadline", "period", "expires", "bucket", "key", "cancelled")
+
+    def __init__(self, wheel, callback, args, deadline, period, key):
+        self.wheel = wheel
+        self.callback = callback
+        self.args = args
+        self.deadline = deadline  # Instante monótono en que debe dispararse
+        self.period = period  # None para temporizadores de un solo disparo
+        self.expires = None  # Tick absoluto de vencimiento
+        self.bucket = None  # Ranura en la que está guardado
+        self.key = key
+        self.cancelled = False
+
+    def cancel(self):
+        """
+        Cancela el temporizador (O(1)). No tiene efecto si ya se disparó.
+
+        Returns:
+            bool: True si estaba programado y se ha cancelado.
+        """
+        return self.wheel.cancel(self)
+
+
+class TimingWheel:
+    """
+    Rueda temporal jerárquica con inserción y cancelación O(1).
+    """
+
+    def __init__(self, tick=TICK, slots=SLOTS, levels=LEVELS, now=None):
+        """
+        Args:
+            tick (float): Resolución en segundos.
+            slots (int): Ranuras por nivel (potencia de 2).
+            levels (int): Número de niveles.
+            now (float or None): Instante monótono de origen (por defecto, time.monotonic()).
+
+        Raises:
+            ValueError: Si los parámetros no son válidos.
+        """
+        if tick <= 0 or levels < 1 or slots < 2 or slots & (slots - 1):
+            raise ValueError("La rueda necesita tick positivo, al menos un nivel y ranuras potencia de 2")
+        self.tick = tick
+        self.slots = slots
+        self.levels = levels
+        self._bits = slots.bit_length() - 1
+        self._mask = slots - 1
+        self._wheels = [[{} for _ in range(slots)] for _ in range(levels)]
+        self._origin = time.monotonic() if now is None else now
+        self._current = 0  # Último tick procesado
+        self._keys = itertools.count()
+        self._count = 0
+        self._lock = threading.Lock()
+        self._thread = None
+        self._stop = threading.Event()
+        self.fired = 0
+
+    def __len__(self):
+        return self._count
+
+    def _tick_of(self, deadline):
+        return math.ceil(round((deadline - self._origin) / self.tick, 9))
+
+    def _insert(self, timer):
+        """
+        Guarda un temporizador en la ranura que le corresponde (con el cerrojo tomado).
+        """
+        expires = timer.expires
+        delta = expires - self._current
+        bits = self._bits
+        for level in range(self.levels):
+            if delta < 1 << (bits * (level + 1)):
+                break
+        else:
+            # Más allá del alcance de la rueda: se aparca en la ranura más lejana del nivel
+            # superior y se recoloca cuando baja en cascada
+            expires = self._current + (1 << (bits * self.levels)) - 1
+        bucket = self._wheels[level][(expires >> (bits * level)) & self._mask]
+        bucket[timer.key] = timer
+        timer.bucket = bucket
+
+    def call_later(self, delay, callback, *args):
+        """
+        Programa una llamada única dentro de `delay` segundos.
+
+        Args:
+            delay (float): Segundos hasta la llamada.
+            callback (callable): Función a llamar.
+            *args: Argumentos de la llamada.
+
+        Returns:
+            Timer: Temporizador, que se puede cancelar.
+        """
+        return self.call_at(time.monotonic() + delay, callback, *args)
+
+    def call_at(self, deadline, callback, *args, period=None):
+        """
+        Programa una llamada en un instante monótono absoluto.
+
+        Args:
+            deadline (float): Instante (time.monotonic()) de la llamada.
+            callback (callable): Función a llamar.
+            *args: Argumentos de la llamada.
+            period (float or None): Si se indica, la llamada se repite cada `period` segundos.
+
+        Returns:
+            Timer: Temporizador, que se puede cancelar.
+        """
+        timer = Timer(self, callback, args, deadline, period, next(self._keys))
+        with self._lock:
+            timer.expires = max(self._tick_of(deadline), self._current + 1)
+            self._insert(timer)
+            self._count += 1
+        return timer
+
+    def call_every(self, period, callback, *args, first=None):
+        """
+        Programa una llamada periódica contra plazos absolutos.
+
+        Args:
+            period (float): Segundos entre llamadas.
+            callback (callable): Función a llamar.
+            *args: Argumentos de la llamada.
+            first (float or None): Instante monótono de la primera llamada (por defecto, ahora).
+
+        Returns:
+            Timer: Temporizador, que se puede cancelar.
+
+        Raises:
+            ValueError: Si el periodo no es positivo.
+        """
+        if period <= 0:
+            raise ValueError("El periodo debe ser positivo")
+        return self.call_at(time.monotonic() if first is None else first, callback, *args, period=period)
+
+    def cancel(self, timer):
+        """
+        Cancela un temporizador (O(1)).
+
+        Args:
+            timer (Timer): Temporizador devuelto al programar.
+
+        Returns:
+            bool: True si estaba programado y se ha cancelado.
+        """
+        with self._lock:
+            timer.cancelled = True
+            if timer.bucket is None or timer.bucket.pop(timer.key, None) is None:
+                return False
+            timer.bucket = None
+            self._count -= 1
+            return True
+
+    def _collect(self, target):
+        """
+        Avanza hasta el tick `target` y devuelve los temporizadores vencidos (con el cerrojo tomado).
+        """
+        due = []
+        if not self._count:
+            self._current = max(self._current, target)
+            return due
+        bits = self._bits
+        while self._current < target and self._count:
+            self._current += 1
+            tick = self._current
+            for level in range(self.levels - 1, 0, -1):
+                if tick & ((1 << (bits * level)) - 1):
+                    continue
+                bucket = self._wheels[level][(tick >> (bits * level)) & self._mask]
+                if bucket:
+                    timers = list(bucket.values())
+                    bucket.clear()
+                    for timer in timers:
+                        self._insert(timer)
+            bucket = self._wheels[0][tick & self._mask]
+            if bucket:
+                for timer in bucket.values():
+                    timer.bucket = None
+                    due.append(timer)
+                self._count -= len(bucket)
+                bucket.clear()
+        self._current = max(self._current, target)
+        return due
+
+    def advance(self, now=None):
+        """
+        Dispara todos los temporizadores vencidos hasta `now`.
+
+        Los periódicos se reprograman a su siguiente plazo absoluto; si ya han vencido
+        varios plazos (el proceso estuvo parado), se salta al siguiente que no ha llegado.
+
+        Args:
+            now (float or None): Instante monótono actual (por defecto, time.monotonic()).
+
+        Returns:
+            int: Número de llamadas realizadas.
+        """
+        if now is None:
+            now = time.monotonic()
+        with self._lock:
+            due = self._collect(int((now - self._origin) / self.tick + 1e-9))
+        due.sort(key=lambda timer: timer.deadline)
+        for timer in due:
+            if timer.period is not None and not timer.cancelled:
+                deadline = timer.deadline + timer.period
+                if deadline <= now:
+                    deadline += (int((now - deadline) // timer.period) + 1) * timer.period
+                with self._lock:
+                    if not timer.cancelled:
+                        timer.deadline = deadline
+                        timer.expires = max(self._tick_of(deadline), self._current + 1)
+                        self._insert(timer)
+                        self._count += 1
+            if timer.cancelled:
+                continue
+            try:
+                timer.callback(*timer.args)
+            except Exception:
+                log.exception("Error en un temporizador")
+        self.fired += len(due)
+        return len(due)
+
+    def delay(self, now=None):
+        """
+        Calcula cuánto falta para el siguiente tick.
+
+        Args:
+            now (float or None): Instante monótono actual (por defecto, time.monotonic()).
+
+        Returns:
+            float: Segundos hasta el próximo tick.
+        """
+        if now is None:
+            now = time.monotonic()
+        return max(0.0, self._origin + (self._current + 1) * self.tick - now)
+
+    async def run_async(self):
+        """
+        Hace avanzar la rueda desde el bucle asyncio actual hasta que se cancele la tarea.
+
+        Returns:
+            None
+        """
+        while True:
+            self.advance()
+            await asyncio.sleep(self.delay())
+
+    def start(self):
+        """
+        Hace avanzar la rueda desde un hilo demonio propio.
+
+        Returns:
+            None
+        """
+        if self._thread is not None:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="timing-wheel", daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        while not self._stop.is_set():
+            self.advance()
+            self._stop.wait(self.delay())
+
+    def stop(self):
+        """
+        Detiene el hilo lanzado con `start`.
+
+        Returns:
+            None
+        """
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
@@ -0,0 +1,144 @@
+"""
+vclock.py
+
+Tiempo virtual y planificación por plazos absolutos para los relojes simulados.
+
+Un reloj que hace `publicar; hora += incremento; sleep(intervalo)` acumula en cada tick
+el tiempo que tarda en publicar y lo que se retrasa el propio sleep, así que tras horas
+de ejecución va por detrás. Aquí la hora no se guarda tick a tick: `VirtualClock` la
+calcula cuando se pide a partir de un ancla monótona,
+
+    hora = inicio + (ahora - t0) * velocidad
+
+y `Deadline` programa las publicaciones contra instantes absolutos (t0, t0 + periodo,
+t0 + 2·periodo...), de modo que un retraso en un tick no se arrastra a los siguientes.
+Un reloj al que nadie consulta no hace ningún trabajo.
+"""
+import time
+from datetime import datetime, timedelta
+
+TIME_FORMAT = "%H:%M:%S"
+
+
+class VirtualClock:
+    """
+    Reloj virtual que avanza `speed` segundos por cada segundo real.
+    """
+
+    def __init__(self, start, speed=1.0, t0=None):
+        """
+        Args:
+            start (str or datetime): Hora inicial ('HH:MM:SS' o datetime).
+            speed (float): Segundos virtuales por segundo real.
+            t0 (float or None): Instante monótono del ancla (por defecto, time.monotonic()).
+        """
+        self.speed = speed
+        self.set(start, t0)
+
+    def set(self, start, at=None):
+        """
+        Reancla el reloj: a partir del instante `at` marca la hora `start`.
+
+        Args:
+            start (str or datetime): Hora a marcar.
+            at (float or None): Instante monótono del ancla (por defecto, ahora).
+
+        Returns:
+            None
+        """
+        if isinstance(start, str):
+            start = datetime.strptime(start, TIME_FORMAT)
+        self.start = start
+        self.t0 = time.monotonic() if at is None else at
+
+    def now(self, at=None):
+        """
+        Calcula la hora virtual en un instante.
+
+        Args:
+            at (float or None): Instante monótono (por defecto, ahora).
+
+        Returns:
+            datetime: Hora virtual.
+        """
+        if at is None:
+            at = time.monotonic()
+        return self.start + timedelta(seconds=(at - self.t0) * self.speed)
+
+    def text(self, at=None):
+        """
+        Calcula la hora virtual en un instante, en formato 'HH:MM:SS'.
+
+        Args:
+            at (float or None): Instante monótono (por defecto, ahora).
+
+        Returns:
+            str: Hora virtual formateada.
+        """
+        return self.now(at).strftime(TIME_FORMAT)
+
+    def shift(self, seconds):
+        """
+        Adelanta (o atrasa, con valores negativos) la hora virtual.
+
+        Args:
+            seconds (float): Segundos virtuales a sumar.
+
+        Returns:
+            None
+        """
+        self.start += timedelta(seconds=seconds)
+
+
+class Deadline:
+    """
+    Secuencia de plazos absolutos separados por un periodo fijo.
+    """
+
+    def __init__(self, period, start=None):
+        """
+        Args:
+            period (float): Segundos entre plazos.
+            start (float or None): Primer plazo, en tiempo monótono (por defecto, ahora).
+
+        Raises:
+            ValueError: Si el periodo no es positivo.
+        """
+        if period <= 0:
+            raise ValueError("El periodo debe ser positivo")
+        self.period = period
+        self.next = time.monotonic() if start is None else start
+
+    def advance(self, now=None):
+        """
+        Pasa al siguiente plazo. Si ya han vencido varios (el proceso estuvo parado),
+        salta al primero que aún no ha llegado en lugar de recuperarlos en ráfaga.
+
+        Args:
+            now (float or None): Instante actual (por defecto, time.monotonic()).
+
+        Returns:
+            int: Número de plazos saltados sin atender.
+        """
+        if now is None:
+            now = time.monotonic()
+        self.next += self.period
+        skipped = 0
+        if self.next < now:
+            skipped = int((now - self.next) // self.period) + 1
+            self.next += skipped * self.period
+        return skipped
+
+    def remaining(self, now=None):
+        """
+        Calcula cuánto falta para el plazo actual.
+
+        Args:
+            now (float or None): Instante actual (por defecto, time.monotonic()).
+
+        Returns:
+            float: Segundos hasta el plazo (0 si ya ha vencido).
+        """
+        if now is None:
+            now = time.monotonic()
+        return max(0.0, self.next - now)
@@ -0,0 +1,5 @@
+"""
+Paquete del controlador domótico.
+
+Contiene el controlador principal (controller.py) y los módulos auxiliares que utiliza.
+"""
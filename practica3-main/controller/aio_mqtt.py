@@ -0,0 +1,182 @@
+"""
+aio_mqtt.py
+
+Cliente MQTT integrado en el bucle de eventos de asyncio.
+
+En el modo clásico el controlador arranca el hilo de red de paho (`loop_start`) junto al
+bucle de Discord, y cada mensaje entrante tiene que saltar de un hilo a otro. `AsyncioMqtt`
+envuelve un cliente de paho (o un `LoopbackClient`) y lo conduce desde el propio bucle de
+asyncio:
+
+- El socket de paho se registra con `loop.add_reader`/`loop.add_writer`, de modo que
+  `loop_read` y `loop_write` se ejecutan en el bucle cuando hay datos, sin hilo de red.
+- Una tarea periódica llama a `loop_misc` para los PING de keepalive y los reintentos.
+- Los callbacks (on_message, on_connect...) se ejecutan en el bucle, así que los manejadores
+  del controlador pueden resolver futuros directamente, sin `call_soon_threadsafe`.
+  Mientras se ejecuta uno, `in_callback` vale True: es el equivalente al hilo de red de
+  paho, en el que no se puede esperar (ver `controller.publisher`); las corrutinas del
+  bucle, como los comandos de Discord, sí pueden.
+- `apublish` permite esperar a que una publicación salga (o a su PUBACK con QoS 1), con un
+  límite de publicaciones en vuelo que actúa como control de flujo.
+
+El resto de atributos (subscribe, on_message, publish...) se delegan en el cliente envuelto.
+"""
+import asyncio
+import logging
+
+import paho.mqtt.client as mqtt
+
+MAX_INFLIGHT = 100  # Publicaciones esperando confirmación como máximo
+MISC_INTERVAL = 1.0  # Segundos entre llamadas a loop_misc
+CALLBACKS = ("on_connect", "on_disconnect", "on_message", "on_subscribe", "on_unsubscribe")
+
+log = logging.getLogger("controller.mqtt")
+
+
+class AsyncioMqtt:
+    """
+    Adaptador que ejecuta un cliente MQTT de paho sobre un bucle de asyncio.
+    """
+
+    def __init__(self, client, loop=None, max_inflight=MAX_INFLIGHT):
+        """
+        Asocia el cliente al bucle. Debe crearse antes de llamar a `connect`.
+
+        Args:
+            client (mqtt.Client or LoopbackClient): Cliente a envolver.
+            loop (asyncio.AbstractEventLoop or None): Bucle a usar (por defecto, el que está en ejecución).
+            max_inflight (int): Número máximo de publicaciones de `apublish` en vuelo.
+        """
+        self.__dict__["client"] = client
+        self.__dict__["loop"] = loop or asyncio.get_running_loop()
+        self.__dict__["_inflight"] = asyncio.Semaphore(max_inflight)
+        self.__dict__["_published"] = {}
+        self.__dict__["_misc_task"] = None
+        self.__dict__["_closing"] = False
+        self.__dict__["in_callback"] = False  # True mientras se ejecuta un callback MQTT
+        self.__dict__["_user_on_publish"] = client.on_publish
+        client.on_publish = self._on_publish
+        if hasattr(client, "attach_loop"):
+            client.attach_loop(self.loop)
+        else:
+            client.on_socket_open = self._on_socket_open
+            client.on_socket_close = self._on_socket_close
+            client.on_socket_register_write = self._on_socket_register_write
+            client.on_socket_unregister_write = self._on_socket_unregister_write
+
+    def __getattr__(self, name):
+        return getattr(self.client, name)
+
+    def __setattr__(self, name, value):
+        # on_publish lo gestiona el adaptador; el resto de callbacks van al cliente
+        if name == "on_publish":
+            self.__dict__["_user_on_publish"] = value
+        elif name in CALLBACKS and value is not None:
+            setattr(self.client, name, self._dispatching(value))
+        else:
+            setattr(self.client, name, value)
+
+    def _dispatching(self, callback):
+        """
+        Envuelve un callback para marcar `in_callback` mientras se ejecuta.
+        """
+        def run(*args, **kwargs):
+            previous = self.in_callback
+            self.__dict__["in_callback"] = True
+            try:
+                return callback(*args, **kwargs)
+            finally:
+                self.__dict__["in_callback"] = previous
+        return run
+
+    # Integración del socket de paho con el bucle
+
+    def _on_socket_open(self, client, userdata, sock):
+        self.loop.add_reader(sock, client.loop_read)
+        if self._misc_task is None:
+            self.__dict__["_misc_task"] = self.loop.create_task(self._misc_loop())
+
+    def _on_socket_close(self, client, userdata, sock):
+        self.loop.remove_reader(sock)
+        self.loop.remove_writer(sock)
+
+    def _on_socket_register_write(self, client, userdata, sock):
+        self.loop.add_writer(sock, client.loop_write)
+
+    def _on_socket_unregister_write(self, client, userdata, sock):
+        self.loop.remove_writer(sock)
+
+    async def _misc_loop(self):
+        """
+        Llama periódicamente a loop_misc (keepalive) y reconecta si se perdió la conexión.
+        """
+        while not self._closing:
+            await asyncio.sleep(MISC_INTERVAL)
+            if self.client.loop_misc() == mqtt.MQTT_ERR_NO_CONN and not self._closing:
+                try:
+                    self.client.reconnect()
+                except OSError as e:
+                    log.warning("error al reconectar con el broker: %s", e)
+
+    # Publicación con control de flujo
+
+    def _on_publish(self, client, userdata, mid, *args):
+        future = self._published.pop(mid, None)
+        if future is not None and not future.done():
+            future.set_result(mid)
+        if self._user_on_publish is not None:
+            self._dispatching(self._user_on_publish)(client, userdata, mid, *args)
+
+    async def apublish(self, topic, payload=None, qos=0, retain=False):
+        """
+        Publica un mensaje y espera a que el cliente confirme su envío.
+
+        Con QoS 0 la confirmación llega al escribir el paquete en el socket; con QoS 1, al
+        recibir el PUBACK del broker. Si ya hay `max_inflight` publicaciones sin confirmar,
+        espera a que se libere alguna antes de publicar.
+
+        Args:
+            topic (str): Topic de destino.
+            payload (str, bytes or None): Contenido del mensaje.
+            qos (int): Nivel de QoS.
+            retain (bool): Si el broker debe retener el mensaje.
+
+        Returns:
+            int: Código de resultado de paho (MQTT_ERR_SUCCESS si se publicó).
+        """
+        async with self._inflight:
+            info = self.client.publish(topic, payload, qos=qos, retain=retain)
+            if info.rc != mqtt.MQTT_ERR_SUCCESS or info.is_published():
+                return info.rc
+            future = self.loop.create_future()
+            self._published[info.mid] = future
+            try:
+                await future
+            finally:
+                self._published.pop(info.mid, None)
+            return info.rc
+
+    def inflight(self):
+        """
+        Devuelve el número de publicaciones de `apublish` pendientes de confirmación.
+
+        Returns:
+            int: Publicaciones en vuelo.
+        """
+        return len(self._published)
+
+    def close(self):
+        """
+        Desconecta el cliente y cancela la tarea de mantenimiento.
+
+        Returns:
+            None
+        """
+        self.__dict__["_closing"] = True
+        if self._misc_task is not None:
+            self._misc_task.cancel()
+            self.__dict__["_misc_task"] = None
+        self.client.disconnect()
+        for future in self._published.values():
+            future.cancel()
+        self._published.clear()
@@ -0,0 +1,120 @@
+"""
+cache.py
+
+Caché del último valor recibido en cada topic.
+
+Los sensores y relojes publican periódicamente aunque nadie les pregunte, así que el
+controlador puede responder a `!sensor` y `!watch` con la última lectura recibida si es
+suficientemente reciente, evitando un viaje de ida y vuelta al broker.
+"""
+import time
+
+
+class CachedValue:
+    """
+    Última lectura recibida en un topic.
+    """
+
+    __slots__ = ("value", "received_at", "seq")
+
+    def __init__(self, value, received_at, seq):
+        """
+        Inicializa una lectura cacheada.
+
+        Args:
+            value (any): Contenido del mensaje recibido.
+            received_at (float): Instante de recepción (reloj monótono, en segundos).
+            seq (int): Número de secuencia de la lectura dentro de su topic (empieza en 1).
+        """
+        self.value = value
+        self.received_at = received_at
+        self.seq = seq
+
+    def age(self, now=None):
+        """
+        Calcula la antigüedad de la lectura.
+
+        Args:
+            now (float or None): Instante de referencia (por defecto, time.monotonic()).
+
+        Returns:
+            float: Segundos transcurridos desde la recepción.
+        """
+        if now is None:
+            now = time.monotonic()
+        return now - self.received_at
+
+
+class LastValueCache:
+    """
+    Caché de la última lectura por topic con límite de antigüedad.
+
+    Solo el callback MQTT escribe en la caché; cada escritura sustituye la entrada completa,
+    por lo que los lectores del bucle de Discord siempre ven una lectura coherente.
+    """
+
+    def __init__(self):
+        """
+        Inicializa una caché vacía.
+        """
+        self._entries = {}
+
+    def put(self, topic, value, now=None):
+        """
+        Guarda una nueva lectura para un topic.
+
+        Args:
+            topic (str): Topic en el que se recibió el mensaje.
+            value (any): Contenido del mensaje.
+            now (float or None): Instante de recepción (por defecto, time.monotonic()).
+
+        Returns:
+            CachedValue: Entrada almacenada.
+        """
+        if now is None:
+            now = time.monotonic()
+        previous = self._entries.get(topic)
+        entry = CachedValue(value, now, previous.seq + 1 if previous else 1)
+        self._entries[topic] = entry
+        return entry
+
+    def get(self, topic):
+        """
+        Obtiene la última lectura de un topic, sea cual sea su antigüedad.
+
+        Args:
+            topic (str): Topic a consultar.
+
+        Returns:
+            CachedValue or None: Última lectura, o None si nunca se recibió nada.
+        """
+        return self._entries.get(topic)
+
+    def get_fresh(self, topic, max_age, now=None):
+        """
+        Obtiene la última lectura de un topic solo si no supera la antigüedad indicada.
+
+        Args:
+            topic (str): Topic a consultar.
+            max_age (float): Antigüedad máxima admitida en segundos.
+            now (float or None): Instante de referencia (por defecto, time.monotonic()).
+
+        Returns:
+            CachedValue or None: Lectura vigente, o None si no existe o está obsoleta.
+        """
+        entry = self._entries.get(topic)
+        if entry is None or entry.age(now) > max_age:
+            return None
+        return entry
+
+    def discard(self, topic):
+        """
+        Elimina la lectura de un topic (por ejemplo, al borrar el dispositivo).
+
+        Args:
+            topic (str): Topic a olvidar.
+
+        Returns:
+            None
+        """
+        self._entries.pop(topic, None)
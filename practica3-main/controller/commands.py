@@ -0,0 +1,336 @@
+"""
+commands.py
+
+Tabla de comandos de Discord del controlador.
+
+Cada comando se registra con su nombre, un parser de argumentos, el handler que lo
+ejecuta y su texto de ayuda (de la tabla se genera `!help`). Al despachar un mensaje:
+
+- se limita la frecuencia de comandos de cada usuario con un cubo de tokens y el número
+  de comandos en curso por usuario y por canal;
+- el handler se ejecuta como una tarea propia con timeout, de modo que un comando lento
+  no retrasa a los demás y, si se pasa de tiempo, el usuario recibe un aviso;
+- se mide la latencia de cada comando y se cuenta su resultado.
+
+Los handlers son corrutinas `handler(message, args, mqtt_client)` que devuelven el texto
+de la respuesta (o None para no responder). Un parser que lanza `UsageError` hace que se
+responda con el uso del comando.
+"""
+import asyncio
+import logging
+import math
+import time
+
+from common.ratelimit import TokenBucket
+
+PREFIX = "!"
+COMMAND_TIMEOUT = 15.0  # Segundos máximos de ejecución de un comando
+MAX_PER_USER = 3  # Comandos en curso por usuario
+MAX_PER_CHANNEL = 10  # Comandos en curso por canal
+USER_RATE = 1.0  # Comandos por segundo y usuario a largo plazo
+USER_BURST = 5  # Comandos seguidos permitidos por usuario
+MAX_USERS = 10000  # Usuarios distintos recordados como máximo
+
+log = logging.getLogger("controller.commands")
+
+
+class UsageError(ValueError):
+    """
+    Los argumentos de un comando no son válidos.
+    """
+
+
+def no_args(args):
+    """
+    Parser de los comandos sin argumentos.
+
+    Raises:
+        UsageError: Si se pasa algún argumento.
+    """
+    if args:
+        raise UsageError()
+    return args
+
+
+def one_arg(args):
+    """
+    Parser de los comandos con exactamente un argumento.
+
+    Returns:
+        str: El argumento.
+
+    Raises:
+        UsageError: Si no hay exactamente un argumento.
+    """
+    if len(args) != 1:
+        raise UsageError()
+    return args[0]
+
+
+class Command:
+    """
+    Entrada de la tabla de comandos.
+    """
+
+    __slots__ = ("name", "handler", "parse", "usage", "help", "timeout")
+
+    def __init__(self, name, handler, parse=None, usage="", help="", timeout=None):
+        """
+        Args:
+            name (str): Nombre del comando (sin prefijo).
+            handler (callable): Corrutina handler(message, args, mqtt_client) -> str or None.
+            parse (callable or None): Función lista de argumentos -> argumentos del handler;
+                None para pasar la lista tal cual.
+            usage (str): Argumentos del comando tal como aparecen en la ayuda.
+            help (str): Descripción breve para !help.
+            timeout (float or None): Segundos máximos de ejecución (None: el de la tabla).
+        """
+        self.name = name
+        self.handler = handler
+        self.parse = parse
+        self.usage = usage
+        self.help = help
+        self.timeout = timeout
+
+    def signature(self, prefix=PREFIX):
+        """
+        Returns:
+            str: Comando con sus argumentos, por ejemplo '!switch <id>'.
+        """
+        return f"{prefix}{self.name} {self.usage}".rstrip()
+
+
+class CommandRegistry:
+    """
+    Tabla de comandos con ejecución concurrente, límites por usuario y métricas.
+    """
+
+    def __init__(self, respond, prefix=PREFIX, timeout=COMMAND_TIMEOUT, per_user=MAX_PER_USER,
+                 per_channel=MAX_PER_CHANNEL, rate=USER_RATE, burst=USER_BURST, metrics=None):
+        """
+        Args:
+            respond (callable): Corrutina respond(message, texto) que envía una respuesta.
+            prefix (str): Prefijo de los comandos.
+            timeout (float): Segundos máximos de ejecución por defecto.
+            per_user (int): Comandos en curso permitidos por usuario.
+            per_channel (int): Comandos en curso permitidos por canal.
+            rate (float): Comandos por segundo y usuario (0 para no limitar).
+            burst (int): Comandos seguidos permitidos por usuario.
+            metrics (MetricsRegistry or None): Registro en el que publicar latencias y resultados.
+        """
+        self.respond = respond
+        self.prefix = prefix
+        self.timeout = timeout
+        self.per_user = per_user
+        self.per_channel = per_channel
+        self.rate = rate
+        self.burst = burst
+        self.commands = {}
+        self._buckets = {}
+        self._by_user = {}
+        self._by_channel = {}
+        self._latency = self._results = None
+        if metrics is not None:
+            self._latency = metrics.histogram("command_seconds", "Tiempo de ejecución de los comandos de Discord",
+                                              ("command",))
+            self._results = metrics.counter("commands_total", "Comandos de Discord por resultado",
+                                            ("command", "result"))
+            metrics.gauge("commands_in_flight", "Comandos de Discord en ejecución",
+                          fn=lambda: sum(self._by_user.values()))
+
+    def add(self, name, handler, parse=None, usage="", help="", timeout=None):
+        """
+        Registra un comando.
+
+        Args:
+            name (str): Nombre del comando (sin prefijo).
+            handler (callable): Corrutina handler(message, args, mqtt_client) -> str or None.
+            parse (callable or None): Parser de argumentos (ver `Command`).
+            usage (str): Argumentos del comando para la ayuda.
+            help (str): Descripción breve para !help.
+            timeout (float or None): Segundos máximos de ejecución.
+
+        Returns:
+            Command: Comando registrado.
+
+        Raises:
+            ValueError: Si ya hay un comando con ese nombre.
+        """
+        if name in self.commands:
+            raise ValueError(f"Comando duplicado: {name}")
+        command = self.commands[name] = Command(name, handler, parse, usage, help, timeout)
+        return command
+
+    def command(self, name, parse=None, usage="", help="", timeout=None):
+        """
+        Decorador equivalente a `add`.
+
+        Returns:
+            callable: Decorador que registra el handler y lo devuelve sin cambios.
+        """
+        def decorator(handler):
+            self.add(name, handler, parse, usage, help, timeout)
+            return handler
+        return decorator
+
+    def help_text(self):
+        """
+        Genera la ayuda de todos los comandos, en orden de registro.
+
+        Returns:
+            str: Ayuda en un bloque de código de Discord.
+        """
+        lines = ["Comandos disponibles:"]
+        lines.extend(f"{command.signature(self.prefix)} - {command.help}" for command in self.commands.values())
+        return "```" + "\n".join(lines) + "```"
+
+    def _count(self, name, result, elapsed=None):
+        if self._results is not None:
+            self._results.inc(labels=(name, result))
+        if elapsed is not None and self._latency is not None:
+            self._latency.observe(elapsed, labels=(name,))
+
+    def _admit(self, user, channel):
+        """
+        Comprueba los límites de un usuario y un canal.
+
+        Returns:
+            str or None: Motivo del rechazo, o None si se admite el comando.
+        """
+        # Los límites de comandos en curso se comprueban antes de gastar un token, para que
+        # un comando rechazado por ellos no consuma la cuota del usuario
+        if self._by_user.get(user, 0) >= self.per_user:
+            return "Tienes demasiados comandos en curso; espera a que terminen"
+        if self._by_channel.get(channel, 0) >= self.per_channel:
+            return "Hay demasiados comandos en curso en este canal; inténtalo en unos segundos"
+        if self.rate > 0:
+            bucket = self._buckets.get(user)
+            if bucket is None:
+                if len(self._buckets) >= MAX_USERS:
+                    self._buckets.clear()
+                bucket = self._buckets[user] = TokenBucket(self.rate, self.burst)
+            if not bucket.take():
+                return f"Demasiados comandos seguidos; espera {max(1, math.ceil(bucket.delay()))} s"
+        return None
+
+    async def _run(self, name, command, args, mqtt_client, message):
+        """
+        Ejecuta el handler de un comando con su timeout y cuenta el resultado.
+
+        Returns:
+            tuple: (respuesta, resultado 'ok', 'timeout' o 'error').
+        """
+        timeout = command.timeout if command.timeout is not None else self.timeout
+        start = time.perf_counter()
+        try:
+            response = await asyncio.wait_for(command.handler(message, args, mqtt_client), timeout)
+            result = "ok"
+        except asyncio.TimeoutError:
+            response = f"{self.prefix}{name}: sin respuesta en {timeout:g} s"
+            result = "timeout"
+        except Exception:
+            log.exception("error ejecutando el comando", extra={"command": name})
+            response = f"Error ejecutando {self.prefix}{name}"
+            result = "error"
+        self._count(name, result, time.perf_counter() - start)
+        return response, result
+
+    @staticmethod
+    def _release(counts, key):
+        counts[key] -= 1
+        if not counts[key]:
+            del counts[key]
+
+    def _split(self, content):
+        """
+        Separa un mensaje en nombre de comando y argumentos.
+
+        Returns:
+            tuple or None: (nombre, lista de argumentos), o None si no es un comando.
+        """
+        content = content.strip()
+        if not content.startswith(self.prefix):
+            return None
+        name, *args = content[len(self.prefix):].split() or [""]
+        return name, args
+
+    async def execute(self, content, mqtt_client, message=None):
+        """
+        Ejecuta un comando y devuelve su respuesta, sin límites por usuario ni envío a Discord.
+
+        Lo usan los workers del modo repartido (ver `controller.sharding`) para los comandos
+        que les reenvía el front end, que ya ha aplicado los límites.
+
+        Args:
+            content (str): Texto del comando.
+            mqtt_client (mqtt.Client): Cliente MQTT que se pasa al handler.
+            message (discord.Message or None): Mensaje original, si lo hay.
+
+        Returns:
+            str or None: Respuesta del comando (o el aviso de uso, error o timeout).
+        """
+        split = self._split(content)
+        if split is None:
+            return None
+        name, args = split
+        command = self.commands.get(name)
+        if command is None:
+            self._count("unknown", "unknown")
+            return f"Comando no reconocido. Usa {self.prefix}help"
+        if command.parse is not None:
+            try:
+                args = command.parse(args)
+            except UsageError:
+                self._count(name, "usage")
+                return f"Uso: {command.signature(self.prefix)}"
+        response, _ = await self._run(name, command, args, mqtt_client, message)
+        return response
+
+    async def dispatch(self, message, mqtt_client):
+        """
+        Interpreta un mensaje de Discord y, si es un comando, lo ejecuta y responde.
+
+        Args:
+            message (discord.Message): Mensaje recibido.
+            mqtt_client (mqtt.Client): Cliente MQTT que se pasa a los handlers.
+
+        Returns:
+            str or None: Resultado ('ok', 'usage', 'unknown', 'throttled', 'timeout' o
+            'error'), o None si el mensaje no es un comando.
+        """
+        split = self._split(message.content)
+        if split is None:
+            return None
+        name, args = split
+        command = self.commands.get(name)
+        if command is None:
+            self._count("unknown", "unknown")
+            await self.respond(message, f"Comando no reconocido. Usa {self.prefix}help")
+            return "unknown"
+        if command.parse is not None:
+            try:
+                args = command.parse(args)
+            except UsageError:
+                self._count(name, "usage")
+                await self.respond(message, f"Uso: {command.signature(self.prefix)}")
+                return "usage"
+
+        author = getattr(message, "author", None)
+        user = getattr(author, "id", author)
+        channel = getattr(message.channel, "id", message.channel)
+        refused = self._admit(user, channel)
+        if refused is not None:
+            self._count(name, "throttled")
+            await self.respond(message, refused)
+            return "throttled"
+
+        self._by_user[user] = self._by_user.get(user, 0) + 1
+        self._by_channel[channel] = self._by_channel.get(channel, 0) + 1
+        try:
+            response, result = await self._run(name, command, args, mqtt_client, message)
+        finally:
+            self._release(self._by_user, user)
+            self._release(self._by_channel, channel)
+        if response is not None:
+            await self.respond(message, response)
+        return result
@@ -1,15 +1,102 @@
 import argparse
+import asyncio
 import discord
 import json
+import logging
+import os
 import sys
 import signal
+import time
 import paho.mqtt.client as mqtt
 
+# Permitir ejecutar el controlador como script (python controller/controller.py)
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from common.codec import Reading, decode_binary, is_binary
+from common.log import add_arguments as add_log_arguments, setup_from_args as setup_logging
+from common.metrics import MetricsRegistry, start_http_server
+from common.switch_command import format_command, is_command, new_command_id, parse_reply, state_topic
+from common.timing_wheel import TimingWheel
+from controller.aio_mqtt import AsyncioMqtt
+from controller.cache import LastValueCache
+from controller.commands import CommandRegistry, UsageError, no_args, one_arg
+from controller.discord_queue import ReplyQueue
+from controller.journal import DeviceJournal
+from controller.liveness import LivenessMonitor
+from controller.pending import PendingRequests
+from controller.provision import DEVICE_TYPES, parse_manifest, provision, summarize
+from controller.publisher import QOS_BY_CLASS, OutboundPublisher
+from controller.registry import DeviceRegistry
+from controller.router import TopicRouter, parse_device_topic
+from controller.rule_executor import RuleExecutor
+from controller.rules import ALL_TARGETS, RuleEngine
+from controller.shadow import SwitchShadow
+from controller.sharding import DEVICES_TOPIC, REPLY_TOPIC, VNODES, HashRing, ShardClient, worker_name
+
 # Variables globales
 device_data = {"device_last_id": 3, "devices": {"1": "sensor", "2": "switch", "3": "watch"}}
-latest_message = None
-message_flag = 0
+pending_requests = PendingRequests()  # Peticiones a dispositivos esperando respuesta
+last_values = LastValueCache()  # Última lectura recibida en cada topic
+REQUEST_TIMEOUT = 5.0  # Segundos máximos de espera por la respuesta de un dispositivo
+CACHE_MAX_AGE = 5.0  # Antigüedad máxima (s) de una lectura para responder desde la caché
 DEVICES_FILE = "data/devices.json"  # Ruta al archivo de persistencia
+RULES_FILE = "data/rules.json"  # Ruta al archivo de reglas
+TOPIC_BASE = "redes2/2312/1"
+# Regla por defecto si no hay fichero de reglas: temperatura > 25 conmuta todos los switches
+DEFAULT_RULES = [{"name": "temperatura_alta", "source": "sensor_+",
+                  "condition": {"op": ">", "value": 25}, "targets": ALL_TARGETS, "action": "TOGGLE"}]
+rule_engine = RuleEngine(TOPIC_BASE, DEFAULT_RULES)
+registry = DeviceRegistry(device_data, TOPIC_BASE)  # Índices por tipo e ID sobre device_data
+DEVICES_PER_PAGE = 20  # Dispositivos por página en !devices
+mqtt_client = None  # Cliente MQTT del controlador (se crea en launch_bot)
+journal = None  # Journal de cambios de dispositivos (se abre al cargar o con el primer cambio)
+publisher = None  # Cola de publicaciones salientes (se crea en launch_bot; sin ella se publica directamente)
+PUBLISH_QOS = dict(QOS_BY_CLASS)  # QoS por clase de mensaje: 'command' (órdenes) y 'request' (consultas)
+LIVENESS_TIMEOUT = None  # Segundos sin mensajes para dar un dispositivo por perdido (None: no se vigila)
+timers = TimingWheel(tick=0.1)  # Temporizadores compartidos del controlador (se arranca en launch_bot)
+liveness = None  # Vigilancia de dispositivos silenciosos (se crea en launch_bot si hay LIVENESS_TIMEOUT)
+shadow = SwitchShadow()  # Estado deseado e informado de cada switch
+RECONCILE_INTERVAL = 2.0  # Segundos entre pasadas del reconciliador de switches (0: desactivado)
+RECONCILE_BATCH = 200  # Switches reconciliados como máximo por pasada
+owns = None  # En un worker: función ID -> bool que indica si el dispositivo es de su partición
+shards = None  # En el front end del modo repartido: ShardClient hacia los workers
+device_listeners = []  # Funciones a las que se pasa cada alta o baja (con el formato del journal)
+RULE_WORKERS = None  # Procesos para las reglas con executor 'process' (None: uno por núcleo; 0: evaluarlas en línea)
+rule_executor = None  # Evaluación de reglas en otros procesos (se crea si alguna regla lo pide)
+
+log = logging.getLogger("controller")
+
+# Métricas del controlador (endpoint --metrics-port y comando !stats)
+metrics = MetricsRegistry()
+messages_in = metrics.counter("mqtt_messages_in_total", "Mensajes MQTT recibidos por tipo de topic", ("class",))
+messages_out = metrics.counter("mqtt_messages_out_total", "Mensajes MQTT publicados por clase", ("class",))
+rule_evaluations = metrics.counter("rule_evaluations_total", "Lecturas evaluadas por el motor de reglas")
+rule_firings = metrics.counter("rule_firings_total", "Reglas disparadas por acción", ("action",))
+request_latency = metrics.histogram("device_request_seconds",
+                                    "Tiempo de ida y vuelta de las peticiones a dispositivos", ("class",))
+request_timeouts = metrics.counter("device_request_timeouts_total",
+                                   "Peticiones a dispositivos sin respuesta a tiempo", ("class",))
+cache_hits = metrics.counter("cache_hits_total", "Consultas respondidas desde la caché", ("class",))
+switch_retries = metrics.counter("switch_command_retries_total", "Reenvíos de órdenes a switches sin confirmar")
+metrics.gauge("pending_requests", "Peticiones esperando respuesta de un dispositivo",
+              fn=lambda: pending_requests.pending_count())
+metrics.gauge("publish_queue_depth", "Publicaciones en la cola de salida",
+              fn=lambda: publisher.depth() if publisher is not None else 0)
+metrics.gauge("publish_unacked", "Publicaciones sin confirmar por el broker",
+              fn=lambda: publisher.unacked() if publisher is not None else 0)
+metrics.gauge("devices_registered", "Dispositivos registrados por tipo", ("type",),
+              fn=lambda: {tipo: registry.count(tipo) for tipo in DEVICE_TYPES})
+replies = ReplyQueue(metrics=metrics)  # Cola de respuestas a Discord por canal
+metrics.gauge("discord_reply_queue_depth", "Respuestas esperando a enviarse a Discord", fn=lambda: replies.depth())
+metrics.gauge("devices_silent", "Dispositivos que han superado el timeout de actividad",
+              fn=lambda: len(liveness.silent) if liveness is not None else 0)
+reconcile_commands = metrics.counter("switch_reconcile_commands_total",
+                                     "Órdenes reenviadas por el reconciliador a switches fuera de su estado deseado")
+metrics.gauge("switches_out_of_sync", "Switches cuyo estado informado no es el deseado", fn=lambda: shadow.out_of_sync())
+rule_offloaded = metrics.counter("rule_offloaded_total", "Evaluaciones de reglas enviadas a otros procesos por resultado",
+                                 ("result",))
+metrics.gauge("rule_executor_backlog", "Evaluaciones de reglas pendientes en otros procesos",
+              fn=lambda: rule_executor.backlog() if rule_executor is not None else 0)
 
 # Función para obtener el TOKEN de un archivo
 
@@ -51,6 +138,7 @@ def signal_handler(sig, frame):
     """
     print("Finalizando... Ctrl+C detectado")
     save_devices()
+    stop_rule_executor()
     sys.exit(0)
 
 # Enviar mensaje al canal de Discord
@@ -59,6 +147,10 @@ async def respond_discord(message, response):
     """
     Envía una respuesta al mismo canal de Discord donde se recibió el mensaje del usuario.
 
+    La respuesta pasa por la cola del canal (ver `controller.discord_queue`), que la agrupa
+    con otras respuestas cercanas, la trocea si supera el límite de Discord y la reintenta
+    si Discord limita la frecuencia de envío.
+
     Args:
         message (discord.Message): El mensaje original recibido por el bot.
         response (str): El contenido de texto que se desea enviar como respuesta.
@@ -67,13 +159,9 @@ async def respond_discord(message, response):
         None
 
     Exceptions:
-        Captura cualquier excepción que ocurra al intentar enviar el mensaje
-        y la imprime por consola.
+        No propaga los errores de envío: la cola los registra en el log.
     """
-    try:
-        await message.channel.send(response)
-    except Exception as e:
-        print("Error enviando mensaje Discord:", e)
+    await replies.send(message.channel, response)
 
 # MQTT: Conexión
 
@@ -81,8 +169,9 @@ def on_connect(client, userdata, flags, rc):
     """
     Callback que se ejecuta cuando el cliente MQTT se conecta exitosamente al broker.
 
-    Suscribe automáticamente al cliente a los topics relevantes del sistema domótico
-    (sensores, switches y reloj). Muestra por consola si la conexión fue exitosa o fallida.
+    Suscribe al cliente con un comodín a todos los topics de dispositivos del grupo, de modo
+    que también se reciben los dispositivos añadidos con !add_device, y a los topics de
+    estado retenido de los switches. Muestra por consola si la conexión fue exitosa o fallida.
 
     Args:
         client (paho.mqtt.client.Client): Instancia del cliente MQTT conectado.
@@ -95,11 +184,17 @@ def on_connect(client, userdata, flags, rc):
     """
     if rc == 0:
         print("Conexión exitosa al broker MQTT.")
-        topics = ["sensor_2", "switch_2", "watch_2"]
-        for topic in topics:
-            full_topic = f"redes2/2312/1/{topic}"
-            client.subscribe(full_topic)
-            print(f"Suscrito al topic: {full_topic}")
+        if publisher is not None and publisher.loop is None:
+            # on_connect se ejecuta en el hilo de red de paho, que nunca debe esperar a la cola
+            publisher.bind_network_thread()
+        if shards is not None:
+            # Front end del modo repartido: los dispositivos los atienden los workers
+            client.subscribe(REPLY_TOPIC, qos=1)
+            print(f"Suscrito al topic: {REPLY_TOPIC}")
+            return
+        topics = [f"{TOPIC_BASE}/+", f"{TOPIC_BASE}/state/+"]
+        client.subscribe([(topic, 0) for topic in topics])
+        print(f"Suscrito a los topics: {', '.join(topics)}")
     else:
         print(f"Error de conexión al broker MQTT. Código de error: {rc}")
 
@@ -110,8 +205,10 @@ def on_mqtt_message(client, userdata, msg):
     """
     Callback que se ejecuta cuando el cliente MQTT recibe un mensaje en un topic suscrito.
 
-    Decodifica el mensaje recibido, lo almacena en una variable global para ser procesado
-    posteriormente y activa una bandera que indica que se ha recibido un nuevo mensaje.
+    Decodifica el mensaje recibido y lo entrega, a través del enrutador de topics, a los
+    handlers registrados para ese tipo de dispositivo. Los mensajes de texto se entregan
+    como str; las lecturas en la codificación binaria de `common.codec`, como `Reading`
+    (sin pasar por texto), después de comprobar que su tipo e ID son los de su topic.
 
     Args:
         client (paho.mqtt.client.Client): Instancia del cliente MQTT que recibió el mensaje.
@@ -121,22 +218,243 @@ def on_mqtt_message(client, userdata, msg):
     Returns:
         None
     """
-    global latest_message, message_flag
-    latest_message = msg.payload.decode("utf-8")
-    print(f"Mensaje recibido:\n\tTopic: {msg.topic}\n\tContenido: {latest_message}")
-    message_flag = 1
+    if is_binary(msg.payload):
+        try:
+            message = decode_binary(msg.payload)
+        except ValueError as e:
+            log.warning("mensaje binario descartado: %s", e, extra={"topic": msg.topic})
+            return
+        if parse_device_topic(msg.topic) != (message.tipo, message.device_id):
+            log.warning("mensaje binario descartado: no corresponde a su topic",
+                        extra={"topic": msg.topic, "type": message.tipo, "device": message.device_id})
+            return
+    else:
+        message = msg.payload.decode("utf-8")
+    if shards is not None and msg.topic == REPLY_TOPIC:
+        if isinstance(message, str):
+            shards.handle_reply(message)
+        return
+    if log.isEnabledFor(logging.DEBUG):
+        log.debug("mensaje recibido", extra={"topic": msg.topic, "payload": message})
+    messages_in.inc(labels=(topic_class(msg.topic),))
+    router.dispatch(msg.topic, message)
+
+
+def topic_class(topic):
+    """
+    Clasifica un topic para las métricas: tipo de dispositivo o último nivel del topic.
+
+    Args:
+        topic (str): Topic MQTT, por ejemplo 'redes2/2312/1/sensor_4'.
+
+    Returns:
+        str: Clase del topic (por ejemplo 'sensor' o 'add_device').
+    """
+    device = parse_device_topic(topic)
+    if device is not None:
+        return device[0]
+    return topic.rpartition("/")[2]
+
+
+def handle_device_reply(topic, message):
+    """
+    Handler común a todos los dispositivos: registra las respuestas recibidas.
+
+    Guarda la respuesta en la caché de últimos valores y completa las peticiones pendientes
+    registradas sobre su topic. Los mensajes vacíos o que contienen órdenes del propio
+    controlador (eco de nuestras publicaciones) no se consideran respuestas.
+
+    Los switches responden en el topic del ID siguiente, que es el de otro switch, así que
+    de sus topics solo se toman las confirmaciones con identificador de orden, que
+    completan la orden pendiente sin guardarse ni atribuirse a ningún switch; su actividad
+    se registra desde su topic de estado (`handle_switch_state`) y al confirmar una orden
+    (`command_switch`).
+
+    Args:
+        topic (str): Topic en el que se recibió el mensaje.
+        message (str or Reading): Contenido decodificado del mensaje.
+
+    Returns:
+        None
+    """
+    if isinstance(message, Reading):
+        # Lectura binaria: se guarda su texto legible para las consultas
+        message = message.text()
+    if not message or is_command(message):
+        return
+    device = parse_device_topic(topic)
+    if device is not None and device[0] == "switch":
+        reply = parse_reply(message)
+        if reply is not None:
+            state, command_id = reply
+            pending_requests.resolve(f"ack:{command_id}", state)
+        return
+    last_values.put(topic, message)
+    pending_requests.resolve(topic, message)
+    if device is not None:
+        device_seen(device[1])
+
+
+def device_seen(device_id):
+    """
+    Registra actividad de un dispositivo: su último mensaje y su vigilancia.
+
+    Args:
+        device_id (str): ID del dispositivo.
+
+    Returns:
+        None
+    """
+    registry.touch(device_id)
+    if liveness is not None:
+        liveness.seen(device_id)
+
+
+def watch_devices(ids=None):
+    """
+    Empieza a vigilar dispositivos que todavía no han publicado.
+
+    Así se detectan también los que no llegan a publicar nunca (ver `LivenessMonitor.watch`).
+    En un worker solo se vigilan los de su partición.
+
+    Args:
+        ids (iterable[str] or None): IDs a vigilar (por defecto, todos los registrados).
+
+    Returns:
+        None
+    """
+    if liveness is None:
+        return
+    if ids is None:
+        ids = list(device_data.get("devices", {}))
+    for device_id in ids:
+        if owns is None or owns(device_id):
+            liveness.watch(device_id)
 
-    if "sensor" in msg.topic:
-        process_sensor_message(msg.topic, latest_message)
+
+def on_liveness_change(device_id, alive):
+    """
+    Avisa en el log cuando un dispositivo deja de publicar o vuelve a hacerlo.
+
+    Args:
+        device_id (str): ID del dispositivo.
+        alive (bool): True si ha vuelto a publicar, False si ha superado el timeout.
+
+    Returns:
+        None
+    """
+    if alive:
+        log.info("dispositivo activo de nuevo", extra={"device": device_id})
+    else:
+        log.warning("dispositivo sin actividad", extra={"device": device_id, "timeout": LIVENESS_TIMEOUT})
+
+
+def handle_switch_state(topic, message):
+    """
+    Handler de los topics de estado retenido de los switches: actualiza su sombra, registra
+    la actividad del switch y completa las órdenes pendientes que esperan su estado.
+
+    Args:
+        topic (str): Topic de estado, por ejemplo 'redes2/2312/1/state/switch_2'.
+        message (str): Estado publicado ('ON' u 'OFF').
+
+    Returns:
+        None
+    """
+    if message not in ("ON", "OFF"):
+        return
+    device_id = topic.rpartition("_")[2]
+    if shadow.report(device_id, message) and log.isEnabledFor(logging.DEBUG):
+        log.debug("estado de switch actualizado", extra={"device": device_id, "state": message})
+    device_seen(device_id)
+    pending_requests.resolve(topic, message)
+
+
+def handle_sensor_reading(topic, message):
+    """
+    Handler de los topics de sensores: pasa la lectura al motor de reglas.
+
+    De las lecturas binarias se pasa directamente su valor numérico.
+
+    Args:
+        topic (str): Topic del sensor.
+        message (str or Reading): Contenido decodificado del mensaje.
+
+    Returns:
+        None
+    """
+    process_sensor_message(topic, message.value if isinstance(message, Reading) else message)
+
+
+# Rutas de los mensajes MQTT recibidos (se evalúan en orden de registro)
+router = TopicRouter()
+# Respuestas solo en los topics de dispositivo: ni los de estado ni los de control (add_device...)
+router.add(f"{TOPIC_BASE}/sensor_+", handle_device_reply)
+router.add(f"{TOPIC_BASE}/switch_+", handle_device_reply)
+router.add(f"{TOPIC_BASE}/watch_+", handle_device_reply)
+router.add(f"{TOPIC_BASE}/sensor_+", handle_sensor_reading)
+router.add(f"{TOPIC_BASE}/state/switch_+", handle_switch_state)
 
 # Gestionar dispositivos
 
+def get_journal():
+    """
+    Obtiene el journal de cambios asociado a DEVICES_FILE, abriéndolo si hace falta.
+
+    Si el journal se abre sin haber llamado antes a `load_devices`, se toma como estado
+    base el contenido actual de `device_data` (y se escribe como snapshot si no coincide
+    con el que hay en disco).
+
+    Args:
+        None
+
+    Returns:
+        DeviceJournal: Journal en uso.
+    """
+    global journal
+    if journal is None or journal.snapshot_path != DEVICES_FILE:
+        if journal is not None:
+            journal.close()
+        journal = DeviceJournal(DEVICES_FILE, metrics=metrics)
+        try:
+            state = journal.open()
+        except (OSError, ValueError):
+            state = None
+        if state != device_data:
+            write_base_snapshot(journal)
+    return journal
+
+
+def write_base_snapshot(journal):
+    """
+    Escribe `device_data` como snapshot del journal, que pasa a ser su estado base.
+
+    Los cambios del journal se aplican sobre el snapshot al cargar, así que si el
+    controlador continúa con un estado que no está en disco (por ejemplo, los valores por
+    defecto porque no había snapshot) hay que escribirlo antes del primer cambio; si no, al
+    reiniciar se perdería.
+
+    Args:
+        journal (DeviceJournal): Journal recién abierto.
+
+    Returns:
+        None
+    """
+    try:
+        journal.checkpoint(device_data)
+    except OSError as e:
+        journal.rebase(device_data)
+        print(f"No se pudo escribir '{DEVICES_FILE}'. Error: {e}")
+
+
 def save_devices():
     """
     Guarda el estado actual de los dispositivos en un archivo JSON.
 
-    Serializa el diccionario global `device_data` y lo almacena en el archivo 'devices.json',
-    permitiendo persistencia de datos entre ejecuciones del programa.
+    Escribe un snapshot completo del diccionario global `device_data` en DEVICES_FILE
+    mediante un fichero temporal que sustituye atómicamente al anterior, y vacía el
+    journal de cambios. Se usa al salir del programa; las altas y bajas normales solo
+    añaden una línea al journal.
 
     Args:
         None
@@ -149,20 +467,19 @@ def save_devices():
         y muestra un mensaje de error por consola.
     """
     try:
-        with open("data/devices.json", "w") as f:
-            json.dump(device_data, f, indent=4)
-        print("Estado de dispositivos guardado correctamente en 'data/devices.json'.")
+        get_journal().checkpoint(device_data)
+        print(f"Estado de dispositivos guardado correctamente en '{DEVICES_FILE}'.")
     except Exception as e:
         print("Error guardando dispositivos:", e)
 
 
 def load_devices():
     """
-    Carga el estado de los dispositivos desde un archivo JSON.
+    Carga el estado de los dispositivos desde el snapshot JSON y su journal de cambios.
 
-    Lee el archivo 'devices.json' y actualiza el diccionario global `device_data`
-    con los datos almacenados. Si el archivo no existe o contiene errores,
-    se imprime un mensaje de advertencia y se mantiene el estado por defecto.
+    Lee DEVICES_FILE, aplica encima los cambios posteriores registrados en el journal y
+    actualiza el diccionario global `device_data` con el resultado. Si el archivo no existe
+    o contiene errores, se imprime un mensaje de advertencia y se mantiene el estado por defecto.
 
     Args:
         None
@@ -174,22 +491,27 @@ def load_devices():
         Captura cualquier excepción durante la lectura o parseo del archivo
         y continúa la ejecución utilizando los valores iniciales por defecto.
     """
-    global device_data
+    global journal
+    if journal is not None:
+        journal.close()
+    journal = DeviceJournal(DEVICES_FILE, metrics=metrics)
     try:
-        with open("data/devices.json", "r") as f:
-            new_data = json.load(f)
-            device_data.clear()
-            device_data.update(new_data)
-        print("Dispositivos cargados correctamente desde 'data/devices.json'.")
+        new_data = journal.open()
+        device_data.clear()
+        device_data.update(new_data)
+        registry.rebuild()
+        print(f"Dispositivos cargados correctamente desde '{DEVICES_FILE}'.")
     except Exception as e:
-        print(f"No se pudo cargar 'devices.json'. Usando datos por defecto. Error: {e}")
+        print(f"No se pudo cargar '{DEVICES_FILE}'. Usando datos por defecto. Error: {e}")
+        write_base_snapshot(journal)
 
 def add_device(tipo):
     """
     Añade un nuevo dispositivo al sistema domótico.
 
     Incrementa el contador global de IDs, agrega un nuevo dispositivo del tipo especificado
-    al diccionario `device_data`, y guarda el estado actualizado en el archivo 'devices.json'.
+    al registro (que actualiza `device_data` y sus índices), y registra el alta en el
+    journal de cambios sin esperar a que se escriba en disco.
 
     Args:
         tipo (str): El tipo de dispositivo a añadir (por ejemplo, 'sensor', 'switch', 'watch').
@@ -197,19 +519,53 @@ def add_device(tipo):
     Returns:
         bool: True si el dispositivo añadido es de tipo 'switch', False en otro caso.
     """
-    device_data["device_last_id"] += 1
-    device_data["devices"][str(device_data["device_last_id"])] = tipo
-    save_devices()
+    device_id = registry.add(tipo)
+    get_journal().append("add", id=device_id, type=tipo)
+    watch_devices([device_id])
+    notify_device_change({"op": "add", "id": device_id, "type": tipo})
     return tipo == "switch"
 
 
+def notify_device_change(record):
+    """
+    Avisa de un alta o baja a las funciones de `device_listeners`.
+
+    Args:
+        record (dict): Cambio con el formato del journal (ver `controller.journal`).
+
+    Returns:
+        None
+    """
+    for listener in device_listeners:
+        listener(record)
+
+
+def add_devices(ranges):
+    """
+    Da de alta varios dispositivos de una vez.
+
+    Reserva un tramo de IDs consecutivos, actualiza el registro en una sola operación y
+    registra el alta como un único cambio en el journal (ver `controller.provision`).
+
+    Args:
+        ranges (list[tuple]): Pares (tipo, cantidad) ya validados.
+
+    Returns:
+        list[str]: IDs asignados, en orden.
+    """
+    ids = provision(registry, get_journal(), ranges)
+    watch_devices(ids)
+    if ids:
+        notify_device_change({"op": "add_range", "id": ids[0], "ranges": [[tipo, count] for tipo, count in ranges]})
+    return ids
+
 def remove_device(device_id):
     """
     Elimina un dispositivo del sistema domótico según su ID.
 
     Busca y elimina el dispositivo correspondiente en el diccionario `device_data`
-    usando el identificador proporcionado. Posteriormente guarda el estado actualizado
-    en el archivo 'devices.json'. Si el ID no existe, no realiza ninguna acción.
+    usando el identificador proporcionado y registra la baja en el journal de cambios.
+    Si el ID no existe, no realiza ninguna acción.
 
     Args:
         device_id (str): ID del dispositivo que se desea eliminar.
@@ -217,47 +573,770 @@ def remove_device(device_id):
     Returns:
         None
     """
-    device_data["devices"].pop(device_id, None)
-    save_devices()
+    tipo = registry.remove(device_id)
+    if tipo is not None:
+        last_values.discard(f"{TOPIC_BASE}/{tipo}_{device_id}")
+        get_journal().append("remove", id=device_id)
+        notify_device_change({"op": "remove", "id": device_id})
+        if liveness is not None:
+            liveness.forget(device_id)
+        if tipo == "switch":
+            shadow.forget(device_id)
 
-def process_sensor_message(message):
+def load_rules(filepath=None):
     """
-    Procesa el mensaje de un sensor para decidir si desencadena una acción.
+    Carga las reglas del controlador desde un archivo JSON.
+
+    Si el archivo no existe o contiene errores, se imprime un aviso y se mantienen
+    las reglas actuales (por defecto, DEFAULT_RULES).
 
     Args:
-        message (str): Mensaje recibido del sensor (por ejemplo, una temperatura).
+        filepath (str or None): Ruta del fichero de reglas (por defecto RULES_FILE).
 
     Returns:
-        str or None: Acción a realizar (por ejemplo, 'TOGGLE') o None si no aplica.
+        None
     """
+    if filepath is None:
+        filepath = RULES_FILE
     try:
-        temp = float(message)
-        if temp > 25:
-            return "TOGGLE"
-    except ValueError:
-        pass
-    return None
+        count = rule_engine.load_file(filepath)
+        print(f"{count} reglas cargadas correctamente desde '{filepath}'.")
+    except (OSError, ValueError) as e:
+        print(f"No se pudieron cargar las reglas de '{filepath}'. Usando reglas actuales. Error: {e}")
 
 
-def publish_action(action, mqtt_client):
+def start_rule_executor():
     """
-    Publica una acción a realizar por un switch en el topic correspondiente.
+    Arranca la evaluación en otros procesos si alguna regla cargada la pide.
+
+    Con RULE_WORKERS a 0, o sin reglas con executor 'process', todas las reglas se evalúan
+    en línea y no se crea ningún proceso.
+
+    Returns:
+        RuleExecutor or None: Executor arrancado, o None si no hace falta.
+    """
+    global rule_executor
+    if rule_executor is None and RULE_WORKERS != 0 and any(rule.executor == "process" for rule in rule_engine.rules):
+        rule_executor = RuleExecutor(lambda rule, topic: fire_rule(rule), workers=RULE_WORKERS)
+        rule_executor.start()
+    return rule_executor
+
+
+def stop_rule_executor():
+    """
+    Evalúa lo pendiente y cierra los procesos de evaluación de reglas, si los hay.
+
+    Returns:
+        None
+    """
+    global rule_executor
+    if rule_executor is not None:
+        rule_executor.close()
+        rule_executor = None
+
+
+def fire_rule(rule):
+    """
+    Aplica una regla disparada: cuenta el disparo y publica su acción en los switches destino.
+
+    Args:
+        rule (Rule): Regla que se ha disparado.
+
+    Returns:
+        None
+    """
+    rule_firings.inc(labels=(rule.action,))
+    if mqtt_client is not None:
+        targets = None if rule.targets == ALL_TARGETS else rule.targets
+        publish_action(rule.action, mqtt_client, targets)
+
+
+def process_sensor_message(topic, message):
+    """
+    Procesa el mensaje de un sensor evaluando las reglas asociadas a su topic.
+
+    Cada regla que se dispara publica su acción en los switches destino. Si hay un
+    `rule_executor`, las reglas con executor 'process' solo se encolan y su acción se
+    publica cuando termina su evaluación en otro proceso.
+
+    Args:
+        topic (str): Topic del sensor que envió el mensaje.
+        message (str or float): Mensaje recibido del sensor (por ejemplo, una temperatura)
+            o su valor ya decodificado.
+
+    Returns:
+        list[str]: Acciones disparadas en línea (por ejemplo, ['TOGGLE']); vacía si no aplica
+        ninguna.
+    """
+    deferred = [] if rule_executor is not None else None
+    fired = rule_engine.evaluate(topic, message, deferred)
+    rule_evaluations.inc()
+    for rule in fired:
+        fire_rule(rule)
+    for rule, values in deferred or ():
+        accepted = rule_executor.submit(rule, topic, values)
+        rule_offloaded.inc(labels=("queued" if accepted else "dropped",))
+    return [rule.action for rule in fired]
+
+
+def publish_action(action, mqtt_client, targets=None):
+    """
+    Publica una acción a realizar por uno o varios switches en sus topics.
+
+    Si hay una cola de publicación configurada, las órdenes se encolan (con la QoS de la
+    clase 'command') y esta función espera si la cola está llena. Las acciones actualizan
+    además el estado deseado de los switches en la sombra (TOGGLE, al contrario del
+    informado; ver `SwitchShadow.expect_toggle`).
 
     Args:
         action (str): Acción a realizar (por ejemplo, 'TOGGLE').
         mqtt_client (mqtt.Client): Cliente MQTT para enviar el mensaje.
+        targets (list[str] or None): IDs de los switches destino; None para todos.
 
     Returns:
         None
     """
-    # Publicar a todos los switches
-    for device_id, tipo in device_data["devices"].items():
+    if targets is None:
+        # Publicar a todos los switches
+        targets = registry.ids_by_type("switch")
+    # Cada switch recuerda sus propias órdenes, así que basta un identificador por acción
+    payload = format_command(action, new_command_id())
+    for device_id in targets:
+        if registry.type_of(device_id) == "switch":
+            if owns is None or owns(device_id):
+                if action in ("ON", "OFF"):
+                    shadow.desire(device_id, action)
+                elif action == "TOGGLE":
+                    shadow.expect_toggle(device_id)
+            messages_out.inc(labels=("command",))
+            if publisher is not None:
+                publisher.publish(f"{TOPIC_BASE}/switch_{device_id}", payload, kind="command")
+            else:
+                mqtt_client.publish(f"{TOPIC_BASE}/switch_{device_id}", payload)
+
+def reconcile_switches():
+    """
+    Reenvía su estado deseado a los switches que no lo han alcanzado.
+
+    Se ejecuta periódicamente desde la rueda de temporizadores. Cada pasada toma como mucho
+    RECONCILE_BATCH switches de la sombra y publica todas sus órdenes seguidas; cada orden
+    lleva un identificador nuevo, así que un switch que ya la hubiera aplicado solo vuelve
+    a confirmar su estado.
+
+    Returns:
+        int: Órdenes publicadas.
+    """
+    if mqtt_client is None:
+        return 0
+    sent = 0
+    for device_id, state in shadow.diverged(limit=RECONCILE_BATCH):
+        if registry.type_of(device_id) != "switch":
+            shadow.forget(device_id)
+            continue
+        topic = f"{TOPIC_BASE}/switch_{device_id}"
+        payload = format_command(state, new_command_id())
+        messages_out.inc(labels=("command",))
+        if publisher is not None:
+            publisher.publish(topic, payload, kind="command")
+        else:
+            mqtt_client.publish(topic, payload)
+        sent += 1
+    if sent:
+        reconcile_commands.inc(sent)
+        log.info("switches reconciliados", extra={"count": sent})
+    return sent
+
+# Peticiones a dispositivos
+
+def publish_request(mqtt_client, topic, payload=None):
+    """
+    Publica una petición a un dispositivo.
+
+    Si hay una cola de publicación configurada, la petición se encola: como orden si lleva
+    contenido y como consulta de telemetría si está vacía (desde el bucle de eventos, con la
+    cola llena, se devuelve un futuro que termina al encolarla). Si no, con un cliente
+    `AsyncioMqtt` devuelve una corrutina que termina cuando la publicación ha salido, para
+    que la espera respete el control de flujo del cliente; con un cliente de paho normal
+    publica directamente.
+
+    Args:
+        mqtt_client (mqtt.Client or AsyncioMqtt): Cliente MQTT.
+        topic (str): Topic de la petición.
+        payload (str or None): Contenido de la petición.
+
+    Returns:
+        any: Resultado de publish, o un awaitable si hay que esperar a la publicación.
+    """
+    kind = "command" if payload else "request"
+    messages_out.inc(labels=(kind,))
+    if publisher is not None:
+        return publisher.publish(topic, payload, kind=kind)
+    if isinstance(mqtt_client, AsyncioMqtt):
+        return mqtt_client.apublish(topic, payload)
+    return mqtt_client.publish(topic, payload)
+
+async def request_device(mqtt_client, request_topic, response_topic, payload=None, timeout=None):
+    """
+    Publica una petición a un dispositivo y espera su respuesta sin bloquear el bucle de eventos.
+
+    Args:
+        mqtt_client (mqtt.Client): Cliente MQTT para enviar la petición.
+        request_topic (str): Topic en el que se publica la petición.
+        response_topic (str): Topic en el que el dispositivo publica la respuesta.
+        payload (str or None): Contenido de la petición (vacío para consultas).
+        timeout (float or None): Segundos máximos de espera (por defecto REQUEST_TIMEOUT).
+
+    Returns:
+        str or None: Respuesta del dispositivo, o None si se agotó el tiempo de espera.
+    """
+    if timeout is None:
+        timeout = REQUEST_TIMEOUT
+    device_class = topic_class(request_topic)
+    start = time.perf_counter()
+    try:
+        response = await pending_requests.request(
+            response_topic,
+            lambda: publish_request(mqtt_client, request_topic, payload),
+            timeout,
+        )
+    except asyncio.TimeoutError:
+        request_timeouts.inc(labels=(device_class,))
+        return None
+    request_latency.observe(time.perf_counter() - start, labels=(device_class,))
+    return response
+
+async def command_switch(mqtt_client, device_id, action="TOGGLE", timeout=None):
+    """
+    Envía una orden a un switch y la reintenta con backoff hasta que la confirme.
+
+    La orden lleva un identificador nuevo (ver `common.switch_command`), así que el switch
+    la aplica una sola vez aunque le lleguen varios reintentos. Se acepta como respuesta su
+    confirmación con ese identificador o el estado que el switch publica en su topic de
+    estado al aplicarla. ON y OFF fijan el estado deseado en la sombra antes de enviarse,
+    de modo que si la orden no se confirma la reenvía el reconciliador; TOGGLE lo ajusta
+    al contrario del informado (ver `SwitchShadow.expect_toggle`). La respuesta actualiza
+    el estado informado.
+
+    Args:
+        mqtt_client (mqtt.Client): Cliente MQTT para enviar la orden.
+        device_id (str): ID del switch.
+        action (str): 'ON', 'OFF' o 'TOGGLE'.
+        timeout (float or None): Plazo total en segundos, reintentos incluidos (por
+            defecto REQUEST_TIMEOUT).
+
+    Returns:
+        str or None: Estado confirmado ('ON'/'OFF'), o None si se agotó el plazo.
+    """
+    if timeout is None:
+        timeout = REQUEST_TIMEOUT
+    command_id = new_command_id()
+    request_topic = f"{TOPIC_BASE}/switch_{device_id}"
+    payload = format_command(action, command_id)
+    attempts = 0
+    if action in ("ON", "OFF"):
+        shadow.desire(device_id, action)
+    elif action == "TOGGLE":
+        shadow.expect_toggle(device_id)
+
+    def send():
+        nonlocal attempts
+        attempts += 1
+        if attempts > 1:
+            switch_retries.inc()
+        return publish_request(mqtt_client, request_topic, payload)
+
+    start = time.perf_counter()
+    try:
+        response = await pending_requests.request_retry(
+            [f"ack:{command_id}", state_topic(device_id, TOPIC_BASE)], send, timeout)
+    except asyncio.TimeoutError:
+        request_timeouts.inc(labels=("switch",))
+        return None
+    request_latency.observe(time.perf_counter() - start, labels=("switch",))
+    device_seen(device_id)
+    if response in ("ON", "OFF"):
+        if action == "TOGGLE":
+            shadow.desire(device_id, response)
+        shadow.report(device_id, response)
+    return response
+
+async def query_devices(mqtt_client, tipo, label, timeout=None, max_age=None):
+    """
+    Consulta a la vez todos los dispositivos de un tipo y agrega sus respuestas.
+
+    Los dispositivos con una lectura en caché más reciente que `max_age` se responden
+    directamente desde la caché. Al resto se les publica la petición a la vez y sus
+    respuestas se recogen concurrentemente bajo un único plazo. Los dispositivos que no
+    responden a tiempo se marcan en la respuesta agregada.
+
+    Args:
+        mqtt_client (mqtt.Client): Cliente MQTT para enviar las peticiones.
+        tipo (str): Tipo de dispositivo a consultar ('sensor' o 'watch').
+        label (str): Nombre del dispositivo en la respuesta (por ejemplo, 'Sensor').
+        timeout (float or None): Plazo común en segundos (por defecto REQUEST_TIMEOUT).
+        max_age (float or None): Antigüedad máxima de la caché (por defecto CACHE_MAX_AGE).
+
+    Returns:
+        str: Respuesta agregada, una línea por dispositivo.
+    """
+    if timeout is None:
+        timeout = REQUEST_TIMEOUT
+    if max_age is None:
+        max_age = CACHE_MAX_AGE
+    topics = {device_id: f"{TOPIC_BASE}/{tipo}_{device_id}" for device_id in registry.ids_by_type(tipo)
+              if owns is None or owns(device_id)}
+    if not topics:
+        # Un worker sin dispositivos de ese tipo no añade nada a la respuesta del front end
+        return "" if owns is not None else f"No hay dispositivos de tipo '{tipo}'"
+
+    responses = {}
+    stale = []
+    for topic in topics.values():
+        entry = last_values.get_fresh(topic, max_age)
+        if entry is None:
+            stale.append(topic)
+        else:
+            responses[topic] = entry.value
+    cache_hits.inc(len(responses), labels=(tipo,))
+
+    def send_all():
+        messages_out.inc(len(stale), labels=("request",))
+        if publisher is not None:
+            return asyncio.gather(*(publisher.apublish(topic, kind="request") for topic in stale))
+        if isinstance(mqtt_client, AsyncioMqtt):
+            return asyncio.gather(*(mqtt_client.apublish(topic) for topic in stale))
+        for topic in stale:
+            mqtt_client.publish(topic)
+
+    if stale:
+        start = time.perf_counter()
+        answered = await pending_requests.request_many(stale, send_all, timeout)
+        missing = sum(1 for response in answered.values() if response is None)
+        if missing:
+            request_timeouts.inc(missing, labels=(tipo,))
+        else:
+            request_latency.observe(time.perf_counter() - start, labels=(tipo,))
+        responses.update(answered)
+    lines = []
+    for device_id, topic in topics.items():
+        response = responses[topic]
+        if response is None:
+            response = "sin respuesta (timeout)"
+        lines.append(f"{label} {device_id}: {response}")
+    return "\n".join(lines)
+
+def format_stats():
+    """
+    Resume las métricas principales del controlador para el comando !stats.
+
+    Returns:
+        str: Resumen en varias líneas.
+    """
+    def by_label(counter):
+        return ", ".join(f"{labels[0]}={int(counter.value(labels))}" for labels in counter.labelsets()) or "0"
+
+    def latency(histogram, labels):
+        p50 = histogram.quantile(0.5, labels)
+        p95 = histogram.quantile(0.95, labels)
+        return f"{histogram.count(labels)} peticiones, p50≤{p50 * 1000:g} ms, p95≤{p95 * 1000:g} ms"
+
+    lines = [
+        f"Mensajes recibidos: {by_label(messages_in)}",
+        f"Mensajes publicados: {by_label(messages_out)}",
+        f"Reglas: {int(rule_evaluations.total())} evaluaciones, {int(rule_firings.total())} disparos",
+        f"Respuestas desde caché: {by_label(cache_hits)}",
+        f"Timeouts: {by_label(request_timeouts)}",
+    ]
+    for labels in request_latency.labelsets():
+        lines.append(f"Latencia {labels[0]}: {latency(request_latency, labels)}")
+    lines.append(f"Peticiones pendientes: {pending_requests.pending_count()}")
+    if publisher is not None:
+        lines.append(f"Cola de publicación: {publisher.depth()} en cola, {publisher.unacked()} sin confirmar")
+    if journal is not None:
+        lines.append(f"Cola del journal: {journal.depth()}")
+    if rule_executor is not None:
+        lines.append(f"Reglas en otros procesos: {rule_executor.backlog()} pendientes, "
+                     f"{rule_executor.dropped} descartadas")
+    lines.append(f"Switches fuera de su estado deseado: {shadow.out_of_sync()}")
+    if liveness is not None:
+        silent = ", ".join(sorted(liveness.silent, key=int)) or "ninguno"
+        lines.append(f"Dispositivos sin actividad (>{LIVENESS_TIMEOUT:g} s): {silent}")
+    return "\n".join(lines)
+
+# Comandos de Discord
+
+def list_devices(args):
+    """
+    Construye una página del listado de dispositivos para el comando !devices.
+
+    Args:
+        args (list[str]): Argumentos del comando: tipo opcional y número de página opcional,
+                          en cualquier orden (por ejemplo ['switch', '2']).
+
+    Returns:
+        str: Texto de la página solicitada o un mensaje de uso si los argumentos no son válidos.
+    """
+    tipo = None
+    page = 1
+    for arg in args:
+        if arg in DEVICE_TYPES and tipo is None:
+            tipo = arg
+        elif arg.isdigit() and int(arg) > 0:
+            page = int(arg)
+        else:
+            return "Uso: !devices [tipo] [página]"
+    devices, pages, total = registry.page(tipo, page, DEVICES_PER_PAGE)
+    if total == 0:
+        return "No hay dispositivos registrados"
+    if page > pages:
+        return f"Página no válida (hay {pages})"
+    lines = [f"Dispositivos (página {page}/{pages}, {total} en total):"]
+    lines.extend(f"{device.device_id}: {device.tipo}" for device in devices)
+    return "\n".join(lines)
+
+
+commands = CommandRegistry(respond_discord, metrics=metrics)  # Tabla de comandos de Discord
+
+
+@commands.command("sensor", parse=no_args, help="Mostrar temperatura")
+async def cmd_sensor(message, args, mqtt_client):
+    """
+    !sensor: consulta la temperatura de todos los sensores.
+    """
+    return await query_devices(mqtt_client, "sensor", "Sensor")
+
+
+def format_switch_status(device_id):
+    """
+    Describe el estado de un switch según su sombra, sin consultarlo.
+
+    Args:
+        device_id (str): ID del switch.
+
+    Returns:
+        str: Estado informado, antigüedad y, si no coincide, el estado deseado.
+    """
+    entry = shadow.get(device_id)
+    if entry is None or entry[1] is None:
+        return f"Switch {device_id}: estado desconocido"
+    desired, reported, reported_at = entry
+    text = f"Switch {device_id}: {reported} (hace {max(time.time() - reported_at, 0):.0f} s)"
+    if desired is not None and desired != reported:
+        text += f", pendiente de pasar a {desired}"
+    return text
+
+
+def parse_switch_args(args):
+    """
+    Parser de !switch: ID del switch y acción opcional (on, off, toggle o status).
+
+    Returns:
+        tuple: (ID, acción en mayúsculas).
+
+    Raises:
+        UsageError: Si los argumentos no son válidos.
+    """
+    if len(args) == 1:
+        return args[0], "TOGGLE"
+    if len(args) == 2 and args[1].upper() in ("ON", "OFF", "TOGGLE", "STATUS"):
+        return args[0], args[1].upper()
+    raise UsageError()
+
+
+@commands.command("switch", parse=parse_switch_args, usage="<id> [on|off|toggle|status]",
+                  help="Encender, apagar, conmutar o consultar un switch")
+async def cmd_switch(message, args, mqtt_client):
+    """
+    !switch <id> [on|off|toggle|status]: envía la orden al switch y devuelve su nuevo estado,
+    o responde con el estado de la sombra.
+    """
+    device_id, action = args
+    if registry.type_of(device_id) != "switch":
+        return "ID de switch no válido."
+    if action == "STATUS":
+        return format_switch_status(device_id)
+    response = await command_switch(mqtt_client, device_id, action)
+    if response is None:
+        return f"Switch {device_id}: sin respuesta (timeout)"
+    return response
+
+
+@commands.command("watch", parse=no_args, help="Mostrar hora")
+async def cmd_watch(message, args, mqtt_client):
+    """
+    !watch: consulta la hora de todos los relojes.
+    """
+    return await query_devices(mqtt_client, "watch", "Reloj")
+
+
+@commands.command("add_device", parse=one_arg, usage="<tipo>", help="Añadir dispositivo (sensor/switch/watch)")
+async def cmd_add_device(message, tipo, mqtt_client):
+    """
+    !add_device <tipo>: da de alta un dispositivo.
+    """
+    if tipo not in DEVICE_TYPES:
+        return "Tipo de dispositivo no válido"
+    if add_device(tipo) and tipo == "switch":
+        mqtt_client.publish(f"{TOPIC_BASE}/add_device", tipo)
+    return f"Dispositivo '{tipo}' añadido"
+
+
+async def bulk_add(ranges, mqtt_client):
+    """
+    Da de alta un manifiesto de dispositivos y anuncia los switches nuevos en un único mensaje.
+
+    El controlador está suscrito con comodines a todos los topics de dispositivos, así que
+    los nuevos se reciben sin suscripciones adicionales.
+
+    Args:
+        ranges (list[tuple]): Pares (tipo, cantidad) ya validados.
+        mqtt_client (mqtt.Client): Cliente MQTT con el que anunciar los switches.
+
+    Returns:
+        str: Resumen del alta.
+    """
+    ids = add_devices(ranges)
+    switches = []
+    start = 0
+    for tipo, count in ranges:
         if tipo == "switch":
-            mqtt_client.publish(f"redes2/2312/1/switch_{device_id}", action)
+            first, last = ids[start], ids[start + count - 1]
+            switches.append(first if count == 1 else f"{first}-{last}")
+        start += count
+    if switches:
+        messages_out.inc(labels=("command",))
+        mqtt_client.publish(f"{TOPIC_BASE}/add_device", "switch " + ",".join(switches))
+    return f"Dispositivos añadidos: {summarize(ranges, ids)}"
+
+
+def parse_add_devices_args(args):
+    """
+    Parser de !add_devices: tipo y cantidad.
+
+    Raises:
+        UsageError: Si no hay exactamente dos argumentos.
+    """
+    if len(args) != 2:
+        raise UsageError()
+    return f"{args[0]},{args[1]}"
+
+
+@commands.command("add_devices", parse=parse_add_devices_args, usage="<tipo> <cantidad>",
+                  help="Añadir varios dispositivos de un tipo")
+async def cmd_add_devices(message, manifest, mqtt_client):
+    """
+    !add_devices <tipo> <cantidad>: da de alta varios dispositivos con IDs consecutivos.
+    """
+    try:
+        ranges = parse_manifest(manifest)
+    except ValueError as e:
+        return str(e)
+    return await bulk_add(ranges, mqtt_client)
+
+
+def manifest_text(message, name):
+    """
+    Extrae un manifiesto del texto de un comando, quitando el bloque de código si lo hay.
+
+    Args:
+        message (discord.Message): Mensaje con el comando.
+        name (str): Nombre del comando.
+
+    Returns:
+        str: Texto que sigue al comando.
+    """
+    text = message.content.strip()[len(commands.prefix) + len(name):].strip()
+    if text.startswith("```"):
+        text = text.strip("`")
+        first, _, rest = text.partition("\n")
+        if first.strip().lower() in ("json", "csv"):
+            text = rest
+    return text
+
+
+@commands.command("import_devices", usage="<manifiesto JSON/CSV o adjunto>",
+                  help="Añadir los dispositivos de un manifiesto")
+async def cmd_import_devices(message, args, mqtt_client):
+    """
+    !import_devices: da de alta los dispositivos de un manifiesto adjunto o escrito en el mensaje.
+    """
+    attachments = getattr(message, "attachments", None) or []
+    try:
+        if attachments:
+            text = (await attachments[0].read()).decode("utf-8")
+        else:
+            text = manifest_text(message, "import_devices")
+        ranges = parse_manifest(text)
+    except (UnicodeDecodeError, ValueError) as e:
+        return f"Manifiesto no válido: {e}"
+    return await bulk_add(ranges, mqtt_client)
+
+
+@commands.command("del_device", parse=one_arg, usage="<id>", help="Eliminar dispositivo")
+async def cmd_del_device(message, device_id, mqtt_client):
+    """
+    !del_device <id>: da de baja un dispositivo.
+    """
+    if registry.type_of(device_id) is None:
+        return "ID de dispositivo no válido"
+    remove_device(device_id)
+    return f"Dispositivo {device_id} eliminado"
+
+
+@commands.command("devices", usage="[tipo] [página]", help="Listar dispositivos")
+async def cmd_devices(message, args, mqtt_client):
+    """
+    !devices [tipo] [página]: lista los dispositivos registrados.
+    """
+    return list_devices(args)
+
+
+@commands.command("stats", parse=no_args, help="Mostrar métricas del controlador")
+async def cmd_stats(message, args, mqtt_client):
+    """
+    !stats: resume las métricas del controlador.
+    """
+    return f"```{format_stats()}```"
+
+
+@commands.command("help", parse=no_args, help="Mostrar ayuda")
+async def cmd_help(message, args, mqtt_client):
+    """
+    !help: muestra la ayuda generada a partir de la tabla de comandos.
+    """
+    return commands.help_text()
+
+
+async def handle_command(message, mqtt_client):
+    """
+    Interpreta y ejecuta un comando de Discord.
+
+    El comando se busca en la tabla `commands` y se ejecuta con su timeout y los límites
+    por usuario y canal (ver `controller.commands`).
+
+    Args:
+        message (discord.Message): Mensaje recibido (su contenido empieza por '!').
+        mqtt_client (mqtt.Client): Cliente MQTT para comunicarse con los dispositivos.
+
+    Returns:
+        None
+    """
+    await commands.dispatch(message, mqtt_client)
+
+# Modo repartido: front end de varios workers (ver controller.sharding)
+
+OWNER_COMMANDS = ("switch",)  # Comandos que atiende el worker dueño del dispositivo (primer argumento)
+BROADCAST_COMMANDS = ("sensor", "watch", "stats")  # Comandos que atienden todos los workers
+
+
+async def forward_to_owner(message, args, mqtt_client):
+    """
+    Handler del front end: reenvía el comando al worker dueño del dispositivo.
+    """
+    worker, text, timed_out = await shards.call_owner(args[0], message.content)
+    return f"{worker}: sin respuesta" if timed_out else text
+
+
+def forward_to_all(name):
+    """
+    Crea el handler del front end que reenvía un comando a todos los workers y une sus respuestas.
+
+    Args:
+        name (str): Nombre del comando.
+
+    Returns:
+        callable: Handler del comando.
+    """
+    async def handler(message, args, mqtt_client):
+        if name in DEVICE_TYPES and registry.count(name) == 0:
+            return f"No hay dispositivos de tipo '{name}'"
+        lines = []
+        for worker, text, timed_out in await shards.broadcast(message.content):
+            if timed_out:
+                lines.append(f"{worker}: sin respuesta")
+            elif text:
+                lines.append(f"[{worker}]\n{text}" if name == "stats" else text)
+        return "\n".join(lines)
+    return handler
+
+
+def start_frontend(workers, timeout=None, vnodes=VNODES):
+    """
+    Configura el controlador como front end de `workers` workers.
+
+    El front end conserva el bot, el registro y el journal de dispositivos: reenvía los
+    comandos de dispositivo al worker dueño y los de consulta a todos, y anuncia cada alta
+    o baja en DEVICES_TOPIC.
+
+    Args:
+        workers (int): Número de workers (se llaman worker_0 ... worker_{N-1}).
+        timeout (float or None): Segundos máximos de espera por un worker (por defecto, el
+            doble de REQUEST_TIMEOUT, para dejar margen a los reintentos del worker).
+        vnodes (int): Nodos virtuales por worker en el anillo; debe coincidir con el
+            `--vnodes` de los workers para que todos asignen igual los dispositivos.
+
+    Returns:
+        ShardClient: Cliente con el que se habla con los workers.
+    """
+    global shards
+    ring = HashRing((worker_name(index) for index in range(workers)), vnodes=vnodes)
+    shards = ShardClient(lambda topic, payload: publish_request(mqtt_client, topic, payload), ring,
+                         pending_requests, timeout if timeout is not None else 2 * REQUEST_TIMEOUT)
+    for name in OWNER_COMMANDS:
+        commands.commands[name].handler = forward_to_owner
+    for name in BROADCAST_COMMANDS:
+        commands.commands[name].handler = forward_to_all(name)
+    device_listeners.append(lambda record: publish_request(mqtt_client, DEVICES_TOPIC, json.dumps(record)))
+    return shards
 
 # Bot principal
 
-def launch_bot(host, port):
+def connect_mqtt(client, host, port):
+    """
+    Configura los callbacks del controlador en un cliente MQTT y lo conecta al broker.
+
+    Args:
+        client (mqtt.Client or AsyncioMqtt): Cliente MQTT.
+        host (str): Dirección del broker MQTT.
+        port (int): Puerto del broker MQTT.
+
+    Returns:
+        mqtt.Client or AsyncioMqtt: El mismo cliente, ya conectado.
+    """
+    client.on_connect = on_connect
+    client.on_message = on_mqtt_message
+    client.connect(host, port, 60)
+    return client
+
+async def run_asyncio(bot, token, host, port):
+    """
+    Ejecuta el cliente MQTT y el bot de Discord en un único bucle de asyncio.
+
+    Los mensajes MQTT se procesan en el mismo bucle que los comandos de Discord, sin hilo
+    de red ni saltos entre hilos, y las peticiones a dispositivos esperan su publicación.
+
+    Args:
+        bot (discord.Client): Bot de Discord ya configurado.
+        token (str): Token del bot.
+        host (str): Dirección del broker MQTT.
+        port (int): Puerto del broker MQTT.
+
+    Returns:
+        None
+    """
+    global mqtt_client, publisher
+    mqtt_client = connect_mqtt(AsyncioMqtt(mqtt.Client()), host, port)
+    publisher = OutboundPublisher(mqtt_client, loop=asyncio.get_running_loop(), qos_by_class=PUBLISH_QOS)
+    publisher.start()
+    try:
+        async with bot:
+            await bot.start(token)
+    finally:
+        # El hilo de envío necesita el bucle para vaciar la cola: no bloquearlo al cerrar
+        await asyncio.to_thread(publisher.close)
+        mqtt_client.close()
+
+def launch_bot(host, port, mode="thread", workers=0, vnodes=VNODES):
     """
     Inicializa y lanza el bot de Discord y el cliente MQTT para el sistema domótico.
 
@@ -268,23 +1347,24 @@ def launch_bot(host, port):
     Args:
         host (str): Dirección del broker MQTT.
         port (int): Puerto del broker MQTT.
+        mode (str): 'thread' para usar el hilo de red de paho junto al bot, o 'asyncio' para
+            ejecutar MQTT y Discord en un único bucle de eventos.
+        workers (int): Si es mayor que 0, el controlador actúa como front end de ese número
+            de workers (`controller/worker.py`) en lugar de atender los dispositivos.
+        vnodes (int): Nodos virtuales por worker en el anillo (mismo valor que los workers).
 
     Funcionalidad:
         - Conexión al broker MQTT y suscripción a topics relevantes.
         - Carga y gestión del estado de los dispositivos (add, delete, list).
-        - Interacción con usuarios vía comandos de Discord:
-            * !sensor
-            * !switch <id>
-            * !watch
-            * !add_device <tipo>
-            * !del_device <id>
-            * !devices
-            * !help
+        - Interacción con usuarios vía los comandos de Discord de la tabla `commands`
+          (!sensor, !switch <id> [on|off|toggle|status], !watch, !add_device, !add_devices,
+          !import_devices, !del_device, !devices, !stats, !help).
         - Manejo seguro de interrupciones (Ctrl+C) para guardar estado antes de salir.
 
     Returns:
         None
     """
+    global liveness, mqtt_client, publisher
     # Obtener el token del bot de Discord desde el archivo de configuración
     TOKEN = get_token_from_file()
 
@@ -300,17 +1380,22 @@ def launch_bot(host, port):
     
     # Cargar dispositivos previamente guardados desde devices.json
     load_devices()
-
-    # Crear cliente MQTT para conectarse al broker
-    mqtt_client = mqtt.Client()
-
-    # Definir funciones callback para conexión y recepción de mensajes
-    mqtt_client.on_connect = on_connect
-    mqtt_client.on_message = on_mqtt_message
-    # Conectarse al broker MQTT
-    mqtt_client.connect(host, port, 60)
-    # Empezar el bucle de escucha de MQTT en un hilo separado
-    mqtt_client.loop_start()
+    # Cargar las reglas del controlador desde rules.json
+    load_rules()
+    if workers:
+        # La ingesta, la vigilancia y la reconciliación las hacen los workers
+        start_frontend(workers, vnodes=vnodes)
+    else:
+        # Vigilar la actividad de los dispositivos con la rueda de temporizadores compartida
+        if LIVENESS_TIMEOUT is not None:
+            liveness = LivenessMonitor(timers, LIVENESS_TIMEOUT, on_change=on_liveness_change)
+            watch_devices()
+        # Reenviar periódicamente su estado deseado a los switches que no lo han alcanzado
+        if RECONCILE_INTERVAL:
+            timers.call_every(RECONCILE_INTERVAL, reconcile_switches)
+        timers.start()
+        # Las reglas costosas que lo piden se evalúan en otros procesos
+        start_rule_executor()
 
     # Evento: cuando el bot de Discord está listo y conectado
     @bot.event
@@ -324,97 +1409,20 @@ def launch_bot(host, port):
         if message.author == bot.user:
             return
 
-        # Variables globales para manejar el mensaje recibido
-        global latest_message, message_flag
+        await handle_command(message, mqtt_client)
 
-        # Limpiar el mensaje recibido (eliminar espacios)
-        content = message.content.strip()
-        
-        # Solo procesar mensajes que comienzan con '!'
-        if not content.startswith("!"):
-            return
+    if mode == "asyncio":
+        # MQTT y Discord comparten el bucle de eventos
+        asyncio.run(run_asyncio(bot, TOKEN, host, port))
+        return
+
+    # Crear cliente MQTT, conectarse al broker y escuchar en un hilo separado
+    mqtt_client = connect_mqtt(mqtt.Client(), host, port)
+    # La cola se crea antes de arrancar el hilo de red para que on_connect pueda registrarlo
+    publisher = OutboundPublisher(mqtt_client, qos_by_class=PUBLISH_QOS)
+    publisher.start()
+    mqtt_client.loop_start()
 
-        # Eliminar el primer carácter ('!') para procesar el comando
-        command = content[1:]
-
-        # Comando: mostrar dispositivos actuales
-        if command == "devices":
-            response = f"Dispositivos: {device_data['devices']}"
-            #await: envislo al canal de Discord pero no quedar esperando
-            await respond_discord(message, response)
-        
-        # Comando: añadir un nuevo dispositivo
-        elif command.startswith("add_device"):
-            try:
-                _, tipo = command.split()
-                if tipo in ("sensor", "switch", "watch"):
-                    if add_device(tipo) and tipo == "switch":
-                        mqtt_client.publish("redes2/2312/1/add_device", tipo)
-                    await respond_discord(message, f"Dispositivo '{tipo}' añadido")
-                else:
-                    await respond_discord(message, "Tipo de dispositivo no válido")
-            except:
-                await respond_discord(message, "Uso: !add_device <tipo>")
-
-        # Comando: eliminar un dispositivo por ID
-        elif command.startswith("del_device"):
-            try:
-                _, device_id = command.split()
-                if device_id in device_data["devices"]:
-                    remove_device(device_id)
-                    await respond_discord(message, f"Dispositivo {device_id} eliminado")
-                else:
-                    await respond_discord(message, "ID de dispositivo no válido")
-            except:
-                await respond_discord(message, "Uso: !del_device <id>")
-
-        # Comando: activar/desactivar un switch por ID
-        # por ejemplo !switch 2
-        elif command.startswith("switch"):
-            try:
-                _, device_id = command.split()
-                if device_id in device_data["devices"] and device_data["devices"][device_id] == "switch":
-                    mqtt_client.publish(f"redes2/2312/1/switch_{device_id}", "TOGGLE")
-                    while not message_flag:
-                        pass
-                    message_flag = 0
-                    await respond_discord(message, latest_message)
-                else:
-                    await respond_discord(message, "ID de switch no válido.")
-            except:
-                await respond_discord(message, "Uso: !switch <id>")
-                # Comando: pedir la temperatura de sensores
-        elif command == "sensor":
-            for device_id, device_type in device_data["devices"].items():
-                if device_type == "sensor":
-                    mqtt_client.publish(f"redes2/2312/1/sensor_{device_id}")
-                    while not message_flag:
-                        pass
-                    message_flag = 0
-                    await respond_discord(message, f"Sensor {device_id}: {latest_message}")
-        # Comando: pedir la hora actual al reloj
-        elif command == "watch":
-            for device_id, device_type in device_data["devices"].items():
-                if device_type == "watch":
-                    mqtt_client.publish(f"redes2/2312/1/watch_{device_id}")
-                    while not message_flag:
-                        pass
-                    message_flag = 0
-                    await respond_discord(message, f"Reloj {device_id}: {latest_message}")
-        # Comando: mostrar ayuda
-        elif command == "help":
-            help_msg = """```Comandos disponibles:
-!sensor - Mostrar temperatura
-!switch <id> - Activar switch
-!watch - Mostrar hora
-!add_device <tipo> - Añadir dispositivo (sensor/switch/watch)
-!del_device <id> - Eliminar dispositivo
-!devices - Listar dispositivos
-!help - Mostrar ayuda```"""
-            await respond_discord(message, help_msg)
-        # Si el comando no se reconoce
-        else:
-            await respond_discord(message, "Comando no reconocido. Usa !help")
     # Arrancar el bot de Discord con el token
     bot.run(TOKEN)
 
@@ -422,5 +1430,43 @@ if __name__ == "__main__":
     parser = argparse.ArgumentParser(description="Controlador Domótico")
     parser.add_argument('--host', default="redes2.ii.uam.es")
     parser.add_argument('--port', type=int, default=1883)
+    parser.add_argument('--timeout', type=float, default=REQUEST_TIMEOUT,
+                        help="Segundos máximos de espera por la respuesta de un dispositivo")
+    parser.add_argument('--command-timeout', type=float, default=commands.timeout,
+                        help="Segundos máximos de ejecución de un comando de Discord")
+    parser.add_argument('--rules', default=RULES_FILE, help="Fichero JSON con las reglas")
+    parser.add_argument('--max-age', type=float, default=CACHE_MAX_AGE,
+                        help="Antigüedad máxima (s) de una lectura para responder desde la caché")
+    parser.add_argument('--command-qos', type=int, choices=(0, 1, 2), default=QOS_BY_CLASS["command"],
+                        help="QoS de las órdenes a dispositivos")
+    parser.add_argument('--request-qos', type=int, choices=(0, 1, 2), default=QOS_BY_CLASS["request"],
+                        help="QoS de las consultas de telemetría")
+    parser.add_argument('--metrics-port', type=int, default=None,
+                        help="Puerto local en el que servir las métricas en formato Prometheus")
+    parser.add_argument('--liveness-timeout', type=float, default=None,
+                        help="Segundos sin mensajes tras los que avisar de que un dispositivo no publica")
+    parser.add_argument('--reconcile-interval', type=float, default=RECONCILE_INTERVAL,
+                        help="Segundos entre reenvíos a switches fuera de su estado deseado (0: desactivado)")
+    parser.add_argument('--rule-workers', type=int, default=None,
+                        help="Procesos para las reglas con executor 'process' (por defecto uno por núcleo; 0: en línea)")
+    parser.add_argument('--workers', type=int, default=0,
+                        help="Actuar como front end de N workers (controller/worker.py); 0 para atender los dispositivos")
+    parser.add_argument('--vnodes', type=int, default=VNODES,
+                        help="Nodos virtuales por worker en el anillo (el mismo valor que en los workers)")
+    parser.add_argument('--mqtt-mode', choices=("thread", "asyncio"), default="thread",
+                        help="Hilo de red de paho o un único bucle de asyncio para MQTT y Discord")
+    add_log_arguments(parser)
     args = parser.parse_args()
-    launch_bot(args.host, args.port)
\ No newline at end of file
+    setup_logging(args)
+    REQUEST_TIMEOUT = args.timeout
+    CACHE_MAX_AGE = args.max_age
+    commands.timeout = args.command_timeout
+    LIVENESS_TIMEOUT = args.liveness_timeout
+    RECONCILE_INTERVAL = args.reconcile_interval
+    RULES_FILE = args.rules
+    RULE_WORKERS = args.rule_workers
+    PUBLISH_QOS.update(command=args.command_qos, request=args.request_qos)
+    if args.metrics_port is not None:
+        start_http_server(metrics, args.metrics_port)
+        print(f"Métricas disponibles en http://127.0.0.1:{args.metrics_port}/metrics")
+    launch_bot(args.host, args.port, args.mqtt_mode, args.workers, args.vnodes)
\ No newline at end of file
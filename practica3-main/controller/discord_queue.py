@@ -0,0 +1,250 @@
+"""
+discord_queue.py
+
+Cola de respuestas salientes hacia Discord, una por canal.
+
+Enviar cada respuesta como un mensaje propio hace que una ráfaga de comandos (o un
+`!sensor` con muchos sensores) choque con los límites de Discord, y un listado largo
+puede superar los 2000 caracteres por mensaje. La cola:
+
+- agrupa en un único mensaje las respuestas a un mismo canal que llegan mientras el
+  canal está ocupado (enviando o esperando por un límite) o, si el canal acaba de enviar
+  algo, dentro de una ventana corta (`window`); un canal inactivo envía sin esperar, así
+  que una respuesta aislada no gana latencia;
+- trocea el resultado por líneas para no superar el límite de Discord, cerrando y
+  reabriendo los bloques de código ``` que queden partidos;
+- limita los envíos de cada canal con un cubo de tokens y, si Discord responde con un
+  429, espera el `retry_after` indicado y reintenta en lugar de perder la respuesta.
+
+`send` espera a que la respuesta se haya entregado (o descartado tras agotar los
+reintentos), así que el comando que la genera no termina antes de que llegue al canal.
+"""
+import asyncio
+import logging
+import time
+
+from common.ratelimit import TokenBucket
+
+DISCORD_LIMIT = 2000  # Caracteres máximos por mensaje de Discord
+MERGE_WINDOW = 0.05  # Segundos durante los que se agrupan respuestas al mismo canal
+CHANNEL_RATE = 1.0  # Mensajes por segundo y canal a largo plazo
+CHANNEL_BURST = 5  # Mensajes seguidos permitidos por canal
+MAX_RETRIES = 5  # Reintentos de un mensaje limitado por Discord (429)
+MAX_CHANNELS = 1000  # Canales recordados; al superarlo se olvidan los inactivos
+FENCE = "```"
+
+log = logging.getLogger("controller.discord")
+
+
+def split_message(text, limit=DISCORD_LIMIT):
+    """
+    Divide un texto en trozos de como mucho `limit` caracteres, por saltos de línea.
+
+    Las líneas más largas que el límite se cortan a la fuerza. Si un corte cae dentro de
+    un bloque de código, el trozo se cierra con ``` y el siguiente lo vuelve a abrir.
+
+    Args:
+        text (str): Texto a dividir.
+        limit (int): Longitud máxima de cada trozo.
+
+    Returns:
+        list[str]: Trozos, en orden (una lista vacía si el texto está vacío).
+    """
+    if len(text) <= limit:
+        return [text] if text else []
+    budget = limit - len(FENCE) - 1  # Reserva para cerrar un bloque de código
+    chunks = []
+    current = []
+    size = 0
+    in_code = False  # Si el trozo en curso termina dentro de un bloque de código
+    opened = False  # Si el trozo en curso empieza reabriendo un bloque de código
+
+    def flush():
+        chunk = "\n".join(current)
+        if in_code:
+            chunk += FENCE
+        chunks.append(chunk)
+
+    for line in text.split("\n"):
+        pieces = [line[i:i + budget] for i in range(0, len(line), budget)] or [""]
+        for piece in pieces:
+            extra = len(piece) + (1 if current else 0)
+            if current and size + extra > budget:
+                flush()
+                opened = in_code
+                current = [FENCE] if opened else []
+                size = len(FENCE) if opened else 0
+                extra = len(piece) + (1 if current else 0)
+            current.append(piece)
+            size += extra
+            if piece.count(FENCE) % 2:
+                in_code = not in_code
+    if current:
+        chunks.append("\n".join(current))
+    return chunks
+
+
+def retry_after(exc):
+    """
+    Obtiene el tiempo de espera de un error de límite de Discord.
+
+    Reconoce `discord.RateLimited` (atributo `retry_after`) y las `discord.HTTPException`
+    con estado 429 (cabecera Retry-After).
+
+    Args:
+        exc (Exception): Error producido al enviar.
+
+    Returns:
+        float or None: Segundos a esperar, o None si el error no es un límite de frecuencia.
+    """
+    seconds = getattr(exc, "retry_after", None)
+    if seconds is not None:
+        return float(seconds)
+    if getattr(exc, "status", None) == 429:
+        headers = getattr(getattr(exc, "response", None), "headers", None) or {}
+        try:
+            return float(headers.get("Retry-After", 1.0))
+        except (TypeError, ValueError):
+            return 1.0
+    return None
+
+
+class _Channel:
+    """
+    Estado de la cola de un canal.
+    """
+
+    __slots__ = ("loop", "pending", "task", "bucket", "blocked_until", "last_sent")
+
+    def __init__(self, loop, rate, burst):
+        self.loop = loop
+        self.pending = []  # (texto, futuro) esperando a agruparse
+        self.task = None
+        self.bucket = TokenBucket(rate, burst)
+        self.blocked_until = 0.0  # Fin del bloqueo indicado por un 429
+        self.last_sent = float("-inf")  # Último envío (time.monotonic())
+
+
+class ReplyQueue:
+    """
+    Colas de respuestas a Discord por canal, con agrupación, troceado y reintentos.
+    """
+
+    def __init__(self, window=MERGE_WINDOW, limit=DISCORD_LIMIT, rate=CHANNEL_RATE, burst=CHANNEL_BURST,
+                 max_retries=MAX_RETRIES, metrics=None):
+        """
+        Args:
+            window (float): Segundos durante los que se agrupan respuestas a un canal que
+                acaba de enviar.
+            limit (int): Caracteres máximos por mensaje.
+            rate (float): Mensajes por segundo y canal.
+            burst (int): Mensajes seguidos permitidos por canal.
+            max_retries (int): Reintentos de un mensaje tras un 429.
+            metrics (MetricsRegistry or None): Registro en el que publicar los contadores de envío.
+        """
+        self.window = window
+        self.limit = limit
+        self.rate = rate
+        self.burst = burst
+        self.max_retries = max_retries
+        self._channels = {}
+        self._sent = self._merged = self._rate_limited = None
+        if metrics is not None:
+            self._sent = metrics.counter("discord_messages_sent_total", "Mensajes enviados a Discord")
+            self._merged = metrics.counter("discord_replies_merged_total",
+                                           "Respuestas agrupadas con otras en un mismo mensaje")
+            self._rate_limited = metrics.counter("discord_rate_limited_total",
+                                                 "Envíos a Discord rechazados por límite de frecuencia")
+
+    def depth(self):
+        """
+        Devuelve el número de respuestas que esperan a enviarse.
+
+        Returns:
+            int: Respuestas en cola en todos los canales.
+        """
+        return sum(len(state.pending) for state in self._channels.values())
+
+    async def send(self, channel, text):
+        """
+        Encola una respuesta para un canal y espera a que se entregue.
+
+        Args:
+            channel (discord.abc.Messageable): Canal destino.
+            text (str): Contenido de la respuesta.
+
+        Returns:
+            bool: True si se ha entregado, False si se ha descartado por un error.
+        """
+        loop = asyncio.get_running_loop()
+        state = self._channels.get(channel)
+        if state is None or state.loop is not loop:
+            if len(self._channels) >= MAX_CHANNELS:
+                self._forget_idle()
+            state = self._channels[channel] = _Channel(loop, self.rate, self.burst)
+        future = loop.create_future()
+        state.pending.append((text, future))
+        if state.task is None or state.task.done():
+            state.task = loop.create_task(self._drain(channel, state))
+        return await future
+
+    def _forget_idle(self):
+        """
+        Olvida el estado de los canales sin respuestas pendientes.
+        """
+        for channel, state in list(self._channels.items()):
+            if not state.pending and (state.task is None or state.task.done()):
+                del self._channels[channel]
+
+    async def _drain(self, channel, state):
+        """
+        Envía las respuestas de un canal mientras haya alguna en cola.
+        """
+        while state.pending:
+            # Ráfaga en curso: esperar la ventana para agrupar; canal inactivo: solo dejar
+            # que se sumen las respuestas generadas en esta misma vuelta del bucle
+            busy = time.monotonic() - state.last_sent < self.window
+            await asyncio.sleep(self.window if busy else 0)
+            wait = max(state.blocked_until - time.monotonic(), state.bucket.delay())
+            if wait > 0:
+                # Mientras se espera siguen llegando respuestas, que se agrupan con estas
+                await asyncio.sleep(wait)
+            batch, state.pending = state.pending, []
+            if self._merged is not None and len(batch) > 1:
+                self._merged.inc(len(batch))
+            ok = True
+            for chunk in split_message("\n".join(text for text, _ in batch), self.limit):
+                if not await self._deliver(channel, state, chunk):
+                    ok = False
+                    break
+            for _, future in batch:
+                if not future.done():
+                    future.set_result(ok)
+
+    async def _deliver(self, channel, state, chunk):
+        """
+        Envía un trozo respetando el cubo del canal y reintentando tras un 429.
+
+        Returns:
+            bool: True si se ha enviado.
+        """
+        for attempt in range(self.max_retries + 1):
+            await asyncio.sleep(max(state.blocked_until - time.monotonic(), state.bucket.delay()))
+            state.bucket.take()
+            try:
+                await channel.send(chunk)
+            except Exception as e:
+                delay = retry_after(e)
+                if delay is None or attempt == self.max_retries:
+                    log.warning("error enviando mensaje a Discord: %s", e)
+                    return False
+                if self._rate_limited is not None:
+                    self._rate_limited.inc()
+                log.info("límite de Discord alcanzado, reintento en %.2f s", delay)
+                state.blocked_until = time.monotonic() + delay
+                continue
+            state.last_sent = time.monotonic()
+            if self._sent is not None:
+                self._sent.inc()
+            return True
+        return False
@@ -0,0 +1,432 @@
+"""
+journal.py
+
+Persistencia de dispositivos mediante un diario de cambios (journal) y snapshots.
+
+Cada alta o baja de dispositivo se añade como una línea JSON al final del journal
+('data/devices.journal'), en vez de reescribir 'data/devices.json' completo. Un hilo
+escritor en segundo plano agrupa los cambios pendientes en una sola escritura y un solo
+fsync (group commit), de modo que el bucle de eventos de Discord nunca espera al disco.
+
+Periódicamente el journal se compacta: el estado completo se escribe en un fichero
+temporal, se sincroniza y sustituye atómicamente al snapshot ('devices.json'), y a
+continuación se vacía el journal. El snapshot guarda el número de secuencia del último
+cambio que incluye ('journal_seq'), así que si el proceso se interrumpe entre ambos pasos
+la recuperación no aplica dos veces el mismo cambio.
+
+Si una escritura falla (disco lleno, error de E/S), el lote no se da por duradero: se
+deshace lo escrito a medias, se reintenta con espera creciente junto con los cambios que
+lleguen mientras tanto y `flush` informa del error a quien espera.
+
+Formato de una línea del journal:
+
+    {"seq": 7, "op": "add", "id": "4", "type": "switch"}
+    {"seq": 8, "op": "remove", "id": "2"}
+    {"seq": 9, "op": "add_range", "id": "5", "ranges": [["switch", 200], ["sensor", 10]]}
+
+Un alta en bloque ('add_range') es un único cambio: los dispositivos reciben IDs
+consecutivos a partir de 'id', por tramos de cada tipo en el orden indicado.
+"""
+import copy
+import json
+import logging
+import os
+import queue
+import threading
+import time
+
+COMPACT_EVERY = 500  # Cambios en el journal antes de compactarlo en un snapshot
+MAX_BATCH = 1000  # Cambios máximos por escritura agrupada
+RETRY_DELAY = 0.1  # Espera inicial (s) antes de reintentar una escritura fallida
+RETRY_MAX_DELAY = 5.0  # Espera máxima (s) entre reintentos
+
+log = logging.getLogger("controller.journal")
+
+
+def empty_state():
+    """
+    Devuelve el estado inicial de un registro de dispositivos vacío.
+
+    Returns:
+        dict: Estado con 'device_last_id' a 0 y sin dispositivos.
+    """
+    return {"device_last_id": 0, "devices": {}}
+
+
+def apply_record(state, record):
+    """
+    Aplica un cambio del journal sobre un estado de dispositivos.
+
+    Args:
+        state (dict): Estado a modificar ({"device_last_id": N, "devices": {...}}).
+        record (dict): Cambio a aplicar.
+
+    Returns:
+        None
+    """
+    devices = state.setdefault("devices", {})
+    if record["op"] == "add":
+        devices[record["id"]] = record["type"]
+        if record["id"].isdigit():
+            state["device_last_id"] = max(state.get("device_last_id", 0), int(record["id"]))
+    elif record["op"] == "add_range":
+        next_id = int(record["id"])
+        for tipo, count in record["ranges"]:
+            for _ in range(count):
+                devices[str(next_id)] = tipo
+                next_id += 1
+        state["device_last_id"] = max(state.get("device_last_id", 0), next_id - 1)
+    elif record["op"] == "remove":
+        devices.pop(record["id"], None)
+
+
+def _fsync_dir(path):
+    """
+    Sincroniza el directorio que contiene un fichero para que un rename sea duradero.
+    """
+    try:
+        fd = os.open(os.path.dirname(os.path.abspath(path)), os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        os.fsync(fd)
+    except OSError:
+        pass
+    finally:
+        os.close(fd)
+
+
+class DeviceJournal:
+    """
+    Journal de cambios de dispositivos con escritor en segundo plano y compactación.
+    """
+
+    def __init__(self, snapshot_path, journal_path=None, compact_every=COMPACT_EVERY, metrics=None):
+        """
+        Inicializa el journal asociado a un fichero de snapshot.
+
+        Args:
+            snapshot_path (str): Ruta del snapshot JSON (por ejemplo 'data/devices.json').
+            journal_path (str or None): Ruta del journal (por defecto, el snapshot con extensión '.journal').
+            compact_every (int): Cambios acumulados tras los que se compacta el journal.
+            metrics (MetricsRegistry or None): Registro en el que publicar la latencia de
+                escritura y compactación y la profundidad de la cola.
+        """
+        self.snapshot_path = snapshot_path
+        if journal_path is None:
+            journal_path = os.path.splitext(snapshot_path)[0] + ".journal"
+        self.journal_path = journal_path
+        self.compact_every = compact_every
+        self._queue = queue.Queue()
+        self._io_lock = threading.Lock()
+        self._cond = threading.Condition()
+        self._seq = 0
+        self._durable_seq = 0
+        self._applied_seq = 0
+        self._error = None  # Último error de escritura, mientras no se haya podido reintentar
+        self._failures = 0  # Escrituras fallidas desde que se abrió el journal
+        self._since_snapshot = 0
+        self._state = empty_state()
+        self._file = None
+        self._thread = None
+        self._write_seconds = None
+        self._compact_seconds = None
+        if metrics is not None:
+            self._write_seconds = metrics.histogram(
+                "journal_write_seconds", "Latencia de escritura y fsync de un lote del journal")
+            self._compact_seconds = metrics.histogram(
+                "journal_compact_seconds", "Latencia de compactación del journal en un snapshot")
+            metrics.gauge("journal_queue_depth", "Cambios pendientes de escribir en el journal", fn=self.depth)
+
+    def open(self):
+        """
+        Recupera el estado (snapshot + cambios posteriores del journal) y arranca el escritor.
+
+        Las líneas incompletas o corruptas al final del journal (escritura interrumpida)
+        se ignoran.
+
+        Returns:
+            dict: Estado recuperado (copia independiente).
+
+        Raises:
+            FileNotFoundError: Si no existe snapshot ni hay cambios en el journal.
+            ValueError: Si el snapshot no es un JSON válido.
+        """
+        error = None
+        snapshot_seq = 0
+        state = empty_state()
+        try:
+            with open(self.snapshot_path, "r") as f:
+                state = json.load(f)
+            snapshot_seq = state.pop("journal_seq", 0)
+        except FileNotFoundError as e:
+            error = e
+        except ValueError as e:
+            error = e
+            state = empty_state()
+
+        last_seq = snapshot_seq
+        replayed = 0
+        for record in self._read_journal():
+            last_seq = max(last_seq, record["seq"])
+            if record["seq"] > snapshot_seq:
+                apply_record(state, record)
+                replayed += 1
+
+        with self._io_lock:
+            self._seq = self._durable_seq = self._applied_seq = last_seq
+            self._since_snapshot = replayed
+            self._state = copy.deepcopy(state)
+        self.start()
+
+        if error is not None and (isinstance(error, ValueError) or replayed == 0):
+            raise error
+        return state
+
+    def _read_journal(self):
+        """
+        Lee los cambios válidos del journal.
+
+        Returns:
+            list[dict]: Cambios en orden de escritura.
+        """
+        records = []
+        try:
+            with open(self.journal_path, "r") as f:
+                for line in f:
+                    try:
+                        record = json.loads(line)
+                        record["seq"], record["op"], record["id"]
+                    except (ValueError, KeyError, TypeError):
+                        break
+                    records.append(record)
+        except FileNotFoundError:
+            pass
+        return records
+
+    def rebase(self, state):
+        """
+        Sustituye el estado en memoria del journal sin escribir en disco.
+
+        Se usa cuando el controlador continúa con un estado distinto del recuperado
+        (por ejemplo, los valores por defecto si no había snapshot).
+
+        Args:
+            state (dict): Estado actual de los dispositivos.
+
+        Returns:
+            None
+        """
+        with self._io_lock:
+            self._state = copy.deepcopy(state)
+
+    def start(self):
+        """
+        Arranca el hilo escritor si no está en marcha.
+
+        Returns:
+            None
+        """
+        if self._thread is None or not self._thread.is_alive():
+            self._thread = threading.Thread(target=self._run, name="device-journal", daemon=True)
+            self._thread.start()
+
+    def append(self, op, **fields):
+        """
+        Encola un cambio para escribirlo en el journal. No bloquea.
+
+        Args:
+            op (str): Tipo de cambio ('add' o 'remove').
+            **fields: Campos del cambio (por ejemplo id='4', type='switch').
+
+        Returns:
+            int: Número de secuencia asignado al cambio.
+        """
+        with self._cond:
+            self._seq += 1
+            seq = self._seq
+        record = {"seq": seq, "op": op}
+        record.update(fields)
+        self._queue.put(record)
+        return seq
+
+    def depth(self):
+        """
+        Devuelve el número de cambios encolados pendientes de escribir.
+
+        Returns:
+            int: Profundidad de la cola del escritor.
+        """
+        return self._queue.qsize()
+
+    def flush(self, timeout=None):
+        """
+        Espera a que todos los cambios encolados estén escritos y sincronizados en disco.
+
+        Args:
+            timeout (float or None): Segundos máximos de espera.
+
+        Returns:
+            bool: True si todos los cambios son duraderos, False si se agotó el tiempo.
+
+        Raises:
+            OSError: Si falla un intento de escritura mientras se espera (el escritor lo
+                sigue reintentando).
+        """
+        with self._cond:
+            target = self._seq
+            failures = self._failures
+            self._cond.wait_for(lambda: self._durable_seq >= target or self._failures != failures, timeout)
+            if self._durable_seq >= target:
+                return True
+            if self._failures != failures:
+                raise OSError(f"No se pudo escribir el journal de dispositivos: {self._error}")
+            return False
+
+    def checkpoint(self, state):
+        """
+        Escribe un snapshot completo del estado indicado y vacía el journal.
+
+        Args:
+            state (dict): Estado actual de los dispositivos.
+
+        Returns:
+            None
+
+        Raises:
+            OSError: Si no se puede escribir el snapshot.
+        """
+        self.flush()
+        with self._io_lock:
+            self._state = copy.deepcopy(state)
+            self._compact_locked()
+
+    def close(self):
+        """
+        Escribe los cambios pendientes y detiene el hilo escritor.
+
+        Si la escritura está fallando, se hace un último intento y los cambios que no se
+        hayan podido escribir se informan en el log.
+
+        Returns:
+            None
+        """
+        if self._thread is not None and self._thread.is_alive():
+            try:
+                self.flush()
+            except OSError as e:
+                log.error("%s", e)
+            self._queue.put(None)
+            self._thread.join()
+        with self._io_lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+
+    def _run(self):
+        """
+        Bucle del hilo escritor: agrupa los cambios pendientes en una escritura y un fsync.
+        """
+        batch = []
+        stopping = False
+        delay = RETRY_DELAY
+        while True:
+            if not batch:
+                record = self._queue.get()
+                if record is None:
+                    return
+                batch.append(record)
+            while len(batch) < MAX_BATCH and not stopping:
+                try:
+                    record = self._queue.get_nowait()
+                except queue.Empty:
+                    break
+                if record is None:
+                    stopping = True
+                    break
+                batch.append(record)
+            try:
+                with self._io_lock:
+                    self._write_locked(batch)
+            except OSError as e:
+                log.error("error escribiendo el journal de dispositivos: %s", e)
+                with self._cond:
+                    self._error = e
+                    self._failures += 1
+                    self._cond.notify_all()
+                if stopping:
+                    log.error("se pierden %d cambios del journal sin escribir", len(batch))
+                    return
+                # Reintentar el mismo lote (con lo que llegue mientras tanto) sin darlo por duradero
+                time.sleep(delay)
+                delay = min(delay * 2, RETRY_MAX_DELAY)
+                continue
+            delay = RETRY_DELAY
+            with self._cond:
+                self._durable_seq = max(self._durable_seq, batch[-1]["seq"])
+                self._error = None
+                self._cond.notify_all()
+            batch = []
+            try:
+                with self._io_lock:
+                    if self._since_snapshot >= self.compact_every:
+                        self._compact_locked()
+            except OSError as e:
+                # Los cambios ya están en el journal: se compactará en el siguiente intento
+                log.error("error compactando el journal de dispositivos: %s", e)
+            if stopping:
+                return
+
+    def _write_locked(self, batch):
+        """
+        Añade un lote de cambios al journal y lo sincroniza (requiere _io_lock).
+
+        Si falla, recorta el journal a su tamaño anterior para no dejar un lote a medias
+        delante del reintento.
+        """
+        start = time.perf_counter()
+        if self._file is None:
+            self._file = open(self.journal_path, "a")
+        offset = self._file.tell()
+        try:
+            self._file.write("".join(json.dumps(record) + "\n" for record in batch))
+            self._file.flush()
+            os.fsync(self._file.fileno())
+        except OSError:
+            file, self._file = self._file, None
+            try:
+                file.close()
+            except OSError:
+                pass
+            try:
+                os.truncate(self.journal_path, offset)
+            except OSError:
+                pass
+            raise
+        for record in batch:
+            apply_record(self._state, record)
+        self._applied_seq = batch[-1]["seq"]
+        self._since_snapshot += len(batch)
+        if self._write_seconds is not None:
+            self._write_seconds.observe(time.perf_counter() - start)
+
+    def _compact_locked(self):
+        """
+        Sustituye atómicamente el snapshot por el estado actual y vacía el journal (requiere _io_lock).
+        """
+        start = time.perf_counter()
+        snapshot = dict(self._state)
+        snapshot["journal_seq"] = self._applied_seq
+        tmp_path = self.snapshot_path + ".tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(snapshot, f, indent=4)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.snapshot_path)
+        _fsync_dir(self.snapshot_path)
+        if self._file is not None:
+            self._file.close()
+        self._file = open(self.journal_path, "w")
+        self._since_snapshot = 0
+        if self._compact_seconds is not None:
+            self._compact_seconds.observe(time.perf_counter() - start)
@@ -0,0 +1,116 @@
+"""
+liveness.py
+
+Detección de dispositivos que han dejado de publicar.
+
+Cada dispositivo vigilado tiene como mucho un temporizador en una `TimingWheel`. Recibir
+un mensaje solo anota el instante (no reprograma nada); cuando el temporizador vence se
+comprueba esa marca y, si el dispositivo ha hablado mientras tanto, se vuelve a armar
+para su nuevo plazo. Así el coste por mensaje es O(1) y el coste por dispositivo es un
+único disparo cada `timeout` segundos, aunque haya miles.
+"""
+import threading
+import time
+
+
+class LivenessMonitor:
+    """
+    Vigila la actividad de un conjunto de dispositivos.
+    """
+
+    def __init__(self, wheel, timeout, on_change=None):
+        """
+        Args:
+            wheel (TimingWheel): Rueda de temporizadores que se hace avanzar por fuera.
+            timeout (float): Segundos sin mensajes tras los que un dispositivo se da por perdido.
+            on_change (callable or None): Función (device_id, alive) a la que se avisa cuando
+                un dispositivo deja de publicar (alive=False) o vuelve (alive=True).
+        """
+        self.wheel = wheel
+        self.timeout = timeout
+        self.on_change = on_change
+        self.silent = set()  # Dispositivos que han superado el timeout
+        self._last = {}  # Último mensaje (time.monotonic()) por dispositivo
+        self._timers = {}
+        self._lock = threading.Lock()
+
+    def seen(self, device_id, now=None):
+        """
+        Registra que se ha recibido un mensaje de un dispositivo.
+
+        Es seguro llamarlo desde cualquier hilo (en particular, desde el hilo de red de paho).
+
+        Args:
+            device_id (str): ID del dispositivo.
+            now (float or None): Instante del mensaje (por defecto, time.monotonic()).
+
+        Returns:
+            None
+        """
+        if now is None:
+            now = time.monotonic()
+        with self._lock:
+            self._last[device_id] = now
+            revived = device_id in self.silent
+            self.silent.discard(device_id)
+            if device_id not in self._timers:
+                self._timers[device_id] = self.wheel.call_at(now + self.timeout, self._expire, device_id)
+        if revived and self.on_change is not None:
+            self.on_change(device_id, True)
+
+    def watch(self, device_id, now=None):
+        """
+        Empieza a vigilar un dispositivo que todavía no ha publicado nada.
+
+        Si no publica en `timeout` segundos desde ahora, se da por perdido. No hace nada si
+        el dispositivo ya estaba vigilado.
+
+        Args:
+            device_id (str): ID del dispositivo.
+            now (float or None): Instante desde el que se cuenta (por defecto, time.monotonic()).
+
+        Returns:
+            None
+        """
+        if now is None:
+            now = time.monotonic()
+        with self._lock:
+            if device_id in self._timers or device_id in self.silent:
+                return
+            self._last[device_id] = now
+            self._timers[device_id] = self.wheel.call_at(now + self.timeout, self._expire, device_id)
+
+    def forget(self, device_id):
+        """
+        Deja de vigilar un dispositivo (por ejemplo, al darlo de baja).
+
+        Args:
+            device_id (str): ID del dispositivo.
+
+        Returns:
+            None
+        """
+        with self._lock:
+            self._last.pop(device_id, None)
+            self.silent.discard(device_id)
+            timer = self._timers.pop(device_id, None)
+        if timer is not None:
+            timer.cancel()
+
+    def _expire(self, device_id):
+        """
+        Vence el temporizador de un dispositivo: lo rearma o lo marca como perdido.
+        """
+        now = time.monotonic()
+        with self._lock:
+            last = self._last.get(device_id)
+            if last is None:
+                return
+            deadline = last + self.timeout
+            if deadline > now:
+                self._timers[device_id] = self.wheel.call_at(deadline, self._expire, device_id)
+                return
+            del self._timers[device_id]
+            self.silent.add(device_id)
+        if self.on_change is not None:
+            self.on_change(device_id, False)
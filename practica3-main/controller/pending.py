@@ -0,0 +1,234 @@
+"""
+pending.py
+
+Registro de peticiones pendientes del controlador.
+
+Cada comando de Discord que necesita una respuesta de un dispositivo registra un
+futuro de asyncio asociado a una clave (el topic de respuesta del dispositivo o un
+identificador de correlación). Si el callback MQTT se ejecuta en el hilo de red de
+paho, resuelve esos futuros mediante `loop.call_soon_threadsafe`, de modo que el bucle
+de eventos de Discord nunca queda bloqueado esperando mensajes. Si se ejecuta en el
+propio bucle (modo asyncio, ver `controller.aio_mqtt`), los resuelve directamente.
+"""
+import asyncio
+import inspect
+import random
+import threading
+
+RETRY_BACKOFF = 0.5  # Espera inicial (s) antes de reenviar una petición sin respuesta
+RETRY_MAX_BACKOFF = 2.0  # Espera máxima (s) entre reenvíos
+
+
+def _set_result(future, value):
+    """
+    Fija el resultado de un futuro si todavía no se ha completado.
+
+    Args:
+        future (asyncio.Future): Futuro a completar.
+        value (any): Valor recibido.
+
+    Returns:
+        None
+    """
+    if not future.done():
+        future.set_result(value)
+
+
+class PendingRequests:
+    """
+    Conjunto de peticiones en vuelo indexadas por clave.
+
+    Varias peticiones pueden esperar sobre la misma clave (por ejemplo, dos usuarios
+    pidiendo el mismo sensor); todas se resuelven con el primer mensaje que llegue.
+    """
+
+    def __init__(self):
+        """
+        Inicializa un registro vacío de peticiones pendientes.
+        """
+        self._waiters = {}
+        self._lock = threading.Lock()
+
+    def register(self, key):
+        """
+        Registra una nueva petición pendiente sobre una clave.
+
+        Debe llamarse desde el bucle de eventos que esperará la respuesta.
+
+        Args:
+            key (str): Topic de respuesta o identificador de correlación.
+
+        Returns:
+            asyncio.Future: Futuro que se completará con el contenido de la respuesta.
+        """
+        future = asyncio.get_running_loop().create_future()
+        with self._lock:
+            self._waiters.setdefault(key, []).append(future)
+        return future
+
+    def discard(self, key, future):
+        """
+        Elimina una petición pendiente (por ejemplo, tras agotar su timeout).
+
+        Args:
+            key (str): Clave sobre la que se registró la petición.
+            future (asyncio.Future): Futuro devuelto por `register`.
+
+        Returns:
+            None
+        """
+        with self._lock:
+            waiters = self._waiters.get(key)
+            if waiters and future in waiters:
+                waiters.remove(future)
+                if not waiters:
+                    del self._waiters[key]
+
+    def resolve(self, key, value):
+        """
+        Completa todas las peticiones pendientes sobre una clave.
+
+        Es seguro llamarlo desde cualquier hilo (en particular, desde el hilo de red de paho).
+        Desde el bucle de los futuros se completan sin pasar por call_soon_threadsafe.
+
+        Args:
+            key (str): Topic de respuesta o identificador de correlación.
+            value (any): Contenido de la respuesta.
+
+        Returns:
+            bool: True si había alguna petición esperando esa clave, False en otro caso.
+        """
+        with self._lock:
+            waiters = self._waiters.pop(key, None)
+        if not waiters:
+            return False
+        try:
+            running = asyncio.get_running_loop()
+        except RuntimeError:
+            running = None
+        for future in waiters:
+            loop = future.get_loop()
+            if loop is running:
+                _set_result(future, value)
+            else:
+                loop.call_soon_threadsafe(_set_result, future, value)
+        return True
+
+    def pending_count(self):
+        """
+        Devuelve el número de peticiones que siguen esperando respuesta.
+
+        Returns:
+            int: Número de futuros pendientes.
+        """
+        with self._lock:
+            return sum(len(waiters) for waiters in self._waiters.values())
+
+    async def request(self, key, send, timeout):
+        """
+        Registra una petición, ejecuta el envío y espera la respuesta con timeout.
+
+        El futuro se registra antes de publicar para no perder respuestas muy rápidas.
+
+        Args:
+            key (str): Clave sobre la que llegará la respuesta.
+            send (callable): Función sin argumentos que publica la petición (puede devolver
+                un awaitable, que se espera antes de empezar a contar el timeout).
+            timeout (float): Tiempo máximo de espera en segundos.
+
+        Returns:
+            any: Contenido de la respuesta.
+
+        Raises:
+            asyncio.TimeoutError: Si no llega respuesta antes del timeout.
+        """
+        future = self.register(key)
+        try:
+            sent = send()
+            if inspect.isawaitable(sent):
+                await sent
+            return await asyncio.wait_for(future, timeout)
+        finally:
+            self.discard(key, future)
+
+    async def request_retry(self, keys, send, timeout, backoff=None, max_backoff=None):
+        """
+        Envía una petición idempotente y la reenvía con backoff exponencial hasta un plazo.
+
+        Tras cada envío se espera entre la mitad y el total de la espera actual (jitter,
+        para que muchos reintentos simultáneos no se sincronicen) y la espera se duplica
+        hasta `max_backoff`. La primera respuesta que llegue a cualquiera de las claves
+        completa la petición, aunque sea la de un envío anterior.
+
+        Args:
+            keys (list[str]): Claves sobre las que puede llegar la respuesta.
+            send (callable): Función sin argumentos que publica la petición (puede devolver
+                un awaitable). Debe ser seguro llamarla varias veces.
+            timeout (float): Plazo total en segundos, reintentos incluidos.
+            backoff (float or None): Espera inicial entre envíos (por defecto RETRY_BACKOFF).
+            max_backoff (float or None): Espera máxima entre envíos (por defecto RETRY_MAX_BACKOFF).
+
+        Returns:
+            any: Contenido de la respuesta.
+
+        Raises:
+            asyncio.TimeoutError: Si no llega respuesta antes del plazo.
+        """
+        if backoff is None:
+            backoff = RETRY_BACKOFF
+        if max_backoff is None:
+            max_backoff = RETRY_MAX_BACKOFF
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + timeout
+        futures = {key: self.register(key) for key in keys}
+        try:
+            delay = backoff
+            while True:
+                sent = send()
+                if inspect.isawaitable(sent):
+                    await sent
+                remaining = deadline - loop.time()
+                if remaining <= 0:
+                    raise asyncio.TimeoutError()
+                wait = min(delay / 2 + random.uniform(0, delay / 2), remaining)
+                done, _ = await asyncio.wait(futures.values(), timeout=wait,
+                                             return_when=asyncio.FIRST_COMPLETED)
+                if done:
+                    return done.pop().result()
+                if loop.time() >= deadline:
+                    raise asyncio.TimeoutError()
+                delay = min(delay * 2, max_backoff)
+        finally:
+            for key, future in futures.items():
+                future.cancel()
+                self.discard(key, future)
+
+    async def request_many(self, keys, send, timeout):
+        """
+        Registra varias peticiones, las publica todas a la vez y espera con un único plazo.
+
+        La latencia total queda acotada por el dispositivo más lento (o por el timeout),
+        no por la suma de todos ellos. Un dispositivo que no responde no retrasa al resto.
+
+        Args:
+            keys (list[str]): Claves sobre las que llegarán las respuestas.
+            send (callable): Función sin argumentos que publica todas las peticiones (puede
+                devolver un awaitable).
+            timeout (float): Plazo máximo común en segundos.
+
+        Returns:
+            dict: Respuesta por clave; las claves sin respuesta a tiempo tienen valor None.
+        """
+        futures = {key: self.register(key) for key in keys}
+        try:
+            sent = send()
+            if inspect.isawaitable(sent):
+                await sent
+            if futures:
+                await asyncio.wait(futures.values(), timeout=timeout)
+            return {key: future.result() if future.done() else None
+                    for key, future in futures.items()}
+        finally:
+            for key, future in futures.items():
+                future.cancel()
+                self.discard(key, future)
@@ -0,0 +1,198 @@
+"""
+provision.py
+
+Alta de dispositivos en bloque a partir de un manifiesto.
+
+Dar de alta cientos de dispositivos con `!add_device` supone un mensaje, una línea del
+journal y un anuncio por dispositivo. Aquí el alta en bloque reserva un tramo de IDs
+consecutivos, actualiza el registro de una vez y deja un único cambio 'add_range' en el
+journal, que se escribe y sincroniza en una sola operación.
+
+Formatos de manifiesto:
+
+    JSON:  {"switch": 200, "sensor": 10}
+           [{"type": "switch", "count": 200}, {"type": "watch"}]
+    CSV:   una fila 'tipo[,cantidad]' por línea (cantidad 1 si se omite); se admite una
+           cabecera 'type,count' y se ignoran las líneas vacías y las que empiezan por '#'.
+
+El controlador lo usa para `!add_devices` e `!import_devices`; como script sirve para
+provisionar el fichero de dispositivos con el controlador parado:
+
+    python controller/provision.py data/edificio.csv
+    python controller/provision.py --type switch --count 200
+"""
+import argparse
+import csv
+import io
+import json
+import os
+import sys
+
+# Permitir ejecutar el script directamente (python controller/provision.py)
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from controller.journal import DeviceJournal, empty_state
+from controller.registry import DeviceRegistry
+
+DEVICE_TYPES = ("sensor", "switch", "watch")
+MAX_BULK = 10000  # Dispositivos como máximo por alta en bloque
+DEVICES_FILE = "data/devices.json"
+TOPIC_BASE = "redes2/2312/1"
+
+
+def _entry(tipo, count, where):
+    """
+    Valida una entrada del manifiesto.
+
+    Returns:
+        tuple: (tipo, cantidad).
+
+    Raises:
+        ValueError: Si el tipo o la cantidad no son válidos.
+    """
+    if tipo not in DEVICE_TYPES:
+        raise ValueError(f"{where}: tipo de dispositivo no válido '{tipo}'")
+    try:
+        count = int(count)
+    except (TypeError, ValueError):
+        raise ValueError(f"{where}: cantidad no válida '{count}'") from None
+    if count < 1:
+        raise ValueError(f"{where}: la cantidad debe ser positiva")
+    return tipo, count
+
+
+def parse_manifest(text):
+    """
+    Interpreta un manifiesto de dispositivos en JSON o CSV.
+
+    Args:
+        text (str): Contenido del manifiesto.
+
+    Returns:
+        list[tuple]: Pares (tipo, cantidad) en el orden del manifiesto.
+
+    Raises:
+        ValueError: Si el manifiesto no es válido, está vacío o supera MAX_BULK dispositivos.
+    """
+    text = text.strip()
+    ranges = []
+    if text.startswith(("{", "[")):
+        spec = json.loads(text)
+        if isinstance(spec, dict):
+            ranges = [_entry(tipo, count, tipo) for tipo, count in spec.items()]
+        elif isinstance(spec, list):
+            for index, item in enumerate(spec, 1):
+                if not isinstance(item, dict):
+                    raise ValueError(f"Entrada {index}: se esperaba un objeto")
+                ranges.append(_entry(item.get("type"), item.get("count", 1), f"Entrada {index}"))
+        else:
+            raise ValueError("El manifiesto JSON debe ser un objeto o una lista")
+    else:
+        for number, row in enumerate(csv.reader(io.StringIO(text)), 1):
+            row = [field.strip() for field in row]
+            if not row or not row[0] or row[0].startswith("#") or row[0] == "type":
+                continue
+            ranges.append(_entry(row[0], row[1] if len(row) > 1 and row[1] else 1, f"Línea {number}"))
+    if not ranges:
+        raise ValueError("El manifiesto no contiene dispositivos")
+    total = sum(count for _, count in ranges)
+    if total > MAX_BULK:
+        raise ValueError(f"Demasiados dispositivos ({total}); el máximo es {MAX_BULK}")
+    return ranges
+
+
+def load_manifest(path):
+    """
+    Lee y valida un manifiesto de dispositivos.
+
+    Args:
+        path (str): Ruta del fichero (JSON o CSV).
+
+    Returns:
+        list[tuple]: Pares (tipo, cantidad).
+
+    Raises:
+        OSError: Si no se puede leer el fichero.
+        ValueError: Si el manifiesto no es válido.
+    """
+    with open(path, "r", encoding="utf-8") as f:
+        return parse_manifest(f.read())
+
+
+def provision(registry, journal, ranges):
+    """
+    Da de alta en bloque los dispositivos indicados.
+
+    Los IDs se asignan consecutivos y el alta se registra en el journal como un único
+    cambio 'add_range'.
+
+    Args:
+        registry (DeviceRegistry): Registro de dispositivos.
+        journal (DeviceJournal): Journal de cambios.
+        ranges (list[tuple]): Pares (tipo, cantidad) ya validados.
+
+    Returns:
+        list[str]: IDs asignados, en orden.
+    """
+    ids = registry.add_range(ranges)
+    if ids:
+        journal.append("add_range", id=ids[0], ranges=[[tipo, count] for tipo, count in ranges])
+    return ids
+
+
+def summarize(ranges, ids):
+    """
+    Resume un alta en bloque, con el tramo de IDs de cada tipo.
+
+    Args:
+        ranges (list[tuple]): Pares (tipo, cantidad) dados de alta.
+        ids (list[str]): IDs asignados, en el mismo orden.
+
+    Returns:
+        str: Resumen, por ejemplo '200 switch (4-203)'.
+    """
+    parts = []
+    start = 0
+    for tipo, count in ranges:
+        first, last = ids[start], ids[start + count - 1]
+        parts.append(f"{count} {tipo} ({first})" if count == 1 else f"{count} {tipo} ({first}-{last})")
+        start += count
+    return ", ".join(parts)
+
+
+def main():
+    """
+    Provisiona dispositivos en el fichero de dispositivos desde la línea de comandos.
+    """
+    parser = argparse.ArgumentParser(description="Alta de dispositivos en bloque")
+    parser.add_argument("manifest", nargs="?", help="Manifiesto JSON o CSV con los dispositivos")
+    parser.add_argument("--type", choices=DEVICE_TYPES, help="Tipo de los dispositivos (sin manifiesto)")
+    parser.add_argument("--count", type=int, default=1, help="Número de dispositivos (con --type)")
+    parser.add_argument("--devices-file", default=DEVICES_FILE, help="Snapshot de dispositivos del controlador")
+    args = parser.parse_args()
+    if (args.manifest is None) == (args.type is None):
+        parser.error("indica un manifiesto o --type")
+
+    try:
+        if args.manifest is not None:
+            ranges = load_manifest(args.manifest)
+        else:
+            ranges = parse_manifest(f"{args.type},{args.count}")
+    except (OSError, ValueError) as e:
+        parser.error(str(e))
+
+    os.makedirs(os.path.dirname(args.devices_file) or ".", exist_ok=True)
+    journal = DeviceJournal(args.devices_file)
+    try:
+        state = journal.open()
+    except FileNotFoundError:
+        state = empty_state()
+        journal.rebase(state)
+    registry = DeviceRegistry(state, TOPIC_BASE)
+    ids = provision(registry, journal, ranges)
+    journal.close()
+    print(f"Dispositivos añadidos en '{args.devices_file}': {summarize(ranges, ids)}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,335 @@
+"""
+publisher.py
+
+Cola de publicaciones salientes del controlador.
+
+Las acciones de las reglas sobre grupos grandes de switches generan ráfagas de cientos de
+publicaciones. En lugar de llamar a `mqtt_client.publish` una a una desde el callback MQTT,
+el controlador las encola en un `OutboundPublisher`:
+
+- La cola está acotada. Si el broker va lento y la cola se llena, quien publica desde un
+  hilo normal (temporizadores, evaluación de reglas en otros procesos) espera, en vez de
+  acumular memoria sin límite. Si la espera supera el plazo, la publicación se descarta y se
+  informa, nunca en silencio.
+- Desde un bucle de asyncio (los comandos de Discord) no se espera en el bucle: con la cola
+  llena, la espera se hace en un hilo del executor del bucle y `publish` devuelve un futuro
+  que se puede esperar (o `apublish`). Esto incluye el bucle del cliente en el modo de
+  `controller.aio_mqtt`.
+- Desde el hilo de red del cliente (o, en el modo de `controller.aio_mqtt`, desde dentro de
+  uno de sus callbacks), que es quien procesa las confirmaciones del broker, no se puede
+  esperar: con la cola llena la publicación se descarta y se cuenta. Es el caso de las acciones de las reglas
+  evaluadas en el callback MQTT; los estados ON/OFF perdidos los reenvía el reconciliador
+  de switches.
+- Un hilo en segundo plano vacía la cola por lotes: todas las publicaciones de un lote se
+  entregan juntas al cliente MQTT, que las escribe en el socket en la misma pasada de su
+  bucle de red (o en un único salto al bucle de asyncio en el modo de `controller.aio_mqtt`).
+- El número de publicaciones sin confirmar por el broker está acotado; mientras se supera,
+  el hilo no envía más lotes y la cola se va llenando.
+- La QoS depende de la clase de mensaje: las órdenes a dispositivos ('command') van con
+  QoS 1 y las peticiones de telemetría ('request'), con QoS 0.
+"""
+import asyncio
+import concurrent.futures
+import inspect
+import logging
+import queue
+import threading
+
+import paho.mqtt.client as mqtt
+
+MAX_QUEUE = 10000  # Publicaciones encoladas como máximo
+MAX_BATCH = 500  # Publicaciones por lote
+MAX_UNACKED = 1000  # Publicaciones enviadas sin confirmar como máximo
+PUT_TIMEOUT = 5.0  # Segundos que espera quien publica con la cola llena
+QOS_BY_CLASS = {"command": 1, "request": 0}  # QoS por clase de mensaje
+
+log = logging.getLogger("controller.publisher")
+
+
+def _running_loop():
+    """
+    Devuelve el bucle de asyncio en ejecución en este hilo, o None si no hay ninguno.
+    """
+    try:
+        return asyncio.get_running_loop()
+    except RuntimeError:
+        return None
+
+
+class OutboundPublisher:
+    """
+    Cola acotada de publicaciones MQTT con envío por lotes en segundo plano.
+    """
+
+    def __init__(self, client, loop=None, max_queue=MAX_QUEUE, batch_size=MAX_BATCH,
+                 max_unacked=MAX_UNACKED, qos_by_class=None):
+        """
+        Inicializa el publicador. Hay que llamar a `start` para arrancar el envío.
+
+        Args:
+            client (mqtt.Client or AsyncioMqtt): Cliente MQTT con el que publicar.
+            loop (asyncio.AbstractEventLoop or None): Bucle en el que hay que llamar a publish
+                (modo asyncio); None si el cliente admite publicar desde cualquier hilo.
+            max_queue (int): Capacidad de la cola.
+            batch_size (int): Publicaciones máximas por lote.
+            max_unacked (int): Publicaciones sin confirmar a partir de las que se deja de enviar.
+            qos_by_class (dict or None): QoS por clase de mensaje (por defecto QOS_BY_CLASS).
+        """
+        self.client = client
+        self.loop = loop
+        self.batch_size = batch_size
+        self.max_unacked = max_unacked
+        self.qos_by_class = dict(QOS_BY_CLASS)
+        if qos_by_class:
+            self.qos_by_class.update(qos_by_class)
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._unacked = []
+        self._lock = threading.Lock()
+        self._thread = None
+        self._network_thread = None
+        self.published = 0
+        self.dropped = 0
+        self.batches = 0
+
+    def start(self):
+        """
+        Arranca el hilo de envío si no está en marcha.
+
+        Returns:
+            None
+        """
+        if self._thread is None or not self._thread.is_alive():
+            self._thread = threading.Thread(target=self._run, name="mqtt-publisher", daemon=True)
+            self._thread.start()
+
+    def bind_network_thread(self, thread=None):
+        """
+        Indica qué hilo procesa la red del cliente (modo hilo de paho).
+
+        El controlador lo llama desde on_connect, que paho ejecuta en su hilo de red.
+
+        Args:
+            thread (threading.Thread or None): Hilo de red (por defecto, el actual).
+
+        Returns:
+            None
+        """
+        self._network_thread = threading.current_thread() if thread is None else thread
+
+    def qos_for(self, kind):
+        """
+        Devuelve la QoS de una clase de mensaje.
+
+        Args:
+            kind (str): Clase de mensaje ('command' o 'request').
+
+        Returns:
+            int: Nivel de QoS (0 para clases desconocidas).
+        """
+        return self.qos_by_class.get(kind, 0)
+
+    def publish(self, topic, payload=None, kind="command", retain=False, timeout=PUT_TIMEOUT):
+        """
+        Encola una publicación. Si la cola está llena, espera hasta `timeout` segundos.
+
+        Desde el hilo de red del cliente (o desde un callback MQTT en su bucle de asyncio) no
+        se puede esperar, porque es quien procesa las confirmaciones del broker: con la cola
+        llena la publicación se descarta. Desde un bucle de asyncio (por ejemplo, un comando
+        de Discord) la espera se hace fuera del bucle y se devuelve un futuro con el resultado.
+
+        Args:
+            topic (str): Topic de destino.
+            payload (str, bytes or None): Contenido del mensaje.
+            kind (str): Clase de mensaje, que determina la QoS.
+            retain (bool): Si el broker debe retener el mensaje.
+            timeout (float or None): Segundos máximos de espera con la cola llena.
+
+        Returns:
+            bool or asyncio.Future: True si la publicación se ha encolado, False si se ha
+            descartado; desde un bucle de asyncio con la cola llena, un futuro con ese valor.
+        """
+        item = (topic, payload, self.qos_for(kind), retain)
+        loop = _running_loop()
+        try:
+            self._queue.put_nowait(item)
+            return True
+        except queue.Full:
+            pass
+        if self._on_network_thread(loop):
+            self._drop(topic, "cola de publicación llena en el hilo de red, se descarta el mensaje")
+            return False
+        if loop is not None:
+            return loop.run_in_executor(None, self._put, item, timeout)
+        return self._put(item, timeout)
+
+    async def apublish(self, topic, payload=None, kind="command", retain=False, timeout=PUT_TIMEOUT):
+        """
+        Versión para corrutinas de `publish`: espera a que la publicación se encole sin
+        bloquear el bucle.
+
+        Returns:
+            bool: True si la publicación se ha encolado, False si se ha descartado.
+        """
+        result = self.publish(topic, payload, kind=kind, retain=retain, timeout=timeout)
+        if inspect.isawaitable(result):
+            result = await result
+        return result
+
+    def _put(self, item, timeout):
+        """
+        Encola una publicación esperando hasta `timeout` segundos si la cola está llena.
+        """
+        try:
+            self._queue.put(item, timeout=timeout)
+        except queue.Full:
+            self._drop(item[0], "cola de publicación llena, se descarta el mensaje")
+            return False
+        return True
+
+    def _drop(self, topic, reason):
+        """
+        Cuenta e informa de una publicación descartada.
+        """
+        with self._lock:
+            self.dropped += 1
+        log.warning(reason, extra={"topic": topic})
+
+    def _on_network_thread(self, loop=None):
+        """
+        Indica si se está ejecutando en el hilo que procesa la red del cliente o, en el modo
+        asyncio, dentro de uno de sus callbacks (ver `AsyncioMqtt.in_callback`).
+        """
+        if self.loop is not None:
+            return loop is self.loop and getattr(self.client, "in_callback", False) is True
+        return self._network_thread is threading.current_thread()
+
+    def depth(self):
+        """
+        Devuelve el número de publicaciones que esperan en la cola.
+
+        Returns:
+            int: Profundidad de la cola.
+        """
+        return self._queue.qsize()
+
+    def unacked(self):
+        """
+        Devuelve el número de publicaciones enviadas que el broker aún no ha confirmado.
+
+        Returns:
+            int: Publicaciones sin confirmar.
+        """
+        self._prune()
+        return len(self._unacked)
+
+    def flush(self, timeout=None):
+        """
+        Espera a que la cola se vacíe.
+
+        Args:
+            timeout (float or None): Segundos máximos de espera.
+
+        Returns:
+            bool: True si la cola está vacía, False si se agotó el tiempo.
+        """
+        with self._queue.all_tasks_done:
+            return self._queue.all_tasks_done.wait_for(lambda: not self._queue.unfinished_tasks, timeout)
+
+    def close(self, timeout=PUT_TIMEOUT):
+        """
+        Envía lo pendiente y detiene el hilo de envío.
+
+        Args:
+            timeout (float or None): Segundos máximos para vaciar la cola.
+
+        Returns:
+            None
+        """
+        if self._thread is not None and self._thread.is_alive():
+            self.flush(timeout)
+            self._queue.put(None)
+            self._thread.join(timeout)
+        self._thread = None
+
+    def _run(self):
+        """
+        Bucle del hilo de envío: saca lotes de la cola y los entrega al cliente.
+        """
+        while True:
+            item = self._queue.get()
+            if item is None:
+                self._queue.task_done()
+                return
+            batch = [item]
+            while len(batch) < self.batch_size:
+                try:
+                    item = self._queue.get_nowait()
+                except queue.Empty:
+                    break
+                if item is None:
+                    self._queue.task_done()
+                    self._queue.put(None)
+                    break
+                batch.append(item)
+            self._wait_unacked()
+            try:
+                if self.loop is not None:
+                    done = concurrent.futures.Future()
+                    self.loop.call_soon_threadsafe(self._send_into, batch, done)
+                    done.result(PUT_TIMEOUT)
+                else:
+                    self._send(batch)
+            except (concurrent.futures.TimeoutError, RuntimeError) as e:
+                self.dropped += len(batch)
+                log.error("no se pudo enviar un lote de %d mensajes: %s", len(batch), e)
+            finally:
+                for _ in batch:
+                    self._queue.task_done()
+
+    def _send(self, batch):
+        """
+        Publica un lote con el cliente y guarda sus confirmaciones pendientes.
+        """
+        infos = [self.client.publish(topic, payload, qos=qos, retain=retain)
+                 for topic, payload, qos, retain in batch]
+        sent = [info for info in infos if info.rc == mqtt.MQTT_ERR_SUCCESS]
+        with self._lock:
+            self._unacked.extend(sent)
+            self.published += len(sent)
+            self.dropped += len(infos) - len(sent)
+            self.batches += 1
+
+    def _send_into(self, batch, done):
+        """
+        Publica un lote desde el bucle de asyncio y notifica al hilo de envío.
+        """
+        try:
+            self._send(batch)
+            done.set_result(None)
+        except Exception as e:
+            done.set_exception(e)
+
+    def _prune(self):
+        """
+        Olvida las publicaciones ya confirmadas por el broker.
+        """
+        with self._lock:
+            self._unacked = [info for info in self._unacked if not info.is_published()]
+
+    def _wait_unacked(self):
+        """
+        Espera mientras haya demasiadas publicaciones sin confirmar.
+
+        Si la más antigua no se confirma en PUT_TIMEOUT segundos, las pendientes dejan de
+        contarse (paho las reenviará al reconectar), para que una conexión caída no detenga el
+        envío para siempre.
+        """
+        self._prune()
+        while len(self._unacked) >= self.max_unacked:
+            oldest = self._unacked[0]
+            oldest.wait_for_publish(PUT_TIMEOUT)
+            if not oldest.is_published():
+                log.warning("%d publicaciones sin confirmar tras %s s", len(self._unacked), PUT_TIMEOUT)
+                with self._lock:
+                    self._unacked.clear()
+            self._prune()
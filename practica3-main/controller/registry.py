@@ -0,0 +1,301 @@
+"""
+registry.py
+
+Registro de dispositivos del controlador con índices secundarios.
+
+Envuelve el diccionario persistido `device_data` ({"device_last_id": N, "devices": {id: tipo}})
+y mantiene, actualizados de forma incremental en cada alta y baja:
+
+- tipo -> IDs de ese tipo (en orden de alta), para que buscar todos los switches o
+  sensores cueste O(k) en los dispositivos que coinciden y no O(n) en el total.
+- ID -> metadatos (tipo, topic y último instante en que se recibió un mensaje).
+"""
+import math
+import threading
+import time
+
+from controller.journal import apply_record
+
+
+class DeviceInfo:
+    """
+    Metadatos de un dispositivo registrado.
+    """
+
+    __slots__ = ("device_id", "tipo", "topic", "last_seen")
+
+    def __init__(self, device_id, tipo, topic):
+        """
+        Inicializa los metadatos de un dispositivo.
+
+        Args:
+            device_id (str): ID del dispositivo.
+            tipo (str): Tipo del dispositivo ('sensor', 'switch' o 'watch').
+            topic (str): Topic MQTT del dispositivo.
+        """
+        self.device_id = device_id
+        self.tipo = tipo
+        self.topic = topic
+        self.last_seen = None
+
+
+class DeviceRegistry:
+    """
+    Vista indexada sobre el diccionario de dispositivos del controlador.
+
+    Todas las altas y bajas deben pasar por el registro (`add`, `add_range`, `remove` o
+    `apply`). Quien modifique el diccionario por fuera (por ejemplo, al cargarlo de disco)
+    debe llamar después a `rebuild`; solo se detecta sin ayuda que se haya sustituido el
+    diccionario de dispositivos por otro, comprobando su identidad.
+
+    Es seguro entre hilos: las altas, bajas y reconstrucciones (desde el bucle de Discord) se
+    hacen bajo un cerrojo, y las consultas que recorren los índices (desde el hilo de red de
+    paho) también lo toman; las búsquedas por ID no lo necesitan.
+    """
+
+    def __init__(self, data, base):
+        """
+        Inicializa el registro sobre un diccionario de dispositivos.
+
+        Args:
+            data (dict): Diccionario con las claves 'device_last_id' y 'devices'.
+            base (str): Prefijo de topics del sistema (por ejemplo 'redes2/2312/1').
+        """
+        self.data = data
+        self.base = base
+        self._devices = None
+        self._by_type = {}
+        self._info = {}
+        self._lock = threading.RLock()
+        self.rebuild()
+
+    def _sync(self):
+        """
+        Reconstruye los índices si el diccionario de dispositivos se ha sustituido por otro.
+        """
+        if self.data.get("devices") is not self._devices:
+            with self._lock:
+                if self.data.get("devices") is not self._devices:
+                    self.rebuild()
+
+    def rebuild(self):
+        """
+        Reconstruye todos los índices a partir del diccionario de dispositivos.
+
+        Returns:
+            None
+        """
+        with self._lock:
+            previous = self._info
+            devices = self.data.setdefault("devices", {})
+            # Los índices nuevos se construyen aparte y se publican al final, para que las
+            # búsquedas por ID sin cerrojo nunca vean uno a medias
+            by_type, info = {}, {}
+            for device_id, tipo in devices.items():
+                by_type.setdefault(tipo, {})[device_id] = None
+                entry = info[device_id] = DeviceInfo(device_id, tipo, f"{self.base}/{tipo}_{device_id}")
+                old = previous.get(device_id)
+                if old is not None and old.tipo == tipo:
+                    entry.last_seen = old.last_seen
+            self._by_type, self._info, self._devices = by_type, info, devices
+
+    def _index(self, device_id, tipo):
+        """
+        Añade un dispositivo a los índices secundarios.
+        """
+        self._by_type.setdefault(tipo, {})[device_id] = None
+        self._info[device_id] = DeviceInfo(device_id, tipo, f"{self.base}/{tipo}_{device_id}")
+
+    def add(self, tipo):
+        """
+        Da de alta un dispositivo nuevo con el siguiente ID libre.
+
+        Args:
+            tipo (str): Tipo del dispositivo.
+
+        Returns:
+            str: ID asignado.
+        """
+        self._sync()
+        with self._lock:
+            self.data["device_last_id"] = self.data.get("device_last_id", 0) + 1
+            device_id = str(self.data["device_last_id"])
+            self._devices[device_id] = tipo
+            self._index(device_id, tipo)
+            return device_id
+
+    def add_range(self, ranges):
+        """
+        Da de alta varios dispositivos con IDs consecutivos a partir del siguiente libre.
+
+        Args:
+            ranges (list[tuple]): Pares (tipo, cantidad); los IDs se asignan en ese orden.
+
+        Returns:
+            list[str]: IDs asignados, en orden.
+        """
+        self._sync()
+        with self._lock:
+            next_id = self.data.get("device_last_id", 0) + 1
+            ids = []
+            for tipo, count in ranges:
+                for _ in range(count):
+                    device_id = str(next_id)
+                    self._devices[device_id] = tipo
+                    self._index(device_id, tipo)
+                    ids.append(device_id)
+                    next_id += 1
+            self.data["device_last_id"] = next_id - 1
+            return ids
+
+    def apply(self, record):
+        """
+        Aplica un alta o baja con el formato del journal (ver `controller.journal`).
+
+        Args:
+            record (dict): Cambio a aplicar ('add', 'add_range' o 'remove').
+
+        Returns:
+            list[str]: IDs que no estaban registrados y se han dado de alta, o el ID dado de
+            baja si existía.
+        """
+        self._sync()
+        with self._lock:
+            if record["op"] == "remove":
+                return [record["id"]] if self.remove(record["id"]) is not None else []
+            if record["op"] == "add":
+                ids = [record["id"]]
+            elif record["op"] == "add_range":
+                first = int(record["id"])
+                ids = [str(first + offset) for offset in range(sum(count for _, count in record["ranges"]))]
+            else:
+                return []
+            added = [device_id for device_id in ids if device_id not in self._info]
+            for device_id in ids:
+                if device_id in self._info:
+                    self._unindex(device_id)
+            apply_record(self.data, record)
+            for device_id in ids:
+                self._index(device_id, self._devices[device_id])
+            return added
+
+    def _unindex(self, device_id):
+        """
+        Quita un dispositivo de los índices secundarios.
+        """
+        info = self._info.pop(device_id)
+        ids = self._by_type[info.tipo]
+        ids.pop(device_id, None)
+        if not ids:
+            del self._by_type[info.tipo]
+
+    def remove(self, device_id):
+        """
+        Da de baja un dispositivo.
+
+        Args:
+            device_id (str): ID del dispositivo.
+
+        Returns:
+            str or None: Tipo del dispositivo eliminado, o None si no existía.
+        """
+        self._sync()
+        with self._lock:
+            tipo = self._devices.pop(device_id, None)
+            if tipo is not None:
+                self._unindex(device_id)
+            return tipo
+
+    def type_of(self, device_id):
+        """
+        Obtiene el tipo de un dispositivo.
+
+        Args:
+            device_id (str): ID del dispositivo.
+
+        Returns:
+            str or None: Tipo, o None si el ID no está registrado.
+        """
+        self._sync()
+        info = self._info.get(device_id)
+        return info.tipo if info else None
+
+    def get(self, device_id):
+        """
+        Obtiene los metadatos de un dispositivo.
+
+        Args:
+            device_id (str): ID del dispositivo.
+
+        Returns:
+            DeviceInfo or None: Metadatos, o None si el ID no está registrado.
+        """
+        self._sync()
+        return self._info.get(device_id)
+
+    def ids_by_type(self, tipo):
+        """
+        Obtiene los IDs de todos los dispositivos de un tipo, en orden de alta.
+
+        Args:
+            tipo (str): Tipo de dispositivo.
+
+        Returns:
+            list[str]: IDs de ese tipo.
+        """
+        self._sync()
+        with self._lock:
+            return list(self._by_type.get(tipo, ()))
+
+    def count(self, tipo=None):
+        """
+        Cuenta los dispositivos registrados, en total o de un tipo.
+
+        Args:
+            tipo (str or None): Tipo a contar; None para todos.
+
+        Returns:
+            int: Número de dispositivos.
+        """
+        self._sync()
+        if tipo is None:
+            return len(self._info)
+        return len(self._by_type.get(tipo, ()))
+
+    def touch(self, device_id, now=None):
+        """
+        Registra que se ha recibido un mensaje de un dispositivo.
+
+        Args:
+            device_id (str): ID del dispositivo.
+            now (float or None): Instante de recepción (por defecto, time.time()).
+
+        Returns:
+            None
+        """
+        info = self._info.get(device_id)
+        if info is not None:
+            info.last_seen = time.time() if now is None else now
+
+    def page(self, tipo=None, page=1, per_page=20):
+        """
+        Obtiene una página del listado de dispositivos, opcionalmente filtrado por tipo.
+
+        Args:
+            tipo (str or None): Tipo por el que filtrar; None para todos.
+            page (int): Número de página (empieza en 1).
+            per_page (int): Dispositivos por página.
+
+        Returns:
+            tuple: (lista de DeviceInfo de la página, número total de páginas, total de dispositivos).
+        """
+        self._sync()
+        with self._lock:
+            if tipo is None:
+                ids = list(self._info)
+            else:
+                ids = list(self._by_type.get(tipo, ()))
+        total = len(ids)
+        pages = max(1, math.ceil(total / per_page))
+        start = (page - 1) * per_page
+        return [self._info[device_id] for device_id in ids[start:start + per_page]], pages, total
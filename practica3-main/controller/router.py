@@ -0,0 +1,178 @@
+"""
+router.py
+
+Enrutador de topics MQTT basado en un trie de niveles.
+
+Los handlers se registran con patrones MQTT ('+' sustituye a un nivel completo y '#' a
+todos los restantes). Además se admite el patrón de nivel '<tipo>_+' (por ejemplo
+'redes2/2312/1/sensor_+'), que captura los niveles '<tipo>_<id>' de ese tipo: se guarda
+como un hijo más del trie y, al buscar un nivel de dispositivo como 'sensor_4', se consulta
+también el hijo 'sensor_+', sin comparar subcadenas con cada patrón. El resultado de cada búsqueda se memoriza por
+topic, por lo que los mensajes repetidos de un mismo dispositivo se despachan sin recorrer
+el trie.
+"""
+
+MAX_COMPILED_TOPICS = 10000  # Límite de topics memorizados antes de vaciar la tabla
+
+
+def type_pattern(level):
+    """
+    Obtiene el patrón de tipo que captura un nivel de dispositivo.
+
+    Args:
+        level (str): Nivel de un topic, por ejemplo 'sensor_4'.
+
+    Returns:
+        str or None: Patrón '<tipo>_+' (por ejemplo 'sensor_+'), o None si el nivel no tiene
+        la forma '<tipo>_<id>'.
+    """
+    head, sep, tail = level.rpartition("_")
+    if sep and head and tail.isdigit():
+        return f"{head}_+"
+    return None
+
+
+def parse_device_topic(topic):
+    """
+    Obtiene el tipo e ID del dispositivo al que pertenece un topic.
+
+    Args:
+        topic (str): Topic MQTT, por ejemplo 'redes2/2312/1/switch_2'.
+
+    Returns:
+        tuple or None: (tipo, id) como strings, o None si el topic no es de un dispositivo.
+    """
+    head, sep, tail = topic.rpartition("/")[2].rpartition("_")
+    if sep and head and tail.isdigit():
+        return head, tail
+    return None
+
+
+class _Node:
+    """
+    Nodo del trie de topics.
+    """
+
+    __slots__ = ("children", "handlers")
+
+    def __init__(self):
+        self.children = {}
+        self.handlers = []
+
+
+class TopicRouter:
+    """
+    Despachador de mensajes MQTT a handlers registrados por patrón de topic.
+
+    El coste de una búsqueda es O(profundidad del topic) y no depende del número de
+    dispositivos; las búsquedas repetidas se resuelven desde una tabla ya compilada.
+    """
+
+    def __init__(self):
+        """
+        Inicializa un enrutador sin rutas.
+        """
+        self._root = _Node()
+        self._order = 0
+        self._compiled = {}
+
+    def add(self, pattern, handler):
+        """
+        Registra un handler para un patrón de topic.
+
+        Args:
+            pattern (str): Patrón MQTT, por ejemplo 'redes2/2312/1/sensor_+'.
+            handler (callable): Función handler(topic, message).
+
+        Returns:
+            None
+        """
+        node = self._root
+        for level in pattern.split("/"):
+            node = node.children.setdefault(level, _Node())
+        node.handlers.append((self._order, handler))
+        self._order += 1
+        self._compiled.clear()
+
+    def remove(self, pattern, handler):
+        """
+        Elimina un handler previamente registrado.
+
+        Args:
+            pattern (str): Patrón con el que se registró.
+            handler (callable): Handler a eliminar.
+
+        Returns:
+            bool: True si se eliminó, False si no estaba registrado.
+        """
+        node = self._root
+        for level in pattern.split("/"):
+            node = node.children.get(level)
+            if node is None:
+                return False
+        for entry in node.handlers:
+            if entry[1] == handler:
+                node.handlers.remove(entry)
+                self._compiled.clear()
+                return True
+        return False
+
+    def match(self, topic):
+        """
+        Obtiene los handlers cuyo patrón coincide con un topic, en orden de registro.
+
+        Args:
+            topic (str): Topic MQTT concreto.
+
+        Returns:
+            tuple: Handlers que deben recibir el mensaje.
+        """
+        handlers = self._compiled.get(topic)
+        if handlers is None:
+            found = []
+            self._collect(self._root, topic.split("/"), 0, found)
+            found.sort(key=lambda entry: entry[0])
+            handlers = tuple(handler for _, handler in found)
+            if len(self._compiled) >= MAX_COMPILED_TOPICS:
+                self._compiled.clear()
+            self._compiled[topic] = handlers
+        return handlers
+
+    def _collect(self, node, levels, index, found):
+        """
+        Recorre el trie acumulando los handlers que coinciden con los niveles dados.
+        """
+        wildcard = node.children.get("#")
+        if wildcard is not None:
+            found.extend(wildcard.handlers)
+        if index == len(levels):
+            found.extend(node.handlers)
+            return
+        level = levels[index]
+        child = node.children.get(level)
+        if child is not None:
+            self._collect(child, levels, index + 1, found)
+        child = node.children.get("+")
+        if child is not None:
+            self._collect(child, levels, index + 1, found)
+        pattern = type_pattern(level)
+        if pattern is not None:
+            child = node.children.get(pattern)
+            if child is not None:
+                self._collect(child, levels, index + 1, found)
+
+    def dispatch(self, topic, message):
+        """
+        Entrega un mensaje a todos los handlers cuyo patrón coincide con su topic.
+
+        Args:
+            topic (str): Topic en el que se recibió el mensaje.
+            message (any): Contenido del mensaje.
+
+        Returns:
+            int: Número de handlers invocados.
+        """
+        handlers = self.match(topic)
+        for handler in handlers:
+            handler(topic, message)
+        return len(handlers)
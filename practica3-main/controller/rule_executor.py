@@ -0,0 +1,229 @@
+"""
+rule_executor.py
+
+Evaluación de reglas costosas fuera del hilo de recepción de mensajes.
+
+Las reglas sencillas (`temp > 25`) se evalúan en línea, en el callback MQTT, en menos de
+un microsegundo. Las de ventana (media, tendencia... sobre cientos de lecturas, ver
+`controller.rules`) pueden tardar bastante más, y evaluarlas en el callback retrasa la
+lectura de todos los mensajes que vienen detrás. Las reglas que lo piden con
+"executor": "process" se evalúan aquí:
+
+- El callback solo encola (regla, topic, lecturas de la ventana) y vuelve; si la cola está
+  llena la evaluación se descarta y se cuenta, nunca se bloquea la recepción.
+- Un hilo en segundo plano agrupa lo encolado en lotes (hasta `batch_size` evaluaciones o
+  `batch_delay` segundos) y envía cada lote como una única tarea a un
+  `ProcessPoolExecutor`, así que las estadísticas se calculan en otros núcleos, fuera del
+  GIL del controlador, y el coste de enviar datos a otro proceso se reparte entre el lote.
+- Los lotes en vuelo están acotados; mientras se supera el límite, el hilo deja de enviar
+  y la cola se va llenando (contrapresión).
+- Cuando termina un lote se llama a `on_fired(regla, topic)` por cada regla que se
+  dispara, desde el hilo de resultados del executor.
+
+A los otros procesos solo viajan tipos básicos (operador, umbral, estadístico y lecturas);
+la evaluación la hace `controller.rules.evaluate_batch`.
+"""
+import concurrent.futures
+import logging
+import os
+import queue
+import threading
+import time
+
+from controller.rules import evaluate_batch
+
+MAX_BACKLOG = 10000  # Evaluaciones encoladas como máximo
+BATCH_SIZE = 256  # Evaluaciones por lote
+BATCH_DELAY = 0.01  # Segundos que se espera a completar un lote
+BATCHES_PER_WORKER = 2  # Lotes en vuelo como máximo por proceso
+
+log = logging.getLogger("controller.rule_executor")
+
+
+class RuleExecutor:
+    """
+    Cola de evaluaciones de reglas que se resuelven por lotes en un pool de procesos.
+    """
+
+    def __init__(self, on_fired, workers=None, batch_size=BATCH_SIZE, batch_delay=BATCH_DELAY,
+                 max_backlog=MAX_BACKLOG, max_batches=None, executor=None):
+        """
+        Inicializa el executor. Hay que llamar a `start` para arrancar la evaluación.
+
+        Args:
+            on_fired (callable): Función (regla, topic) a la que se llama por cada regla que
+                se dispara.
+            workers (int or None): Procesos del pool (None: uno por núcleo).
+            batch_size (int): Evaluaciones máximas por lote.
+            batch_delay (float): Segundos máximos de espera para completar un lote.
+            max_backlog (int): Capacidad de la cola de evaluaciones.
+            max_batches (int or None): Lotes en vuelo como máximo (por defecto,
+                BATCHES_PER_WORKER por proceso).
+            executor (concurrent.futures.Executor or None): Executor a usar en lugar de crear
+                un ProcessPoolExecutor (no se cierra en `close`).
+        """
+        self.on_fired = on_fired
+        self.workers = workers
+        self.batch_size = batch_size
+        self.batch_delay = batch_delay
+        self._executor = executor
+        self._owns_executor = executor is None
+        self._queue = queue.Queue(maxsize=max_backlog)
+        if max_batches is None:
+            max_batches = BATCHES_PER_WORKER * (workers or os.cpu_count() or 1)
+        self._slots = threading.BoundedSemaphore(max_batches)
+        self._lock = threading.Lock()
+        self._pending = 0
+        self._thread = None
+        self.evaluated = 0
+        self.fired = 0
+        self.dropped = 0
+        self.batches = 0
+
+    def start(self):
+        """
+        Crea el pool de procesos (si no se indicó otro executor) y arranca el hilo de envío.
+
+        Returns:
+            None
+        """
+        if self._executor is None:
+            self._executor = concurrent.futures.ProcessPoolExecutor(max_workers=self.workers)
+        if self._thread is None or not self._thread.is_alive():
+            self._thread = threading.Thread(target=self._run, name="rule-executor", daemon=True)
+            self._thread.start()
+
+    def submit(self, rule, topic, values):
+        """
+        Encola la evaluación de una regla sin esperar nunca.
+
+        Args:
+            rule (Rule): Regla a evaluar.
+            topic (str): Topic de la lectura que la ha provocado.
+            values (tuple[float]): Lecturas de la ventana de la regla.
+
+        Returns:
+            bool: True si se ha encolado, False si la cola estaba llena y se ha descartado.
+        """
+        with self._lock:
+            self._pending += 1
+        try:
+            self._queue.put_nowait((rule, topic, values))
+        except queue.Full:
+            with self._lock:
+                self._pending -= 1
+                self.dropped += 1
+            log.warning("cola de evaluación de reglas llena, se descarta", extra={"rule": rule.name, "topic": topic})
+            return False
+        return True
+
+    def backlog(self):
+        """
+        Devuelve el número de evaluaciones encoladas o en curso en otro proceso.
+
+        Returns:
+            int: Evaluaciones pendientes.
+        """
+        with self._lock:
+            return self._pending
+
+    def flush(self, timeout=None):
+        """
+        Espera a que se hayan evaluado todas las evaluaciones pendientes.
+
+        Args:
+            timeout (float or None): Segundos máximos de espera.
+
+        Returns:
+            bool: True si no queda nada pendiente, False si se agotó el tiempo.
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while self.backlog():
+            if deadline is not None and time.monotonic() >= deadline:
+                return False
+            time.sleep(0.005)
+        return True
+
+    def close(self, timeout=5.0):
+        """
+        Evalúa lo pendiente, detiene el hilo de envío y cierra el pool de procesos.
+
+        Args:
+            timeout (float or None): Segundos máximos para vaciar la cola.
+
+        Returns:
+            None
+        """
+        if self._thread is not None and self._thread.is_alive():
+            self.flush(timeout)
+            self._queue.put(None)
+            self._thread.join(timeout)
+        self._thread = None
+        if self._owns_executor and self._executor is not None:
+            self._executor.shutdown(wait=True, cancel_futures=True)
+            self._executor = None
+
+    def _run(self):
+        """
+        Bucle del hilo de envío: agrupa las evaluaciones encoladas y envía cada lote al pool.
+        """
+        stop = False
+        while not stop:
+            item = self._queue.get()
+            if item is None:
+                return
+            batch = [item]
+            deadline = time.monotonic() + self.batch_delay
+            while len(batch) < self.batch_size:
+                remaining = deadline - time.monotonic()
+                try:
+                    item = self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait()
+                except queue.Empty:
+                    break
+                if item is None:
+                    stop = True
+                    break
+                batch.append(item)
+            self._slots.acquire()
+            try:
+                future = self._executor.submit(evaluate_batch, [(rule.op, rule.threshold, rule.stat, values)
+                                                                for rule, _, values in batch])
+            except RuntimeError as e:
+                # El pool se está cerrando o ha perdido un proceso
+                self._finish(batch)
+                log.error("no se pudo evaluar un lote de %d reglas: %s", len(batch), e)
+                continue
+            future.add_done_callback(lambda done, batch=batch: self._completed(batch, done))
+
+    def _completed(self, batch, future):
+        """
+        Recoge el resultado de un lote y avisa de las reglas que se disparan.
+
+        Aunque el lote falle o se cancele (al cerrar el pool), su hueco se libera siempre.
+        """
+        try:
+            try:
+                results = future.result()
+            except (Exception, concurrent.futures.CancelledError) as e:
+                log.error("fallo al evaluar un lote de %d reglas: %r", len(batch), e)
+                return
+            fired = [(rule, topic) for (rule, topic, _), ok in zip(batch, results) if ok]
+            with self._lock:
+                self.evaluated += len(batch)
+                self.fired += len(fired)
+                self.batches += 1
+            try:
+                for rule, topic in fired:
+                    self.on_fired(rule, topic)
+            except Exception:
+                log.exception("error al aplicar una regla evaluada en otro proceso")
+        finally:
+            self._finish(batch)
+
+    def _finish(self, batch):
+        """
+        Da por terminado un lote y libera su hueco.
+        """
+        with self._lock:
+            self._pending -= len(batch)
+        self._slots.release()
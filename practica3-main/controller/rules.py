@@ -0,0 +1,366 @@
+"""
+rules.py
+
+Motor de reglas declarativas del controlador.
+
+Cada regla indica un dispositivo (o patrón de topics) de origen, una condición sobre el
+valor recibido, los switches destino y la acción a enviarles. Al cargarlas, las reglas se
+compilan en un índice por topic de origen (un TopicRouter), de modo que cada mensaje
+entrante solo evalúa las reglas que hacen referencia a su topic.
+
+Formato de data/rules.json:
+
+    [
+        {"name": "calor", "source": "sensor_+",
+         "condition": {"op": ">", "value": 25},
+         "targets": "all", "action": "TOGGLE"}
+    ]
+
+`source` es un sensor ('sensor_1'), el patrón de todos los sensores ('sensor_+') o el
+topic completo de uno de ellos. Solo se evalúan las lecturas de los sensores, así que se
+rechazan las reglas con otro origen.
+`targets` es una lista de IDs de switch o "all" para todos los switches.
+
+La condición puede aplicarse a un estadístico de las últimas lecturas del topic en lugar
+de a la lectura actual, con "stat" (una clave de STATS) y "window" (número de lecturas):
+
+    {"name": "tendencia", "source": "sensor_+",
+     "condition": {"op": ">", "value": 0.5, "stat": "trend", "window": 600},
+     "targets": "all", "action": "ON", "executor": "process"}
+
+Mientras no hay `window` lecturas, el estadístico se calcula sobre las disponibles. Las
+reglas con "executor": "process" se pueden evaluar fuera del hilo de recepción (ver
+`controller.rule_executor`); el resto se evalúan siempre en línea.
+"""
+import json
+import operator
+import statistics
+from collections import deque
+from itertools import islice
+
+from common.codec import parse_number
+from controller.router import TopicRouter, type_pattern
+
+OPERATORS = {
+    ">": operator.gt,
+    ">=": operator.ge,
+    "<": operator.lt,
+    "<=": operator.le,
+    "==": operator.eq,
+    "!=": operator.ne,
+}
+ACTIONS = ("TOGGLE", "ON", "OFF")
+ALL_TARGETS = "all"
+SOURCE_PATTERN = "sensor_+"  # Topics cuyas lecturas evalúa el motor de reglas
+EXECUTORS = ("inline", "process")
+MAX_WINDOW = 100000  # Lecturas como máximo en la ventana de una regla
+
+
+def _trend(values):
+    """
+    Pendiente de la recta de regresión de las lecturas (cambio medio por lectura).
+    """
+    if len(values) < 2 or len(set(values)) == 1:
+        return 0.0
+    return statistics.linear_regression(range(len(values)), values).slope
+
+
+STATS = {
+    "last": lambda values: values[-1],
+    "mean": statistics.fmean,
+    "median": statistics.median,
+    "min": min,
+    "max": max,
+    "stdev": statistics.pstdev,
+    "trend": _trend,
+}
+
+
+def evaluate_condition(op, threshold, stat, values):
+    """
+    Evalúa una condición sobre una ventana de lecturas.
+
+    Es una función de módulo (y recibe solo tipos básicos) para poder ejecutarla en otro
+    proceso.
+
+    Args:
+        op (str): Operador de comparación (una clave de OPERATORS).
+        threshold (float): Valor con el que se compara.
+        stat (str): Estadístico a calcular (una clave de STATS).
+        values (sequence[float]): Lecturas, de la más antigua a la más reciente.
+
+    Returns:
+        bool: True si la condición se cumple.
+    """
+    return OPERATORS[op](STATS[stat](values), threshold)
+
+
+def evaluate_batch(items):
+    """
+    Evalúa un lote de condiciones (ver `evaluate_condition`).
+
+    Args:
+        items (list[tuple]): Tuplas (op, umbral, estadístico, lecturas).
+
+    Returns:
+        list[bool]: Resultado de cada condición, en el mismo orden.
+    """
+    return [evaluate_condition(*item) for item in items]
+
+
+def last_values(history, value, size):
+    """
+    Copia las últimas lecturas de un historial para evaluar una ventana.
+
+    Solo se recorren las `size` lecturas más recientes, no todo el historial.
+
+    Args:
+        history (deque[float] or None): Historial del topic (None si no se guarda).
+        value (float): Lectura actual (la última del historial).
+        size (int): Lecturas de la ventana.
+
+    Returns:
+        tuple[float]: Hasta `size` lecturas, de la más antigua a la más reciente.
+    """
+    if history is None or size == 1:
+        return (value,)
+    if size >= len(history):
+        return tuple(history)
+    return tuple(islice(reversed(history), size))[::-1]
+
+
+class Rule:
+    """
+    Regla compilada: condición sobre el valor de un topic y acción sobre unos switches.
+    """
+
+    def __init__(self, name, source, op, threshold, targets, action, stat="last", window=1, executor="inline"):
+        """
+        Inicializa una regla ya validada.
+
+        Args:
+            name (str): Nombre descriptivo de la regla.
+            source (str): Patrón de topic de origen (completo, con TOPIC_BASE).
+            op (str): Operador de comparación (una clave de OPERATORS).
+            threshold (float): Valor con el que se compara la lectura.
+            targets (list[str] or str): IDs de switch destino, o ALL_TARGETS.
+            action (str): Acción a enviar (una de ACTIONS).
+            stat (str): Estadístico de la ventana que se compara (una clave de STATS).
+            window (int): Número de lecturas de la ventana.
+            executor (str): 'inline' o 'process' (una de EXECUTORS).
+        """
+        self.name = name
+        self.source = source
+        self.op = op
+        self.threshold = threshold
+        self.targets = targets
+        self.action = action
+        self.stat = stat
+        self.window = window
+        self.executor = executor
+        self._compare = OPERATORS[op]
+
+    def matches(self, value):
+        """
+        Evalúa la condición de la regla sobre una lectura numérica.
+
+        Args:
+            value (float): Valor recibido del dispositivo de origen.
+
+        Returns:
+            bool: True si la regla se dispara.
+        """
+        return self._compare(value, self.threshold)
+
+    def matches_window(self, values):
+        """
+        Evalúa la condición de la regla sobre las últimas lecturas.
+
+        Args:
+            values (sequence[float]): Lecturas de la ventana (la última es la actual).
+
+        Returns:
+            bool: True si la regla se dispara.
+        """
+        if self.stat == "last":
+            return self._compare(values[-1], self.threshold)
+        return evaluate_condition(self.op, self.threshold, self.stat, values)
+
+    def __repr__(self):
+        return f"Rule({self.name!r}: {self.source} {self.op} {self.threshold} -> {self.action})"
+
+
+def compile_rule(spec, base, index=0):
+    """
+    Valida la definición de una regla y la convierte en un objeto Rule.
+
+    Args:
+        spec (dict): Definición de la regla tal y como aparece en el fichero.
+        base (str): Prefijo de topics del sistema (por ejemplo 'redes2/2312/1').
+        index (int): Posición de la regla en el fichero (para el nombre por defecto).
+
+    Returns:
+        Rule: Regla compilada.
+
+    Raises:
+        ValueError: Si la definición está incompleta o contiene valores no válidos.
+    """
+    try:
+        source = str(spec["source"])
+        condition = spec["condition"]
+        op = condition["op"]
+        threshold = float(condition["value"])
+        action = spec["action"]
+        stat = condition.get("stat", "last")
+        window = int(condition.get("window", 1))
+    except (KeyError, TypeError, ValueError, AttributeError) as e:
+        raise ValueError(f"Regla {index} mal definida: {e}")
+    if op not in OPERATORS:
+        raise ValueError(f"Regla {index}: operador no válido '{op}'")
+    if action not in ACTIONS:
+        raise ValueError(f"Regla {index}: acción no válida '{action}'")
+    if stat not in STATS:
+        raise ValueError(f"Regla {index}: estadístico no válido '{stat}'")
+    if not 1 <= window <= MAX_WINDOW:
+        raise ValueError(f"Regla {index}: 'window' debe estar entre 1 y {MAX_WINDOW}")
+    executor = spec.get("executor", "inline")
+    if executor not in EXECUTORS:
+        raise ValueError(f"Regla {index}: executor no válido '{executor}'")
+    targets = spec.get("targets", ALL_TARGETS)
+    if targets != ALL_TARGETS:
+        if not isinstance(targets, list) or not targets:
+            raise ValueError(f"Regla {index}: 'targets' debe ser una lista de IDs o '{ALL_TARGETS}'")
+        targets = [str(target) for target in targets]
+    if "/" not in source:
+        source = f"{base}/{source}"
+    prefix, _, level = source.rpartition("/")
+    if prefix != base or SOURCE_PATTERN not in (level, type_pattern(level)):
+        raise ValueError(f"Regla {index}: el origen '{spec['source']}' no es un sensor (se esperaba "
+                         f"'sensor_<id>' o '{SOURCE_PATTERN}')")
+    return Rule(spec.get("name", f"regla_{index}"), source, op, threshold, targets, action, stat, window, executor)
+
+
+class RuleEngine:
+    """
+    Conjunto de reglas indexado por topic de origen.
+
+    El coste por mensaje depende solo del número de reglas que hacen referencia a su topic,
+    no del total de reglas cargadas. Para los topics con reglas de ventana se guardan las
+    últimas lecturas (tantas como la ventana más larga de sus reglas).
+    """
+
+    def __init__(self, base, specs=()):
+        """
+        Inicializa el motor y compila las reglas indicadas.
+
+        Args:
+            base (str): Prefijo de topics del sistema.
+            specs (iterable[dict]): Definiciones de reglas.
+        """
+        self.base = base
+        self.rules = []
+        self._index = TopicRouter()
+        self._history = {}
+        self.load(specs)
+
+    def load(self, specs):
+        """
+        Sustituye las reglas actuales por las indicadas, compilándolas en el índice.
+
+        Si alguna regla no es válida no se modifica el conjunto actual.
+
+        Args:
+            specs (iterable[dict]): Definiciones de reglas.
+
+        Returns:
+            int: Número de reglas cargadas.
+
+        Raises:
+            ValueError: Si alguna regla está mal definida.
+        """
+        rules = [compile_rule(spec, self.base, i) for i, spec in enumerate(specs)]
+        index = TopicRouter()
+        for rule in rules:
+            index.add(rule.source, rule)
+        self.rules = rules
+        self._index = index
+        self._history = {}
+        return len(rules)
+
+    def load_file(self, filepath):
+        """
+        Carga las reglas desde un fichero JSON.
+
+        Args:
+            filepath (str): Ruta del fichero de reglas.
+
+        Returns:
+            int: Número de reglas cargadas.
+
+        Raises:
+            OSError: Si el fichero no se puede leer.
+            ValueError: Si el JSON o alguna regla no son válidos.
+        """
+        with open(filepath, "r") as f:
+            specs = json.load(f)
+        if not isinstance(specs, list):
+            raise ValueError("El fichero de reglas debe contener una lista")
+        return self.load(specs)
+
+    def rules_for(self, topic):
+        """
+        Obtiene las reglas que hacen referencia a un topic.
+
+        Args:
+            topic (str): Topic del mensaje recibido.
+
+        Returns:
+            tuple[Rule]: Reglas candidatas, en el orden del fichero.
+        """
+        return self._index.match(topic)
+
+    def evaluate(self, topic, message, deferred=None):
+        """
+        Evalúa las reglas de un topic sobre el mensaje recibido.
+
+        El mensaje solo se convierte a número si hay alguna regla para su topic. Acepta un
+        número, o un texto con el formato de los dispositivos ('26', 'Temperature: 26 °C',
+        'Sensor value: 26.0').
+
+        Args:
+            topic (str): Topic del mensaje recibido.
+            message (str or float): Contenido del mensaje o valor ya decodificado.
+            deferred (list or None): Si se indica, las reglas con executor 'process' no se
+                evalúan: se añade a esta lista un par (regla, lecturas de su ventana) por
+                cada una para evaluarlas en otro proceso.
+
+        Returns:
+            list[Rule]: Reglas que se disparan (de las evaluadas aquí).
+        """
+        rules = self._index.match(topic)
+        if not rules:
+            return []
+        value = parse_number(message)
+        if value is None:
+            return []
+        window = max(rule.window for rule in rules)
+        history = None
+        if window > 1:
+            history = self._history.get(topic)
+            if history is None or history.maxlen != window:
+                history = self._history[topic] = deque(history or (), maxlen=window)
+            history.append(value)
+        fired = []
+        for rule in rules:
+            if deferred is not None and rule.executor == "process":
+                deferred.append((rule, last_values(history, value, rule.window)))
+            elif rule.stat == "last":
+                # Solo importa la lectura actual: no hace falta copiar la ventana
+                if rule.matches(value):
+                    fired.append(rule)
+            elif rule.matches_window(last_values(history, value, rule.window)):
+                fired.append(rule)
+        return fired
+
+    def __len__(self):
+        return len(self.rules)
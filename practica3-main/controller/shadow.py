@@ -0,0 +1,192 @@
+"""
+shadow.py
+
+Sombra de los switches en el controlador: estado deseado y último estado informado.
+
+Cada switch publica su estado ('ON'/'OFF') como mensaje retenido en su topic de estado
+(ver `common.switch_command.state_topic`), así que el controlador lo conoce sin tener que
+conmutarlo y lo recibe al suscribirse aunque el switch lleve tiempo sin cambiar. La sombra
+guarda por switch:
+
+- el estado deseado, fijado por una orden ON/OFF (None si no se ha pedido ninguno); un
+  TOGGLE lo cambia al contrario del último estado informado, o lo borra si no se conoce,
+  para que el reconciliador no deshaga el cambio reenviando el deseado anterior;
+- el último estado informado por el switch y el instante en que llegó.
+
+Las consultas de estado se responden desde la sombra sin esperar al switch, y un
+reconciliador periódico pide a `diverged` los switches cuyo estado informado no coincide
+con el deseado para reenviarles la orden en un único lote.
+"""
+import threading
+import time
+
+RESEND_INTERVAL = 5.0  # Segundos mínimos entre dos reenvíos de la orden a un mismo switch
+
+
+class ShadowEntry:
+    """
+    Estado de un switch en la sombra.
+    """
+
+    __slots__ = ("desired", "reported", "reported_at", "sent_at")
+
+    def __init__(self):
+        self.desired = None  # 'ON', 'OFF' o None si no se ha pedido ningún estado
+        self.reported = None  # Último estado informado por el switch
+        self.reported_at = None  # Instante (time.time()) del último informe
+        self.sent_at = float("-inf")  # Último envío de la orden deseada (time.monotonic())
+
+    def in_sync(self):
+        """
+        Returns:
+            bool: True si no hay estado deseado o el switch ya lo ha alcanzado.
+        """
+        return self.desired is None or self.desired == self.reported
+
+
+class SwitchShadow:
+    """
+    Sombras de todos los switches (segura entre hilos).
+    """
+
+    def __init__(self, resend_interval=RESEND_INTERVAL):
+        """
+        Args:
+            resend_interval (float): Segundos mínimos entre reenvíos a un mismo switch.
+        """
+        self.resend_interval = resend_interval
+        self._entries = {}
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def _entry(self, device_id):
+        entry = self._entries.get(device_id)
+        if entry is None:
+            entry = self._entries[device_id] = ShadowEntry()
+        return entry
+
+    def desire(self, device_id, state, now=None):
+        """
+        Fija el estado deseado de un switch y lo marca como recién enviado.
+
+        Args:
+            device_id (str): ID del switch.
+            state (str): 'ON' u 'OFF'.
+            now (float or None): Instante del envío (por defecto, time.monotonic()).
+
+        Returns:
+            None
+        """
+        with self._lock:
+            entry = self._entry(device_id)
+            entry.desired = state
+            entry.sent_at = time.monotonic() if now is None else now
+
+    def expect_toggle(self, device_id, now=None):
+        """
+        Ajusta el estado deseado de un switch al que se envía un TOGGLE.
+
+        El deseado pasa a ser el contrario del último estado informado; si no se conoce, se
+        borra (el switch queda sin estado deseado hasta la siguiente orden ON/OFF).
+
+        Args:
+            device_id (str): ID del switch.
+            now (float or None): Instante del envío (por defecto, time.monotonic()).
+
+        Returns:
+            str or None: Nuevo estado deseado.
+        """
+        with self._lock:
+            entry = self._entry(device_id)
+            if entry.reported in ("ON", "OFF"):
+                entry.desired = "OFF" if entry.reported == "ON" else "ON"
+            else:
+                entry.desired = None
+            entry.sent_at = time.monotonic() if now is None else now
+            return entry.desired
+
+    def report(self, device_id, state, at=None):
+        """
+        Registra el estado informado por un switch.
+
+        Args:
+            device_id (str): ID del switch.
+            state (str): 'ON' u 'OFF'.
+            at (float or None): Instante del informe (por defecto, time.time()).
+
+        Returns:
+            bool: True si el estado informado ha cambiado.
+        """
+        with self._lock:
+            entry = self._entry(device_id)
+            changed = entry.reported != state
+            entry.reported = state
+            entry.reported_at = time.time() if at is None else at
+            return changed
+
+    def get(self, device_id):
+        """
+        Obtiene la sombra de un switch.
+
+        Args:
+            device_id (str): ID del switch.
+
+        Returns:
+            tuple or None: (deseado, informado, instante del informe), o None si no se sabe
+            nada del switch.
+        """
+        with self._lock:
+            entry = self._entries.get(device_id)
+            if entry is None:
+                return None
+            return entry.desired, entry.reported, entry.reported_at
+
+    def forget(self, device_id):
+        """
+        Elimina la sombra de un switch (por ejemplo, al darlo de baja).
+
+        Args:
+            device_id (str): ID del switch.
+
+        Returns:
+            None
+        """
+        with self._lock:
+            self._entries.pop(device_id, None)
+
+    def out_of_sync(self):
+        """
+        Returns:
+            int: Número de switches cuyo estado informado no es el deseado.
+        """
+        with self._lock:
+            return sum(not entry.in_sync() for entry in self._entries.values())
+
+    def diverged(self, limit=None, now=None):
+        """
+        Selecciona los switches a los que hay que reenviar su estado deseado.
+
+        Solo se devuelven los que no lo han alcanzado y llevan al menos `resend_interval`
+        segundos sin reenvío; quedan marcados como enviados en `now`.
+
+        Args:
+            limit (int or None): Switches como máximo (None: todos).
+            now (float or None): Instante actual (por defecto, time.monotonic()).
+
+        Returns:
+            list[tuple]: (ID, estado deseado) de cada switch a reconciliar.
+        """
+        if now is None:
+            now = time.monotonic()
+        batch = []
+        with self._lock:
+            for device_id, entry in self._entries.items():
+                if limit is not None and len(batch) >= limit:
+                    break
+                if entry.in_sync() or now - entry.sent_at < self.resend_interval:
+                    continue
+                entry.sent_at = now
+                batch.append((device_id, entry.desired))
+        return batch
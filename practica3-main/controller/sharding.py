@@ -0,0 +1,266 @@
+"""
+sharding.py
+
+Reparto de dispositivos entre varios procesos controladores (workers).
+
+Un único controlador procesa todos los mensajes en un proceso, así que el GIL lo limita a
+un núcleo. En modo repartido:
+
+- Cada worker (`controller/worker.py`) es dueño de una partición de los IDs de
+  dispositivo, calculada con un anillo de hash consistente (`HashRing`) con nodos
+  virtuales: al añadir o quitar un worker solo cambian de dueño ~1/N de los dispositivos.
+  El worker se suscribe únicamente a los topics de sus dispositivos (`device_topics`), así
+  que la ingesta de telemetría y la evaluación de reglas se reparten entre los workers, que
+  pueden estar en distintas máquinas siempre que compartan broker y fichero de dispositivos.
+- El front end (`controller.py --workers N`) mantiene el bot de Discord, el registro y el
+  journal de dispositivos. Los comandos sobre un dispositivo se envían al worker dueño, los
+  de consulta general a todos (y se unen las respuestas), y las altas y bajas se anuncian a
+  los workers en DEVICES_TOPIC con el mismo formato que el journal.
+
+Los comandos viajan por MQTT en JSON:
+
+    petición  (COMMAND_TOPIC/<worker>): {"id": "5f2a91c0", "content": "!switch 4 on", "reply": "<topic>"}
+    respuesta (REPLY_TOPIC):            {"id": "5f2a91c0", "text": "ON"}
+
+No se usan suscripciones compartidas ($share/...): el broker repartiría los mensajes por
+orden de llegada y no por dispositivo, y la respuesta de un dispositivo podría llegar a un
+worker distinto del que la está esperando.
+"""
+import asyncio
+import bisect
+import hashlib
+import json
+import logging
+import secrets
+
+VNODES = 64  # Nodos virtuales por worker en el anillo
+CONTROL_BASE = "redes2/2312/1/ctl"
+COMMAND_TOPIC = f"{CONTROL_BASE}/cmd"  # Prefijo de los topics de comandos de cada worker
+REPLY_TOPIC = f"{CONTROL_BASE}/reply"  # Respuestas de los workers al front end
+DEVICES_TOPIC = f"{CONTROL_BASE}/devices"  # Altas y bajas de dispositivos
+SUBSCRIBE_BATCH = 500  # Topics como máximo por petición SUBSCRIBE
+
+log = logging.getLogger("controller.sharding")
+
+
+def worker_name(index):
+    """
+    Returns:
+        str: Nombre del worker con ese índice, por ejemplo 'worker_0'.
+    """
+    return f"worker_{index}"
+
+
+def command_topic(worker):
+    """
+    Returns:
+        str: Topic en el que un worker recibe los comandos del front end.
+    """
+    return f"{COMMAND_TOPIC}/{worker}"
+
+
+def device_topics(base, device_id, tipo):
+    """
+    Obtiene los topics a los que debe suscribirse el dueño de un dispositivo.
+
+    Args:
+        base (str): Prefijo de los topics del grupo.
+        device_id (str): ID del dispositivo.
+        tipo (str): Tipo del dispositivo.
+
+    Returns:
+        list[str]: Topic del dispositivo y, si es un switch, su topic de respuesta (el del ID
+        siguiente) y su topic de estado.
+    """
+    topics = [f"{base}/{tipo}_{device_id}"]
+    if tipo == "switch":
+        topics.append(f"{base}/switch_{int(device_id) + 1}")
+        topics.append(f"{base}/state/switch_{device_id}")
+    return topics
+
+
+def subscribe_batched(client, topics, qos=0):
+    """
+    Suscribe un cliente a una lista de topics en el menor número de peticiones.
+
+    Args:
+        client (mqtt.Client): Cliente MQTT.
+        topics (list[str]): Topics a suscribir.
+        qos (int): QoS de las suscripciones.
+
+    Returns:
+        int: Peticiones SUBSCRIBE enviadas.
+    """
+    requests = 0
+    for start in range(0, len(topics), SUBSCRIBE_BATCH):
+        client.subscribe([(topic, qos) for topic in topics[start:start + SUBSCRIBE_BATCH]])
+        requests += 1
+    return requests
+
+
+def _hash(key):
+    return int.from_bytes(hashlib.md5(key.encode()).digest()[:8], "big")
+
+
+class HashRing:
+    """
+    Anillo de hash consistente que asigna cada clave a un nodo.
+    """
+
+    def __init__(self, nodes=(), vnodes=VNODES):
+        """
+        Args:
+            nodes (iterable[str]): Nodos iniciales.
+            vnodes (int): Nodos virtuales por nodo (más nodos, reparto más uniforme).
+        """
+        self.vnodes = vnodes
+        self.nodes = []
+        self._points = []
+        self._owners = []
+        for node in nodes:
+            self.add(node)
+
+    def __len__(self):
+        return len(self.nodes)
+
+    def add(self, node):
+        """
+        Añade un nodo al anillo.
+
+        Args:
+            node (str): Nombre del nodo.
+
+        Returns:
+            None
+
+        Raises:
+            ValueError: Si el nodo ya está en el anillo.
+        """
+        if node in self.nodes:
+            raise ValueError(f"Nodo duplicado: {node}")
+        self.nodes.append(node)
+        for replica in range(self.vnodes):
+            point = _hash(f"{node}#{replica}")
+            index = bisect.bisect(self._points, point)
+            self._points.insert(index, point)
+            self._owners.insert(index, node)
+
+    def remove(self, node):
+        """
+        Quita un nodo del anillo; sus claves pasan a los nodos siguientes.
+
+        Args:
+            node (str): Nombre del nodo.
+
+        Returns:
+            None
+        """
+        self.nodes.remove(node)
+        kept = [(point, owner) for point, owner in zip(self._points, self._owners) if owner != node]
+        self._points = [point for point, _ in kept]
+        self._owners = [owner for _, owner in kept]
+
+    def owner(self, key):
+        """
+        Obtiene el nodo dueño de una clave.
+
+        Args:
+            key (str): Clave (por ejemplo, el ID de un dispositivo).
+
+        Returns:
+            str: Nombre del nodo.
+
+        Raises:
+            LookupError: Si el anillo está vacío.
+        """
+        if not self._points:
+            raise LookupError("El anillo no tiene nodos")
+        index = bisect.bisect(self._points, _hash(str(key))) % len(self._points)
+        return self._owners[index]
+
+
+class ShardClient:
+    """
+    Envío de comandos del front end a los workers y espera de sus respuestas.
+    """
+
+    def __init__(self, publish, ring, pending, timeout):
+        """
+        Args:
+            publish (callable): Función (topic, payload) que publica un mensaje (puede
+                devolver un awaitable).
+            ring (HashRing): Anillo con los workers.
+            pending (PendingRequests): Registro en el que esperar las respuestas.
+            timeout (float): Segundos máximos de espera por la respuesta de un worker.
+        """
+        self.publish = publish
+        self.ring = ring
+        self.pending = pending
+        self.timeout = timeout
+
+    def handle_reply(self, payload):
+        """
+        Completa la petición a la que corresponde una respuesta de un worker.
+
+        Es seguro llamarlo desde el hilo de red de paho.
+
+        Args:
+            payload (str): Respuesta en JSON.
+
+        Returns:
+            bool: True si había una petición esperando esa respuesta.
+        """
+        try:
+            reply = json.loads(payload)
+            key, text = f"rpc:{reply['id']}", reply.get("text")
+        except (ValueError, KeyError, TypeError):
+            log.warning("respuesta de worker no válida", extra={"payload": payload})
+            return False
+        return self.pending.resolve(key, text)
+
+    async def call(self, worker, content):
+        """
+        Envía un comando a un worker y espera su respuesta.
+
+        Args:
+            worker (str): Nombre del worker.
+            content (str): Comando tal como se recibió en Discord.
+
+        Returns:
+            str or None: Respuesta del worker (None si no hay nada que responder).
+
+        Raises:
+            asyncio.TimeoutError: Si el worker no responde a tiempo.
+        """
+        request_id = secrets.token_hex(4)
+        payload = json.dumps({"id": request_id, "content": content, "reply": REPLY_TOPIC})
+        return await self.pending.request(f"rpc:{request_id}",
+                                          lambda: self.publish(command_topic(worker), payload), self.timeout)
+
+    async def call_owner(self, key, content):
+        """
+        Envía un comando al worker dueño de una clave.
+
+        Returns:
+            tuple: (worker, respuesta o None, True si se agotó el tiempo).
+        """
+        worker = self.ring.owner(key)
+        try:
+            return worker, await self.call(worker, content), False
+        except asyncio.TimeoutError:
+            return worker, None, True
+
+    async def broadcast(self, content):
+        """
+        Envía un comando a todos los workers a la vez.
+
+        Returns:
+            list[tuple]: (worker, respuesta o None, True si se agotó el tiempo) por worker,
+            en el orden del anillo.
+        """
+        async def one(worker):
+            try:
+                return worker, await self.call(worker, content), False
+            except asyncio.TimeoutError:
+                return worker, None, True
+        return list(await asyncio.gather(*(one(worker) for worker in self.ring.nodes)))
@@ -0,0 +1,284 @@
+"""
+worker.py
+
+Worker del modo repartido del controlador (ver `controller.sharding`).
+
+Cada worker carga el registro de dispositivos completo (para conocer los destinos de las
+reglas), pero solo se suscribe a los topics de los dispositivos de su partición del anillo
+de hash, así que solo ingiere su telemetría, evalúa sus reglas, vigila su actividad y
+reconcilia sus switches. Además:
+
+- ejecuta los comandos que le reenvía el front end (`controller.py --workers N`) y le
+  devuelve la respuesta;
+- aplica las altas y bajas que anuncia el front end y ajusta sus suscripciones.
+
+Todo se ejecuta en un único bucle de asyncio con el cliente MQTT de `controller.aio_mqtt`.
+
+Argumentos:
+  --index        Índice de este worker (0 ... N-1)
+  --workers      Número total de workers
+  --host         Host del broker MQTT (por defecto: redes2.ii.uam.es)
+  --port         Puerto del broker MQTT (por defecto: 1883)
+
+Ejemplo (dos workers y el front end):
+  python controller/worker.py --host localhost --workers 2 --index 0 &
+  python controller/worker.py --host localhost --workers 2 --index 1 &
+  python controller/controller.py --host localhost --workers 2
+"""
+import argparse
+import asyncio
+import inspect
+import json
+import logging
+import os
+import sys
+
+import paho.mqtt.client as mqtt
+
+# Permitir ejecutar el worker como script (python controller/worker.py)
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import controller.controller as ctrl
+from common.log import add_arguments as add_log_arguments, setup_from_args as setup_logging
+from common.metrics import start_http_server
+from controller.aio_mqtt import AsyncioMqtt
+from controller.journal import DeviceJournal
+from controller.liveness import LivenessMonitor
+from controller.publisher import OutboundPublisher
+from controller.sharding import (DEVICES_TOPIC, VNODES, HashRing, command_topic, device_topics, subscribe_batched,
+                                 worker_name)
+
+log = logging.getLogger("controller.worker")
+
+
+class ShardWorker:
+    """
+    Worker dueño de una partición de los dispositivos.
+    """
+
+    def __init__(self, name, ring):
+        """
+        Args:
+            name (str): Nombre del worker (por ejemplo 'worker_0').
+            ring (HashRing): Anillo con todos los workers.
+        """
+        self.name = name
+        self.ring = ring
+        self.client = None
+        self.loop = None
+
+    def owns(self, device_id):
+        """
+        Returns:
+            bool: True si el dispositivo pertenece a la partición de este worker.
+        """
+        return self.ring.owner(device_id) == self.name
+
+    def owned_topics(self, ids=None):
+        """
+        Obtiene los topics de los dispositivos propios.
+
+        Args:
+            ids (iterable[str] or None): IDs a considerar (por defecto, todos los registrados).
+
+        Returns:
+            list[str]: Topics a los que suscribirse.
+        """
+        if ids is None:
+            ids = list(ctrl.device_data.get("devices", {}))
+        topics = []
+        for device_id in ids:
+            tipo = ctrl.registry.type_of(device_id)
+            if tipo is not None and self.owns(device_id):
+                topics.extend(device_topics(ctrl.TOPIC_BASE, device_id, tipo))
+        return topics
+
+    def on_connect(self, client, userdata, flags, rc):
+        """
+        Callback de conexión: se suscribe a sus comandos, a las altas y bajas y a su partición.
+        """
+        if rc != 0:
+            log.error("error de conexión al broker MQTT", extra={"rc": rc})
+            return
+        client.subscribe([(command_topic(self.name), 1), (DEVICES_TOPIC, 1)])
+        topics = self.owned_topics()
+        requests = subscribe_batched(client, topics)
+        log.info("worker suscrito a su partición",
+                 extra={"worker": self.name, "topics": len(topics), "requests": requests})
+
+    def on_message(self, client, userdata, msg):
+        """
+        Callback MQTT: atiende los mensajes de control y pasa el resto al controlador.
+        """
+        if msg.topic == command_topic(self.name):
+            self.loop.create_task(self.handle_command(msg.payload.decode("utf-8")))
+        elif msg.topic == DEVICES_TOPIC:
+            self.handle_devices(msg.payload.decode("utf-8"))
+        else:
+            ctrl.on_mqtt_message(client, userdata, msg)
+
+    async def handle_command(self, payload):
+        """
+        Ejecuta un comando reenviado por el front end y publica la respuesta.
+
+        Args:
+            payload (str): Petición en JSON (ver `controller.sharding`).
+
+        Returns:
+            None
+        """
+        try:
+            request = json.loads(payload)
+            request_id, content, reply_topic = request["id"], request["content"], request["reply"]
+        except (ValueError, KeyError, TypeError):
+            log.warning("comando reenviado no válido", extra={"payload": payload})
+            return
+        text = await ctrl.commands.execute(content, self.client)
+        sent = ctrl.publish_request(self.client, reply_topic, json.dumps({"id": request_id, "text": text}))
+        if inspect.isawaitable(sent):
+            await sent
+
+    def handle_devices(self, payload):
+        """
+        Aplica un alta o baja anunciada por el front end y ajusta las suscripciones.
+
+        Args:
+            payload (str): Cambio en JSON, con el formato del journal.
+
+        Returns:
+            None
+        """
+        try:
+            record = json.loads(payload)
+            record["op"], record["id"]
+        except (ValueError, KeyError, TypeError):
+            log.warning("cambio de dispositivos no válido", extra={"payload": payload})
+            return
+        if record["op"] == "remove":
+            device_id = record["id"]
+            tipo = ctrl.registry.type_of(device_id)
+            ctrl.registry.apply(record)
+            if tipo is not None and self.owns(device_id):
+                self.client.unsubscribe(device_topics(ctrl.TOPIC_BASE, device_id, tipo))
+                ctrl.last_values.discard(f"{ctrl.TOPIC_BASE}/{tipo}_{device_id}")
+                ctrl.shadow.forget(device_id)
+                if ctrl.liveness is not None:
+                    ctrl.liveness.forget(device_id)
+            return
+        added = ctrl.registry.apply(record)
+        ctrl.watch_devices(added)
+        topics = self.owned_topics(added)
+        if topics:
+            subscribe_batched(self.client, topics)
+
+    async def run(self, host, port):
+        """
+        Conecta el worker al broker y atiende mensajes hasta que se cancela.
+
+        Args:
+            host (str): Dirección del broker MQTT.
+            port (int): Puerto del broker MQTT.
+
+        Returns:
+            None
+        """
+        self.loop = asyncio.get_running_loop()
+        ctrl.owns = self.owns
+        client = AsyncioMqtt(mqtt.Client())
+        client.on_connect = self.on_connect
+        client.on_message = self.on_message
+        ctrl.mqtt_client = self.client = client
+        ctrl.publisher = OutboundPublisher(client, loop=self.loop, qos_by_class=ctrl.PUBLISH_QOS)
+        ctrl.publisher.start()
+        client.connect(host, port, 60)
+        if ctrl.LIVENESS_TIMEOUT is not None:
+            ctrl.liveness = LivenessMonitor(ctrl.timers, ctrl.LIVENESS_TIMEOUT, on_change=ctrl.on_liveness_change)
+            ctrl.watch_devices()
+        if ctrl.RECONCILE_INTERVAL:
+            ctrl.timers.call_every(ctrl.RECONCILE_INTERVAL, ctrl.reconcile_switches)
+        ctrl.timers.start()
+        ctrl.start_rule_executor()
+        try:
+            await asyncio.Event().wait()
+        finally:
+            ctrl.timers.stop()
+            await asyncio.to_thread(ctrl.stop_rule_executor)
+            # El hilo de envío necesita el bucle para vaciar la cola: no bloquearlo al cerrar
+            await asyncio.to_thread(ctrl.publisher.close)
+            client.close()
+
+
+def load_devices(path):
+    """
+    Carga el registro de dispositivos sin abrir el journal para escribir (lo escribe el front end).
+
+    Args:
+        path (str): Snapshot de dispositivos.
+
+    Returns:
+        None
+    """
+    journal = DeviceJournal(path)
+    try:
+        state = journal.open()
+    except (OSError, ValueError) as e:
+        print(f"No se pudo cargar '{path}'. Usando datos por defecto. Error: {e}")
+        return
+    finally:
+        journal.close()
+    ctrl.device_data.clear()
+    ctrl.device_data.update(state)
+    ctrl.registry.rebuild()
+
+
+def main():
+    """
+    Analiza los argumentos de línea de comandos y arranca el worker.
+    """
+    parser = argparse.ArgumentParser(description="Worker del controlador domótico")
+    parser.add_argument("--index", type=int, required=True, help="Índice de este worker")
+    parser.add_argument("--workers", type=int, required=True, help="Número total de workers")
+    parser.add_argument("--host", default="redes2.ii.uam.es")
+    parser.add_argument("--port", type=int, default=1883)
+    parser.add_argument("--vnodes", type=int, default=VNODES, help="Nodos virtuales por worker en el anillo")
+    parser.add_argument("--devices-file", default=ctrl.DEVICES_FILE, help="Snapshot de dispositivos del front end")
+    parser.add_argument("--rules", default=ctrl.RULES_FILE, help="Fichero JSON con las reglas")
+    parser.add_argument("--timeout", type=float, default=ctrl.REQUEST_TIMEOUT,
+                        help="Segundos máximos de espera por la respuesta de un dispositivo")
+    parser.add_argument("--max-age", type=float, default=ctrl.CACHE_MAX_AGE,
+                        help="Antigüedad máxima (s) de una lectura para responder desde la caché")
+    parser.add_argument("--liveness-timeout", type=float, default=None,
+                        help="Segundos sin mensajes tras los que avisar de que un dispositivo no publica")
+    parser.add_argument("--reconcile-interval", type=float, default=ctrl.RECONCILE_INTERVAL,
+                        help="Segundos entre reenvíos a switches fuera de su estado deseado (0: desactivado)")
+    parser.add_argument("--rule-workers", type=int, default=ctrl.RULE_WORKERS,
+                        help="Procesos para las reglas con executor 'process' (por defecto uno por núcleo; 0: en línea)")
+    parser.add_argument("--metrics-port", type=int, default=None,
+                        help="Puerto local en el que servir las métricas en formato Prometheus")
+    add_log_arguments(parser)
+    args = parser.parse_args()
+    if not 0 <= args.index < args.workers:
+        parser.error("--index debe estar entre 0 y --workers - 1")
+    setup_logging(args)
+
+    ctrl.REQUEST_TIMEOUT = args.timeout
+    ctrl.CACHE_MAX_AGE = args.max_age
+    ctrl.LIVENESS_TIMEOUT = args.liveness_timeout
+    ctrl.RECONCILE_INTERVAL = args.reconcile_interval
+    ctrl.RULE_WORKERS = args.rule_workers
+    load_devices(args.devices_file)
+    ctrl.load_rules(args.rules)
+    if args.metrics_port is not None:
+        start_http_server(ctrl.metrics, args.metrics_port)
+
+    ring = HashRing((worker_name(index) for index in range(args.workers)), vnodes=args.vnodes)
+    worker = ShardWorker(worker_name(args.index), ring)
+    print(f"{worker.name}: {len(worker.owned_topics())} topics de {ctrl.registry.count()} dispositivos", flush=True)
+    try:
+        asyncio.run(worker.run(args.host, args.port))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
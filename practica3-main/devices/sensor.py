@@ -1,20 +1,31 @@
 from .device import Device
+import logging
 import random
 
+from common.codec import encode_binary
+
+log = logging.getLogger("devices.sensor")
+
 class Sensor(Device):
     """
     Clase Sensor que representa un sensor de temperatura,
     heredando de la clase abstracta Device.
     """
 
-    def __init__(self, device_id):
+    def __init__(self, device_id, encoding="text", deadband=None):
         """
         Inicializa un sensor con su identificador único.
 
         Args:
             device_id (str): Identificador del sensor.
+            encoding (str): Codificación de las lecturas: 'text' o 'binary' (ver common.codec).
+            deadband (DeadbandPolicy or None): Política de publicación por excepción para
+                `report` (ver common.deadband); None para publicar todas las lecturas.
         """
         super().__init__(device_id)
+        self.encoding = encoding
+        self.deadband = deadband
+        self.seq = 0
 
     def get_data(self):
         """
@@ -26,6 +37,40 @@ class Sensor(Device):
         """
         pass
 
+    def publish_value(self, client, value):
+        """
+        Publica una lectura en el topic del sensor con la codificación configurada.
+
+        Args:
+            client (paho.mqtt.client.Client): Cliente MQTT conectado.
+            value (float): Temperatura a publicar.
+
+        Returns:
+            None
+        """
+        if self.encoding == "binary":
+            client.publish(self.topic, encode_binary("sensor", self.device_id, value, self.seq))
+        else:
+            client.publish(self.topic, f"Sensor value: {value:.2f}")
+        self.seq += 1
+
+    def report(self, client, value, now=None):
+        """
+        Publica una lectura muestreada solo si la política de banda muerta lo permite.
+
+        Args:
+            client (paho.mqtt.client.Client): Cliente MQTT conectado.
+            value (float): Temperatura muestreada.
+            now (float or None): Instante de la muestra (por defecto, time.monotonic()).
+
+        Returns:
+            bool: True si la lectura se ha publicado.
+        """
+        if self.deadband is not None and not self.deadband.check(value, now):
+            return False
+        self.publish_value(client, value)
+        return True
+
     def handle_message(self, client, msg):
         """
         Procesa un mensaje MQTT recibido y responde con un valor aleatorio simulado.
@@ -37,8 +82,11 @@ class Sensor(Device):
         Returns:
             None
         """
-        print(f"Sensor recibió mensaje en topic '{msg.topic}': {msg.payload.decode('utf-8')}")
+        log.debug("sensor recibió mensaje", extra={"topic": msg.topic, "payload": msg.payload})
         # Simular una medida de temperatura aleatoria entre -20 y 50 grados
         sensor_value = random.uniform(-20, 50)
-        # Publicar el valor generado en el mismo topic del sensor
-        client.publish(self.topic, f"Sensor value: {sensor_value:.2f}")
+        # Publicar el valor generado en el mismo topic del sensor; una consulta explícita
+        # se responde siempre, aunque haya banda muerta
+        self.publish_value(client, sensor_value)
+        if self.deadband is not None:
+            self.deadband.record(sensor_value)
@@ -1,21 +1,27 @@
 from .device import Device
 import json
 
+from common.switch_command import CommandLog, format_reply, next_state, parse_command, state_topic
+
 class Switch(Device):
     """
     Clase Switch que representa un interruptor (on/off),
     heredando de la clase abstracta Device.
     """
 
-    def __init__(self, device_id):
+    def __init__(self, device_id, reply_topic=None):
         """
         Inicializa un interruptor con su identificador único y estado inicial apagado.
 
         Args:
             device_id (str): Identificador único del switch.
+            reply_topic (str or None): Topic en el que confirmar las órdenes; por defecto,
+                el del ID siguiente, como dummy_switch.
         """
         super().__init__(device_id)
         self.state = False  # El switch empieza apagado (False)
+        self.reply_topic = reply_topic
+        self.applied = CommandLog()  # Órdenes ya aplicadas, para descartar duplicados
 
     def get_data(self):
         """
@@ -29,9 +35,10 @@ class Switch(Device):
 
     def handle_message(self, client, msg):
         """
-        Procesa un mensaje MQTT para cambiar el estado del switch.
-
-        Actualmente no implementado (se implementaría en el dummy_switch).
+        Procesa una orden MQTT (ON, OFF o TOGGLE, ver common.switch_command) y confirma el
+        nuevo estado. Una orden con un identificador ya aplicado no cambia el estado: solo
+        se vuelve a confirmar. Cada orden aplicada publica además el estado retenido en el
+        topic de estado del switch.
 
         Args:
             client (paho.mqtt.client.Client): Cliente MQTT.
@@ -40,7 +47,21 @@ class Switch(Device):
         Returns:
             None
         """
-        pass
+        payload = msg.payload.decode() if isinstance(msg.payload, bytes) else msg.payload
+        command = parse_command(payload)
+        if command is None:
+            return
+        action, command_id = command
+        state = self.applied.get(command_id)
+        if state is None:
+            state = self.state = next_state(self.state, action)
+            self.applied.record(command_id, state)
+            base = msg.topic.rpartition("/")[0]
+            client.publish(state_topic(self.device_id, base), format_reply(state), qos=1, retain=True)
+        topic = self.reply_topic
+        if topic is None:
+            topic = f"{msg.topic.rpartition('_')[0]}_{int(self.device_id) + 1}"
+        client.publish(topic, format_reply(state, command_id))
 
     def get_device_id(self) -> str:
         """
@@ -1,10 +1,18 @@
 from .device import Device
-from datetime import datetime, timedelta
+import logging
+
+from common.vclock import VirtualClock
+
+log = logging.getLogger("devices.watch")
 
 class Watch(Device):
     """
     Clase Watch que representa un reloj configurable en el sistema domótico,
     heredando de la clase abstracta Device.
+
+    La hora no se actualiza tick a tick: se calcula al consultarla a partir del tiempo
+    real transcurrido (ver common.vclock), por lo que no deriva ni cuesta nada mientras
+    nadie la pide.
     """
 
     def __init__(self, device_id, start_time, frequency, rate):
@@ -20,10 +28,18 @@ class Watch(Device):
         super().__init__(device_id)
         self.frequency = frequency
         self.rate = rate
-        if isinstance(start_time, str):
-            self.current_time = datetime.strptime(start_time, '%H:%M:%S')
-        else:
-            self.current_time = start_time
+        self.clock = VirtualClock(start_time, rate)
+
+    @property
+    def current_time(self):
+        """
+        datetime: Hora actual del reloj, calculada en el momento de consultarla.
+        """
+        return self.clock.now()
+
+    @current_time.setter
+    def current_time(self, value):
+        self.clock.set(value)
 
     def handle_message(self, client, msg):
         """
@@ -36,7 +52,7 @@ class Watch(Device):
         Returns:
             None
         """
-        print(f"🕒 Reloj recibió solicitud de hora en topic '{msg.topic}'")
+        log.debug("reloj recibió solicitud de hora", extra={"topic": msg.topic})
         client.publish(self.topic, self.get_time())
 
     def get_time(self):
@@ -46,13 +62,16 @@ class Watch(Device):
         Returns:
             str: Hora actual del reloj en formato 'HH:MM:SS'.
         """
-        return self.current_time.strftime('%H:%M:%S')
+        return self.clock.text()
 
     def advance_time(self):
         """
-        Avanza la hora del reloj según la frecuencia y la tasa de avance configuradas.
+        Adelanta la hora del reloj un tick (frecuencia por tasa de avance).
+
+        Ya no hace falta llamarlo periódicamente, porque la hora avanza sola con el
+        tiempo real; queda para saltar manualmente un tick.
 
         Returns:
             None
         """
-        self.current_time += timedelta(seconds=self.frequency * self.rate)
+        self.clock.shift(self.frequency * self.rate)
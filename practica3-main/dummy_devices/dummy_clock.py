@@ -3,12 +3,17 @@ dummy_clock.py
 
 Simula un reloj que publica la hora cada cierto intervalo en un topic MQTT.
 
+La hora se calcula a partir del tiempo monótono transcurrido (`common.vclock`) y cada
+publicación se programa contra un plazo absoluto, así que el reloj no deriva aunque
+publicar o dormir lleve más de lo previsto.
+
 Argumentos:
   --host         Host del broker MQTT (por defecto: redes2.ii.uam.es)
   --port, -p     Puerto del broker MQTT (por defecto: 1883)
   --time         Hora de inicio en formato HH:MM:SS (por defecto: hora actual)
   --increment    Incremento en segundos entre publicaciones (por defecto: 1)
   --rate         Frecuencia de publicación (en segundos) (por defecto: 1)
+  --metrics-port Puerto local para servir métricas en formato Prometheus (opcional)
   id             ID del reloj (entero, obligatorio)
 
 Ejemplo:
@@ -19,12 +24,21 @@ import time
 import json
 import signal
 import os
-from datetime import datetime, timedelta
+import sys
+from datetime import datetime
 import paho.mqtt.client as mqtt
 
+# Permitir ejecutar el dummy como script (python dummy_devices/dummy_clock.py)
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from common.metrics import MetricsRegistry, start_http_server
+from common.vclock import Deadline, VirtualClock
+
 clocks_file = "data/clocks.json"
 clock_data = {}
 client = None
+metrics = MetricsRegistry()
+messages_out = metrics.counter("device_messages_out_total", "Horas publicadas por el reloj")
 
 def load_clocks():
     """"
@@ -82,9 +96,6 @@ def run(host, port, clock_id, start_time, increment, rate):
     if topic_response not in clock_data:
         clock_data[topic_response] = start_time
 
-    current_time = datetime.strptime(clock_data[topic_response], "%H:%M:%S")
-    delta = timedelta(seconds=increment)
-
     client = mqtt.Client(protocol=mqtt.MQTTv311)
 
 
@@ -94,12 +105,17 @@ def run(host, port, clock_id, start_time, increment, rate):
 
     signal.signal(signal.SIGINT, handle_sigint)
 
+    # `increment` segundos virtuales cada `rate` segundos reales
+    clock = VirtualClock(clock_data[topic_response], increment / rate)
+    deadline = Deadline(rate, clock.t0)
     while True:
-        clock_str = current_time.strftime("%H:%M:%S")
+        # La hora publicada es la del plazo, no la del instante (algo posterior) en que se publica
+        clock_str = clock.text(deadline.next)
         client.publish(topic_response, clock_str)
+        messages_out.inc()
         clock_data[topic_response] = clock_str
-        current_time += delta
-        time.sleep(rate)
+        deadline.advance()
+        time.sleep(deadline.remaining())
 
 def main():
     """
@@ -112,8 +128,14 @@ def main():
     parser.add_argument("--increment", type=int, default=1, help="Incremento en segundos")
     parser.add_argument("--rate", type=float, default=1.0, help="Frecuencia de envío en segundos")
     parser.add_argument("id", type=int, help="ID del reloj")
+    parser.add_argument("--metrics-port", type=int, default=None,
+                        help="Puerto local en el que servir las métricas en formato Prometheus")
 
     args = parser.parse_args()
+    if args.rate <= 0:
+        parser.error("--rate debe ser positivo")
+    if args.metrics_port is not None:
+        start_http_server(metrics, args.metrics_port)
     if args.time:
         start_time = args.time
     else:
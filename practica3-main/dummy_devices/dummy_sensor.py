@@ -10,6 +10,12 @@ Argumentos:
   --max, -M      Valor máximo de temperatura (por defecto: 30)
   --increment    Incremento entre valores (por defecto: 1)
   --interval, -i Intervalo de publicación en segundos (por defecto: 1)
+  --deadband     Publicar solo si la temperatura cambia más que este valor (opcional)
+  --deadband-relative  Igual, como fracción del último valor publicado (opcional)
+  --heartbeat    Segundos máximos sin publicar aunque el valor no cambie (opcional)
+  --min-interval Segundos mínimos entre dos publicaciones (opcional)
+  --encoding     Codificación de las lecturas: text o binary (por defecto: text)
+  --metrics-port Puerto local para servir métricas en formato Prometheus (opcional)
   id             ID del sensor (entero, obligatorio)
 
 Ejemplo:
@@ -20,13 +26,23 @@ import time
 import json
 import signal
 import os
+import sys
 import paho.mqtt.client as mqtt
 
+# Permitir ejecutar el dummy como script (python dummy_devices/dummy_sensor.py)
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from common.codec import ENCODINGS, encode_binary
+from common.deadband import add_arguments as add_deadband_arguments, policy_from_args
+from common.metrics import MetricsRegistry, start_http_server
+
 
 
 sensors_file = "data/sensors.json"
 sensor_data = {}
 client = None
+metrics = MetricsRegistry()
+messages_out = metrics.counter("device_messages_out_total", "Lecturas publicadas por el sensor")
 
 def load_sensors():
     """
@@ -65,11 +81,51 @@ def handle_sigint(sig, frame):
         client.disconnect()
     exit(0)
 
-def run(host, port, sensor_id, min_val, max_val, increment, interval,test_once=False):
+def format_reading(value, encoding="text", sensor_id=0, seq=0):
+    """
+    Construye el mensaje que publica el sensor para una lectura.
+
+    Args:
+        value (int): Temperatura actual.
+        encoding (str): 'text' para el mensaje legible o 'binary' para la codificación compacta.
+        sensor_id (int): ID del sensor (solo para la codificación binaria).
+        seq (int): Número de secuencia de la lectura (solo para la codificación binaria).
+
+    Returns:
+        str or bytes: Mensaje a publicar.
+    """
+    if encoding == "binary":
+        return encode_binary("sensor", sensor_id, value, seq)
+    return f"Temperature: {value} °C"
+
+def next_value(current, min_val, max_val, increment):
+    """
+    Calcula la siguiente temperatura de la rampa del sensor.
+
+    Args:
+        current (int): Temperatura actual.
+        min_val (int): Valor mínimo de temperatura.
+        max_val (int): Valor máximo de temperatura.
+        increment (int): Paso de incremento entre valores.
+
+    Returns:
+        int: Siguiente temperatura (vuelve al mínimo al superar el máximo).
+    """
+    current += increment
+    if current > max_val:
+        current = min_val
+    return current
+
+def run(host, port, sensor_id, min_val, max_val, increment, interval,test_once=False, encoding="text",
+        policy=None):
     """
     Ejecuta la lógica principal del sensor simulado.
     Publica temperaturas simuladas en un topic a intervalos regulares.
 
+    Con una política de banda muerta el sensor sigue muestreando cada `interval` segundos,
+    pero solo publica las muestras que la política acepta, y responde a las consultas del
+    controlador (mensajes vacíos en su topic) con el último valor publicado.
+
     Args:
         host (str): Host del broker MQTT.
         port (int): Puerto del broker MQTT.
@@ -78,6 +134,9 @@ def run(host, port, sensor_id, min_val, max_val, increment, interval,test_once=F
         max_val (int): Valor máximo de temperatura.
         increment (int): Paso de incremento entre valores.
         interval (float): Tiempo entre publicaciones en segundos.
+        encoding (str): Codificación de las lecturas ('text' o 'binary').
+        policy (DeadbandPolicy or None): Política de publicación por excepción; None para
+            publicar todas las muestras.
     """
     global client
     topic_response = f"redes2/2312/1/sensor_{sensor_id}"
@@ -95,11 +154,26 @@ def run(host, port, sensor_id, min_val, max_val, increment, interval,test_once=F
     signal.signal(signal.SIGINT, handle_sigint)
 
     current = sensor_data[topic_response]
+    seq = 0
+
+    if policy is not None:
+        def on_request(client, userdata, msg):
+            # Consulta del controlador: responder aunque el valor no haya cambiado
+            if not msg.payload:
+                value = policy.last_value if policy.last_value is not None else current
+                client.publish(topic_response, format_reading(value, encoding, sensor_id, seq))
+                messages_out.inc()
+
+        client.on_message = on_request
+        client.subscribe(topic_response)
+        client.loop_start()
+
     while True:
-        client.publish(topic_response, f"Temperature: {current} °C")
-        current += increment
-        if current > max_val:
-            current = min_val
+        if policy is None or policy.check(current):
+            client.publish(topic_response, format_reading(current, encoding, sensor_id, seq))
+            seq += 1
+            messages_out.inc()
+        current = next_value(current, min_val, max_val, increment)
         sensor_data[topic_response] = current
         if test_once:
             time.sleep(0.1)
@@ -119,9 +193,17 @@ def main():
     parser.add_argument("--interval", "-i", type=float, default=1)
     parser.add_argument("id", type=int, help="ID del sensor")
     parser.add_argument("--test-once", action="store_true")
+    add_deadband_arguments(parser)
+    parser.add_argument("--encoding", choices=ENCODINGS, default="text",
+                        help="Codificación de las lecturas")
+    parser.add_argument("--metrics-port", type=int, default=None,
+                        help="Puerto local en el que servir las métricas en formato Prometheus")
     args = parser.parse_args()
+    if args.metrics_port is not None:
+        start_http_server(metrics, args.metrics_port)
     load_sensors()
-    run(args.host, args.port, args.id, args.min, args.max, args.increment, args.interval, args.test_once)
+    run(args.host, args.port, args.id, args.min, args.max, args.increment, args.interval, args.test_once, args.encoding,
+        policy_from_args(args))
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
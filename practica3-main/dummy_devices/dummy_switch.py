@@ -3,10 +3,14 @@ dummy_switch.py
 
 Simula un interruptor (switch) que cambia su estado ON/OFF al recibir una acción por MQTT.
 
+Acepta órdenes ON, OFF y TOGGLE con identificador (ver `common.switch_command`) y aplica
+cada identificador una sola vez; cualquier otro payload conmuta el switch como antes.
+
 Argumentos:
   --host         Host del broker MQTT (por defecto: redes2.ii.uam.es)
   --port, -p     Puerto del broker MQTT (por defecto: 1883)
   --probability, -P  Probabilidad de fallo al recibir una acción (por defecto: 0.3)
+  --metrics-port Puerto local para servir métricas en formato Prometheus (opcional)
   id             ID del switch (entero, obligatorio)
 
 Ejemplo:
@@ -16,10 +20,18 @@ import paho.mqtt.client as mqtt
 import json
 import random
 import argparse
+import logging
 import signal
 import sys
 import os
 
+# Permitir ejecutar el dummy como script (python dummy_devices/dummy_switch.py)
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from common.log import add_arguments as add_log_arguments, setup_from_args as setup_logging
+from common.metrics import MetricsRegistry, start_http_server
+from common.switch_command import CommandLog, format_reply, next_state, parse_command, state_topic
+
 # Variables globales
 switch_data = {}
 switch_id = None
@@ -27,6 +39,11 @@ broker_host = None
 broker_port = None
 probability = 0.3
 client = None
+applied = CommandLog()  # Órdenes ya aplicadas, para descartar reintentos duplicados
+log = logging.getLogger("dummy.switch")
+metrics = MetricsRegistry()
+commands_in = metrics.counter("device_commands_in_total", "Órdenes recibidas por el switch", ("result",))
+messages_out = metrics.counter("device_messages_out_total", "Respuestas publicadas por el switch")
 
 def handle_action(device_id):
     """
@@ -35,6 +52,47 @@ def handle_action(device_id):
     state = switch_data.get(str(device_id), False)
     switch_data[str(device_id)] = not state
     return "ON" if not state else "OFF"
+
+def apply_command(state, fail_probability, action="TOGGLE"):
+    """
+    Aplica una acción recibida sobre el estado de un switch.
+
+    Args:
+        state (bool): Estado actual del switch (True encendido).
+        fail_probability (float): Probabilidad de simular un fallo.
+        action (str): 'ON', 'OFF' o 'TOGGLE'.
+
+    Returns:
+        bool or None: Nuevo estado, o None si se simula un fallo y no se realiza la acción.
+    """
+    if random.random() < fail_probability:
+        return None
+    return next_state(state, action)
+
+def response_topic(device_id):
+    """
+    Obtiene el topic en el que el switch publica su nuevo estado.
+
+    Args:
+        device_id (int): ID del switch.
+
+    Returns:
+        str: Topic de respuesta (el del siguiente ID).
+    """
+    return f"redes2/2312/1/switch_{int(device_id) + 1}"
+
+def publish_state(client, device_id, state):
+    """
+    Publica el estado del switch como mensaje retenido en su topic de estado.
+
+    Args:
+        client: Instancia del cliente MQTT.
+        device_id (int): ID del switch.
+        state (bool): Estado actual (True encendido).
+    """
+    client.publish(state_topic(device_id), "ON" if state else "OFF", qos=1, retain=True)
+    messages_out.inc()
+
 # Funciones para guardar y cargar estado de switches
 def save_switches():
     """
@@ -74,7 +132,7 @@ def handle_sigint(sig, frame):
 def on_connect(client, userdata, flags, rc):
     """
     Callback que se ejecuta al conectar al broker.
-    Se suscribe al topic del switch correspondiente.
+    Se suscribe al topic del switch correspondiente y publica su estado actual.
 
     Args:
         client: Instancia del cliente MQTT.
@@ -86,12 +144,14 @@ def on_connect(client, userdata, flags, rc):
     topic_request = f"redes2/2312/1/switch_{switch_id}"
     client.subscribe(topic_request)
     print(f"Suscrito al topic {topic_request}")
+    publish_state(client, switch_id, switch_data.get(str(switch_id), False))
 
 # Callback al recibir un mensaje
 def on_message(client, userdata, msg):
     """
     Callback que se ejecuta al recibir un mensaje.
-    Cambia el estado del switch si no hay fallo simulado.
+    Cambia el estado del switch si no hay fallo simulado. Una orden repetida (mismo
+    identificador) no se vuelve a aplicar: solo se confirma el estado que dejó.
 
     Args:
         client: Instancia del cliente MQTT.
@@ -100,20 +160,36 @@ def on_message(client, userdata, msg):
     """
     global switch_data
     message = msg.payload.decode()
-    print(f"Mensaje recibido en {msg.topic}: {message}")
-    
-    if random.random() < probability:
-        print("Simulando fallo. No se realizará acción.")
-        return
-
-    state = switch_data.get(str(switch_id), False)
-    switch_data[str(switch_id)] = not state
-    print(f"Nuevo estado de switch {switch_id}: {'ON' if not state else 'OFF'}")
-    
-    topic_response = f"redes2/2312/1/switch_{switch_id+1}"
-    response = "ON" if not state else "OFF"
+    debug = log.isEnabledFor(logging.DEBUG)
+    if debug:
+        log.debug("mensaje recibido", extra={"topic": msg.topic, "payload": message})
+
+    command = parse_command(message)
+    if command is None:
+        return  # Confirmación de otro switch, no una orden
+    action, command_id = command
+
+    state = applied.get(command_id)
+    if state is not None:
+        commands_in.inc(labels=("duplicate",))
+    else:
+        state = apply_command(switch_data.get(str(switch_id), False), probability, action)
+        if state is None:
+            commands_in.inc(labels=("failed",))
+            if debug:
+                log.debug("simulando fallo, no se realiza la acción", extra={"topic": msg.topic})
+            return
+        commands_in.inc(labels=("applied",))
+        applied.record(command_id, state)
+        switch_data[str(switch_id)] = state
+        publish_state(client, switch_id, state)
+
+    topic_response = response_topic(switch_id)
+    response = format_reply(state, command_id)
     client.publish(topic_response, response)
-    print(f"Respuesta publicada en {topic_response}: {response}")
+    messages_out.inc()
+    if debug:
+        log.debug("respuesta publicada", extra={"topic": topic_response, "payload": response})
 
 def main():
     """
@@ -126,7 +202,12 @@ def main():
     parser.add_argument("-p", "--port", type=int, default=1883, help="Broker port")
     parser.add_argument("-P", "--probability", type=float, default=0.3, help="Failure probability")
     parser.add_argument("id", type=int, help="Switch device ID")
+    parser.add_argument("--metrics-port", type=int, default=None, help="Local Prometheus metrics port")
+    add_log_arguments(parser)
     args = parser.parse_args()
+    setup_logging(args)
+    if args.metrics_port is not None:
+        start_http_server(metrics, args.metrics_port)
 
     broker_host = args.host
     broker_port = args.port
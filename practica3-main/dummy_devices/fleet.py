@@ -0,0 +1,409 @@
+"""
+fleet.py
+
+Simula una flota completa de dispositivos (sensores, switches y relojes) en un único
+proceso con un solo bucle asyncio y un pequeño conjunto de conexiones MQTT compartidas.
+Las publicaciones periódicas de todos los dispositivos las programa una única rueda de
+temporizadores (`common.timing_wheel`) en lugar de una tarea por dispositivo.
+
+Cada dispositivo reutiliza el comportamiento de su dummy (rampa de temperatura de
+dummy_sensor, probabilidad de fallo de dummy_switch e incremento de dummy_clock), pero
+sin el coste de un intérprete y una conexión por dispositivo.
+
+Formato del fichero de flota (JSON):
+
+    {
+        "connections": 4,
+        "sensors":  {"count": 100, "first_id": 1000, "min": 20, "max": 30, "increment": 1, "interval": 1},
+        "switches": {"count": 50, "first_id": 2000, "step": 2, "probability": 0.3},
+        "clocks":   {"count": 10, "first_id": 3000, "time": "09:00:00", "increment": 60, "rate": 1}
+    }
+
+Los switches responden en el topic del ID siguiente (igual que dummy_switch), por lo que
+por defecto se les asignan IDs de dos en dos ("step": 2) para que la respuesta de un switch
+no llegue como orden a otro; además publican su estado retenido en su topic de estado. Con "encoding": "binary" en "sensors" las lecturas se publican
+en la codificación binaria compacta de `common.codec`, y con "deadband", "deadband_relative",
+"heartbeat" o "min_interval" cada sensor solo publica por excepción (ver `common.deadband`);
+en ese caso, como dummy_sensor, también atiende las consultas del controlador (un mensaje
+vacío en su topic) respondiendo con su último valor.
+
+Argumentos:
+  --host         Host del broker MQTT (por defecto: redes2.ii.uam.es)
+  --port, -p     Puerto del broker MQTT (por defecto: 1883)
+  fleet          Fichero JSON con la descripción de la flota
+
+Ejemplo:
+  python dummy_devices/fleet.py --host localhost data/fleet.json
+"""
+import argparse
+import asyncio
+import json
+import os
+import signal
+import sys
+import time
+from datetime import datetime
+import paho.mqtt.client as mqtt
+
+# Permitir ejecutar la flota como script (python dummy_devices/fleet.py)
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from common.deadband import policy_from_spec
+from common.log import add_arguments as add_log_arguments, setup_from_args as setup_logging
+from common.loopback import LOOPBACK_HOST, make_client
+from common.metrics import MetricsRegistry, start_http_server
+from common.switch_command import CommandLog, format_reply, parse_command, state_topic
+from common.timing_wheel import TimingWheel
+from common.vclock import Deadline, VirtualClock
+from dummy_devices.dummy_sensor import format_reading, next_value
+from dummy_devices.dummy_switch import apply_command, response_topic
+
+TOPIC_BASE = "redes2/2312/1"
+DEFAULT_CONNECTIONS = 4
+
+
+def expand_ids(spec, default_step=1):
+    """
+    Calcula los IDs de un grupo de dispositivos de la flota.
+
+    Args:
+        spec (dict): Descripción del grupo (claves 'count', 'first_id' y opcionalmente 'step').
+        default_step (int): Separación entre IDs si el grupo no indica 'step'.
+
+    Returns:
+        list[int]: IDs del grupo.
+    """
+    count = int(spec.get("count", 0))
+    first_id = int(spec.get("first_id", 1))
+    step = int(spec.get("step", default_step))
+    return [first_id + i * step for i in range(count)]
+
+
+class Fleet:
+    """
+    Conjunto de dispositivos simulados que comparten bucle de eventos y conexiones MQTT.
+    """
+
+    def __init__(self, spec, connections=None):
+        """
+        Inicializa la flota a partir de su descripción.
+
+        Args:
+            spec (dict): Descripción de la flota (ver docstring del módulo).
+            connections (int or None): Conexiones MQTT a abrir (por defecto, las del fichero).
+        """
+        self.spec = spec
+        self.connections = connections or int(spec.get("connections", DEFAULT_CONNECTIONS))
+        self.sensors = {sensor_id: spec["sensors"].get("min", 20)
+                        for sensor_id in expand_ids(spec.get("sensors", {}))}
+        self.switches = {switch_id: False
+                         for switch_id in expand_ids(spec.get("switches", {}), default_step=2)}
+        start = spec.get("clocks", {}).get("time") or datetime.now().strftime("%H:%M:%S")
+        self.clocks = {clock_id: datetime.strptime(start, "%H:%M:%S")
+                       for clock_id in expand_ids(spec.get("clocks", {}))}
+        self.clients = []
+        self.loop = None
+        self.wheel = None
+        self.published = 0
+        self._seq = {}  # Número de secuencia por sensor
+        self._policies = {}  # Política de banda muerta por sensor
+        # Con banda muerta un sensor puede pasar mucho sin publicar: entonces atiende consultas
+        self.answers_requests = policy_from_spec(spec.get("sensors", {})) is not None
+        self._vclocks = {}  # (VirtualClock, Deadline) por reloj
+        self._applied = {}  # Órdenes ya aplicadas (CommandLog) por switch
+        self.metrics = MetricsRegistry()
+        self.messages_out = self.metrics.counter(
+            "device_messages_out_total", "Mensajes publicados por la flota por tipo de dispositivo", ("type",))
+        self.commands_in = self.metrics.counter(
+            "device_commands_in_total", "Órdenes recibidas por los switches de la flota", ("result",))
+
+    def client_for(self, device_id):
+        """
+        Obtiene la conexión MQTT compartida que usa un dispositivo.
+
+        Args:
+            device_id (int): ID del dispositivo.
+
+        Returns:
+            mqtt.Client: Cliente MQTT asignado.
+        """
+        return self.clients[device_id % len(self.clients)]
+
+    def publish(self, device_id, topic, payload, retain=False):
+        """
+        Publica un mensaje en nombre de un dispositivo.
+
+        Args:
+            device_id (int): ID del dispositivo que publica.
+            topic (str): Topic destino.
+            payload (str): Contenido del mensaje.
+            retain (bool): Publicar como mensaje retenido (con QoS 1).
+
+        Returns:
+            None
+        """
+        if retain:
+            self.client_for(device_id).publish(topic, payload, qos=1, retain=True)
+        else:
+            self.client_for(device_id).publish(topic, payload)
+        self.published += 1
+        self.messages_out.inc(labels=(topic.rpartition("/")[2].rpartition("_")[0],))
+
+    def connect(self, host, port):
+        """
+        Abre las conexiones MQTT y suscribe cada switch (y cada sensor que atiende consultas)
+        en la conexión que le corresponde.
+
+        Cada conexión hace una única suscripción agrupada con todos sus dispositivos.
+
+        Args:
+            host (str): Host del broker MQTT.
+            port (int): Puerto del broker MQTT.
+
+        Returns:
+            None
+        """
+        for _ in range(self.connections):
+            client = make_client(host, protocol=mqtt.MQTTv311)
+            client.on_connect = self._on_connect
+            client.on_message = self._on_message
+            self.clients.append(client)
+        for client in self.clients:
+            client.connect(host, port, 60)
+            client.loop_start()
+        print(f"Flota conectada al broker {host}:{port} con {len(self.clients)} conexiones "
+              f"({len(self.sensors)} sensores, {len(self.switches)} switches, {len(self.clocks)} relojes)",
+              flush=True)
+
+    def _on_connect(self, client, userdata, flags, rc):
+        """
+        Callback de conexión: suscribe los switches (y los sensores que atienden consultas)
+        asignados a esta conexión y publica el estado de los switches.
+        """
+        index = self.clients.index(client)
+        own = [switch_id for switch_id in self.switches if switch_id % len(self.clients) == index]
+        topics = [(f"{TOPIC_BASE}/switch_{switch_id}", 0) for switch_id in own]
+        if self.answers_requests:
+            topics.extend((f"{TOPIC_BASE}/sensor_{sensor_id}", 0) for sensor_id in self.sensors
+                          if sensor_id % len(self.clients) == index)
+        if topics:
+            client.subscribe(topics)
+        for switch_id in own:
+            self.publish(switch_id, state_topic(switch_id, TOPIC_BASE), "ON" if self.switches[switch_id] else "OFF",
+                         retain=True)
+
+    def _on_message(self, client, userdata, msg):
+        """
+        Callback MQTT (hilo de red de paho): pasa la orden o la consulta al bucle de la flota.
+        """
+        if msg.topic.rpartition("/")[2].startswith("sensor_"):
+            self.loop.call_soon_threadsafe(self.handle_sensor_request, msg.topic, msg.payload)
+        else:
+            self.loop.call_soon_threadsafe(self.handle_switch, msg.topic, msg.payload.decode("utf-8", "replace"))
+
+    def handle_sensor_request(self, topic, payload=b""):
+        """
+        Responde a una consulta del controlador a un sensor con su último valor publicado.
+
+        Los mensajes no vacíos son las lecturas del propio sensor y se ignoran.
+
+        Args:
+            topic (str): Topic del sensor.
+            payload (bytes): Contenido recibido (vacío en las consultas).
+
+        Returns:
+            None
+        """
+        sensor_id = int(topic.rpartition("_")[2])
+        if payload or sensor_id not in self.sensors:
+            return
+        params = self.spec["sensors"]
+        policy = self._policies.get(sensor_id)
+        value = policy.last_value if policy is not None and policy.last_value is not None else self.sensors[sensor_id]
+        self.publish(sensor_id, topic, format_reading(value, params.get("encoding", "text"), sensor_id,
+                                                      self._seq.get(sensor_id, 0)))
+
+    def handle_switch(self, topic, payload="TOGGLE"):
+        """
+        Aplica una orden recibida por un switch de la flota y publica su nuevo estado.
+
+        Igual que dummy_switch, una orden con identificador solo se aplica una vez.
+
+        Args:
+            topic (str): Topic en el que se recibió la orden.
+            payload (str): Orden recibida (ver common.switch_command).
+
+        Returns:
+            None
+        """
+        switch_id = int(topic.rpartition("_")[2])
+        if switch_id not in self.switches:
+            self.commands_in.inc(labels=("unknown",))
+            return
+        command = parse_command(payload)
+        if command is None:
+            return
+        action, command_id = command
+        applied = self._applied.get(switch_id)
+        state = applied.get(command_id) if applied is not None else None
+        if state is not None:
+            self.commands_in.inc(labels=("duplicate",))
+        else:
+            probability = self.spec["switches"].get("probability", 0.3)
+            state = apply_command(self.switches[switch_id], probability, action)
+            if state is None:
+                self.commands_in.inc(labels=("failed",))
+                return
+            self.commands_in.inc(labels=("applied",))
+            self.switches[switch_id] = state
+            if command_id is not None:
+                self._applied.setdefault(switch_id, CommandLog()).record(command_id, state)
+            self.publish(switch_id, state_topic(switch_id, TOPIC_BASE), "ON" if state else "OFF", retain=True)
+        self.publish(switch_id, response_topic(switch_id), format_reply(state, command_id))
+
+    def sensor_tick(self, sensor_id):
+        """
+        Toma una muestra de un sensor y la publica si su política lo permite.
+
+        Args:
+            sensor_id (int): ID del sensor.
+
+        Returns:
+            None
+        """
+        params = self.spec["sensors"]
+        if sensor_id not in self._seq:
+            self._seq[sensor_id] = 0
+            self._policies[sensor_id] = policy_from_spec(params)
+        policy = self._policies[sensor_id]
+        value = self.sensors[sensor_id]
+        if policy is None or policy.check(value):
+            self.publish(sensor_id, f"{TOPIC_BASE}/sensor_{sensor_id}",
+                         format_reading(value, params.get("encoding", "text"), sensor_id, self._seq[sensor_id]))
+            self._seq[sensor_id] += 1
+        self.sensors[sensor_id] = next_value(value, params.get("min", 20),
+                                             params.get("max", 30), params.get("increment", 1))
+
+    def clock_tick(self, clock_id):
+        """
+        Publica la hora de un reloj correspondiente a su plazo actual.
+
+        Args:
+            clock_id (int): ID del reloj.
+
+        Returns:
+            float: Segundos hasta el siguiente plazo del reloj.
+        """
+        if clock_id not in self._vclocks:
+            params = self.spec["clocks"]
+            rate = params.get("rate", 1)
+            clock = VirtualClock(self.clocks[clock_id], params.get("increment", 1) / rate)
+            self._vclocks[clock_id] = (clock, Deadline(rate, clock.t0))
+        clock, deadline = self._vclocks[clock_id]
+        # La hora publicada es la del plazo, no la del instante (algo posterior) en que se publica
+        self.publish(clock_id, f"{TOPIC_BASE}/watch_{clock_id}", clock.text(deadline.next))
+        self.clocks[clock_id] = clock.now(deadline.next)
+        deadline.advance()
+        return deadline.remaining()
+
+    def schedule(self, wheel):
+        """
+        Programa en una rueda de temporizadores las publicaciones de todos los dispositivos.
+
+        Los primeros plazos de cada grupo se reparten a lo largo de su intervalo para que
+        los dispositivos no publiquen todos en el mismo tick.
+
+        Args:
+            wheel (TimingWheel): Rueda que hará avanzar el bucle de la flota.
+
+        Returns:
+            list[Timer]: Temporizadores periódicos programados.
+        """
+        timers = []
+        now = time.monotonic()
+        interval = self.spec.get("sensors", {}).get("interval", 1)
+        for index, sensor_id in enumerate(self.sensors):
+            first = now + interval * index / len(self.sensors)
+            timers.append(wheel.call_every(interval, self.sensor_tick, sensor_id, first=first))
+        rate = self.spec.get("clocks", {}).get("rate", 1)
+        for index, clock_id in enumerate(self.clocks):
+            first = now + rate * index / len(self.clocks)
+            timers.append(wheel.call_every(rate, self.clock_tick, clock_id, first=first))
+        return timers
+
+    async def run(self, host, port):
+        """
+        Conecta la flota y ejecuta todos los dispositivos hasta que se cancele.
+
+        Args:
+            host (str): Host del broker MQTT.
+            port (int): Puerto del broker MQTT.
+
+        Returns:
+            None
+        """
+        self.loop = asyncio.get_running_loop()
+        self.connect(host, port)
+        self.wheel = TimingWheel()
+        self.schedule(self.wheel)
+        try:
+            await self.wheel.run_async()
+        finally:
+            self.stop()
+
+    def stop(self):
+        """
+        Cierra todas las conexiones MQTT de la flota.
+
+        Returns:
+            None
+        """
+        for client in self.clients:
+            client.loop_stop()
+            client.disconnect()
+        print(f"Flota detenida. Mensajes publicados: {self.published}")
+
+
+def load_fleet(filepath):
+    """
+    Lee la descripción de una flota desde un fichero JSON.
+
+    Args:
+        filepath (str): Ruta del fichero.
+
+    Returns:
+        dict: Descripción de la flota.
+    """
+    with open(filepath, "r") as f:
+        return json.load(f)
+
+
+def main():
+    """
+    Analiza los argumentos de línea de comandos y lanza la flota simulada.
+    """
+    parser = argparse.ArgumentParser(description="Flota de dispositivos simulados")
+    parser.add_argument("--host", default="redes2.ii.uam.es")
+    parser.add_argument("--port", "-p", type=int, default=1883)
+    parser.add_argument("--connections", "-c", type=int, default=None,
+                        help="Conexiones MQTT compartidas (por defecto, las del fichero)")
+    parser.add_argument("--metrics-port", type=int, default=None,
+                        help="Puerto local en el que servir las métricas en formato Prometheus")
+    parser.add_argument("fleet", help="Fichero JSON con la descripción de la flota")
+    add_log_arguments(parser)
+    args = parser.parse_args()
+    if args.host == LOOPBACK_HOST:
+        parser.error("el broker en memoria solo existe dentro de un proceso; usa Fleet desde las pruebas o benchmarks")
+    setup_logging(args)
+
+    fleet = Fleet(load_fleet(args.fleet), args.connections)
+    if args.metrics_port is not None:
+        start_http_server(fleet.metrics, args.metrics_port)
+    signal.signal(signal.SIGINT, signal.default_int_handler)
+    try:
+        asyncio.run(fleet.run(args.host, args.port))
+    except KeyboardInterrupt:
+        print("\nSaliendo por Ctrl+C...")
+
+if __name__ == "__main__":
+    main()
@@ -31,5 +31,8 @@ python3 dummy_devices/dummy_clock.py --host $HOST --port $PORT --time 12:00:00 -
 PID_CLOCK=$!
 echo "dummy_clock.py lanzado (PID: $PID_CLOCK)"
 
+# Flota completa en un solo proceso (alternativa a un proceso por dispositivo):
+# python3 dummy_devices/fleet.py --host $HOST --port $PORT data/fleet.json
+
 echo ""
 echo "Usa 'kill $PID_SENSOR $PID_SWITCH $PID_CLOCK' para detenerlos si lo necesitas."
@@ -0,0 +1,73 @@
+import asyncio
+import threading
+
+import controller.controller as ctrl
+from common.loopback import LoopbackBroker, LoopbackClient
+from controller.aio_mqtt import AsyncioMqtt
+
+
+def test_callbacks_run_on_event_loop_thread():
+    """Verifica que en modo asyncio los mensajes llegan en el hilo del bucle, sin loop_start."""
+    broker = LoopbackBroker()
+
+    async def scenario():
+        client = AsyncioMqtt(LoopbackClient(broker=broker))
+        received = asyncio.get_running_loop().create_future()
+        client.on_message = lambda c, userdata, msg: received.set_result(
+            (msg.payload, threading.current_thread()))
+        client.connect("loopback")
+        client.subscribe("t/#")
+        rc = await client.apublish("t/1", "hola")
+        payload, thread = await asyncio.wait_for(received, 1)
+        client.close()
+        return rc, payload, thread, client.inflight()
+
+    rc, payload, thread, inflight = asyncio.run(scenario())
+    assert rc == 0 and payload == b"hola"
+    assert thread is threading.main_thread()
+    assert inflight == 0
+
+
+def test_apublish_waits_for_confirmation_and_limits_inflight():
+    """Verifica que apublish espera a on_publish y respeta el máximo de publicaciones en vuelo."""
+    broker = LoopbackBroker()
+
+    async def scenario():
+        client = AsyncioMqtt(LoopbackClient(broker=broker), max_inflight=2)
+        confirmed = []
+        client.on_publish = lambda c, userdata, mid: confirmed.append(mid)
+        client.connect("loopback")
+        await asyncio.gather(*(client.apublish(f"t/{i}", str(i), qos=1) for i in range(5)))
+        return confirmed, client.inflight()
+
+    confirmed, inflight = asyncio.run(scenario())
+    assert sorted(confirmed) == [1, 2, 3, 4, 5]
+    assert inflight == 0
+
+
+def test_controller_queries_devices_on_single_loop(monkeypatch):
+    """Verifica una consulta de sensores de extremo a extremo con un único bucle de asyncio."""
+    broker = LoopbackBroker()
+    monkeypatch.setitem(ctrl.device_data, "devices", {"1": "sensor", "2": "sensor"})
+    monkeypatch.setattr(ctrl, "last_values", type(ctrl.last_values)())
+
+    async def scenario():
+        controller = ctrl.connect_mqtt(AsyncioMqtt(LoopbackClient(broker=broker)), "loopback", 1883)
+        device = AsyncioMqtt(LoopbackClient(broker=broker))
+
+        def on_request(client, userdata, msg):
+            if not msg.payload:
+                client.publish(msg.topic, f"Temperature: 2{msg.topic[-1]} °C")
+
+        device.on_message = on_request
+        device.connect("loopback")
+        device.subscribe(f"{ctrl.TOPIC_BASE}/+")
+        await asyncio.sleep(0)
+        try:
+            return await ctrl.query_devices(controller, "sensor", "Sensor", timeout=1, max_age=0)
+        finally:
+            controller.close()
+            device.close()
+
+    response = asyncio.run(scenario())
+    assert response == "Sensor 1: Temperature: 21 °C\nSensor 2: Temperature: 22 °C"
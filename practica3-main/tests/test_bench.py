@@ -0,0 +1,25 @@
+import json
+import sys
+
+import controller.controller as ctrl
+from benchmarks import bench_controller
+
+
+def test_benchmark_writes_machine_readable_results(tmp_path, monkeypatch):
+    """Verifica que el benchmark ejecuta todos los escenarios y guarda resultados en JSON."""
+    # El benchmark sustituye el estado global del controlador; se restaura al terminar
+    for name in ("rule_engine", "last_values", "mqtt_client"):
+        monkeypatch.setattr(ctrl, name, getattr(ctrl, name))
+    for key in ("devices", "device_last_id"):
+        monkeypatch.setitem(ctrl.device_data, key, ctrl.device_data[key])
+
+    output = tmp_path / "results.json"
+    monkeypatch.setattr(sys, "argv", ["bench", "--devices", "5", "--messages", "200", "--rules", "10",
+                                      "--commands", "5", "--output", str(output)])
+    bench_controller.main()
+
+    results = json.loads(output.read_text())
+    assert set(results["scenarios"]) == set(bench_controller.SCENARIOS)
+    for result in results["scenarios"].values():
+        assert result["operations"] > 0
+        assert result["p50_us"] <= result["p99_us"]
@@ -0,0 +1,54 @@
+import asyncio
+from types import SimpleNamespace
+from unittest.mock import MagicMock, patch
+
+from controller.cache import LastValueCache
+
+
+def test_put_increments_sequence_per_topic():
+    """Verifica que cada topic lleva su propio número de secuencia."""
+    cache = LastValueCache()
+    cache.put("a", "1", now=0)
+    cache.put("a", "2", now=1)
+    cache.put("b", "x", now=1)
+    assert cache.get("a").value == "2"
+    assert cache.get("a").seq == 2
+    assert cache.get("b").seq == 1
+
+
+def test_get_fresh_respects_max_age():
+    """Verifica que una lectura obsoleta no se devuelve como vigente."""
+    cache = LastValueCache()
+    cache.put("a", "20", now=100.0)
+    assert cache.get_fresh("a", max_age=5, now=104.0).value == "20"
+    assert cache.get_fresh("a", max_age=5, now=106.0) is None
+    assert cache.get_fresh("desconocido", max_age=5) is None
+
+
+def test_query_answers_from_cache_without_publishing(monkeypatch):
+    """Verifica que !sensor responde desde la caché si la lectura es reciente."""
+    import controller.controller as ctrl
+    monkeypatch.setitem(ctrl.device_data, "devices", {"7": "sensor"})
+    monkeypatch.setattr(ctrl, "last_values", LastValueCache())
+    msg = MagicMock()
+    msg.topic = "redes2/2312/1/sensor_7"
+    msg.payload = b"21"
+    with patch("controller.controller.process_sensor_message"):
+        ctrl.on_mqtt_message(None, None, msg)
+
+    mqtt_client = MagicMock()
+    response = asyncio.run(ctrl.query_devices(mqtt_client, "sensor", "Sensor", max_age=60))
+    assert response == "Sensor 7: 21"
+    mqtt_client.publish.assert_not_called()
+
+
+def test_only_device_topics_are_cached(monkeypatch):
+    """Verifica que los topics de control y de estado no entran en la caché de lecturas."""
+    import controller.controller as ctrl
+    monkeypatch.setattr(ctrl, "last_values", LastValueCache())
+    for topic, payload in (("redes2/2312/1/add_device", b"switch"), ("redes2/2312/1/state/switch_3", b"ON"),
+                           ("redes2/2312/1/watch_5", b"09:00:00")):
+        ctrl.on_mqtt_message(None, None, SimpleNamespace(topic=topic, payload=payload))
+    assert ctrl.last_values.get("redes2/2312/1/add_device") is None
+    assert ctrl.last_values.get("redes2/2312/1/state/switch_3") is None
+    assert ctrl.last_values.get("redes2/2312/1/watch_5").value == "09:00:00"
@@ -0,0 +1,68 @@
+from unittest.mock import MagicMock
+
+import pytest
+
+import controller.controller as ctrl
+from common.codec import BINARY_FORMAT, MAGIC, decode_binary, encode_binary, is_binary, parse_number
+from controller.rules import RuleEngine
+from dummy_devices.dummy_sensor import format_reading
+
+BASE = "redes2/2312/1"
+
+
+def test_parse_device_text_messages():
+    """Verifica que se extrae el valor de los mensajes de texto de los dispositivos."""
+    assert parse_number("25") == 25.0
+    assert parse_number("Temperature: 25 °C") == 25.0
+    assert parse_number("Sensor value: -12.34") == -12.34
+    assert parse_number("temp=21.5C") == 21.5
+    assert parse_number("sin valor") is None
+
+
+def test_binary_roundtrip_and_detection():
+    """Verifica la codificación binaria: tamaño fijo, ida y vuelta y detección por el primer byte."""
+    payload = encode_binary("sensor", 1042, 26.5, seq=70000, timestamp=1000.25)
+    assert len(payload) == BINARY_FORMAT.size == 20
+    assert is_binary(payload) and not is_binary("Temperature: 26 °C".encode())
+    reading = decode_binary(payload)
+    assert (reading.tipo, reading.device_id, reading.value) == ("sensor", "1042", 26.5)
+    assert reading.seq == 70000 & 0xFFFF and reading.timestamp == 1000.25
+    assert reading.text() == "Temperature: 26.5 °C"
+    with pytest.raises(ValueError):
+        decode_binary(payload[:-1])
+
+
+def test_rules_fire_on_text_and_binary_readings(monkeypatch):
+    """Verifica que las reglas se disparan con lecturas de texto y binarias del sensor."""
+    engine = RuleEngine(BASE, [{"source": "sensor_+", "condition": {"op": ">", "value": 25}, "action": "ON"}])
+    assert [rule.action for rule in engine.evaluate(f"{BASE}/sensor_1", "Temperature: 26 °C")] == ["ON"]
+    assert engine.evaluate(f"{BASE}/sensor_1", "Sensor value: 20.00") == []
+
+    monkeypatch.setitem(ctrl.device_data, "devices", {"1": "sensor", "2": "switch"})
+    monkeypatch.setattr(ctrl, "rule_engine", engine)
+    monkeypatch.setattr(ctrl, "last_values", type(ctrl.last_values)())
+    monkeypatch.setattr(ctrl, "publisher", None)
+    mqtt_client = MagicMock()
+    monkeypatch.setattr(ctrl, "mqtt_client", mqtt_client)
+    msg = MagicMock(topic=f"{BASE}/sensor_1", payload=format_reading(30, "binary", 1))
+    ctrl.on_mqtt_message(None, None, msg)
+    mqtt_client.publish.assert_called_once()
+    topic, payload = mqtt_client.publish.call_args.args
+    assert topic == f"{BASE}/switch_2" and payload.startswith("ON cmd=")
+    assert ctrl.last_values.get(f"{BASE}/sensor_1").value == "Temperature: 30 °C"
+
+
+def test_binary_reading_reaches_rules_without_text(monkeypatch):
+    """Verifica que las reglas reciben el valor binario sin reanalizar texto y que se valida el topic."""
+    seen = []
+    monkeypatch.setattr(ctrl, "process_sensor_message", lambda topic, value: seen.append((topic, value)))
+    monkeypatch.setattr(ctrl, "last_values", type(ctrl.last_values)())
+    ctrl.on_mqtt_message(None, None, MagicMock(topic=f"{BASE}/sensor_3", payload=encode_binary("sensor", 3, 21.5)))
+    assert seen == [(f"{BASE}/sensor_3", 21.5)]
+
+    # Una lectura binaria de otro dispositivo no se atribuye al topic en el que llega
+    ctrl.on_mqtt_message(None, None, MagicMock(topic=f"{BASE}/sensor_4", payload=encode_binary("sensor", 3, 99.0)))
+    # Ni una de un tipo sin esquema binario
+    unknown = BINARY_FORMAT.pack(MAGIC, 3, 4, 0, 1000.0, 60.0)
+    ctrl.on_mqtt_message(None, None, MagicMock(topic=f"{BASE}/sensor_4", payload=unknown))
+    assert len(seen) == 1 and ctrl.last_values.get(f"{BASE}/sensor_4") is None
@@ -0,0 +1,94 @@
+import asyncio
+from unittest.mock import MagicMock
+
+from controller.commands import CommandRegistry, one_arg
+
+
+def make_message(content, user=1, channel=10):
+    message = MagicMock()
+    message.content = content
+    message.author.id = user
+    message.channel.id = channel
+    return message
+
+
+def make_registry(**kwargs):
+    replies = []
+
+    async def respond(message, text):
+        replies.append(text)
+    return CommandRegistry(respond, **kwargs), replies
+
+
+def test_dispatch_parses_arguments_and_generates_help():
+    """Verifica el despacho por tabla, los mensajes de uso y la ayuda generada."""
+    commands, replies = make_registry()
+
+    @commands.command("eco", parse=one_arg, usage="<texto>", help="Repetir texto")
+    async def eco(message, text, mqtt_client):
+        return text.upper()
+
+    async def scenario():
+        return [await commands.dispatch(make_message(content), None)
+                for content in ("!eco hola", "!eco", "!nada", "sin prefijo")]
+
+    assert asyncio.run(scenario()) == ["ok", "usage", "unknown", None]
+    assert replies == ["HOLA", "Uso: !eco <texto>", "Comando no reconocido. Usa !help"]
+    assert "!eco <texto> - Repetir texto" in commands.help_text()
+
+
+def test_slow_command_times_out_without_blocking_others():
+    """Verifica que un comando lento agota su timeout mientras otros usuarios siguen siendo atendidos."""
+    commands, replies = make_registry(timeout=0.05)
+
+    @commands.command("lento")
+    async def lento(message, args, mqtt_client):
+        await asyncio.sleep(1)
+
+    @commands.command("rapido")
+    async def rapido(message, args, mqtt_client):
+        return "hecho"
+
+    async def scenario():
+        return await asyncio.gather(commands.dispatch(make_message("!lento", user=1), None),
+                                    commands.dispatch(make_message("!rapido", user=2), None))
+
+    assert asyncio.run(scenario()) == ["timeout", "ok"]
+    assert replies == ["hecho", "!lento: sin respuesta en 0.05 s"]
+
+
+def test_per_user_throttling_and_concurrency_limit():
+    """Verifica el cubo de tokens por usuario y el límite de comandos en curso."""
+    commands, replies = make_registry(rate=0.001, burst=2, per_user=1)
+
+    @commands.command("espera")
+    async def espera(message, args, mqtt_client):
+        await asyncio.sleep(0.02)
+        return "ok"
+
+    async def scenario():
+        first = await asyncio.gather(commands.dispatch(make_message("!espera"), None),
+                                     commands.dispatch(make_message("!espera"), None))
+        # El rechazo por comandos en curso no gasta token: el tercero aún cabe en la ráfaga
+        third = await commands.dispatch(make_message("!espera"), None)
+        fourth = await commands.dispatch(make_message("!espera"), None)
+        other = await commands.dispatch(make_message("!espera", user=2), None)
+        return list(first) + [third, fourth, other]
+
+    assert asyncio.run(scenario()) == ["ok", "throttled", "ok", "throttled", "ok"]
+    assert "demasiados comandos en curso" in replies[0] and "Demasiados comandos seguidos" in replies[3]
+
+
+def test_throttle_message_never_says_zero_seconds():
+    """Verifica que la espera anunciada se redondea hacia arriba y es de al menos 1 s."""
+    commands, replies = make_registry(rate=10, burst=1)
+
+    @commands.command("eco")
+    async def eco(message, args, mqtt_client):
+        return None
+
+    async def scenario():
+        return [await commands.dispatch(make_message("!eco"), None) for _ in range(2)]
+
+    assert asyncio.run(scenario()) == ["ok", "throttled"]
+    assert replies == ["Demasiados comandos seguidos; espera 1 s"]
@@ -37,7 +37,9 @@ def test_perform_action_on_rule_result():
     ctrl.mqtt_client = MagicMock()
     ctrl.device_data["1"] = "switch"
     ctrl.publish_action("ON", ctrl.mqtt_client)
-    ctrl.mqtt_client.publish.assert_called_once_with("redes2/2312/1/switch_2", "ON")
+    ctrl.mqtt_client.publish.assert_called_once()
+    topic, payload = ctrl.mqtt_client.publish.call_args.args
+    assert topic == "redes2/2312/1/switch_2" and payload.startswith("ON cmd=")
 
 
 def test_loads_devices_from_json(tmp_path):
@@ -49,3 +51,21 @@ def test_loads_devices_from_json(tmp_path):
     with patch("controller.controller.DEVICES_FILE", str(fake_json)):
         ctrl.load_devices()
     assert ctrl.device_data["devices"]["1"] == "sensor"
+
+
+def test_default_devices_survive_restart_without_snapshot(tmp_path, monkeypatch):
+    """Verifica que los dispositivos por defecto no se pierden si no había devices.json."""
+    import controller.controller as ctrl
+    monkeypatch.setattr(ctrl, "DEVICES_FILE", str(tmp_path / "devices.json"))
+    monkeypatch.setattr(ctrl, "journal", None)
+    defaults = {"device_last_id": 3, "devices": {"1": "sensor", "2": "switch", "3": "watch"}}
+    ctrl.device_data.clear()
+    ctrl.device_data.update(defaults)
+    ctrl.registry.rebuild()
+    ctrl.load_devices()
+    ctrl.add_device("switch")
+    ctrl.get_journal().close()
+    ctrl.device_data.clear()
+    ctrl.load_devices()
+    ctrl.get_journal().close()
+    assert ctrl.device_data["devices"] == {"1": "sensor", "2": "switch", "3": "watch", "4": "switch"}
@@ -0,0 +1,48 @@
+from unittest.mock import MagicMock
+
+import pytest
+
+from common.deadband import DeadbandPolicy, policy_from_spec
+from devices.sensor import Sensor
+
+
+def test_absolute_and_relative_thresholds():
+    """Verifica que solo se publican los cambios que superan la banda muerta."""
+    policy = DeadbandPolicy(absolute=0.5)
+    assert [policy.check(v, now=0) for v in (20, 20.3, 20.6, 20.8, 21.2)] == [True, False, True, False, True]
+    assert (policy.published, policy.suppressed) == (3, 2)
+
+    relative = DeadbandPolicy(relative=0.1)
+    assert relative.check(100, now=0)
+    assert not relative.check(109, now=1)
+    assert relative.check(111, now=2)
+
+    any_change = DeadbandPolicy()
+    assert any_change.check(5, now=0) and not any_change.check(5, now=1) and any_change.check(6, now=2)
+
+
+def test_heartbeat_and_min_interval():
+    """Verifica el latido periódico y el intervalo mínimo entre publicaciones."""
+    policy = DeadbandPolicy(absolute=1, heartbeat=10, min_interval=2)
+    assert policy.check(20, now=0)
+    assert not policy.check(25, now=1)  # cambio grande, pero antes del intervalo mínimo
+    assert policy.check(25, now=2)
+    assert not policy.check(25, now=11)
+    assert policy.check(25, now=12)  # latido aunque el valor no cambie
+    with pytest.raises(ValueError):
+        DeadbandPolicy(absolute=-1)
+    assert policy_from_spec({"count": 10}) is None
+    assert policy_from_spec({"deadband": 0.5, "heartbeat": 30}).heartbeat == 30
+
+
+def test_sensor_reports_by_exception_but_answers_requests():
+    """Verifica que el sensor filtra sus lecturas periódicas pero responde siempre a una consulta."""
+    client = MagicMock()
+    sensor = Sensor("3", deadband=DeadbandPolicy(absolute=1))
+    sensor.topic = "redes2/2312/1/sensor_3"
+    assert sensor.report(client, 20.0, now=0)
+    assert not sensor.report(client, 20.5, now=1)
+    assert client.publish.call_count == 1
+
+    sensor.handle_message(client, MagicMock(topic=sensor.topic, payload=b""))
+    assert client.publish.call_count == 2
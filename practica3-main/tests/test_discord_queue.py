@@ -0,0 +1,56 @@
+import asyncio
+
+from controller.discord_queue import ReplyQueue, split_message
+
+
+class FakeChannel:
+    def __init__(self, failures=()):
+        self.sent = []
+        self.failures = list(failures)
+
+    async def send(self, text):
+        if self.failures:
+            raise self.failures.pop(0)
+        self.sent.append(text)
+
+
+class RateLimited(Exception):
+    def __init__(self, retry_after):
+        super().__init__("429")
+        self.retry_after = retry_after
+
+
+def test_split_message_on_lines_and_code_blocks():
+    """Verifica que los textos largos se trocean por líneas sin romper los bloques de código."""
+    assert split_message("corto") == ["corto"]
+    text = "```" + "\n".join(f"línea {i:03d}" for i in range(100)) + "```"
+    chunks = split_message(text, limit=200)
+    assert len(chunks) > 1 and all(len(chunk) <= 200 for chunk in chunks)
+    assert all(chunk.startswith("```") and chunk.endswith("```") for chunk in chunks)
+    assert "".join(chunk.strip("`") + "\n" for chunk in chunks).split() == text.strip("`").split()
+    assert [len(chunk) for chunk in split_message("x" * 450, limit=200)] == [196, 196, 58]
+
+
+def test_replies_in_window_are_merged_into_one_message():
+    """Verifica que las respuestas simultáneas a un canal salen en un único mensaje."""
+    queue = ReplyQueue(window=0.01)
+    channel, other = FakeChannel(), FakeChannel()
+
+    async def scenario():
+        return await asyncio.gather(queue.send(channel, "Sensor 1: 20"), queue.send(channel, "Sensor 4: 21"),
+                                    queue.send(other, "ON"))
+
+    assert asyncio.run(scenario()) == [True, True, True]
+    assert channel.sent == ["Sensor 1: 20\nSensor 4: 21"] and other.sent == ["ON"]
+    assert queue.depth() == 0
+
+
+def test_rate_limited_send_is_retried_after_delay():
+    """Verifica que un 429 de Discord se reintenta tras el tiempo indicado en lugar de perderse."""
+    queue = ReplyQueue(window=0, max_retries=2)
+    channel = FakeChannel([RateLimited(0.02)])
+    assert asyncio.run(queue.send(channel, "hola")) is True
+    assert channel.sent == ["hola"]
+
+    failing = FakeChannel([RuntimeError("caído")])
+    assert asyncio.run(queue.send(failing, "adiós")) is False
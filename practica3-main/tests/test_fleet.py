@@ -0,0 +1,81 @@
+import time
+from types import SimpleNamespace
+from unittest.mock import MagicMock
+
+from common.loopback import LoopbackBroker, LoopbackClient
+from common.timing_wheel import TimingWheel
+
+from dummy_devices.fleet import Fleet, expand_ids
+
+SPEC = {
+    "connections": 2,
+    "sensors": {"count": 3, "first_id": 10, "min": 20, "max": 21, "increment": 1, "interval": 0.01},
+    "switches": {"count": 2, "first_id": 20, "probability": 0.0},
+    "clocks": {"count": 1, "first_id": 30, "time": "09:00:00", "increment": 60, "rate": 0.01},
+}
+
+
+def make_fleet():
+    fleet = Fleet(SPEC)
+    fleet.clients = [MagicMock(), MagicMock()]
+    return fleet
+
+
+def test_expand_ids_with_step():
+    """Verifica el reparto de IDs de un grupo de la flota."""
+    assert expand_ids({"count": 3, "first_id": 5}) == [5, 6, 7]
+    assert expand_ids({"count": 3, "first_id": 5}, default_step=2) == [5, 7, 9]
+
+
+def test_switch_ids_do_not_collide_with_responses():
+    """Verifica que la respuesta de un switch (ID + 1) no es el topic de otro switch."""
+    fleet = make_fleet()
+    assert sorted(fleet.switches) == [20, 22]
+
+
+def test_switch_command_toggles_and_replies_on_shared_connection():
+    """Verifica que un switch de la flota reutiliza el comportamiento de dummy_switch."""
+    fleet = make_fleet()
+    fleet.handle_switch("redes2/2312/1/switch_22")
+    assert fleet.switches[22] is True
+    fleet.client_for(22).publish.assert_any_call("redes2/2312/1/switch_23", "ON")
+    fleet.client_for(22).publish.assert_any_call("redes2/2312/1/state/switch_22", "ON", qos=1, retain=True)
+
+
+def test_sensors_and_clocks_share_one_wheel():
+    """Verifica que sensores y relojes publican desde la misma rueda de temporizadores."""
+    fleet = make_fleet()
+    wheel = TimingWheel(tick=0.001)
+    timers = fleet.schedule(wheel)
+    assert len(timers) == len(fleet.sensors) + len(fleet.clocks)
+    deadline = time.monotonic() + 0.035
+    while time.monotonic() < deadline:
+        wheel.advance(time.monotonic())
+        time.sleep(0.001)
+    payloads = [call.args[1] for client in fleet.clients for call in client.publish.call_args_list]
+    assert "Temperature: 20 °C" in payloads and "Temperature: 21 °C" in payloads
+    assert "09:00:00" in payloads and "09:01:00" in payloads
+
+def test_quiet_sensor_answers_requests_through_broker():
+    """Verifica que un sensor con banda muerta responde a la consulta del controlador aunque no publique."""
+    spec = dict(SPEC, connections=1, sensors=dict(SPEC["sensors"], count=1, deadband=5))
+    fleet = Fleet(spec)
+    fleet.loop = SimpleNamespace(call_soon_threadsafe=lambda callback, *args: callback(*args))
+    broker = LoopbackBroker()
+    device = LoopbackClient(broker=broker)
+    device.on_connect = fleet._on_connect
+    device.on_message = fleet._on_message
+    fleet.clients = [device]
+    device.connect("loopback")
+    controller = LoopbackClient(broker=broker)
+    received = []
+    controller.on_message = lambda client, userdata, msg: received.append(msg.payload)
+    controller.connect("loopback")
+    controller.subscribe("redes2/2312/1/sensor_10")
+    device.loop(timeout=0)
+    fleet.sensor_tick(10)  # Publica 20
+    fleet.sensor_tick(10)  # 21 está dentro de la banda muerta: no publica
+    controller.publish("redes2/2312/1/sensor_10", "")
+    device.loop(timeout=0)
+    controller.loop(timeout=0)
+    assert received == [b"Temperature: 20 \xc2\xb0C", b"", b"Temperature: 20 \xc2\xb0C"]
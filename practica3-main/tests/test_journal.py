@@ -0,0 +1,96 @@
+import json
+
+import pytest
+
+from controller.journal import DeviceJournal
+
+
+def test_replay_snapshot_plus_journal(tmp_path):
+    """Verifica que al reabrir se recupera el snapshot más los cambios del journal."""
+    path = tmp_path / "devices.json"
+    path.write_text(json.dumps({"device_last_id": 1, "devices": {"1": "sensor"}}))
+    journal = DeviceJournal(str(path))
+    journal.open()
+    journal.append("add", id="2", type="switch")
+    journal.append("add", id="3", type="watch")
+    journal.append("remove", id="1")
+    assert journal.flush(timeout=5)
+    journal.close()
+
+    state = DeviceJournal(str(path)).open()
+    assert state == {"device_last_id": 3, "devices": {"2": "switch", "3": "watch"}}
+    # El snapshot no se ha reescrito: solo se añadieron líneas al journal
+    assert json.loads(path.read_text())["devices"] == {"1": "sensor"}
+
+
+def test_compaction_replaces_snapshot_and_truncates(tmp_path):
+    """Verifica la compactación automática y que no se reaplican cambios ya incluidos."""
+    path = tmp_path / "devices.json"
+    journal = DeviceJournal(str(path), compact_every=10)
+    with pytest.raises(FileNotFoundError):
+        journal.open()
+    for i in range(1, 26):
+        journal.append("add", id=str(i), type="sensor")
+    journal.flush(timeout=5)
+    journal.close()
+
+    snapshot = json.loads(path.read_text())
+    assert snapshot["journal_seq"] >= 10
+    lines = (tmp_path / "devices.journal").read_text().splitlines()
+    assert len(lines) < 25
+    state = DeviceJournal(str(path)).open()
+    assert len(state["devices"]) == 25
+    assert state["device_last_id"] == 25
+
+
+def test_torn_tail_is_ignored(tmp_path):
+    """Verifica que una última línea a medio escribir no impide la recuperación."""
+    path = tmp_path / "devices.json"
+    path.write_text(json.dumps({"device_last_id": 0, "devices": {}}))
+    (tmp_path / "devices.journal").write_text(
+        '{"seq": 1, "op": "add", "id": "1", "type": "switch"}\n{"seq": 2, "op": "ad')
+    journal = DeviceJournal(str(path))
+    assert journal.open()["devices"] == {"1": "switch"}
+    assert journal.append("add", id="2", type="sensor") == 2
+    journal.close()
+
+
+def test_checkpoint_writes_given_state(tmp_path):
+    """Verifica que checkpoint escribe el estado completo y vacía el journal."""
+    path = tmp_path / "devices.json"
+    journal = DeviceJournal(str(path))
+    journal.rebase({"device_last_id": 0, "devices": {}})
+    journal.start()
+    journal.append("add", id="1", type="sensor")
+    journal.checkpoint({"device_last_id": 1, "devices": {"1": "sensor"}})
+    journal.close()
+    assert json.loads(path.read_text())["devices"] == {"1": "sensor"}
+    assert (tmp_path / "devices.journal").read_text() == ""
+
+
+def test_failed_write_is_retried_and_not_reported_durable(tmp_path, monkeypatch):
+    """Verifica que un lote que no se pudo escribir no se da por duradero y se reintenta."""
+    import controller.journal as journal_module
+    monkeypatch.setattr(journal_module, "RETRY_DELAY", 0.05)
+    path = tmp_path / "devices.json"
+    journal = DeviceJournal(str(path))
+    journal.rebase({"device_last_id": 0, "devices": {}})
+    real_fsync = journal_module.os.fsync
+    disk = {"full": True}
+
+    def fsync(fd):
+        if disk["full"]:
+            raise OSError(28, "No space left on device")
+        real_fsync(fd)
+
+    monkeypatch.setattr(journal_module.os, "fsync", fsync)
+    journal.start()
+    journal.append("add", id="1", type="sensor")
+    with pytest.raises(OSError, match="No space left"):
+        journal.flush(timeout=5)
+    disk["full"] = False
+    assert journal.flush(timeout=5)
+    journal.close()
+    lines = (tmp_path / "devices.journal").read_text().splitlines()
+    assert [json.loads(line)["id"] for line in lines] == ["1"]
+    assert DeviceJournal(str(path)).open()["devices"] == {"1": "sensor"}
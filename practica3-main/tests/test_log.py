@@ -0,0 +1,55 @@
+import io
+import json
+import logging
+
+import common.log as log_module
+from common.log import RateLimitFilter, StructuredFormatter, setup_logging, shutdown_logging
+
+
+def make_record(msg, level=logging.DEBUG, **fields):
+    record = logging.LogRecord("controller", level, __file__, 1, msg, (), None)
+    record.__dict__.update(fields)
+    return record
+
+
+def test_structured_formatter_text_and_json():
+    """Verifica el formato clave=valor y el formato JSON con campos estructurados."""
+    record = make_record("mensaje recibido", topic="redes2/2312/1/sensor_1", payload="Temperature: 21 °C")
+    text = StructuredFormatter().format(record)
+    assert 'DEBUG controller mensaje recibido topic=redes2/2312/1/sensor_1 payload="Temperature: 21 °C"' in text
+    entry = json.loads(StructuredFormatter(json_format=True).format(record))
+    assert entry["msg"] == "mensaje recibido" and entry["payload"] == "Temperature: 21 °C"
+
+
+def test_rate_limit_per_topic_counts_suppressed(monkeypatch):
+    """Verifica que el filtro limita cada topic por separado e informa de los descartados."""
+    now = [100.0]
+    monkeypatch.setattr(log_module.time, "monotonic", lambda: now[0])
+    limiter = RateLimitFilter(rate=1, burst=2)
+    results = [limiter.filter(make_record("x", topic="a")) for _ in range(5)]
+    assert results == [True, True, False, False, False]
+    assert limiter.filter(make_record("x", topic="b"))
+    assert limiter.filter(make_record("x"))
+    assert limiter.filter(make_record("x", level=logging.WARNING, topic="a"))
+
+    now[0] += 1.0
+    record = make_record("x", topic="a")
+    assert limiter.filter(record) and record.suppressed == 3
+
+
+def test_setup_logging_writes_through_queue():
+    """Verifica que los registros llegan al destino a través del escritor en segundo plano."""
+    stream = io.StringIO()
+    root = logging.getLogger()
+    level = root.level
+    setup_logging("INFO", stream=stream, rate=0)
+    try:
+        log = logging.getLogger("test.log")
+        log.debug("no se emite")
+        log.info("arrancado %s", "ok", extra={"port": 1883})
+    finally:
+        shutdown_logging()
+        root.setLevel(level)
+    output = stream.getvalue()
+    assert "INFO test.log arrancado ok port=1883" in output
+    assert "no se emite" not in output
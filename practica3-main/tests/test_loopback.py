@@ -0,0 +1,104 @@
+import asyncio
+from unittest.mock import MagicMock
+
+from common.loopback import LoopbackBroker, LoopbackClient
+
+
+def make_client(broker, client_id="", clean_session=None):
+    client = LoopbackClient(client_id=client_id, clean_session=clean_session, broker=broker)
+    received = []
+    client.on_message = lambda c, userdata, msg: received.append((msg.topic, msg.payload, msg.qos, msg.retain))
+    client.connect("loopback")
+    return client, received
+
+
+def test_wildcard_subscriptions_deliver_once():
+    """Verifica los comodines '+' y '#' y que un cliente recibe cada mensaje una sola vez."""
+    broker = LoopbackBroker()
+    client, received = make_client(broker)
+    client.subscribe([("redes2/2312/1/+", 0), ("redes2/#", 1)])
+    publisher, _ = make_client(broker)
+    publisher.publish("redes2/2312/1/sensor_1", "21", qos=1)
+    publisher.publish("redes2/2312/1/a/b", b"x")
+    publisher.publish("otro/topic", b"y")
+    client.loop(timeout=0)
+    assert received == [("redes2/2312/1/sensor_1", b"21", 1, False),
+                        ("redes2/2312/1/a/b", b"x", 0, False)]
+
+
+def test_retained_messages_delivered_on_subscribe_and_cleared():
+    """Verifica que los mensajes retenidos llegan a los nuevos suscriptores."""
+    broker = LoopbackBroker()
+    publisher, _ = make_client(broker)
+    publisher.publish("state/switch_1", "ON", retain=True)
+    publisher.publish("state/switch_2", "OFF", retain=True)
+    publisher.publish("state/switch_2", "", retain=True)
+    client, received = make_client(broker)
+    client.subscribe("state/+", qos=1)
+    client.loop(timeout=0)
+    assert received == [("state/switch_1", b"ON", 0, True)]
+
+
+def test_persistent_session_keeps_only_qos1_while_offline():
+    """Verifica que con sesión persistente se guardan los QoS 1 y se descartan los QoS 0."""
+    broker = LoopbackBroker()
+    client, received = make_client(broker, client_id="controller", clean_session=False)
+    client.subscribe("cmd/#", qos=1)
+    client.disconnect()
+    publisher, _ = make_client(broker)
+    publisher.publish("cmd/a", "perdido", qos=0)
+    publisher.publish("cmd/b", "guardado", qos=1)
+    client.connect("loopback")
+    client.loop(timeout=0)
+    assert received == [("cmd/b", b"guardado", 1, False)]
+
+
+def test_callbacks_and_publish_info():
+    """Verifica on_connect, on_publish y el resultado de publish como en paho."""
+    broker = LoopbackBroker()
+    client = LoopbackClient(broker=broker)
+    client.on_connect = MagicMock()
+    client.on_publish = MagicMock()
+    client.connect("loopback")
+    info = client.publish("a", "b", qos=1)
+    client.loop(timeout=0)
+    assert info.is_published()
+    client.on_connect.assert_called_once()
+    client.on_publish.assert_called_once_with(client, None, info.mid)
+
+
+def test_controller_and_dummy_switch_without_network(monkeypatch):
+    """Prueba de integración: !switch llega al dummy_switch y vuelve por el broker en memoria."""
+    import controller.controller as ctrl
+    import dummy_devices.dummy_switch as switch
+    broker = LoopbackBroker()
+    monkeypatch.setitem(ctrl.device_data, "devices", {"41": "switch"})
+    monkeypatch.setattr(switch, "switch_id", 41)
+    monkeypatch.setattr(switch, "probability", 0.0)
+    monkeypatch.setattr(switch, "switch_data", {})
+
+    device = LoopbackClient(broker=broker)
+    device.on_connect = switch.on_connect
+    device.on_message = switch.on_message
+    controller = LoopbackClient(broker=broker)
+    controller.on_connect = ctrl.on_connect
+    controller.on_message = ctrl.on_mqtt_message
+    for client in (device, controller):
+        client.connect("loopback")
+        client.loop(timeout=0)
+        client.loop_start()
+
+    discord_message = MagicMock()
+    discord_message.content = "!switch 41"
+    replies = []
+
+    async def fake_send(text):
+        replies.append(text)
+    discord_message.channel.send = fake_send
+    try:
+        asyncio.run(ctrl.handle_command(discord_message, controller))
+    finally:
+        for client in (device, controller):
+            client.loop_stop()
+    assert replies == ["ON"]
+    assert switch.switch_data == {"41": True}
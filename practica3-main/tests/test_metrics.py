@@ -0,0 +1,61 @@
+import asyncio
+import urllib.request
+from unittest.mock import AsyncMock, MagicMock
+
+import controller.controller as ctrl
+from common.metrics import MetricsRegistry, start_http_server
+
+
+def test_render_prometheus_text():
+    """Verifica el formato de texto de contadores, gauges e histogramas."""
+    metrics = MetricsRegistry()
+    received = metrics.counter("messages_total", "Mensajes", ("class",))
+    received.inc(labels=("sensor",))
+    received.inc(2, labels=("switch",))
+    metrics.gauge("queue_depth", "Cola", fn=lambda: 7)
+    latency = metrics.histogram("latency_seconds", "Latencia", buckets=(0.1, 1.0))
+    latency.observe(0.05)
+    latency.observe(0.5)
+
+    text = metrics.render()
+    assert '# TYPE messages_total counter' in text
+    assert 'messages_total{class="sensor"} 1' in text
+    assert 'messages_total{class="switch"} 2' in text
+    assert 'queue_depth 7' in text
+    assert 'latency_seconds_bucket{le="0.1"} 1' in text
+    assert 'latency_seconds_bucket{le="+Inf"} 2' in text
+    assert 'latency_seconds_count 2' in text
+    assert latency.quantile(0.5) == 0.1 and latency.quantile(0.95) == 1.0
+    assert metrics.counter("messages_total", "Mensajes", ("class",)) is received
+
+
+def test_http_endpoint_serves_metrics():
+    """Verifica que el endpoint local sirve las métricas."""
+    metrics = MetricsRegistry()
+    metrics.counter("up_total", "Arranques").inc()
+    server = start_http_server(metrics, 0)
+    try:
+        url = f"http://127.0.0.1:{server.server_address[1]}/metrics"
+        with urllib.request.urlopen(url, timeout=2) as response:
+            body = response.read().decode()
+    finally:
+        server.shutdown()
+    assert "up_total 1" in body
+
+
+def test_controller_counts_messages_and_rules(monkeypatch):
+    """Verifica que el controlador cuenta mensajes recibidos, reglas y los muestra en !stats."""
+    monkeypatch.setattr(ctrl, "mqtt_client", None)
+    before_in = ctrl.messages_in.value(("sensor",))
+    before_eval = ctrl.rule_evaluations.total()
+    msg = MagicMock(topic="redes2/2312/1/sensor_1", payload=b"Temperature: 30 \xc2\xb0C")
+    ctrl.on_mqtt_message(None, None, msg)
+    assert ctrl.messages_in.value(("sensor",)) == before_in + 1
+    assert ctrl.rule_evaluations.total() == before_eval + 1
+
+    discord_message = MagicMock()
+    discord_message.content = "!stats"
+    discord_message.channel.send = AsyncMock()
+    asyncio.run(ctrl.handle_command(discord_message, None))
+    response = discord_message.channel.send.call_args.args[0]
+    assert "Mensajes recibidos:" in response and "sensor=" in response
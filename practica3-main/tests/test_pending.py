@@ -0,0 +1,97 @@
+import asyncio
+import threading
+from unittest.mock import MagicMock
+
+import pytest
+
+from controller.pending import PendingRequests
+
+
+def test_resolve_from_other_thread():
+    """Verifica que un futuro se completa desde el hilo de red de MQTT."""
+    pending = PendingRequests()
+
+    async def scenario():
+        send = lambda: threading.Timer(0.05, pending.resolve, ("t/1", "ON")).start()
+        return await pending.request("t/1", send, timeout=1)
+
+    assert asyncio.run(scenario()) == "ON"
+    assert pending.pending_count() == 0
+
+
+def test_request_timeout_discards_future():
+    """Verifica que una petición sin respuesta expira y no queda registrada."""
+    pending = PendingRequests()
+
+    async def scenario():
+        await pending.request("t/1", lambda: None, timeout=0.05)
+
+    with pytest.raises(asyncio.TimeoutError):
+        asyncio.run(scenario())
+    assert pending.pending_count() == 0
+    assert pending.resolve("t/1", "tarde") is False
+
+
+def test_many_requests_in_flight():
+    """Verifica que varias peticiones sobre claves distintas conviven sin bloquearse."""
+    pending = PendingRequests()
+
+    async def scenario():
+        futures = [pending.register(f"t/{i}") for i in range(20)]
+        for i in reversed(range(20)):
+            pending.resolve(f"t/{i}", i)
+        return await asyncio.gather(*futures)
+
+    assert asyncio.run(scenario()) == list(range(20))
+
+
+def test_switch_command_answered_by_mqtt_message(monkeypatch):
+    """Verifica que !switch responde con el mensaje MQTT del dummy sin espera activa."""
+    import controller.controller as ctrl
+    monkeypatch.setitem(ctrl.device_data, "devices", {"2": "switch"})
+    discord_message = MagicMock()
+    discord_message.content = "!switch 2"
+    replies = []
+
+    async def fake_send(text):
+        replies.append(text)
+    discord_message.channel.send = fake_send
+
+    mqtt_client = MagicMock()
+
+    def answer(topic, payload):
+        # El switch confirma la orden con su identificador en el topic del ID siguiente
+        reply = MagicMock(topic="redes2/2312/1/switch_3", payload=f"ON ack={payload.split('=')[1]}".encode())
+        threading.Timer(0.05, ctrl.on_mqtt_message, (None, None, reply)).start()
+    mqtt_client.publish.side_effect = answer
+
+    asyncio.run(ctrl.handle_command(discord_message, mqtt_client))
+    mqtt_client.publish.assert_called_once()
+    topic, payload = mqtt_client.publish.call_args.args
+    assert topic == "redes2/2312/1/switch_2"
+    assert payload.startswith("TOGGLE cmd=")
+    assert replies == ["ON"]
+
+
+def test_sensor_fan_out_marks_timeouts(monkeypatch):
+    """Verifica que !sensor consulta todos los sensores a la vez y marca los que no responden."""
+    import controller.controller as ctrl
+    from controller.cache import LastValueCache
+    monkeypatch.setitem(ctrl.device_data, "devices", {"1": "sensor", "4": "sensor", "5": "switch"})
+    monkeypatch.setattr(ctrl, "last_values", LastValueCache())
+    monkeypatch.setattr(ctrl, "process_sensor_message", MagicMock())
+    mqtt_client = MagicMock()
+
+    def reply(topic, payload=None):
+        if topic.endswith("sensor_1"):
+            msg = MagicMock()
+            msg.topic = topic
+            msg.payload = b"Temperature: 22 \xc2\xb0C"
+            threading.Timer(0.02, ctrl.on_mqtt_message, (None, None, msg)).start()
+    mqtt_client.publish.side_effect = reply
+
+    response = asyncio.run(ctrl.query_devices(mqtt_client, "sensor", "Sensor", timeout=0.2))
+    assert mqtt_client.publish.call_count == 2
+    assert response.splitlines() == ["Sensor 1: Temperature: 22 °C",
+                                     "Sensor 4: sin respuesta (timeout)"]
+    assert ctrl.pending_requests.pending_count() == 0
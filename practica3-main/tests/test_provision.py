@@ -0,0 +1,78 @@
+import asyncio
+import json
+import subprocess
+import sys
+from unittest.mock import MagicMock
+
+import pytest
+
+from controller.journal import DeviceJournal
+from controller.provision import parse_manifest, provision
+from controller.registry import DeviceRegistry
+
+
+def test_parse_manifest_json_and_csv():
+    """Verifica los formatos de manifiesto admitidos."""
+    assert parse_manifest('{"switch": 200, "sensor": 10}') == [("switch", 200), ("sensor", 10)]
+    assert parse_manifest('[{"type": "switch", "count": 2}, {"type": "watch"}]') == [("switch", 2), ("watch", 1)]
+    assert parse_manifest("type,count\n# planta 1\nswitch,3\n\nsensor\n") == [("switch", 3), ("sensor", 1)]
+    for bad in ("lamp,3", "switch,0", "switch,x", "", "switch,20000"):
+        with pytest.raises(ValueError):
+            parse_manifest(bad)
+
+
+def test_provision_writes_one_journal_record(tmp_path):
+    """Verifica que un alta en bloque asigna IDs consecutivos y deja un único cambio en el journal."""
+    path = tmp_path / "devices.json"
+    path.write_text(json.dumps({"device_last_id": 3, "devices": {"3": "sensor"}}))
+    journal = DeviceJournal(str(path))
+    state = journal.open()
+    ids = provision(DeviceRegistry(state, "t"), journal, [("switch", 200), ("watch", 2)])
+    journal.close()
+
+    assert ids[0] == "4" and ids[-1] == "205"
+    assert len((tmp_path / "devices.journal").read_text().splitlines()) == 1
+    recovered = DeviceJournal(str(path)).open()
+    assert recovered == state
+    assert recovered["devices"]["203"] == "switch" and recovered["devices"]["205"] == "watch"
+
+
+def test_add_devices_command_announces_once(monkeypatch, tmp_path):
+    """Verifica que !add_devices da de alta todos los switches con un solo anuncio MQTT."""
+    import controller.controller as ctrl
+    monkeypatch.setattr(ctrl, "device_data", {"device_last_id": 1, "devices": {"1": "sensor"}})
+    monkeypatch.setattr(ctrl, "registry", DeviceRegistry(ctrl.device_data, ctrl.TOPIC_BASE))
+    monkeypatch.setattr(ctrl, "DEVICES_FILE", str(tmp_path / "devices.json"))
+    monkeypatch.setattr(ctrl, "journal", None)
+    discord_message = MagicMock()
+    discord_message.content = "!add_devices switch 200"
+    replies = []
+
+    async def fake_send(text):
+        replies.append(text)
+    discord_message.channel.send = fake_send
+    mqtt_client = MagicMock()
+
+    asyncio.run(ctrl.handle_command(discord_message, mqtt_client))
+    ctrl.journal.close()
+    assert replies == ["Dispositivos añadidos: 200 switch (2-201)"]
+    assert ctrl.registry.count("switch") == 200
+    mqtt_client.publish.assert_called_once_with("redes2/2312/1/add_device", "switch 2-201")
+
+    discord_message.content = '!import_devices ```json\n{"watch": 2}\n```'
+    discord_message.attachments = []
+    asyncio.run(ctrl.handle_command(discord_message, mqtt_client))
+    ctrl.journal.close()
+    assert replies[-1] == "Dispositivos añadidos: 2 watch (202-203)"
+
+
+def test_provision_cli(tmp_path):
+    """Verifica el script de provisión sobre un fichero de dispositivos nuevo."""
+    manifest = tmp_path / "edificio.csv"
+    manifest.write_text("switch,5\nsensor,2\n")
+    devices = tmp_path / "devices.json"
+    result = subprocess.run([sys.executable, "controller/provision.py", str(manifest), "--devices-file", str(devices)],
+                            capture_output=True, text=True, timeout=10)
+    assert result.returncode == 0, result.stderr
+    state = DeviceJournal(str(devices)).open()
+    assert state["device_last_id"] == 7 and state["devices"]["7"] == "sensor"
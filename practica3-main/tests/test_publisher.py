@@ -0,0 +1,134 @@
+import asyncio
+import threading
+import time
+from unittest.mock import MagicMock
+
+import controller.controller as ctrl
+import controller.publisher as publisher_module
+from common.loopback import LoopbackBroker, LoopbackClient
+from controller.aio_mqtt import AsyncioMqtt
+from controller.publisher import OutboundPublisher
+
+
+def test_batches_and_qos_by_class():
+    """Verifica que las órdenes van con QoS 1, las consultas con QoS 0 y que se envían por lotes."""
+    broker = LoopbackBroker()
+    received = []
+    subscriber = LoopbackClient(broker=broker)
+    subscriber.on_message = lambda c, userdata, msg: received.append((msg.topic, msg.qos))
+    subscriber.connect("loopback")
+    subscriber.subscribe("t/#", qos=1)
+    client = LoopbackClient(broker=broker)
+    client.connect("loopback")
+
+    publisher = OutboundPublisher(client, batch_size=100)
+    for i in range(50):
+        publisher.publish(f"t/switch_{i}", "TOGGLE", kind="command")
+    publisher.publish("t/sensor_1", kind="request")
+    publisher.start()
+    assert publisher.flush(2)
+    publisher.close()
+    subscriber.loop(timeout=0)
+
+    assert len(received) == 51
+    assert all(qos == 1 for topic, qos in received if "switch" in topic)
+    assert ("t/sensor_1", 0) in received
+    assert publisher.published == 51 and publisher.batches == 1
+    assert publisher.depth() == 0
+
+
+def test_backpressure_when_broker_does_not_confirm(monkeypatch):
+    """Verifica que sin confirmaciones del broker la cola se llena y se descarta informando."""
+    monkeypatch.setattr(publisher_module, "PUT_TIMEOUT", 0.2)
+    info = MagicMock(rc=0)
+    info.is_published.return_value = False
+    info.wait_for_publish.side_effect = time.sleep
+    client = MagicMock()
+    client.publish.return_value = info
+
+    publisher = OutboundPublisher(client, max_queue=2, batch_size=1, max_unacked=1)
+    publisher.start()
+    results = [publisher.publish(f"t/{i}", "ON", timeout=0.05) for i in range(6)]
+    publisher.close(timeout=0)
+
+    assert results[0] is True
+    assert False in results
+    assert publisher.dropped >= 1
+
+
+def test_publish_action_goes_through_publisher(monkeypatch):
+    """Verifica que las acciones de las reglas se encolan como órdenes."""
+    monkeypatch.setitem(ctrl.device_data, "devices", {"1": "switch", "2": "sensor", "3": "switch"})
+    queued = MagicMock()
+    monkeypatch.setattr(ctrl, "publisher", queued)
+    mqtt_client = MagicMock()
+    ctrl.publish_action("ON", mqtt_client)
+    mqtt_client.publish.assert_not_called()
+    assert [c.args[0] for c in queued.publish.call_args_list] == [
+        "redes2/2312/1/switch_1", "redes2/2312/1/switch_3"]
+    assert all(c.kwargs["kind"] == "command" for c in queued.publish.call_args_list)
+
+
+def test_network_thread_drops_instead_of_waiting():
+    """Verifica que desde el hilo de red, con la cola llena, se descarta sin esperar ni publicar."""
+    client = MagicMock()
+    publisher = OutboundPublisher(client, max_queue=1)
+    publisher.bind_network_thread()
+    assert publisher.publish("t/1", "ON") is True
+    assert publisher.publish("t/2", "ON") is False
+    client.publish.assert_not_called()
+    assert publisher.depth() == 1 and publisher.dropped == 1
+
+
+def test_event_loop_callers_do_not_block():
+    """Verifica que desde un bucle de asyncio la espera por la cola llena no bloquea el bucle."""
+    client = MagicMock()
+    client.publish.return_value = MagicMock(rc=0)
+    publisher = OutboundPublisher(client, max_queue=1)
+
+    async def scenario():
+        assert publisher.publish("t/1", "ON") is True
+        waiting = asyncio.create_task(publisher.apublish("t/2", "ON", timeout=2))
+        ticks = 0
+
+        async def tick():
+            nonlocal ticks
+            while True:
+                ticks += 1
+                await asyncio.sleep(0.01)
+
+        ticker = asyncio.create_task(tick())
+        await asyncio.sleep(0.05)
+        publisher.start()  # Vacía la cola y deja sitio
+        result = await waiting
+        ticker.cancel()
+        return result, ticks
+
+    result, ticks = asyncio.run(scenario())
+    assert result is True and ticks > 3
+    assert publisher.flush(2)
+    publisher.close()
+    assert [c.args[0] for c in client.publish.call_args_list] == ["t/1", "t/2"]
+
+
+def test_asyncio_mode_waits_in_tasks_and_drops_in_callbacks():
+    """Verifica que en el modo asyncio un comando espera sitio en la cola y un callback MQTT no."""
+    async def scenario():
+        client = AsyncioMqtt(LoopbackClient(broker=LoopbackBroker()))
+        client.connect("loopback")
+        publisher = OutboundPublisher(client, loop=asyncio.get_running_loop(), max_queue=1)
+        assert publisher.publish("t/1", "ON") is True
+        dropped = []
+        client.on_message = lambda c, userdata, msg: dropped.append(publisher.publish("t/x", "ON"))
+        client.on_message(None, None, None)
+        waiting = asyncio.create_task(publisher.apublish("t/2", "ON", timeout=2))
+        await asyncio.sleep(0.05)
+        assert not waiting.done()
+        publisher.start()  # Vacía la cola y deja sitio
+        result = await waiting
+        assert publisher.flush(2)
+        await asyncio.to_thread(publisher.close)
+        client.close()
+        return dropped, result, publisher.dropped
+
+    assert asyncio.run(scenario()) == ([False], True, 1)
@@ -0,0 +1,108 @@
+import threading
+
+from controller.registry import DeviceRegistry
+
+BASE = "redes2/2312/1"
+
+
+def make_registry():
+    data = {"device_last_id": 3, "devices": {"1": "sensor", "2": "switch", "3": "switch"}}
+    return data, DeviceRegistry(data, BASE)
+
+
+def test_type_index_updates_incrementally():
+    """Verifica que altas y bajas actualizan el índice por tipo y el diccionario persistido."""
+    data, registry = make_registry()
+    assert registry.ids_by_type("switch") == ["2", "3"]
+    new_id = registry.add("switch")
+    assert new_id == "4"
+    assert data["devices"]["4"] == "switch"
+    assert registry.remove("2") == "switch"
+    assert registry.ids_by_type("switch") == ["3", "4"]
+    assert registry.remove("99") is None
+    assert registry.get("4").topic == f"{BASE}/switch_4"
+
+
+def test_rebuilds_when_data_replaced():
+    """Verifica que los índices se reconstruyen si device_data se recarga desde fuera."""
+    data, registry = make_registry()
+    registry.touch("1", now=10.0)
+    data.clear()
+    data.update({"device_last_id": 5, "devices": {"5": "watch"}})
+    assert registry.ids_by_type("switch") == []
+    assert registry.type_of("5") == "watch"
+    assert registry.get("5").last_seen is None
+
+
+
+def test_outside_changes_need_explicit_rebuild():
+    """Verifica que las lecturas no reconstruyen los índices por un cambio hecho por fuera."""
+    data, registry = make_registry()
+    data["devices"]["4"] = "watch"
+    assert registry.type_of("4") is None
+    registry.rebuild()
+    assert registry.type_of("4") == "watch"
+
+
+def test_apply_journal_records_incrementally():
+    """Verifica que los cambios del front end se aplican sobre los índices sin reconstruirlos."""
+    data, registry = make_registry()
+    assert registry.apply({"op": "add_range", "id": "4", "ranges": [["sensor", 2], ["switch", 1]]}) == ["4", "5", "6"]
+    assert registry.apply({"op": "add", "id": "6", "type": "watch"}) == []
+    assert registry.ids_by_type("switch") == ["2", "3"] and registry.type_of("6") == "watch"
+    assert registry.apply({"op": "remove", "id": "4"}) == ["4"]
+    assert data == {"device_last_id": 6, "devices": {"1": "sensor", "2": "switch", "3": "switch",
+                                                     "5": "sensor", "6": "watch"}}
+
+
+def test_reads_from_another_thread_during_bulk_add():
+    """Verifica que consultas y reconstrucciones desde otro hilo no fallan durante un alta masiva."""
+    data, registry = make_registry()
+    registry.touch("1", now=10.0)
+    errors = []
+    done = threading.Event()
+
+    def reader():
+        while not done.is_set():
+            try:
+                registry.ids_by_type("sensor")
+                registry.rebuild()  # Como al recargar el registro
+                registry.type_of("1")
+                registry.page("switch", 1, 20)
+            except Exception as e:
+                errors.append(e)
+                return
+
+    thread = threading.Thread(target=reader)
+    thread.start()
+    try:
+        for _ in range(20):
+            registry.add_range([("sensor", 2000)])
+    finally:
+        done.set()
+        thread.join()
+    assert errors == [] and registry.count("sensor") == 40001
+    assert registry.get("1").last_seen == 10.0
+
+def test_paginated_listing_with_filter():
+    """Verifica el listado paginado y filtrado por tipo."""
+    data = {"device_last_id": 0, "devices": {}}
+    registry = DeviceRegistry(data, BASE)
+    for i in range(45):
+        registry.add("sensor" if i % 3 else "switch")
+    devices, pages, total = registry.page(None, 3, 20)
+    assert (len(devices), pages, total) == (5, 3, 45)
+    devices, pages, total = registry.page("switch", 1, 20)
+    assert total == 15 and pages == 1
+    assert all(device.tipo == "switch" for device in devices)
+
+
+def test_devices_command_output(monkeypatch):
+    """Verifica el texto de !devices con filtro, página y argumentos no válidos."""
+    import controller.controller as ctrl
+    monkeypatch.setitem(ctrl.device_data, "devices", {str(i): "sensor" for i in range(1, 31)})
+    text = ctrl.list_devices(["sensor", "2"])
+    assert text.splitlines()[0] == "Dispositivos (página 2/2, 30 en total):"
+    assert len(text.splitlines()) == 11
+    assert ctrl.list_devices(["9"]) == "Página no válida (hay 2)"
+    assert ctrl.list_devices(["lampara"]) == "Uso: !devices [tipo] [página]"
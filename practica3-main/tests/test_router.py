@@ -0,0 +1,60 @@
+from unittest.mock import MagicMock
+
+from controller.router import TopicRouter, parse_device_topic, type_pattern
+
+
+def test_type_pattern_of_device_level():
+    """Verifica el patrón de tipo que captura cada nivel de dispositivo."""
+    assert type_pattern("sensor_4") == "sensor_+"
+    assert type_pattern("add_device") is None
+    assert type_pattern("switch_") is None
+
+
+def test_plus_matches_whole_level():
+    """Verifica que '+' captura un nivel completo, también los de dispositivo."""
+    router = TopicRouter()
+    anything, sensors = MagicMock(), MagicMock()
+    router.add("redes2/2312/1/+", anything)
+    router.add("redes2/2312/1/sensor_+", sensors)
+    assert router.match("redes2/2312/1/sensor_4") == (anything, sensors)
+    assert router.match("redes2/2312/1/add_device") == (anything,)
+    assert router.match("redes2/2312/1/state/switch_4") == ()
+
+
+def test_parse_device_topic():
+    """Verifica la extracción de (tipo, id) de un topic de dispositivo."""
+    assert parse_device_topic("redes2/2312/1/switch_12") == ("switch", "12")
+    assert parse_device_topic("redes2/2312/1/add_device") is None
+
+
+def test_dispatch_by_type_and_wildcards():
+    """Verifica que cada mensaje llega solo a los handlers de su tipo y a los comodines."""
+    router = TopicRouter()
+    everything, sensors, switch_3 = MagicMock(), MagicMock(), MagicMock()
+    router.add("redes2/2312/1/#", everything)
+    router.add("redes2/2312/1/sensor_+", sensors)
+    router.add("redes2/2312/1/switch_3", switch_3)
+
+    assert router.dispatch("redes2/2312/1/sensor_40", "21") == 2
+    assert router.dispatch("redes2/2312/1/switch_3", "ON") == 2
+    assert router.dispatch("redes2/2312/1/watch_1", "12:00:00") == 1
+    assert router.dispatch("otro/topic", "x") == 0
+    sensors.assert_called_once_with("redes2/2312/1/sensor_40", "21")
+    switch_3.assert_called_once_with("redes2/2312/1/switch_3", "ON")
+    assert everything.call_count == 3
+
+
+def test_handlers_run_in_registration_order_and_can_be_removed():
+    """Verifica el orden de despacho y que eliminar una ruta invalida la tabla compilada."""
+    router = TopicRouter()
+    calls = []
+    first = lambda topic, message: calls.append("first")
+    second = lambda topic, message: calls.append("second")
+    router.add("a/+", first)
+    router.add("a/#", second)
+    router.dispatch("a/b", None)
+    assert calls == ["first", "second"]
+
+    assert router.remove("a/+", first) is True
+    assert router.match("a/b") == (second,)
+    assert router.remove("a/+", first) is False
@@ -0,0 +1,89 @@
+import concurrent.futures
+import threading
+from unittest.mock import MagicMock
+
+import controller.controller as ctrl
+from controller.rule_executor import RuleExecutor
+from controller.rules import RuleEngine, evaluate_batch
+
+BASE = "redes2/2312/1"
+TREND_RULE = {"name": "sube", "source": "sensor_1", "executor": "process", "targets": ["2"], "action": "ON",
+              "condition": {"op": ">", "value": 1, "stat": "trend", "window": 5}}
+
+
+def test_evaluate_batch():
+    """Verifica la evaluación de un lote de condiciones con tipos básicos."""
+    assert evaluate_batch([(">", 1, "trend", (1, 3, 5)), ("<", 2, "stdev", (4, 4, 4)),
+                           (">=", 3, "median", (1, 2)), ("==", 9, "max", (9,))]) == [True, True, False, True]
+
+
+def test_batches_in_process_pool():
+    """Verifica que las evaluaciones se agrupan en lotes y se resuelven en otro proceso."""
+    rule = RuleEngine(BASE, [TREND_RULE]).rules[0]
+    fired = []
+    executor = RuleExecutor(lambda rule, topic: fired.append(topic), workers=1, batch_size=100, batch_delay=0.2)
+    for i in range(50):
+        executor.submit(rule, f"{BASE}/sensor_{i}", (0.0, float(i % 5)))
+    executor.start()
+    try:
+        assert executor.flush(30)
+    finally:
+        executor.close()
+    assert executor.evaluated == 50 and executor.batches == 1
+    assert sorted(fired) == sorted(f"{BASE}/sensor_{i}" for i in range(50) if i % 5 > 1)
+    assert executor.backlog() == 0
+
+
+
+def test_cancelled_batch_releases_its_slot():
+    """Verifica que un lote cancelado al cerrar el pool libera su hueco y sus evaluaciones pendientes."""
+    rule = RuleEngine(BASE, [TREND_RULE]).rules[0]
+    executor = RuleExecutor(lambda rule, topic: None, max_batches=1, executor=MagicMock())
+    executor.submit(rule, "t", (1.0, 2.0))
+    batch = [executor._queue.get_nowait()]
+    executor._slots.acquire()
+    future = concurrent.futures.Future()
+    future.cancel()
+    executor._completed(batch, future)
+    assert executor.backlog() == 0 and executor._slots.acquire(blocking=False)
+
+def test_full_backlog_drops_without_blocking():
+    """Verifica que con la cola llena la evaluación se descarta en lugar de esperar."""
+    rule = RuleEngine(BASE, [TREND_RULE]).rules[0]
+    executor = RuleExecutor(lambda rule, topic: None, max_backlog=2, executor=MagicMock())
+    assert executor.submit(rule, "t", (1.0,)) and executor.submit(rule, "t", (2.0,))
+    assert not executor.submit(rule, "t", (3.0,))
+    assert executor.dropped == 1 and executor.backlog() == 2
+
+
+def test_controller_offloads_process_rules(monkeypatch):
+    """Verifica que el controlador encola las reglas 'process' y publica su acción al evaluarlas."""
+    monkeypatch.setitem(ctrl.device_data, "devices", {"1": "sensor", "2": "switch"})
+    monkeypatch.setattr(ctrl, "rule_engine", RuleEngine(BASE, [TREND_RULE]))
+    monkeypatch.setattr(ctrl, "mqtt_client", MagicMock())
+    published = threading.Event()
+    ctrl.mqtt_client.publish.side_effect = lambda *args, **kwargs: published.set()
+    pool = concurrent.futures.ThreadPoolExecutor(max_workers=1)
+    monkeypatch.setattr(ctrl, "rule_executor", RuleExecutor(lambda rule, topic: ctrl.fire_rule(rule),
+                                                            batch_delay=0, executor=pool))
+    ctrl.rule_executor.start()
+    try:
+        assert ctrl.process_sensor_message(f"{BASE}/sensor_1", "20") == []
+        assert ctrl.process_sensor_message(f"{BASE}/sensor_1", "25") == []  # Se evalúa en el pool
+        assert published.wait(5)
+    finally:
+        ctrl.rule_executor.close()
+        pool.shutdown()
+    ctrl.mqtt_client.publish.assert_called_once()
+    topic, payload = ctrl.mqtt_client.publish.call_args.args
+    assert topic == f"{BASE}/switch_2" and payload.startswith("ON cmd=")
+    assert ctrl.rule_offloaded.value(("queued",)) >= 2
+
+
+def test_no_executor_without_process_rules(monkeypatch):
+    """Verifica que no se crean procesos si ninguna regla los pide."""
+    monkeypatch.setattr(ctrl, "rule_executor", None)
+    assert ctrl.start_rule_executor() is None
+    monkeypatch.setattr(ctrl, "rule_engine", RuleEngine(BASE, [TREND_RULE]))
+    monkeypatch.setattr(ctrl, "RULE_WORKERS", 0)
+    assert ctrl.start_rule_executor() is None
@@ -0,0 +1,107 @@
+import json
+from collections import deque
+from unittest.mock import MagicMock
+
+import pytest
+
+from common.switch_command import parse_command
+from controller.rules import RuleEngine, last_values
+
+BASE = "redes2/2312/1"
+
+
+def test_rules_indexed_by_source_topic():
+    """Verifica que cada mensaje solo evalúa las reglas de su topic."""
+    engine = RuleEngine(BASE, [
+        {"source": "sensor_1", "condition": {"op": ">", "value": 25}, "targets": ["2"], "action": "ON"},
+        {"source": "sensor_3", "condition": {"op": "<", "value": 10}, "targets": ["4"], "action": "OFF"},
+        {"source": "sensor_+", "condition": {"op": ">=", "value": 40}, "action": "TOGGLE"},
+    ])
+    assert len(engine.rules_for(f"{BASE}/sensor_1")) == 2
+    assert len(engine.rules_for(f"{BASE}/sensor_9")) == 1
+    assert engine.rules_for(f"{BASE}/watch_1") == ()
+
+    assert [rule.action for rule in engine.evaluate(f"{BASE}/sensor_1", "30")] == ["ON"]
+    assert [rule.action for rule in engine.evaluate(f"{BASE}/sensor_3", "45")] == ["TOGGLE"]
+    assert engine.evaluate(f"{BASE}/sensor_1", "no numérico") == []
+
+
+def test_invalid_rule_keeps_previous_rules():
+    """Verifica que una regla mal definida no sustituye a las reglas cargadas."""
+    engine = RuleEngine(BASE, [{"source": "sensor_1", "condition": {"op": ">", "value": 1}, "action": "ON"}])
+    with pytest.raises(ValueError):
+        engine.load([{"source": "sensor_1", "condition": {"op": "~", "value": 1}, "action": "ON"}])
+    assert len(engine) == 1
+
+
+def test_load_rules_from_file(tmp_path):
+    """Verifica la carga de reglas desde un fichero JSON."""
+    path = tmp_path / "rules.json"
+    path.write_text(json.dumps([
+        {"name": "frio", "source": "sensor_2", "condition": {"op": "<", "value": 15},
+         "targets": [5], "action": "ON"}]))
+    engine = RuleEngine(BASE)
+    assert engine.load_file(str(path)) == 1
+    assert engine.rules[0].targets == ["5"]
+
+
+def test_sensor_message_publishes_rule_action_to_targets(monkeypatch):
+    """Verifica que una regla disparada publica su acción solo en sus switches destino."""
+    import controller.controller as ctrl
+    monkeypatch.setitem(ctrl.device_data, "devices", {"1": "sensor", "2": "switch", "3": "switch"})
+    monkeypatch.setattr(ctrl, "rule_engine", RuleEngine(BASE, [
+        {"source": "sensor_1", "condition": {"op": ">", "value": 25}, "targets": ["3"], "action": "ON"}]))
+    monkeypatch.setattr(ctrl, "mqtt_client", MagicMock())
+
+    assert ctrl.process_sensor_message(f"{BASE}/sensor_1", "26") == ["ON"]
+    ctrl.mqtt_client.publish.assert_called_once()
+    topic, payload = ctrl.mqtt_client.publish.call_args.args
+    assert topic == f"{BASE}/switch_3" and parse_command(payload)[0] == "ON"
+    assert ctrl.process_sensor_message(f"{BASE}/sensor_1", "20") == []
+
+
+def test_window_statistics_over_recent_readings():
+    """Verifica las reglas sobre estadísticos de las últimas lecturas de cada topic."""
+    engine = RuleEngine(BASE, [
+        {"name": "media", "source": "sensor_+", "condition": {"op": ">", "value": 25, "stat": "mean", "window": 3},
+         "action": "ON"},
+        {"name": "sube", "source": "sensor_1", "condition": {"op": ">", "value": 0.5, "stat": "trend", "window": 4},
+         "action": "OFF", "executor": "process"},
+    ])
+    fired = lambda topic, value: [rule.name for rule in engine.evaluate(f"{BASE}/{topic}", value)]
+    assert fired("sensor_1", "20") == []  # Con una sola lectura la tendencia es 0
+    assert fired("sensor_1", "32") == ["media", "sube"]
+    assert fired("sensor_2", "30") == ["media"]  # Cada topic tiene su propia ventana
+    assert fired("sensor_1", "10") == []  # Media de (20, 32, 10) y tendencia negativa
+
+    deferred = []
+    assert engine.evaluate(f"{BASE}/sensor_1", "40", deferred)[0].name == "media"
+    assert [(rule.name, values) for rule, values in deferred] == [("sube", (20.0, 32.0, 10.0, 40.0))]
+
+
+
+def test_last_values_copies_only_the_window():
+    """Verifica que de un historial largo solo se copian las lecturas de la ventana de la regla."""
+    history = deque(range(1000), maxlen=1000)
+    assert last_values(history, 999, 3) == (997, 998, 999)
+    assert last_values(history, 999, 1) == (999,)
+    assert last_values(deque([1, 2], maxlen=10), 2, 5) == (1, 2)
+    assert last_values(None, 7, 5) == (7,)
+
+def test_invalid_window_rules():
+    """Verifica que se rechazan estadísticos, ventanas y executors no válidos."""
+    base = {"source": "sensor_1", "action": "ON"}
+    for condition, extra in [({"op": ">", "value": 1, "stat": "moda"}, {}),
+                             ({"op": ">", "value": 1, "window": 0}, {}),
+                             ({"op": ">", "value": 1}, {"executor": "gpu"})]:
+        with pytest.raises(ValueError):
+            RuleEngine(BASE, [dict(base, condition=condition, **extra)])
+
+
+def test_rules_only_accept_sensor_sources():
+    """Verifica que se rechazan las reglas cuyo origen no es un sensor (nunca se evaluarían)."""
+    rule = {"condition": {"op": ">", "value": 1}, "action": "ON"}
+    assert RuleEngine(BASE, [dict(rule, source=f"{BASE}/sensor_7")]).rules[0].source == f"{BASE}/sensor_7"
+    for source in ("watch_1", "switch_+", "+", "otro/sensor_1"):
+        with pytest.raises(ValueError, match="no es un sensor"):
+            RuleEngine(BASE, [dict(rule, source=source)])
@@ -0,0 +1,122 @@
+import asyncio
+from types import SimpleNamespace
+from unittest.mock import MagicMock
+
+from controller.shadow import SwitchShadow
+
+
+def test_diverged_switches_are_resent_after_interval():
+    """Verifica que solo se reenvía a los switches fuera de su estado deseado, y no en cada pasada."""
+    shadow = SwitchShadow(resend_interval=5)
+    shadow.desire("2", "ON", now=0)
+    shadow.desire("4", "OFF", now=0)
+    shadow.report("4", "OFF", at=100)
+    shadow.report("6", "ON", at=100)
+    assert shadow.out_of_sync() == 1
+    assert shadow.diverged(now=1) == []
+    assert shadow.diverged(now=5) == [("2", "ON")]
+    assert shadow.diverged(now=6) == []
+    shadow.report("2", "ON")
+    assert shadow.diverged(now=20) == []
+    assert shadow.get("6") == (None, "ON", 100)
+
+
+def test_diverged_respects_batch_limit():
+    """Verifica que una pasada del reconciliador toma como mucho `limit` switches."""
+    shadow = SwitchShadow(resend_interval=1)
+    for i in range(10):
+        shadow.desire(str(i), "ON", now=0)
+    assert len(shadow.diverged(limit=4, now=1)) == 4
+    assert len(shadow.diverged(limit=100, now=1.5)) == 6
+
+
+def test_toggle_expects_opposite_of_reported_state():
+    """Verifica que un TOGGLE no deja como deseado el estado anterior para el reconciliador."""
+    shadow = SwitchShadow(resend_interval=0)
+    shadow.desire("2", "ON", now=0)
+    shadow.report("2", "ON", at=100)
+    assert shadow.expect_toggle("2", now=1) == "OFF"
+    assert shadow.diverged(now=2) == [("2", "OFF")]
+    shadow.report("2", "OFF")
+    assert shadow.diverged(now=3) == []
+    # Sin estado informado no se sabe a qué pasa: se borra el deseado
+    shadow.desire("4", "ON", now=0)
+    assert shadow.expect_toggle("4", now=1) is None
+    assert shadow.diverged(now=2) == []
+
+
+def test_toggle_command_answered_by_state_topic(monkeypatch):
+    """Verifica que una orden a un switch se completa con su estado retenido y no con otro topic."""
+    import controller.controller as ctrl
+    from controller.pending import PendingRequests
+    monkeypatch.setattr(ctrl, "shadow", SwitchShadow(resend_interval=0))
+    monkeypatch.setattr(ctrl, "pending_requests", PendingRequests())
+    monkeypatch.setattr(ctrl, "publisher", None)
+    ctrl.shadow.report("2", "OFF", at=100)
+
+    async def scenario():
+        loop = asyncio.get_running_loop()
+        mqtt_client = MagicMock()
+
+        def answer(topic, payload):
+            # Respuesta a secas de otro switch en el topic del ID siguiente: no cuenta
+            loop.call_soon(ctrl.handle_device_reply, "redes2/2312/1/switch_3", "OFF")
+            loop.call_soon(ctrl.handle_switch_state, "redes2/2312/1/state/switch_2", "ON")
+        mqtt_client.publish.side_effect = answer
+        return await ctrl.command_switch(mqtt_client, "2", "TOGGLE", timeout=1)
+
+    assert asyncio.run(scenario()) == "ON"
+    assert ctrl.shadow.get("2")[:2] == ("ON", "ON")
+
+
+def test_controller_status_from_retained_state_and_reconcile(monkeypatch):
+    """Verifica que !switch <id> status responde desde la sombra y que el reconciliador reenvía la orden."""
+    import controller.controller as ctrl
+    monkeypatch.setattr(ctrl, "shadow", SwitchShadow(resend_interval=0))
+    monkeypatch.setitem(ctrl.device_data, "devices", {"2": "switch"})
+    mqtt_client = MagicMock()
+    monkeypatch.setattr(ctrl, "mqtt_client", mqtt_client)
+    monkeypatch.setattr(ctrl, "publisher", None)
+
+    ctrl.on_mqtt_message(None, None, SimpleNamespace(topic="redes2/2312/1/state/switch_2", payload=b"OFF"))
+    assert ctrl.format_switch_status("2").startswith("Switch 2: OFF")
+
+    discord_message = MagicMock()
+    discord_message.content = "!switch 2 status"
+    replies = []
+
+    async def fake_send(text):
+        replies.append(text)
+    discord_message.channel.send = fake_send
+    asyncio.run(ctrl.handle_command(discord_message, mqtt_client))
+    assert replies[0].startswith("Switch 2: OFF")
+    mqtt_client.publish.assert_not_called()
+
+    ctrl.shadow.desire("2", "ON", now=0)
+    assert ctrl.reconcile_switches() == 1
+    topic, payload = mqtt_client.publish.call_args.args
+    assert topic == "redes2/2312/1/switch_2" and payload.startswith("ON cmd=")
+    assert "pendiente de pasar a ON" in ctrl.format_switch_status("2")
+
+    ctrl.on_mqtt_message(None, None, SimpleNamespace(topic="redes2/2312/1/state/switch_2", payload=b"ON"))
+    assert ctrl.reconcile_switches() == 0
+
+
+def test_switch_activity_is_credited_to_the_right_switch(monkeypatch):
+    """Verifica que la respuesta en el topic del ID siguiente no cuenta como actividad de ese switch."""
+    import controller.controller as ctrl
+    from controller.registry import DeviceRegistry
+    data = {"next_id": 4, "devices": {"2": "switch", "3": "switch"}}
+    monkeypatch.setattr(ctrl, "device_data", data)
+    monkeypatch.setattr(ctrl, "registry", DeviceRegistry(data, ctrl.TOPIC_BASE))
+    monkeypatch.setattr(ctrl, "shadow", SwitchShadow())
+    monkeypatch.setattr(ctrl, "liveness", None)
+    monkeypatch.setattr(ctrl, "last_values", MagicMock())
+
+    ctrl.on_mqtt_message(None, None, SimpleNamespace(topic="redes2/2312/1/switch_3", payload=b"ON ack=ab12"))
+    ctrl.on_mqtt_message(None, None, SimpleNamespace(topic="redes2/2312/1/switch_3", payload=b"OFF"))
+    assert ctrl.registry.get("3").last_seen is None
+    ctrl.last_values.put.assert_not_called()
+
+    ctrl.on_mqtt_message(None, None, SimpleNamespace(topic="redes2/2312/1/state/switch_2", payload=b"ON"))
+    assert ctrl.registry.get("2").last_seen is not None and ctrl.registry.get("3").last_seen is None
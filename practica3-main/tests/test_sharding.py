@@ -0,0 +1,111 @@
+import asyncio
+import json
+from unittest.mock import MagicMock
+
+from controller.commands import CommandRegistry, one_arg
+from controller.pending import PendingRequests
+from controller.sharding import DEVICES_TOPIC, HashRing, ShardClient, command_topic, subscribe_batched
+
+
+def test_ring_spreads_keys_and_moves_few_on_resize():
+    """Verifica que el anillo reparte las claves y que añadir un worker solo mueve una parte."""
+    ring = HashRing(["worker_0", "worker_1", "worker_2"])
+    keys = [str(i) for i in range(3000)]
+    before = {key: ring.owner(key) for key in keys}
+    counts = {node: list(before.values()).count(node) for node in ring.nodes}
+    assert all(600 < count < 1400 for count in counts.values())
+
+    ring.add("worker_3")
+    moved = [key for key in keys if ring.owner(key) != before[key]]
+    assert all(ring.owner(key) == "worker_3" for key in moved)
+    assert len(moved) < len(keys) / 2
+    ring.remove("worker_3")
+    assert all(ring.owner(key) == before[key] for key in keys)
+
+
+def test_subscribe_batched_groups_topics():
+    """Verifica que las suscripciones se agrupan en pocas peticiones."""
+    client = MagicMock()
+    assert subscribe_batched(client, [f"t/{i}" for i in range(1200)]) == 3
+    assert len(client.subscribe.call_args_list[0].args[0]) == 500
+
+
+def test_shard_client_round_trip_and_timeout():
+    """Verifica el envío de comandos a los workers y la espera de sus respuestas."""
+    ring = HashRing(["worker_0", "worker_1"])
+    pending = PendingRequests()
+    sent = []
+
+    def publish(topic, payload):
+        request = json.loads(payload)
+        sent.append(topic)
+        if topic == command_topic("worker_0"):
+            reply = json.dumps({"id": request["id"], "text": f"w0 {request['content']}"})
+            asyncio.get_running_loop().call_soon(shards.handle_reply, reply)
+
+    shards = ShardClient(publish, ring, pending, timeout=0.1)
+
+    async def scenario():
+        return await shards.broadcast("!stats")
+
+    assert asyncio.run(scenario()) == [("worker_0", "w0 !stats", False), ("worker_1", None, True)]
+    assert sorted(sent) == [command_topic("worker_0"), command_topic("worker_1")]
+    assert pending.pending_count() == 0
+
+
+def test_execute_runs_command_without_discord():
+    """Verifica que un worker ejecuta un comando reenviado y obtiene su respuesta."""
+    registry = CommandRegistry(respond=None)
+
+    @registry.command("echo", parse=one_arg, usage="<texto>")
+    async def echo(message, text, mqtt_client):
+        return text.upper()
+
+    assert asyncio.run(registry.execute("!echo hola", None)) == "HOLA"
+    assert asyncio.run(registry.execute("!echo", None)) == "Uso: !echo <texto>"
+    assert asyncio.run(registry.execute("hola", None)) is None
+
+
+def test_worker_subscribes_to_partition_and_follows_changes(monkeypatch):
+    """Verifica que un worker solo se suscribe a sus dispositivos y sigue las altas y bajas."""
+    import controller.controller as ctrl
+    from controller.registry import DeviceRegistry
+    from controller.worker import ShardWorker
+
+    data = {"device_last_id": 40, "devices": {str(i): "switch" if i % 2 else "sensor" for i in range(1, 41)}}
+    monkeypatch.setattr(ctrl, "device_data", data)
+    monkeypatch.setattr(ctrl, "registry", DeviceRegistry(data, ctrl.TOPIC_BASE))
+    ring = HashRing(["worker_0", "worker_1"])
+    workers = [ShardWorker(name, ring) for name in ring.nodes]
+    owned = [set(topic for topic in worker.owned_topics() if "state" not in topic and "switch" not in topic)
+             for worker in workers]
+    assert owned[0].isdisjoint(owned[1])
+    assert len(owned[0] | owned[1]) == 20
+
+    worker = next(w for w in workers if w.owns("41"))
+    worker.client = MagicMock()
+    worker.on_connect(worker.client, None, None, 0)
+    assert worker.client.subscribe.call_args_list[0].args[0] == [(command_topic(worker.name), 1), (DEVICES_TOPIC, 1)]
+
+    worker.client.reset_mock()
+    worker.handle_devices(json.dumps({"op": "add_range", "id": "41", "ranges": [["switch", 1]]}))
+    topics = [topic for topic, _ in worker.client.subscribe.call_args.args[0]]
+    assert topics == ["redes2/2312/1/switch_41", "redes2/2312/1/switch_42", "redes2/2312/1/state/switch_41"]
+    worker.handle_devices(json.dumps({"op": "remove", "id": "41"}))
+    worker.client.unsubscribe.assert_called_once_with(topics)
+    assert ctrl.registry.type_of("41") is None
+
+
+def test_worker_answers_forwarded_command(monkeypatch):
+    """Verifica que un worker responde en el topic indicado a un comando reenviado."""
+    import controller.controller as ctrl
+    from controller.worker import ShardWorker
+
+    monkeypatch.setattr(ctrl, "publisher", None)
+    worker = ShardWorker("worker_0", HashRing(["worker_0"]))
+    worker.client = MagicMock()
+    request = {"id": "ab", "content": "!switch 999 status", "reply": "r"}
+    asyncio.run(worker.handle_command(json.dumps(request)))
+    topic, payload = worker.client.publish.call_args.args
+    assert topic == "r"
+    assert json.loads(payload) == {"id": "ab", "text": "ID de switch no válido."}
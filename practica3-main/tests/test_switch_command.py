@@ -0,0 +1,87 @@
+import asyncio
+import threading
+from types import SimpleNamespace
+from unittest.mock import MagicMock
+
+from common.switch_command import (CommandLog, format_command, format_reply, is_command, parse_command,
+                                   parse_reply)
+from devices.switch import Switch
+
+
+def test_command_and_reply_round_trip():
+    """Verifica el formato de órdenes y confirmaciones, y la compatibilidad con el formato antiguo."""
+    assert parse_command(format_command("ON", "ab12")) == ("ON", "ab12")
+    assert parse_command("TOGGLE") == ("TOGGLE", None)
+    assert parse_command("1") == ("TOGGLE", None)
+    assert parse_command(format_reply(True, "ab12")) is None
+    # La respuesta a secas de otro switch no es una orden
+    assert parse_command(format_reply(True)) is None and parse_command("OFF") is None
+    assert parse_reply("OFF ack=ab12") == ("OFF", "ab12")
+    assert parse_reply("ON") is None
+    assert is_command("TOGGLE cmd=ab12") and is_command("TOGGLE")
+    assert not is_command("ON") and not is_command("ON ack=ab12")
+
+
+def test_command_log_forgets_oldest():
+    """Verifica que el registro de órdenes aplicadas tiene un tamaño máximo."""
+    log = CommandLog(size=2)
+    for i, command_id in enumerate(["a", "b", "c"]):
+        log.record(command_id, bool(i % 2))
+    assert log.get("a") is None
+    assert log.get("c") is False
+    assert log.get(None) is None
+
+
+def test_duplicate_command_is_applied_once():
+    """Verifica que un reintento con el mismo identificador no vuelve a conmutar el switch."""
+    switch = Switch("4")
+    client = MagicMock()
+    msg = SimpleNamespace(topic="redes2/2312/1/switch_4", payload=b"TOGGLE cmd=ab12")
+    switch.handle_message(client, msg)
+    switch.handle_message(client, msg)
+    assert switch.state is True
+    replies = [c.args for c in client.publish.call_args_list if c.args[0] == "redes2/2312/1/switch_5"]
+    assert replies == [("redes2/2312/1/switch_5", "ON ack=ab12")] * 2
+    client.publish.assert_any_call("redes2/2312/1/state/switch_4", "ON", qos=1, retain=True)
+
+
+def test_dummy_switch_ignores_duplicates(monkeypatch):
+    """Verifica la deduplicación de órdenes en dummy_switch."""
+    import dummy_devices.dummy_switch as dummy
+    monkeypatch.setattr(dummy, "switch_data", {})
+    monkeypatch.setattr(dummy, "applied", CommandLog())
+    monkeypatch.setattr(dummy, "probability", 0.0)
+    monkeypatch.setattr(dummy, "switch_id", 1)
+    client = MagicMock()
+    msg = SimpleNamespace(topic="redes2/2312/1/switch_1", payload=b"TOGGLE cmd=ff00")
+    dummy.on_message(client, None, msg)
+    dummy.on_message(client, None, msg)
+    dummy.on_message(client, None, SimpleNamespace(topic=msg.topic, payload=b"OFF cmd=ff01"))
+    replies = [c.args[1] for c in client.publish.call_args_list if c.args[0] == "redes2/2312/1/switch_2"]
+    assert replies == ["ON ack=ff00", "ON ack=ff00", "OFF ack=ff01"]
+
+
+def test_controller_retries_lost_command(monkeypatch):
+    """Verifica que el controlador reenvía una orden perdida con el mismo identificador."""
+    import controller.controller as ctrl
+    monkeypatch.setitem(ctrl.device_data, "devices", {"2": "switch"})
+    switch = Switch("2")
+    sent = []
+
+    def publish(topic, payload):
+        sent.append(payload)
+        if len(sent) == 1:
+            return  # Se pierde la primera orden
+        reply_client = MagicMock()
+        switch.handle_message(reply_client, SimpleNamespace(topic=topic, payload=payload.encode()))
+        reply_topic, reply_payload = reply_client.publish.call_args_list[-1].args
+        reply = SimpleNamespace(topic=reply_topic, payload=reply_payload.encode())
+        threading.Timer(0.01, ctrl.on_mqtt_message, (None, None, reply)).start()
+
+    mqtt_client = MagicMock()
+    mqtt_client.publish.side_effect = publish
+    monkeypatch.setattr("controller.pending.RETRY_BACKOFF", 0.05)
+
+    assert asyncio.run(ctrl.command_switch(mqtt_client, "2", "ON", timeout=2.0)) == "ON"
+    assert len(sent) == 2 and sent[0] == sent[1]
+    assert switch.state is True
@@ -0,0 +1,76 @@
+import random
+
+import pytest
+
+from common.timing_wheel import TimingWheel
+from controller.liveness import LivenessMonitor
+
+
+def test_timers_fire_on_their_tick_across_levels():
+    """Verifica que temporizadores cercanos, lejanos y fuera de alcance vencen en su tick exacto."""
+    random.seed(7)
+    wheel = TimingWheel(tick=1, slots=4, levels=3, now=0)  # Alcance de 64 ticks
+    now = [0]
+    fired = {}
+    deadlines = {key: random.randint(1, 300) for key in range(200)}
+    for key, deadline in deadlines.items():
+        wheel.call_at(deadline, lambda key=key: fired.setdefault(key, now[0]))
+    cancelled = wheel.call_at(10, fired.setdefault, "cancelado", 0)
+    assert cancelled.cancel() and not cancelled.cancel()
+    for now[0] in range(301):
+        wheel.advance(now[0])
+    assert fired == deadlines and len(wheel) == 0
+
+
+def test_periodic_timer_keeps_absolute_deadlines():
+    """Verifica que un temporizador periódico no acumula retrasos y salta los plazos perdidos."""
+    wheel = TimingWheel(tick=0.01, now=0)
+    calls = []
+    timer = wheel.call_every(1.0, lambda: calls.append(timer.deadline), first=1.0)
+    for now in (1.004, 2.009, 3.0, 7.5, 8.0):
+        wheel.advance(now)
+    assert calls == [2.0, 3.0, 4.0, 8.0, 9.0]  # Plazo siguiente tras cada disparo
+    timer.cancel()
+    assert wheel.advance(20) == 0
+    with pytest.raises(ValueError):
+        wheel.call_every(0, print)
+
+
+def test_liveness_rearms_lazily_and_reports_changes(monkeypatch):
+    """Verifica que un dispositivo solo se marca sin actividad si no publica durante el timeout."""
+    now = [0.0]
+    monkeypatch.setattr("controller.liveness.time.monotonic", lambda: now[0])
+    wheel = TimingWheel(tick=0.1, now=0)
+    changes = []
+    monitor = LivenessMonitor(wheel, 5.0, on_change=lambda device_id, alive: changes.append((device_id, alive)))
+    monitor.seen("1")
+    monitor.seen("2")
+    now[0] = 4.0
+    monitor.seen("1")
+    now[0] = 5.0
+    wheel.advance(now[0])  # Vencen ambos, pero "1" habló a los 4 s: solo se rearma
+    assert monitor.silent == {"2"} and changes == [("2", False)]
+    now[0] = 6.0
+    monitor.seen("2")
+    assert monitor.silent == set() and changes[-1] == ("2", True)
+    monitor.forget("1")
+    assert len(wheel) == 1
+    now[0] = 11.0
+    wheel.advance(now[0])
+    assert monitor.silent == {"2"}
+
+
+def test_liveness_watch_detects_devices_that_never_publish(monkeypatch):
+    """Verifica que un dispositivo vigilado desde el arranque se marca aunque no publique nunca."""
+    now = [0.0]
+    monkeypatch.setattr("controller.liveness.time.monotonic", lambda: now[0])
+    wheel = TimingWheel(tick=0.1, now=0)
+    monitor = LivenessMonitor(wheel, 5.0)
+    monitor.watch("1")
+    monitor.watch("2")
+    now[0] = 3.0
+    monitor.seen("2")
+    monitor.watch("2")  # Ya vigilado: no reinicia su plazo
+    now[0] = 5.0
+    wheel.advance(now[0])
+    assert monitor.silent == {"1"} and len(wheel) == 1
@@ -0,0 +1,43 @@
+from datetime import datetime
+
+import pytest
+
+from common.vclock import Deadline, VirtualClock
+from devices.watch import Watch
+
+
+def test_virtual_clock_is_computed_from_anchor():
+    """Verifica que la hora virtual se calcula a partir del tiempo transcurrido, sin ticks."""
+    clock = VirtualClock("09:00:00", speed=60, t0=100.0)
+    assert clock.text(100.0) == "09:00:00"
+    assert clock.text(101.0) == "09:01:00"
+    # Tras un millón de ticks de 10 ms la hora sigue siendo exacta
+    assert clock.text(100.0 + 1_000_000 * 0.01) == "07:40:00"
+    clock.set("12:00:00", at=200.0)
+    clock.shift(30)
+    assert clock.text(200.0) == "12:00:30"
+
+
+def test_deadlines_are_absolute_and_skip_missed_ticks():
+    """Verifica que los plazos no acumulan retrasos y que se saltan los vencidos."""
+    deadline = Deadline(1.0, start=10.0)
+    assert deadline.advance(now=10.3) == 0 and deadline.next == 11.0
+    assert deadline.remaining(now=10.4) == pytest.approx(0.6)
+    assert deadline.advance(now=11.9) == 0 and deadline.next == 12.0
+    assert deadline.advance(now=15.5) == 3 and deadline.next == 16.0
+    assert deadline.remaining(now=17.0) == 0.0
+    with pytest.raises(ValueError):
+        Deadline(0)
+
+
+def test_watch_time_advances_lazily(monkeypatch):
+    """Verifica que el reloj de devices calcula la hora al consultarla."""
+    now = [50.0]
+    monkeypatch.setattr("common.vclock.time.monotonic", lambda: now[0])
+    watch = Watch("1", "23:59:00", frequency=1, rate=2)
+    now[0] += 45
+    assert watch.get_time() == "00:00:30"
+    watch.advance_time()
+    assert watch.get_time() == "00:00:32"
+    watch.current_time = datetime(1900, 1, 1, 8, 0, 0)
+    assert watch.get_time() == "08:00:00"